@@ -0,0 +1,115 @@
+"""
+# Benchmark loading and dumping a large config: PyYAML's pure-Python
+# loader/dumper against libyaml's C ones, and loading from a snapshot
+#
+# Run from the repository root:
+#   python3 benchmarks/configLoad.py --channels 10000
+"""
+import argparse
+import base64
+import datetime
+import os
+import pickle
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import yaml
+
+from managedYoutubeDL import YAMLBuilder
+from managedYoutubeDL import yamlBuilder
+from managedYoutubeDL.items import Channel
+from managedYoutubeDL.manager import Manager
+
+
+def createManager(numChannels: int) -> Manager:
+  """
+  # A manager with <numChannels> channels, each with a few filters set
+  #
+  :param numChannels:
+  :return:
+  """
+  UTC = datetime.timezone.utc
+  channelList = []
+  for i in range(numChannels):
+    channelList.append(Channel(
+      title         = "Channel number {}".format(i),
+      id            = "UC{:022d}".format(i),
+      publishedAt   = datetime.datetime(2015, 1, 1, tzinfo=UTC) + timedelta(days=i % 3000),
+      ignore        = i % 10 == 0,
+      minVideoDate  = datetime.datetime(2024, 1, 1, tzinfo=UTC) + timedelta(minutes=i),
+      includeFilter = "part \\d+" if i % 7 == 0 else None,
+      priority      = i % 3,
+      pollInterval  = 3600 * (1 + i % 24),
+    ))
+  return Manager(
+    clientSecretsFile  = None,
+    pickledCredentials = base64.b64encode(pickle.dumps("pickleStr")).decode("utf-8"),
+    downloadDirectory  = "",
+    ffmpegLocation     = None,
+    channelList        = channelList,
+    seenChannelVideos  = dict([(channel.id, ["v{:010d}".format(n) for n in range(5)]) for channel in channelList[:1000]]),
+  )
+
+
+def timeIt(fn, repeats: int) -> float:
+  """
+  # Best time (seconds) of <repeats> calls of <fn>
+  #
+  :param fn:
+  :param repeats:
+  :return:
+  """
+  best = None
+  for _ in range(repeats):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return best
+
+
+if __name__ == "__main__":
+
+  parser = argparse.ArgumentParser(description="Benchmark config loading and dumping.")
+  parser.add_argument("--channels", type=int, default=10000, help="channels in the config (default: 10000)")
+  parser.add_argument("--repeats", type=int, default=3, help="runs of each case; the best is reported (default: 3)")
+  args = parser.parse_args()
+
+  manager = createManager(args.channels)
+  pureLoader = mock.patch.object(yamlBuilder, "_SafeLoader", yaml.SafeLoader)
+  pureDumper = mock.patch.object(yamlBuilder, "_SafeDumper", yaml.SafeDumper)
+
+  with tempfile.TemporaryDirectory() as tmpDir:
+    configFile = os.path.join(tmpDir, "config.yaml")
+    YAMLBuilder.dumpManager(manager, configFile)
+
+    results = []
+
+    # dumping
+    with pureDumper:
+      results.append(("dump (pure Python)", timeIt(lambda: YAMLBuilder.dumpManager(manager, configFile, overwrite=True),
+                                                   args.repeats)))
+    if yaml.__with_libyaml__:
+      results.append(("dump (libyaml)", timeIt(lambda: YAMLBuilder.dumpManager(manager, configFile, overwrite=True),
+                                               args.repeats)))
+
+    # loading
+    with pureLoader:
+      results.append(("load (pure Python)", timeIt(lambda: YAMLBuilder.loadManager(configFile), args.repeats)))
+    if yaml.__with_libyaml__:
+      results.append(("load (libyaml)", timeIt(lambda: YAMLBuilder.loadManager(configFile), args.repeats)))
+
+    YAMLBuilder.loadManager(configFile, snapshot=True)
+    results.append(("load (snapshot)", timeIt(lambda: YAMLBuilder.loadManager(configFile, snapshot=True), args.repeats)))
+
+    print("{} channels, config {:.1f} MiB, snapshot {:.1f} MiB, libyaml {}".format(
+      args.channels, os.path.getsize(configFile) / (1024 * 1024),
+      os.path.getsize(configFile + ".snapshot") / (1024 * 1024),
+      "available" if yaml.__with_libyaml__ else "not available"))
+    for name, elapsed in results:
+      print("{:<24} {:>8.3f} s".format(name, elapsed))
@@ -0,0 +1,190 @@
+"""
+# Benchmark the effect of concurrent fragment downloads and chunked range
+# requests on download throughput
+#
+# A local media server stands in for YouTube: every connection gets a short
+# full-speed burst and is then throttled, much like googlevideo does. It
+# serves an HLS playlist of fragments (parallel fragment downloads) and a
+# progressive file with Range support (chunked range requests).
+#
+# Run from the repository root:
+#   python3 benchmarks/fragmentThroughput.py
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import yt_dlp
+
+from managedYoutubeDL.manager import Manager
+
+
+class ThrottledMediaHandler(BaseHTTPRequestHandler):
+  
+  # set by createServer()
+  fragmentSize = None
+  numFragments = None
+  burstBytes   = None
+  throttleRate = None
+  payload      = None
+  
+  def log_message(self, *args):
+    pass
+  
+  def _sendThrottled(self, data: bytes):
+    """
+    # Write <data> at full speed for the first <burstBytes>, then at
+    # <throttleRate> bytes/s
+    #
+    :param data:
+    :return:
+    """
+    blockSize = 64 * 1024
+    sent      = 0
+    while sent < len(data):
+      block = data[sent:sent + blockSize]
+      try:
+        self.wfile.write(block)
+      except (BrokenPipeError, ConnectionResetError):
+        # yt-dlp closes its probe requests early
+        return
+      sent += len(block)
+      if sent > self.burstBytes:
+        time.sleep(len(block) / self.throttleRate)
+  
+  def do_GET(self):
+    
+    # HLS playlist of equally sized fragments
+    if self.path == "/video.m3u8":
+      lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:2", "#EXT-X-MEDIA-SEQUENCE:0"]
+      for i in range(self.numFragments):
+        lines += ["#EXTINF:2.0,", "/frag{}.ts".format(i)]
+      lines.append("#EXT-X-ENDLIST")
+      body = ("\n".join(lines) + "\n").encode("utf-8")
+      self.send_response(200)
+      self.send_header("Content-Type", "application/vnd.apple.mpegurl")
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+    
+    # a single fragment
+    elif self.path.startswith("/frag"):
+      body = self.payload[:self.fragmentSize]
+      self.send_response(200)
+      self.send_header("Content-Type", "video/mp2t")
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self._sendThrottled(body)
+    
+    # progressive file, with Range support
+    elif self.path == "/video.mp4":
+      start, end = 0, len(self.payload) - 1
+      rangeHeader = self.headers.get("Range")
+      if rangeHeader and rangeHeader.startswith("bytes="):
+        first, _, last = rangeHeader[len("bytes="):].partition("-")
+        start = int(first) if first else 0
+        end   = min(int(last), end) if last else end
+      body = self.payload[start:end + 1]
+      self.send_response(206 if rangeHeader else 200)
+      self.send_header("Content-Type", "video/mp4")
+      self.send_header("Accept-Ranges", "bytes")
+      self.send_header("Content-Length", str(len(body)))
+      if rangeHeader:
+        self.send_header("Content-Range", "bytes {}-{}/{}".format(start, end, len(self.payload)))
+      self.end_headers()
+      self._sendThrottled(body)
+    
+    else:
+      self.send_error(404)
+
+
+def createServer(fragmentSize: int, numFragments: int, burstBytes: int, throttleRate: int):
+  """
+  # Start the throttled media server on a free local port, in a background thread
+  #
+  :return:
+  """
+  ThrottledMediaHandler.fragmentSize = fragmentSize
+  ThrottledMediaHandler.numFragments = numFragments
+  ThrottledMediaHandler.burstBytes   = burstBytes
+  ThrottledMediaHandler.throttleRate = throttleRate
+  ThrottledMediaHandler.payload      = os.urandom(fragmentSize * numFragments)
+  
+  server = ThreadingHTTPServer(("127.0.0.1", 0), ThrottledMediaHandler)
+  server.daemon_threads = True
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server
+
+
+def timeDownload(url: str, options: dict) -> tuple:
+  """
+  # Download <url> with yt-dlp <options>, returning (seconds, bytes)
+  #
+  :param url:
+  :param options:
+  :return:
+  """
+  with tempfile.TemporaryDirectory() as tmpDir:
+    options = dict(options)
+    options.update({
+      "quiet":             True,
+      "no_warnings":       True,
+      "noprogress":        True,
+      "outtmpl":           os.path.join(tmpDir, "%(id)s.%(ext)s"),
+      "hls_prefer_native": True,
+      "fixup":             "never",
+    })
+    
+    start = time.perf_counter()
+    with yt_dlp.YoutubeDL(options) as ydl:
+      returnCode = ydl.download([url])
+    elapsed = time.perf_counter() - start
+    
+    if returnCode != 0:
+      raise RuntimeError("download failed: {}".format(url))
+    numBytes = sum(entry.stat().st_size for entry in os.scandir(tmpDir) if entry.is_file())
+    return elapsed, numBytes
+
+
+if __name__ == "__main__":
+  
+  parser = argparse.ArgumentParser(description="Benchmark fragment concurrency and chunked range requests.")
+  parser.add_argument("--fragment-size", type=int, default=512 * 1024, help="bytes per HLS fragment")
+  parser.add_argument("--fragments",     type=int, default=32,         help="number of HLS fragments")
+  parser.add_argument("--burst",         type=int, default=256 * 1024, help="full-speed bytes per connection")
+  parser.add_argument("--rate",          type=int, default=2 * 1024 * 1024, help="throttled bytes/s per connection")
+  parser.add_argument("--quality",       type=str, default="max", help="quality whose fragment setting to use")
+  args = parser.parse_args()
+  
+  server  = createServer(args.fragment_size, args.fragments, args.burst, args.rate)
+  baseURL = "http://127.0.0.1:{}".format(server.server_address[1])
+  quality = Manager.VideoQuality(args.quality)
+  
+  # the transfer options the manager would use for this quality
+  manager      = Manager(clientSecretsFile=None, ffmpegLocation=None)
+  tunedOptions = manager.addTransferOptions({}, quality)
+  
+  # chunk the progressive file at the burst size so each range request
+  # stays within its connection's full-speed allowance
+  tunedProgressive = dict(tunedOptions, http_chunk_size=args.burst)
+  
+  cases = [
+    ("HLS, sequential fragments",       baseURL + "/video.m3u8", {"concurrent_fragment_downloads": 1}),
+    ("HLS, manager fragment setting",   baseURL + "/video.m3u8", tunedOptions),
+    ("progressive, single request",     baseURL + "/video.mp4",  {}),
+    ("progressive, chunked requests",   baseURL + "/video.mp4",  tunedProgressive),
+  ]
+  
+  print("quality={} concurrent_fragment_downloads={}".format(
+    quality.value, tunedOptions["concurrent_fragment_downloads"]))
+  for name, url, options in cases:
+    elapsed, numBytes = timeDownload(url, options)
+    print("{:<32} {:>8.2f} s {:>10.2f} MiB/s".format(name, elapsed, numBytes / elapsed / (1024 * 1024)))
+  
+  server.shutdown()
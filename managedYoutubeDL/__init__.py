@@ -1,7 +1,21 @@
 import datetime
+import importlib
 
-from managedYoutubeDL.fetcher import Fetcher
-from managedYoutubeDL.yamlBuilder import YAMLBuilder
+
+# Fetcher and YAMLBuilder are imported on first use, so importing a
+# lightweight submodule (e.g. items) doesn't also import the Google API
+# client and PyYAML
+_LAZY_ATTRIBUTES = {
+  "Fetcher":     "managedYoutubeDL.fetcher",
+  "YAMLBuilder": "managedYoutubeDL.yamlBuilder",
+}
+
+def __getattr__(name):
+  if name not in _LAZY_ATTRIBUTES:
+    raise AttributeError("module {} has no attribute {}".format(__name__, name))
+  value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+  globals()[name] = value
+  return value
 
 
 
@@ -24,13 +38,20 @@ def convertTime(timeValue):
     return timeValue
 
   # if it's a string, try and convert it (YouTube API uses ISO 8601 with Z suffix)
+  #  -fromisoformat reads it directly on Python 3.11+; older versions fall
+  #   back to strptime
   elif isinstance(timeValue, str):
-    strTime = timeValue.replace("T", " ").replace("Z", "")
     try:
-      dt = datetime.datetime.strptime(strTime, "%Y-%m-%d %H:%M:%S.%f")
+      dt = datetime.datetime.fromisoformat(timeValue)
     except ValueError:
-      dt = datetime.datetime.strptime(strTime, "%Y-%m-%d %H:%M:%S")
-    return dt.replace(tzinfo=datetime.timezone.utc)
+      strTime = timeValue.replace("T", " ").replace("Z", "")
+      try:
+        dt = datetime.datetime.strptime(strTime, "%Y-%m-%d %H:%M:%S.%f")
+      except ValueError:
+        dt = datetime.datetime.strptime(strTime, "%Y-%m-%d %H:%M:%S")
+    if dt.tzinfo is None:
+      return dt.replace(tzinfo=datetime.timezone.utc)
+    return dt
   
   # no idea what this is
   else:
@@ -7,6 +7,8 @@ pip3 install --upgrade google-auth-oauthlib google-auth-httplib2
 # re.compile("^.*title=\"([^\"]+)\".*/channel/([A-Z0-9\-\_]{24})", re.MULTILINE | re.IGNORECASE)
 import sys
 import argparse
+import atexit
+import json
 import os
 
 
@@ -15,30 +17,22 @@ import os
 currentDirectory = os.path.dirname(os.path.realpath(__file__))
 rootDirectory    = os.path.dirname(os.path.dirname(currentDirectory))
 
-# CHECK: log file can be created
-LOG_FILENAME = os.path.join(currentDirectory, "{}.log".format(os.path.basename(__file__)))
-logFileDir = os.path.dirname(LOG_FILENAME)
-if not os.path.exists(logFileDir):
-  raise FileNotFoundError("log directory does not exist: {}".format(logFileDir))
+# the log file is <log directory>/__main__.py.log (or .jsonl)
+LOG_FILENAME = os.path.basename(__file__)
 
 # CHECK: fetcher is in path
 pkgLocation = os.path.join(rootDirectory, "managedYoutubeDL")
 if pkgLocation not in sys.path:
   sys.path.insert(0, pkgLocation)
 
-# create a file logger that automatically rotates log files
 import logging
-logging.getLogger("").setLevel(logging.DEBUG)
-from logging.handlers import RotatingFileHandler
-fileHandler = RotatingFileHandler(filename=LOG_FILENAME, maxBytes=5000000, backupCount=5, encoding="utf-8")
-fileHandler.setLevel(logging.DEBUG)
-fileHandler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-logging.getLogger("").addHandler(fileHandler)
 
 
 
 from managedYoutubeDL.manager import Manager
-from managedYoutubeDL import YAMLBuilder
+from managedYoutubeDL import Fetcher, YAMLBuilder
+from managedYoutubeDL.logSetup import startFileLogging
+from managedYoutubeDL.runLock import RunLock, RunLockedError
 
 
 
@@ -70,16 +64,120 @@ def downloadNew(**kwargs):
     raise ValueError(
       f"Unknown video quality {qual_str}. Supported qualitities: {[x.value for x in Manager.VideoQuality]}")
   
+  # only report what we would download, leaving the config untouched
+  if kwargs.get("plan"):
+    plan = manager.planNewVideos(quality=quality)
+    if kwargs.get("json"):
+      print(json.dumps(plan.toDict(), indent=2))
+    else:
+      logger.info("")
+      for line in plan.formatTable():
+        logger.info(line)
+    return
+  
   # download new videos
-  numDownloaded, numFailed = manager.downloadNewVideos(quality=quality)
-  # safe dump the manager
-  YAMLBuilder.safeDumpManager(manager, configFileLocation, overwrite=True)
+  numDownloaded, numFailed = manager.downloadNewVideos(quality=quality, claims=manager.createClaimDirectory())
+  # save the run state, and the config if its settings changed
+  YAMLBuilder.saveManager(manager, configFileLocation)
 
   logger.info("")
   logger.info("{} downloaded. {} failed. ({} API credits)".format(
       numDownloaded, numFailed, manager.getAPICreditsUsed()))
   
 
+def daemon(**kwargs):
+  from managedYoutubeDL.daemon import Daemon
+  
+  # video quality
+  quality  = None
+  qual_str = kwargs.get("quality")
+  try:
+    quality = Manager.VideoQuality(qual_str)
+  except ValueError: pass
+  if quality is None:
+    raise ValueError(
+      f"Unknown video quality {qual_str}. Supported qualitities: {[x.value for x in Manager.VideoQuality]}")
+  
+  # keep the manager loaded, checking for new videos every interval, until
+  # we receive SIGTERM/SIGINT
+  downloadDaemon = Daemon(
+    configFileLocation = kwargs.get("configFileLocation"),
+    quality            = quality,
+    interval           = kwargs.get("interval"),
+  )
+  downloadDaemon.installSignalHandlers()
+  downloadDaemon.run()
+
+
+def batch(**kwargs):
+  from managedYoutubeDL.batch import BatchRunner
+  
+  # video quality
+  quality  = None
+  qual_str = kwargs.get("quality")
+  try:
+    quality = Manager.VideoQuality(qual_str)
+  except ValueError: pass
+  if quality is None:
+    raise ValueError(
+      f"Unknown video quality {qual_str}. Supported qualitities: {[x.value for x in Manager.VideoQuality]}")
+  
+  # download every config's new videos in one process, sharing API clients
+  # and download slots
+  batchRunner = BatchRunner(
+    configFileLocations = kwargs.get("configFileLocations"),
+    quality             = quality,
+    workers             = kwargs.get("workers"),
+  )
+  batchRunner.installSignalHandlers()
+  batchRunner.run()
+
+
+def coordinator(**kwargs):
+  from managedYoutubeDL.workQueue import WorkQueue
+  
+  # location of configuration file to use
+  configFileLocation = kwargs.get("configFileLocation")
+  
+  # create the manager from the configuration file
+  manager = YAMLBuilder.loadManager(configFileLocation)
+  
+  # video quality
+  quality = None
+  qual_str = kwargs.get("quality")
+  try:
+    quality = Manager.VideoQuality(qual_str)
+  except ValueError: pass
+  if quality is None:
+    raise ValueError(
+      f"Unknown video quality {qual_str}. Supported qualitities: {[x.value for x in Manager.VideoQuality]}")
+  
+  # fold in the workers' results, then queue the new videos
+  workQueue = WorkQueue(kwargs.get("queueFile"))
+  numDownloaded, numFailed = manager.collectQueueResults(workQueue)
+  numQueued = manager.enqueueNewVideos(workQueue, quality=quality)
+  
+  # save the run state, and the config if its settings changed
+  YAMLBuilder.saveManager(manager, configFileLocation)
+  
+  logger.info("")
+  logger.info("{} downloaded. {} failed. {} queued. ({} API credits)".format(
+    numDownloaded, numFailed, numQueued, manager.getAPICreditsUsed()))
+
+
+def worker(**kwargs):
+  import signal
+  from managedYoutubeDL.workQueue import QueueWorker, WorkQueue
+  
+  # the worker only uses the config's download settings, and never saves it
+  manager = YAMLBuilder.loadManager(kwargs.get("configFileLocation"))
+  
+  queueWorker = QueueWorker(manager, WorkQueue(kwargs.get("queueFile")), name=kwargs.get("name"))
+  signal.signal(signal.SIGTERM, queueWorker.stop)
+  signal.signal(signal.SIGINT,  queueWorker.stop)
+  queueWorker.run(exitWhenEmpty=kwargs.get("once"))
+
+
 def updateChannels(**kwargs):
   
   # location of configuration file to use
@@ -91,15 +189,15 @@ def updateChannels(**kwargs):
   
   # update channels
   logger.info("Updating channels")
-  numAdded, numRemoved = manager.updateChannels()
+  numAdded, numRemoved, numRenamed = manager.updateChannels()
   
   # create config file only if the channel list has changed
-  if numAdded == numRemoved == 0:
-    logger.info("No channels added or removed")
+  if numAdded == numRemoved == numRenamed == 0:
+    logger.info("No channels added, removed or renamed")
   else:
-    logger.info("Added {} channels. Removed {} channels".format(numAdded, numRemoved))
+    logger.info("Added {} channels. Removed {} channels. Renamed {} channels".format(numAdded, numRemoved, numRenamed))
     logger.debug("updateChannels: Creating the config file")
-    YAMLBuilder.safeDumpManager(manager, configFileLocation, overwrite=True)
+    YAMLBuilder.saveManager(manager, configFileLocation)
   
   # how many API credits did we use
   logger.info("Used {} API credits".format(manager.getAPICreditsUsed()))
@@ -137,13 +235,38 @@ def manualDownload(**kwargs):
     'format': Manager.SUPPORTED_QUALITIES.get(quality, None),
   }
   
+  # parallel fragments and chunked range requests
+  manager.addTransferOptions(options, quality)
+  
+  # videos already in the download directory, and the files downloaded
+  libraryIndex  = manager.getLibraryIndex()
+  finishedFiles = []
+  options["post_hooks"] = [finishedFiles.append]
+  
   import yt_dlp
   with yt_dlp.YoutubeDL(options) as ydl:
     
     for i, videoURL in enumerate(urlList):
+      
+      # CHECK: we don't already have this video
+      videoID = Fetcher.parseVideoID(videoURL)
+      if libraryIndex is not None and videoID is not None and libraryIndex.hasVideo(videoID):
+        logger.info("Already downloaded: {}/{}, {} ({})".format(
+          i+1, len(urlList), videoURL, libraryIndex.getVideoPath(videoID)))
+        continue
+      
       logger.info("Downloading: {}/{}, {}".format(i+1, len(urlList), videoURL))
+      del finishedFiles[:]
       returnCode = ydl.download([videoURL])
       logger.info("Success" if returnCode == 0 else "Problem")
+      
+      # add it to the library index
+      if returnCode == 0 and libraryIndex is not None and videoID is not None:
+        libraryIndex.addVideo(videoID, finishedFiles[-1] if len(finishedFiles) > 0 else None)
+  
+  # store the updated library index
+  if libraryIndex is not None:
+    libraryIndex.save()
     
 
 
@@ -160,6 +283,15 @@ if __name__ == "__main__":
   
   # optional arguments
   parser.add_argument("--verbose", action="store_true", help="turn on verbose mode")
+  parser.add_argument("--snapshot", action="store_true",
+                      help="cache the parsed config in <config-file>.snapshot, to load it faster next time")
+  parser.add_argument("--log-dir", type=str, dest="logDirectory", default=currentDirectory,
+                      help="directory for the log file (default: the package directory)")
+  parser.add_argument("--log-json", action="store_true", dest="logJSON",
+                      help="write the log file as JSON lines, with channel and video IDs as fields")
+  parser.add_argument("--log-level", type=str.upper, dest="logLevel", default="DEBUG",
+                      choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                      help="lowest level of message written to the log file (default: DEBUG)")
   parser.set_defaults(verbose=False)
   
   
@@ -170,10 +302,69 @@ if __name__ == "__main__":
                              description="Fetch newly added videos.")
   sp.add_argument(metavar="config-file", type=str, dest="configFileLocation",
                   help="location of the configuration file to use")
-  sp.set_defaults(func=downloadNew)
+  sp.set_defaults(func=downloadNew, lockConfig=True)
   
   # optional arguments
   sp.add_argument("--quality", type=str, help="quality level of videos", default="max")
+  sp.add_argument("--plan", action="store_true",
+                  help="report the API credits, videos, bytes and time a run would use, without downloading")
+  sp.add_argument("--json", action="store_true", help="with --plan, print the report as JSON")
+  
+  ##############################
+  # run as a daemon
+  ##############################
+  sp = subparsers.add_parser("daemon", help="keep running, fetching and downloading new videos periodically",
+                             description="Keep running, fetching and downloading newly added videos every interval. "
+                                         "SIGTERM finishes the current download, saves, then exits.")
+  sp.add_argument(metavar="config-file", type=str, dest="configFileLocation",
+                  help="location of the configuration file to use")
+  sp.set_defaults(func=daemon)
+  
+  # optional arguments
+  sp.add_argument("--quality", type=str, help="quality level of videos", default="max")
+  sp.add_argument("--interval", type=int, help="seconds between checks for new videos (default: 900)", default=900)
+  
+  ##############################
+  # download for several configs
+  ##############################
+  sp = subparsers.add_parser("batch", help="fetch and download newly added videos for several config files",
+                             description="Fetch and download newly added videos for several config files in one "
+                                         "process, sharing API clients and a limit on concurrent downloads between them.")
+  sp.add_argument(metavar="config-file", nargs="+", type=str, dest="configFileLocations",
+                  help="locations of the configuration files to use")
+  sp.set_defaults(func=batch)
+  
+  # optional arguments
+  sp.add_argument("--quality", type=str, help="quality level of videos", default="max")
+  sp.add_argument("--workers", type=int, help="max concurrent downloads across all configs; each config downloads one "
+                                                "video at a time (default: 2)", default=2)
+  
+  ##############################
+  # distribute downloads over several hosts
+  ##############################
+  sp = subparsers.add_parser("coordinator", help="queue newly added videos for workers to download",
+                             description="Collect the workers' results from the queue, then fetch newly added videos "
+                                         "and add them to the queue.")
+  sp.add_argument(metavar="config-file", type=str, dest="configFileLocation",
+                  help="location of the configuration file to use")
+  sp.add_argument(metavar="queue-file", type=str, dest="queueFile",
+                  help="location of the work queue (on a directory shared with the workers)")
+  sp.set_defaults(func=coordinator, lockConfig=True)
+  
+  # optional arguments
+  sp.add_argument("--quality", type=str, help="quality level of videos", default="max")
+  
+  sp = subparsers.add_parser("worker", help="download videos from a coordinator's queue",
+                             description="Claim and download videos from a coordinator's queue, until SIGTERM/SIGINT.")
+  sp.add_argument(metavar="config-file", type=str, dest="configFileLocation",
+                  help="location of the configuration file whose download settings to use")
+  sp.add_argument(metavar="queue-file", type=str, dest="queueFile",
+                  help="location of the work queue")
+  sp.set_defaults(func=worker)
+  
+  # optional arguments
+  sp.add_argument("--name", type=str, help="name of this worker (default: <host>-<pid>)", default=None)
+  sp.add_argument("--once", action="store_true", help="exit once the queue is empty")
   
   ##############################
   # initialise
@@ -194,7 +385,7 @@ if __name__ == "__main__":
                              description="Update the known list of channel subscriptions.")
   sp.add_argument(metavar="config-file", type=str, dest="configFileLocation",
                   help="location of the configuration file to use")
-  sp.set_defaults(func=updateChannels)
+  sp.set_defaults(func=updateChannels, lockConfig=True)
   
   
   ##############################
@@ -218,17 +409,41 @@ if __name__ == "__main__":
   # parse the arguments
   args = parser.parse_args()
   
+  # log everything to a rotating file, written by a background thread
+  #  -stopped at exit, which writes out anything still queued
+  #  -debug messages are only built if the file or console will show them
+  logPipeline = startFileLogging(args.logDirectory, LOG_FILENAME, jsonLines=args.logJSON,
+                                 level=logging.getLevelName(args.logLevel))
+  atexit.register(logPipeline.stop)
+  
   # Setup console logger
   #  -verbose turns on DEBUG messages
   console = logging.StreamHandler()
   console.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+  if logging.getLogger("").getEffectiveLevel() > console.level:
+    logging.getLogger("").setLevel(console.level)
   console.setFormatter(logging.Formatter("%(message)s"))
   logging.getLogger("").addHandler(console)
   logger = logging.getLogger(__name__)
   
+  # load configs from their snapshots, and keep them up to date
+  YAMLBuilder.useSnapshots = args.snapshot
+  
   
   #############################################################################
   # Perform operation
   #############################################################################
-  args.func(**vars(args))
+  
+  # commands that save the config hold its run lock, so an overlapping
+  # run (e.g., a slow cron job) exits straight away instead of clobbering
+  # the other's state
+  try:
+    if getattr(args, "lockConfig", False):
+      with RunLock(args.configFileLocation):
+        args.func(**vars(args))
+    else:
+      args.func(**vars(args))
+  except RunLockedError as err:
+    logger.warning("{}; exiting".format(err))
+    sys.exit(os.EX_TEMPFAIL)
   sys.exit(0)
@@ -0,0 +1,307 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import contextlib
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from managedYoutubeDL.runLock import RunLock, RunLockedError
+
+
+class FairScheduler:
+  """
+  # A limit of <workers> downloads at once, shared between several configs
+  #  -when a slot frees up, it goes to the waiting config that has been
+  #   given the fewest slots so far, so a config with a large backlog
+  #   can't starve the others
+  """
+
+  def __init__(self, workers: int):
+
+    # CHECK: number of workers is valid
+    if not isinstance(workers, int) or isinstance(workers, bool) or workers < 1:
+      raise ValueError("workers must be an int >= 1")
+
+    self.workers = workers
+    self.granted = {}
+
+    self._active  = 0
+    self._waiting = []
+    self._cond    = threading.Condition()
+
+
+  def _nextKey(self):
+
+    # fewest slots granted first, then whoever has waited longest
+    return min(self._waiting, key=lambda key: (self.granted.get(key, 0), self._waiting.index(key)))
+
+
+  @contextlib.contextmanager
+  def slot(self, key):
+    """
+    # Wait for a free slot for config <key>, and hold it while in the
+    # with-block
+    #
+    :param key:
+    :return:
+    """
+    with self._cond:
+      self._waiting.append(key)
+      while self._active >= self.workers or self._nextKey() != key:
+        self._cond.wait()
+      self._waiting.remove(key)
+      self._active += 1
+      self.granted[key] = self.granted.get(key, 0) + 1
+      self._cond.notify_all()
+
+    try:
+      yield
+    finally:
+      with self._cond:
+        self._active -= 1
+        self._cond.notify_all()
+
+
+class SharedFetcher:
+  """
+  # One Fetcher (and so one API client) used by every config with the same
+  # credentials
+  #  -API calls are serialised, as the client isn't thread-safe
+  #  -a channel's recent videos and a video's details are only requested
+  #   once per batch, however many configs subscribe to the channel
+  """
+
+  def __init__(self, fetcher):
+    self.fetcher = fetcher
+
+    self._recentVideos = {}
+    self._videoDetails = {}
+    self._lock         = threading.Lock()
+
+
+  @property
+  def creditsUsed(self):
+    return self.fetcher.creditsUsed
+
+
+  def __getattr__(self, name):
+
+    # anything we don't share goes straight to the fetcher
+    attr = getattr(self.fetcher, name)
+    if not callable(attr):
+      return attr
+
+    def locked(*args, **kwargs):
+      with self._lock:
+        return attr(*args, **kwargs)
+    return locked
+
+
+  def fetchRecentVideos(self, channelID, maxResults=10):
+    key = (channelID, maxResults)
+    with self._lock:
+      if key not in self._recentVideos:
+        self._recentVideos[key] = self.fetcher.fetchRecentVideos(channelID, maxResults)
+      videoList = self._recentVideos[key]
+    return None if videoList is None else list(videoList)
+
+
+  def fetchVideoDetails(self, video):
+    with self._lock:
+      if video.id not in self._videoDetails:
+        self._videoDetails[video.id] = self.fetcher.fetchVideoDetails(video)
+      return dict(self._videoDetails[video.id])
+
+
+class BatchRunner:
+  """
+  # Downloads the new videos of several configs in one process
+  #  -configs with the same credentials share a Fetcher (see SharedFetcher)
+  #  -each config runs in its own thread, downloading one video at a time
+  #   in one of the <workers> slots of a shared FairScheduler
+  #  -so <workers> caps the downloads across all configs, but only one per
+  #   config runs at once: a single config with a large backlog still
+  #   downloads sequentially
+  #  -each config is saved (atomically) after every video, as in the daemon
+  #  -a config locked by another run is skipped
+  """
+
+  # default max number of concurrent downloads across all configs
+  DEFAULT_WORKERS = 2
+
+
+  def __init__(self, configFileLocations: list, quality, workers: int = None, stopEvent: threading.Event = None,
+               loadManager=None, dumpManager=None):
+    """
+    #
+    :param configFileLocations:
+    :param quality: Manager.VideoQuality to download at
+    :param workers: max number of concurrent downloads (one per config)
+    :param stopEvent:
+    :param loadManager: function(fileLoc) -> Manager
+    :param dumpManager: function(manager, fileLoc)
+    """
+    from managedYoutubeDL import YAMLBuilder
+
+    # CHECK: each config is only given once
+    realPaths = [os.path.realpath(fileLoc) for fileLoc in configFileLocations]
+    if len(set(realPaths)) != len(realPaths):
+      raise ValueError("the same config file was given more than once")
+    if len(configFileLocations) == 0:
+      raise ValueError("no config files given")
+
+    self.configFileLocations = list(configFileLocations)
+    self.quality             = quality
+    self.scheduler           = FairScheduler(BatchRunner.DEFAULT_WORKERS if workers is None else workers)
+    self.stopEvent           = threading.Event() if stopEvent is None else stopEvent
+
+    self.loadManager = YAMLBuilder.loadManager if loadManager is None else loadManager
+    self.dumpManager = dumpManager
+    if self.dumpManager is None:
+      self.dumpManager = YAMLBuilder.saveManager
+
+    # config file location -> Manager
+    self.managers = {}
+
+    # config file location -> RunLock we hold on it
+    self.runLocks = {}
+
+    # config files that couldn't be loaded
+    self.failedConfigs = []
+
+
+  def stop(self, *args):
+    """
+    # Ask every config to stop once its current download has finished
+    #  -usable as a signal handler
+    #
+    :return:
+    """
+    if not self.stopEvent.is_set():
+      logger.info("BatchRunner: Stopping after the current downloads")
+    self.stopEvent.set()
+
+
+  def installSignalHandlers(self):
+    signal.signal(signal.SIGTERM, self.stop)
+    signal.signal(signal.SIGINT,  self.stop)
+
+
+  def load(self):
+    """
+    # Load each config's manager, sharing a fetcher between those with the
+    # same credentials
+    #  -a config that can't be loaded is logged, unlocked and left out, so
+    #   it doesn't stop the others
+    #
+    :return:
+    """
+    self.managers      = {}
+    self.failedConfigs = []
+    for fileLoc in self.configFileLocations:
+      runLock = RunLock(fileLoc)
+      try:
+        runLock.acquire()
+      except RunLockedError as err:
+        logger.warning("BatchRunner: Skipping {}: {}".format(fileLoc, err))
+        continue
+      
+      try:
+        self.managers[fileLoc] = self.loadManager(fileLoc)
+      except Exception as err:
+        logger.error("BatchRunner: Couldn't load {}: {}".format(fileLoc, err), exc_info=True)
+        runLock.release()
+        self.failedConfigs.append(fileLoc)
+        continue
+      self.runLocks[fileLoc] = runLock
+
+    sharedFetchers = {}
+    for fileLoc, manager in self.managers.items():
+      if not manager.hasFetcher():
+        continue
+      credentials = (manager.clientSecretsFile, manager.pickledCredentials)
+      if credentials not in sharedFetchers:
+        sharedFetchers[credentials] = SharedFetcher(manager.ytFetcher)
+      manager.ytFetcher = sharedFetchers[credentials]
+
+    logger.info("BatchRunner: Loaded {} config(s) using {} API client(s)".format(
+      len(self.managers), len(sharedFetchers)))
+    
+    # CHECK: each config downloads one video at a time
+    if self.scheduler.workers > len(self.managers):
+      logger.warning("BatchRunner: Only {} of the {} download slots can be used, as each config downloads "
+                     "one video at a time".format(len(self.managers), self.scheduler.workers))
+    return sharedFetchers
+
+
+  def releaseLocks(self):
+    for runLock in self.runLocks.values():
+      runLock.release()
+    self.runLocks = {}
+
+
+  def save(self, fileLoc: str):
+    """
+    # Save the manager's state to its config file <fileLoc>
+    #
+    :param fileLoc:
+    :return:
+    """
+    manager = self.managers[fileLoc]
+    self.dumpManager(manager, fileLoc)
+
+    libraryIndex = manager.getLibraryIndex()
+    if libraryIndex is not None:
+      libraryIndex.save()
+
+
+  def _runConfig(self, fileLoc: str) -> tuple:
+    logger.info("BatchRunner: Checking {}".format(fileLoc))
+    try:
+      return self.managers[fileLoc].downloadNewVideos(
+        quality      = self.quality,
+        stopEvent    = self.stopEvent,
+        checkpoint   = lambda: self.save(fileLoc),
+        downloadSlot = lambda: self.scheduler.slot(fileLoc),
+        claims       = self.managers[fileLoc].createClaimDirectory(),
+      )
+    finally:
+      self.save(fileLoc)
+
+
+  def run(self) -> dict:
+    """
+    # Download the new videos of every config
+    #  -a failing config is logged, and doesn't stop the others
+    #
+    :return: config file location -> (number downloaded, number failed), or
+             None if the config failed or couldn't be loaded (configs locked
+             by another run are left out)
+    """
+    results = {}
+    try:
+      sharedFetchers = self.load()
+      for fileLoc in self.failedConfigs:
+        results[fileLoc] = None
+      with ThreadPoolExecutor(max_workers=max(len(self.managers), 1), thread_name_prefix="config") as executor:
+        futures = {fileLoc: executor.submit(self._runConfig, fileLoc) for fileLoc in self.managers}
+        for fileLoc, future in futures.items():
+          try:
+            results[fileLoc] = future.result()
+          except Exception as err:
+            logger.error("BatchRunner: {} failed: {}".format(fileLoc, err), exc_info=True)
+            results[fileLoc] = None
+    finally:
+      self.releaseLocks()
+
+    # how did each config do
+    logger.info("")
+    for fileLoc, result in results.items():
+      if result is None:
+        logger.info("{}: failed".format(fileLoc))
+      else:
+        logger.info("{}: {} downloaded. {} failed.".format(fileLoc, result[0], result[1]))
+    logger.info("({} API credits)".format(sum([fetcher.creditsUsed for fetcher in sharedFetchers.values()])))
+    return results
@@ -0,0 +1,284 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import datetime
+import os
+import signal
+import threading
+import time
+from datetime import timedelta
+
+from managedYoutubeDL.runLock import RunLock
+
+
+class Daemon:
+  """
+  # Keeps a Manager (with its Fetcher, API client and merge pool) resident
+  # and runs a download cycle every <interval>, instead of paying the
+  # start-up cost on every cron invocation
+  #  -the configuration file is saved after every video, and reloaded if it
+  #   is edited while the daemon is running (keeping the edits, see save())
+  #  -stop() (or SIGTERM/SIGINT) lets the current download and merges
+  #   finish, saves, then returns from run()
+  #  -in push mode (webSubCallbackURL set), uploads pushed by the WebSub
+  #   hub are downloaded as they arrive, and each cycle only polls the
+  #   channels without a current subscription
+  #  -the daemon holds the config's RunLock while it runs, so a cron run of
+  #   the same config exits rather than clobbering its state
+  """
+
+  # default time (seconds) between the start of consecutive cycles
+  DEFAULT_INTERVAL = 60*15
+  
+  # max time (seconds) to wait for pushed notifications before checking
+  # whether we've been stopped
+  PUSH_WAIT = 1
+
+
+  def __init__(self, configFileLocation: str, quality, interval=None, stopEvent: threading.Event = None,
+               loadManager=None, dumpManager=None):
+    """
+    #
+    :param configFileLocation:
+    :param quality: Manager.VideoQuality to download at
+    :param interval: timedelta or seconds between the start of each cycle
+    :param stopEvent:
+    :param loadManager: function(fileLoc) -> Manager
+    :param dumpManager: function(manager, fileLoc)
+    """
+    from managedYoutubeDL import YAMLBuilder
+
+    if interval is None:
+      interval = Daemon.DEFAULT_INTERVAL
+    if isinstance(interval, (int, float)):
+      interval = timedelta(seconds=interval)
+
+    # CHECK: interval is valid
+    if not isinstance(interval, timedelta) or interval.total_seconds() <= 0:
+      raise ValueError("interval must be a positive timedelta or number of seconds")
+
+    self.configFileLocation = configFileLocation
+    self.quality            = quality
+    self.interval           = interval
+    self.stopEvent          = threading.Event() if stopEvent is None else stopEvent
+
+    self.loadManager = YAMLBuilder.loadManager if loadManager is None else loadManager
+    self.dumpManager = dumpManager
+    if self.dumpManager is None:
+      self.dumpManager = YAMLBuilder.saveManager
+
+    self.manager    = None
+    self.mergePool  = None
+    self.webSub     = None
+    self.cycles     = 0
+
+    # modification time of the config file when we last loaded or saved it
+    self._configMtime = None
+    
+    # the push settings the WebSub receiver was created with
+    self._webSubSettings = None
+
+
+  def stop(self, *args):
+    """
+    # Ask the daemon to stop once the current download has finished
+    #  -usable as a signal handler
+    #
+    :return:
+    """
+    if not self.stopEvent.is_set():
+      logger.info("Daemon: Stopping after the current download")
+    self.stopEvent.set()
+
+
+  def installSignalHandlers(self):
+    signal.signal(signal.SIGTERM, self.stop)
+    signal.signal(signal.SIGINT,  self.stop)
+
+
+  def _getConfigMtime(self):
+    try:
+      return os.stat(self.configFileLocation).st_mtime_ns
+    except FileNotFoundError:
+      return None
+
+
+  def load(self):
+    """
+    # (Re)load the manager from the config file, if it has changed since we
+    # last loaded or saved it
+    #
+    :return:
+    """
+    configMtime = self._getConfigMtime()
+    if self.manager is not None and configMtime == self._configMtime:
+      return
+
+    if self.manager is not None:
+      logger.info("Daemon: {} was changed; reloading it".format(self.configFileLocation))
+    self.manager      = self.loadManager(self.configFileLocation)
+    self._configMtime = configMtime
+
+    # a merge pool that lasts as long as the daemon
+    if self.mergePool is not None:
+      self.mergePool.shutdown()
+    self.mergePool = self.manager.createMergePool()
+    
+    # a callback server for pushed uploads, if configured
+    #  -kept across reloads, with its subscriptions, unless the push
+    #   settings have changed
+    webSubSettings = (self.manager.webSubCallbackURL, self.manager.webSubPort, self.manager.webSubHubURL)
+    if webSubSettings != self._webSubSettings:
+      if self.webSub is not None:
+        self.webSub.stop()
+      self.webSub          = self.manager.createWebSubReceiver()
+      self._webSubSettings = webSubSettings
+      if self.webSub is not None:
+        self.webSub.start()
+
+
+  def save(self):
+    """
+    # Save the manager's state to the config file
+    #  -if the config was edited since we last loaded or saved it, the edits
+    #   aren't overwritten: our run state is saved into the edited config
+    #   instead, and the next cycle reloads it
+    #
+    :return:
+    """
+    manager = self.manager
+    if self._getConfigMtime() != self._configMtime:
+      logger.info("Daemon: {} was changed; saving our run state into it".format(self.configFileLocation))
+      try:
+        manager = self.loadManager(self.configFileLocation)
+      except Exception as err:
+        logger.error("Daemon: Could not load the changed {} ({}); not saving over it".format(
+          self.configFileLocation, err))
+        return
+      manager.copyRunState(self.manager)
+    
+    self.dumpManager(manager, self.configFileLocation)
+    if manager is self.manager:
+      self._configMtime = self._getConfigMtime()
+
+    libraryIndex = self.manager.getLibraryIndex()
+    if libraryIndex is not None:
+      libraryIndex.save()
+
+
+  def runCycle(self, pushedVideos: dict = None) -> tuple:
+    """
+    # Check for, and download, new videos once
+    #  -with <pushedVideos> (channel ID -> videos), only those videos are
+    #   checked; otherwise we poll
+    #
+    :param pushedVideos:
+    :return: (number downloaded, number failed)
+    """
+    self.load()
+    self.cycles += 1
+    creditsUsed = self.manager.getAPICreditsUsed()
+
+    logger.info("")
+    logger.info("Daemon: {} {} started at {}".format(
+      "Cycle" if pushedVideos is None else "Pushed cycle", self.cycles,
+      datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)))
+    
+    # in push mode, only poll channels whose uploads aren't being pushed
+    pushChannelIDs = None
+    if self.webSub is not None:
+      channelIDs = [channel.id for channel in self.manager.channelList if not channel.ignore]
+      if pushedVideos is None:
+        self.webSub.renewLeases(channelIDs)
+        pushChannelIDs = [channelID for channelID in channelIDs if self.webSub.hasLease(channelID)]
+        logger.info("Daemon: {} of {} channel(s) are pushed; polling the rest".format(
+          len(pushChannelIDs), len(channelIDs)))
+      else:
+        pushChannelIDs = channelIDs
+    
+    try:
+      numDownloaded, numFailed = self.manager.downloadNewVideos(
+        quality        = self.quality,
+        stopEvent      = self.stopEvent,
+        checkpoint     = self.save,
+        mergePool      = self.mergePool,
+        pushedVideos   = pushedVideos,
+        pushChannelIDs = pushChannelIDs,
+        claims         = self.manager.createClaimDirectory(),
+      )
+    finally:
+      self.save()
+
+    logger.info("{} downloaded. {} failed. ({} API credits)".format(
+      numDownloaded, numFailed, self.manager.getAPICreditsUsed() - creditsUsed))
+    return numDownloaded, numFailed
+
+
+  def _waitForNextCycle(self, nextCycleTime: float):
+    """
+    # Wait until <nextCycleTime> (time.monotonic()), downloading any
+    # pushed uploads as they arrive
+    #
+    :param nextCycleTime:
+    :return:
+    """
+    while not self.stopEvent.is_set():
+      remaining = nextCycleTime - time.monotonic()
+      if remaining <= 0:
+        return
+      
+      # nothing is pushed to us
+      if self.webSub is None:
+        self.stopEvent.wait(remaining)
+        return
+      
+      pushedVideos = self.webSub.getNotifications(timeout=min(remaining, Daemon.PUSH_WAIT))
+      if len(pushedVideos) > 0:
+        try:
+          self.runCycle(pushedVideos=pushedVideos)
+        except Exception as err:
+          logger.error("Daemon: Pushed cycle {} failed: {}".format(self.cycles, err), exc_info=True)
+
+
+  def run(self, maxCycles: int = None):
+    """
+    # Run download cycles every <interval> until stopped (or until
+    # <maxCycles> have run)
+    #  -a failed cycle is logged, and we try again next interval
+    #  -raises RunLockedError if another run holds the config's lock
+    #
+    :param maxCycles:
+    :return:
+    """
+    # CHECK: no other run is using our config
+    runLock = RunLock(self.configFileLocation)
+    runLock.acquire()
+    
+    logger.info("Daemon: Checking for new videos every {}".format(self.interval))
+    try:
+      while not self.stopEvent.is_set():
+        startTime = time.monotonic()
+
+        try:
+          self.runCycle()
+        except Exception as err:
+          logger.error("Daemon: Cycle {} failed: {}".format(self.cycles, err), exc_info=True)
+
+        if maxCycles is not None and self.cycles >= maxCycles:
+          break
+
+        # wait for the next cycle, waking straight away if we're stopped
+        waitTime = max(self.interval.total_seconds() - (time.monotonic() - startTime), 0)
+        logger.debug("Daemon: Next cycle in {:.0f}s".format(waitTime))
+        self._waitForNextCycle(time.monotonic() + waitTime)
+
+    finally:
+      if self.webSub is not None:
+        self.webSub.stop()
+        self.webSub          = None
+        self._webSubSettings = None
+      if self.mergePool is not None:
+        self.mergePool.shutdown()
+        self.mergePool = None
+      runLock.release()
+      logger.info("Daemon: Stopped after {} cycle(s)".format(self.cycles))
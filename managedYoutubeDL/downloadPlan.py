@@ -0,0 +1,163 @@
+import logging
+logger = logging.getLogger(__name__)
+
+from managedYoutubeDL.downloadQueue import formatBytes
+
+
+def historicalThroughput(records: list, quality=None) -> dict:
+  """
+  # Average download performance from telemetry <records>
+  #  -only successful downloads are used, at <quality> if there are any,
+  #   otherwise at every quality
+  #
+  :param records: telemetry records (see telemetry.buildJobRecord)
+  :param quality: Manager.VideoQuality, or its value
+  :return: {"samples", "bytesPerSecond", "extractTime", "mergeTime"}, or
+           None if there are no usable records
+  """
+  quality    = getattr(quality, "value", quality)
+  downloaded = [record for record in records if record.get("outcome") == "downloaded"
+                and record.get("bytes") and record.get("transferTime")]
+  if quality is not None and any(record.get("quality") == quality for record in downloaded):
+    downloaded = [record for record in downloaded if record.get("quality") == quality]
+  if len(downloaded) == 0:
+    return None
+
+  def mean(key):
+    values = [record[key] for record in downloaded if record.get(key) is not None]
+    return 0.0 if len(values) == 0 else sum(values) / len(values)
+
+  return {
+    "samples":        len(downloaded),
+    "bytesPerSecond": sum([record["bytes"] for record in downloaded]) / sum([record["transferTime"] for record in downloaded]),
+    "extractTime":    mean("extractTime"),
+    "mergeTime":      mean("mergeTime"),
+  }
+
+
+class DownloadPlan:
+  """
+  # What a download-new run would do: the API credits discovery uses, and
+  # the videos it would queue, with their estimated bytes and time
+  #  -a video's time is its extraction, transfer (at the historical
+  #   throughput) and merge time, plus the wait between downloads; it's
+  #   unknown without throughput history
+  """
+
+  def __init__(self, quality, throughput: dict = None, waitBetweenDownloads: float = 0):
+    self.quality              = getattr(quality, "value", quality)
+    self.throughput           = throughput
+    self.waitBetweenDownloads = waitBetweenDownloads
+
+    # API credits used in total (including any not spent on a channel)
+    self.credits  = 0
+
+    # one entry per channel checked
+    self.channels = []
+
+
+  def estimateTime(self, estimatedSize):
+    """
+    # Estimated time (seconds) to download a video of <estimatedSize> bytes
+    #
+    :param estimatedSize: bytes, or None if unknown
+    :return: seconds, or None if there's no throughput history
+    """
+    if self.throughput is None:
+      return None
+    transferTime = 0 if estimatedSize is None else estimatedSize / self.throughput["bytesPerSecond"]
+    return self.throughput["extractTime"] + transferTime + self.throughput["mergeTime"] + self.waitBetweenDownloads
+
+
+  def addChannel(self, channel, credits: int, videoList: list, estimatedSizes: list):
+    """
+    # Add <channel>'s line to the plan
+    #
+    :param channel:
+    :param credits: API credits used checking the channel
+    :param videoList: videos that would be queued
+    :param estimatedSizes: estimated bytes of each video (None if unknown)
+    :return:
+    """
+    videos = []
+    for video, estimatedSize in zip(videoList, estimatedSizes):
+      videos.append({
+        "id":            video.id,
+        "title":         video.title,
+        "publishedAt":   None if video.publishedAt is None else video.publishedAt.isoformat(),
+        "estimatedSize": estimatedSize,
+        "estimatedTime": self.estimateTime(estimatedSize),
+      })
+
+    self.channels.append({
+      "channel":        channel.title,
+      "channelID":      channel.id,
+      "credits":        credits,
+      "videos":         videos,
+      "estimatedBytes": sum([video["estimatedSize"] or 0 for video in videos]),
+      "unknownSizes":   len([video for video in videos if video["estimatedSize"] is None]),
+      "estimatedTime":  None if self.throughput is None else sum([video["estimatedTime"] for video in videos]),
+    })
+
+
+  def totals(self) -> dict:
+    return {
+      "credits":        self.credits,
+      "videos":         sum([len(row["videos"]) for row in self.channels]),
+      "estimatedBytes": sum([row["estimatedBytes"] for row in self.channels]),
+      "unknownSizes":   sum([row["unknownSizes"] for row in self.channels]),
+      "estimatedTime":  None if self.throughput is None else sum([row["estimatedTime"] for row in self.channels]),
+    }
+
+
+  def toDict(self) -> dict:
+    """
+    # The plan as a JSON-serialisable dictionary
+    #
+    :return:
+    """
+    return {
+      "quality":    self.quality,
+      "throughput": self.throughput,
+      "channels":   self.channels,
+      "total":      self.totals(),
+    }
+
+
+  def formatTable(self) -> list:
+    """
+    # The plan as the lines of a table, one row per channel plus a total
+    #
+    :return:
+    """
+    def formatTime(seconds):
+      if seconds is None:
+        return "unknown"
+      minutes, seconds = divmod(int(round(seconds)), 60)
+      hours, minutes   = divmod(minutes, 60)
+      return "{}h{:02d}m{:02d}s".format(hours, minutes, seconds) if hours else "{}m{:02d}s".format(minutes, seconds)
+
+    def formatSize(row):
+      size = formatBytes(row["estimatedBytes"])
+      return size if row["unknownSizes"] == 0 else "{} (+{} unknown)".format(size, row["unknownSizes"])
+
+    totals = self.totals()
+    rows   = [[row["channel"], str(row["credits"]), str(len(row["videos"])), formatSize(row),
+               formatTime(row["estimatedTime"])] for row in self.channels]
+    rows.append(["Total", str(totals["credits"]), str(totals["videos"]), formatSize(totals),
+                 formatTime(totals["estimatedTime"])])
+
+    header = ["Channel", "Credits", "Videos", "Bytes", "Time"]
+    widths = [max(len(line[i]) for line in [header] + rows) for i in range(len(header))]
+    def formatRow(line):
+      return "  ".join([line[0].ljust(widths[0])] + [value.rjust(width) for value, width in zip(line[1:], widths[1:])])
+
+    lines = [formatRow(header), "  ".join(["-" * width for width in widths])]
+    lines += [formatRow(line) for line in rows[:-1]]
+    lines += ["  ".join(["-" * width for width in widths]), formatRow(rows[-1])]
+    if self.throughput is None:
+      lines.append("(no download history in the telemetry file, so times are unknown)")
+    else:
+      lines.append("(times at {}/s, from {} past download(s))".format(
+        formatBytes(self.throughput["bytesPerSecond"]), self.throughput["samples"]))
+    return lines
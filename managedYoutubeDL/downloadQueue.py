@@ -0,0 +1,294 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import itertools
+import shutil
+import threading
+import time
+from enum import Enum
+
+
+def formatBytes(numBytes) -> str:
+  """
+  # Return a human-readable version of <numBytes>
+  #
+  :param numBytes:
+  :return:
+  """
+  if numBytes is None:
+    return "unknown"
+  value = float(numBytes)
+  for unit in ["B", "KiB", "MiB", "GiB", "TiB"]:
+    if abs(value) < 1024 or unit == "TiB":
+      break
+    value /= 1024
+  return "{:.1f} {}".format(value, unit) if unit != "B" else "{} B".format(int(value))
+
+
+class DownloadJob:
+  """
+  # One video waiting to be downloaded, along with what we know about it
+  """
+
+  def __init__(self, channel, video, quality=None, estimatedSize=None):
+    self.channel       = channel
+    self.video         = video
+    self.quality       = quality
+    self.estimatedSize = estimatedSize
+    self.attempts      = 0
+    
+    # yt-dlp info extracted while estimating the size (and how long that
+    # took), reused by the download
+    self.videoInfo     = None
+    self.extractTime   = None
+    
+    # set when the job is added to a DownloadQueue
+    self.enqueuedAt    = None
+    self.sequence      = None
+    
+    # set once the job has been downloaded (and merged)
+    self.result        = None
+    self.mergeTime     = None
+    
+    # set when the job was claimed from a WorkQueue
+    self.queueID       = None
+  
+  def waitingSince(self) -> float:
+    """
+    # When (epoch seconds) this job started waiting to be downloaded
+    #
+    :return:
+    """
+    publishedAt = getattr(self.video, "publishedAt", None)
+    if publishedAt is None:
+      return self.enqueuedAt
+    return min(self.enqueuedAt, publishedAt.timestamp())
+
+  @property
+  def key(self):
+    return self.video.id
+
+  def __str__(self):
+    return "[{}] {}".format(self.channel.title, self.video.title)
+
+
+class DownloadResult:
+  """
+  # The outcome of downloading one video
+  #  -<streamFiles> are the separate video/audio streams still waiting to
+  #   be merged, if merging was left to a MergePool
+  #  -<extractTime> and <transferTime> (seconds) are the time spent
+  #   extracting the video's info and transferring its <numBytes>
+  #  -<fileLoc> is the finished video file, once known
+  """
+
+  def __init__(self, success: bool, streamFiles: list = None, formatID: str = None, numBytes: int = None,
+               extractTime: float = None, transferTime: float = None, fileLoc: str = None):
+    self.success      = success
+    self.streamFiles  = [] if streamFiles is None else streamFiles
+    self.fileLoc      = fileLoc
+    self.formatID     = formatID
+    self.numBytes     = numBytes
+    self.extractTime  = extractTime
+    self.transferTime = transferTime
+
+  def __bool__(self):
+    return bool(self.success)
+
+  def needsMerge(self) -> bool:
+    return self.success and len(self.streamFiles) > 0
+
+
+class DownloadQueue:
+  """
+  # The jobs waiting to be downloaded, handed out in the order given by
+  # the queue's ordering policy
+  #  -whatever the policy, jobs from higher priority channels come first
+  """
+  
+  class Order(Enum):
+    
+    # the order jobs were added in (channel by channel)
+    CHANNEL        = "channel"
+    
+    # smallest estimated size first, with aging so large jobs aren't starved
+    SMALLEST_FIRST = "smallest-first"
+    
+    # most recently published first
+    NEWEST_FIRST   = "newest-first"
+  
+  
+  def __init__(self, order=None, agingHalfLife: float = None, clock=None):
+    """
+    # <agingHalfLife> (seconds): with SMALLEST_FIRST, a job's effective size
+    # halves every <agingHalfLife> seconds it has been waiting, counted from
+    # when its video was published (or when it was queued, if earlier or
+    # unknown), so a large video left behind by earlier runs isn't starved
+    # by a steady supply of small ones
+    #
+    :param order:
+    :param agingHalfLife:
+    :param clock:
+    """
+    
+    # CHECK: aging half life is valid
+    if agingHalfLife is not None and agingHalfLife <= 0:
+      raise ValueError("agingHalfLife must be > 0, or None")
+    
+    self.order         = DownloadQueue.Order.CHANNEL if order is None else DownloadQueue.Order(order)
+    self.agingHalfLife = agingHalfLife
+    self.clock         = time.time if clock is None else clock
+    
+    self._jobs    = []
+    self._counter = itertools.count()
+  
+  
+  def __len__(self):
+    return len(self._jobs)
+  
+  
+  def jobs(self) -> list:
+    """
+    # Return the jobs still waiting, in no particular order
+    #
+    :return:
+    """
+    return list(self._jobs)
+  
+  
+  def needsSizeEstimates(self) -> bool:
+    return self.order == DownloadQueue.Order.SMALLEST_FIRST
+  
+  
+  def push(self, job: DownloadJob):
+    job.enqueuedAt = self.clock()
+    job.sequence   = next(self._counter)
+    self._jobs.append(job)
+  
+  
+  def pop(self) -> DownloadJob:
+    """
+    # Remove and return the next job to download
+    #
+    :return:
+    """
+    if len(self._jobs) == 0:
+      raise IndexError("pop from an empty DownloadQueue")
+    
+    now = self.clock()
+    
+    # jobs of unknown size are treated as being as large as the largest known job
+    knownSizes = [job.estimatedSize for job in self._jobs if job.estimatedSize is not None]
+    unknownSize = max(knownSizes, default=0)
+    
+    nextJob = min(self._jobs, key=lambda job: self._sortKey(job, now, unknownSize))
+    self._jobs.remove(nextJob)
+    return nextJob
+  
+  
+  def _sortKey(self, job: DownloadJob, now: float, unknownSize: int) -> tuple:
+    
+    # higher priority channels first
+    priority = -(getattr(job.channel, "priority", 0) or 0)
+    
+    # jobs in the order they were added
+    if self.order == DownloadQueue.Order.CHANNEL:
+      return (priority, job.sequence)
+    
+    # newest videos first; undated videos last
+    if self.order == DownloadQueue.Order.NEWEST_FIRST:
+      publishedAt = getattr(job.video, "publishedAt", None)
+      return (priority, publishedAt is None, -publishedAt.timestamp() if publishedAt else 0, job.sequence)
+    
+    # smallest (aged) size first
+    size = unknownSize if job.estimatedSize is None else job.estimatedSize
+    if self.agingHalfLife is not None:
+      size *= 0.5 ** (max(now - job.waitingSince(), 0) / self.agingHalfLife)
+    return (priority, size, job.sequence)
+
+
+class DiskSpaceGuard:
+  """
+  # Admission control for downloads: a job is only started if its estimated
+  # size fits in the free space of the download directory, after taking
+  # away the space already reserved by in-flight jobs and a safety margin
+  """
+
+  def __init__(self, directory: str, minFreeSpace: int = 0, diskUsage=None):
+
+    # CHECK: minFreeSpace is valid
+    if not isinstance(minFreeSpace, int) or minFreeSpace < 0:
+      raise ValueError("minFreeSpace must be an int >= 0")
+
+    self.directory    = directory
+    self.minFreeSpace = minFreeSpace
+    self.diskUsage    = shutil.disk_usage if diskUsage is None else diskUsage
+
+    # bytes reserved by each in-flight job
+    self.reservations = {}
+    self._lock        = threading.Lock()
+
+
+  def reservedBytes(self) -> int:
+    with self._lock:
+      return sum(self.reservations.values())
+
+
+  def availableBytes(self) -> int:
+    """
+    # Free space we can still hand out to new jobs
+    #
+    :return:
+    """
+    free = self.diskUsage(self.directory).free
+    return free - self.reservedBytes() - self.minFreeSpace
+
+
+  def admit(self, job: DownloadJob) -> bool:
+    """
+    # Reserve space for <job> if it fits, and report whether it was admitted
+    #  -jobs whose size couldn't be estimated are admitted without a
+    #   reservation, as we have nothing to compare
+    #
+    :param job:
+    :return:
+    """
+
+    # nothing to compare against
+    if job.estimatedSize is None:
+      logger.info("Disk space: admitting {} (size unknown, {} reserved)"
+                  .format(job, formatBytes(self.reservedBytes())))
+      return True
+
+    with self._lock:
+      free      = self.diskUsage(self.directory).free
+      reserved  = sum(self.reservations.values())
+      available = free - reserved - self.minFreeSpace
+
+      # not enough space: defer
+      if job.estimatedSize > available:
+        logger.warning("Disk space: deferring {}: needs {}, only {} available ({} free, {} reserved, {} kept free)"
+                       .format(job, formatBytes(job.estimatedSize), formatBytes(max(available, 0)),
+                               formatBytes(free), formatBytes(reserved), formatBytes(self.minFreeSpace)))
+        return False
+
+      # reserve the space
+      self.reservations[job.key] = job.estimatedSize
+      logger.info("Disk space: admitting {}: reserved {} ({} now reserved, {} free)"
+                  .format(job, formatBytes(job.estimatedSize), formatBytes(reserved + job.estimatedSize),
+                          formatBytes(free)))
+      return True
+
+
+  def release(self, job: DownloadJob):
+    """
+    # Give back <job>'s reservation once it has finished
+    #  -its files are now on disk, so are counted in the free space instead
+    #
+    :param job:
+    :return:
+    """
+    with self._lock:
+      released = self.reservations.pop(job.key, None)
+    if released is not None:
+      logger.debug("DiskSpaceGuard: released {} for {}".format(formatBytes(released), job))
@@ -6,11 +6,11 @@ import re
 import math
 import pickle
 import base64
+import urllib.parse
 from datetime import timedelta
 
-import google_auth_oauthlib.flow
-import googleapiclient.discovery
-import googleapiclient.errors
+# the Google API libraries are slow to import, so they're only imported
+# when a flow or client is actually built
 
 
 class Fetcher:
@@ -134,6 +134,7 @@ class Fetcher:
     # create a flow and use it to get credentials
     #  -requires human interaction
     logger.info("Fetching credentials:")
+    import google_auth_oauthlib.flow
     flow = google_auth_oauthlib.flow.InstalledAppFlow.from_client_secrets_file(
       clientSecretsFile, Fetcher.SCOPES)
     credentials = flow.run_console()
@@ -172,6 +173,31 @@ class Fetcher:
     """
     return Fetcher.VIDEO_URL_PREFIX + videoID
   
+  @staticmethod
+  def parseVideoID(videoURL: str):
+    """
+    # Return the ID of the youtube video at <videoURL>, or None if it isn't
+    # a recognised video link
+    #  -handles "watch?v=<id>", "youtu.be/<id>", "shorts/<id>" and "live/<id>"
+    #
+    :param videoURL:
+    :return:
+    """
+    parsed = urllib.parse.urlparse(videoURL)
+    host   = parsed.netloc.lower().split(":")[0]
+    parts  = [part for part in parsed.path.split("/") if part]
+    
+    if host.endswith("youtu.be"):
+      videoID = parts[0] if len(parts) > 0 else None
+    elif len(parts) == 2 and parts[0] in ["shorts", "live", "embed"]:
+      videoID = parts[1]
+    else:
+      videoID = urllib.parse.parse_qs(parsed.query).get("v", [None])[0]
+    
+    if videoID is None or re.fullmatch(r"[A-Za-z0-9_-]{11}", videoID) is None:
+      return None
+    return videoID
+  
   
   def __init__(self, clientSecretsFile, pickledCredentials):
     
@@ -200,6 +226,7 @@ class Fetcher:
     }
     
     # create the youtube client
+    import googleapiclient.discovery
     self.youtubeClient = googleapiclient.discovery.build(
                            Fetcher.API_SERVICE_NAME,
                            Fetcher.API_VERSION,
@@ -254,7 +281,17 @@ class Fetcher:
     # get the first page of channels I'm subscribed to
     logger.debug("fetchMySubscriptions: Getting first page")
     data      = _requestMySubscriptions()
-    channList = Fetcher._parseSubscriptions(data)
+    channList = []
+    channIDs  = set()
+    
+    # add each channel on a page that we haven't seen before
+    def _addPage(pageData):
+      for item in Fetcher._parseSubscriptions(pageData):
+        if item.id not in channIDs:
+          channIDs.add(item.id)
+          channList.append(item)
+    
+    _addPage(data)
     logger.debug("fetchMySubscriptions: Got {} channels".format(len(channList)))
     
     # if there are other pages
@@ -265,26 +302,21 @@ class Fetcher:
       # as "next" pages seem to return results from previous pages as well, we
       # will need to fetch the next page more times
       #  -max attempts = expected * <maxNextPageAttemptMultiplier>
+      #  -we stop as soon as we have all <totalChannels> IDs, or there are
+      #   no more pages
       attempt = 0
       maxAttempts = (int(math.ceil(totalChannels / maxResultsPerPage)) - 1) * maxNextPageAttemptMultiplier
       
       # iterate over the remaining pages and get the subscriptions
       logger.debug("fetchMySubscriptions: Max next-page attempts: {}".format(maxAttempts))
-      while len(channList) < totalChannels and attempt < maxAttempts:
+      while len(channIDs) < totalChannels and attempt < maxAttempts and nextPageToken is not None:
         attempt += 1
         
         # get the next page of channels
         logger.debug("fetchMySubscriptions: ({}/{} attempts) getting next page".format(attempt, maxAttempts))
         data          = _requestMySubscriptions(pageToken=nextPageToken)
-        pageChanns    = Fetcher._parseSubscriptions(data)
         nextPageToken = data.get("nextPageToken", None)
-        logger.debug("fetchMySubscriptions: Got {} channels".format(len(pageChanns)))
-        
-        
-        # for each channel on this page, if it hasn't been seen before, add it
-        for item in pageChanns:
-          if item not in channList:
-            channList.append(item)
+        _addPage(data)
         logger.debug("fetchMySubscriptions: Channels count now {}/{}".format(len(channList), totalChannels))
     
     
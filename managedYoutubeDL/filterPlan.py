@@ -0,0 +1,308 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import re
+
+from managedYoutubeDL.items import Video
+from managedYoutubeDL.logSetup import logFields
+
+
+def _compare(comparison, value1, value2):
+  """
+  # Compare two values of the same type, where one or more may be None
+  #
+  :param comparison: "max" or "min"
+  :param value1:
+  :param value2:
+  :return:
+  """
+  if   value1 is None: return value2
+  elif value2 is None: return value1
+  else:
+    return {
+      "max": max,
+      "min": min,
+    }.get(comparison)(value1, value2)
+
+
+class FilterPredicate:
+  """
+  # One test a video must pass to be downloaded
+  #  -<test>(video) returns whether the video passes
+  #  -<reason> is logged when a video fails it
+  #  -<cost> is the rough relative cost of running it once
+  """
+
+  # relative costs: an in-memory check, a regex search, a YouTube API call,
+  # and a yt-dlp extraction
+  COST_MEMORY     = 1
+  COST_REGEX      = 5
+  COST_API        = 1000
+  COST_EXTRACTION = 20000
+
+  def __init__(self, name: str, test, reason: str, cost: float):
+    self.name   = name
+    self.test   = test
+    self.reason = reason
+    self.cost   = cost
+
+  def rank(self, evaluated: int, rejected: int) -> float:
+    """
+    # Expected cost of running this predicate per video it rejects, given
+    # it has <rejected> of the <evaluated> videos so far
+    #  -running predicates in increasing rank order minimises the expected
+    #   cost of filtering a video
+    #
+    :param evaluated:
+    :param rejected:
+    :return:
+    """
+    # start from an even chance of rejecting a video
+    rejectRate = (rejected + 1) / (evaluated + 2)
+    return self.cost / rejectRate
+
+
+class FilterPlan:
+  """
+  # A channel's filters, combined with the global ones and compiled once
+  #  -the plan is rebuilt only when the channel's or the global filter
+  #   settings change (see settingsKey())
+  #  -predicates run cheapest-and-most-selective first, using each one's
+  #   cost and how often it has rejected videos (kept in <stats>)
+  #  -a video is rejected by the first predicate it fails
+  #  -the metadata filters (description, tags, view count) share one
+  #   yt-dlp extraction per video
+  #  -a video whose duration or info couldn't be fetched is neither passed
+  #   nor rejected, but deferred (see <deferred>), so it's checked again
+  #   next run
+  """
+
+  REGEX_FLAGS = re.MULTILINE | re.IGNORECASE
+
+
+  @staticmethod
+  def settingsKey(manager, channel) -> tuple:
+    """
+    # The filter settings a plan for <channel> is built from
+    #
+    :param manager:
+    :param channel:
+    :return:
+    """
+    return (
+      channel.minVideoDate,   manager.globalMinVideoDate,
+      channel.maxVideoDate,   manager.globalMaxVideoDate,
+      channel.includeFilter,  manager.globalIncludeFilter,
+      channel.excludeFilter,  manager.globalExcludeFilter,
+      channel.minVideoLength, manager.globalMinVideoLength,
+      channel.maxVideoLength, manager.globalMaxVideoLength,
+      channel.descriptionFilter, manager.globalDescriptionFilter,
+      channel.tagFilter,         manager.globalTagFilter,
+      channel.minViewCount,      manager.globalMinViewCount,
+    )
+
+
+  def __init__(self, manager, channel, stats: dict = None):
+    """
+    #
+    :param manager:
+    :param channel:
+    :param stats: predicate name -> [evaluated, rejected] counts to carry on
+                  from the channel's previous plan
+    """
+    self.manager    = manager
+    self.channel    = channel
+    self.key        = FilterPlan.settingsKey(manager, channel)
+    self.stats      = {} if stats is None else stats
+    self.predicates = self._buildPredicates()
+
+    # video ID -> yt-dlp info, for the videos being evaluated
+    self._metadata  = {}
+
+    # IDs of the videos being evaluated that a predicate couldn't decide on
+    self._undecided = set()
+
+    # the videos the last evaluate() deferred
+    self.deferred   = []
+
+
+  @property
+  def rejections(self) -> dict:
+    return {name: rejected for name, (_, rejected) in self.stats.items() if rejected > 0}
+
+
+  def _buildPredicates(self) -> list:
+    manager    = self.manager
+    channel    = self.channel
+    predicates = []
+
+    # not seen this video before
+    predicates.append(FilterPredicate("seen", lambda video: not manager.haveSeenVideo(channel, video),
+                                      "seen before", FilterPredicate.COST_MEMORY))
+
+    # video min/max date
+    minVideoDate = _compare("max", channel.minVideoDate, manager.globalMinVideoDate)
+    maxVideoDate = _compare("min", channel.maxVideoDate, manager.globalMaxVideoDate)
+    if minVideoDate is not None:
+      predicates.append(FilterPredicate("minVideoDate", lambda video: video.publishedAt >= minVideoDate,
+                                        "published before min date", FilterPredicate.COST_MEMORY))
+    if maxVideoDate is not None:
+      predicates.append(FilterPredicate("maxVideoDate", lambda video: video.publishedAt <= maxVideoDate,
+                                        "published after max date", FilterPredicate.COST_MEMORY))
+
+    # regex video title inclusion, then exclusion
+    for name, pattern in [("channelIncludeFilter", channel.includeFilter),
+                          ("globalIncludeFilter",  manager.globalIncludeFilter)]:
+      if pattern:
+        regex = re.compile(pattern, FilterPlan.REGEX_FLAGS)
+        predicates.append(FilterPredicate(name, lambda video, regex=regex: regex.search(video.title) is not None,
+                                          "didn't match include filter", FilterPredicate.COST_REGEX))
+    for name, pattern in [("channelExcludeFilter", channel.excludeFilter),
+                          ("globalExcludeFilter",  manager.globalExcludeFilter)]:
+      if pattern:
+        regex = re.compile(pattern, FilterPlan.REGEX_FLAGS)
+        predicates.append(FilterPredicate(name, lambda video, regex=regex: regex.search(video.title) is None,
+                                          "matched exclude filter", FilterPredicate.COST_REGEX))
+
+    # video duration: an API call
+    minVideoLength = _compare("max", channel.minVideoLength, manager.globalMinVideoLength)
+    maxVideoLength = _compare("min", channel.maxVideoLength, manager.globalMaxVideoLength)
+    if minVideoLength or maxVideoLength:
+      predicates.append(FilterPredicate("videoLength",
+                                        lambda video: self._checkDuration(video, minVideoLength, maxVideoLength),
+                                        "video length out of range", FilterPredicate.COST_API))
+
+    # video description and tags: one of them must match each pattern
+    for name, pattern, field, reason in [
+        ("channelDescriptionFilter", channel.descriptionFilter,       "description", "didn't match description filter"),
+        ("globalDescriptionFilter",  manager.globalDescriptionFilter, "description", "didn't match description filter"),
+        ("channelTagFilter",         channel.tagFilter,               "tags",        "no tag matched tag filter"),
+        ("globalTagFilter",          manager.globalTagFilter,         "tags",        "no tag matched tag filter")]:
+      if pattern:
+        regex = re.compile(pattern, FilterPlan.REGEX_FLAGS)
+        predicates.append(FilterPredicate(
+          name, lambda video, regex=regex, field=field: self._matchMetadata(video, field, regex),
+          reason, FilterPredicate.COST_EXTRACTION))
+
+    # video view count
+    minViewCount = _compare("max", channel.minViewCount, manager.globalMinViewCount)
+    if minViewCount:
+      predicates.append(FilterPredicate("minViewCount", lambda video: self._checkViewCount(video, minViewCount),
+                                        "too few views", FilterPredicate.COST_EXTRACTION))
+
+    return predicates
+
+
+  def _getMetadata(self, video: Video) -> dict:
+    """
+    # <video>'s yt-dlp info, or None (and <video> is undecided) if it
+    # couldn't be extracted
+    #
+    :param video:
+    :return:
+    """
+    if video.id not in self._metadata:
+      info = self.manager.getVideoMetadata(self.channel, video)
+      if info.get("error") is not None:
+        logger.error("Deferred (info unknown): [{}] {}".format(self.channel.title, video.title),
+                     extra=logFields(self.channel, video))
+        self._undecided.add(video.id)
+        info = None
+      self._metadata[video.id] = info
+    return self._metadata[video.id]
+
+
+  def _checkViewCount(self, video: Video, minViewCount: int) -> bool:
+    info = self._getMetadata(video)
+    if info is None:
+      return False
+    return (info["viewCount"] or 0) >= minViewCount
+
+
+  def _matchMetadata(self, video: Video, field: str, regex) -> bool:
+    info = self._getMetadata(video)
+    if info is None:
+      return False
+    value = info[field]
+    if field == "tags":
+      return any(regex.search(tag) is not None for tag in value or [])
+    return value is not None and regex.search(value) is not None
+
+
+  def orderPredicates(self) -> list:
+    """
+    # Sort the predicates by rank, cheapest-and-most-selective first
+    #
+    :return:
+    """
+    def rank(predicate):
+      evaluated, rejected = self.stats.get(predicate.name, (0, 0))
+      return predicate.rank(evaluated, rejected)
+    self.predicates.sort(key=rank)
+    return self.predicates
+
+
+  def _checkDuration(self, video: Video, minVideoLength, maxVideoLength) -> bool:
+
+    # get this video's duration
+    videoDetails = self.manager.ytFetcher.fetchVideoDetails(video)
+    if videoDetails is None or videoDetails["duration"] is None:
+      logger.error("Deferred (duration unknown): [{}] {}".format(self.channel.title, video.title),
+                   extra=logFields(self.channel, video))
+      self._undecided.add(video.id)
+      return False
+
+    # reject this video if it's too short or too long
+    if minVideoLength and videoDetails["duration"] < minVideoLength:
+      logger.debug("FilterPlan: video length too short ({} < {})".format(videoDetails["duration"], minVideoLength))
+      return False
+    if maxVideoLength and videoDetails["duration"] > maxVideoLength:
+      logger.debug("FilterPlan: video length too long ({} > {})".format(videoDetails["duration"], maxVideoLength))
+      return False
+    return True
+
+
+  def evaluate(self, videoList: list) -> list:
+    """
+    # Return the videos in <videoList> that pass every predicate
+    #  -videos a predicate couldn't decide on are left in <deferred>
+    #
+    :param videoList:
+    :return:
+    """
+    self.orderPredicates()
+
+    # per-video debug lines are only built if they'll be logged
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    approvedVideos = []
+    self.deferred  = []
+    for video in videoList:
+
+      # CHECK: item is a video
+      if not isinstance(video, Video):
+        raise TypeError("{} is not a Video".format(video))
+
+      if debug:
+        logger.debug("filterChannelVideos: Filtering video: %s", video.title, extra=logFields(self.channel, video))
+
+      for predicate in self.predicates:
+        passed = predicate.test(video)
+        counts = self.stats.setdefault(predicate.name, [0, 0])
+        counts[0] += 1
+        if not passed:
+          if video.id in self._undecided:
+            self.deferred.append(video)
+            break
+          if debug:
+            logger.debug("filterChannelVideos: FILTERED OUT: %s", predicate.reason,
+                         extra=logFields(self.channel, video))
+          counts[1] += 1
+          break
+      else:
+        approvedVideos.append(video)
+
+    # the extracted info is only needed while filtering
+    self._metadata  = {}
+    self._undecided = set()
+    return approvedVideos
@@ -6,11 +6,45 @@ import re
 from datetime import timedelta
 
 class Item:
-  pass
+  """
+  # Items keep their fields in __slots__ (listed in FIELDS), rather than a
+  # __dict__, so large channel lists stay small, and hash on their ID so
+  # they can be kept in sets and dicts
+  #  -equal items have equal IDs, so changing an item's ID while it's in a
+  #   set or dict loses it
+  """
+  __slots__ = ()
+  FIELDS    = ()
+  
+  def toDict(self) -> dict:
+    """
+    # Return the item's fields, in FIELDS order
+    #
+    :return:
+    """
+    return dict([(key, getattr(self, key)) for key in self.FIELDS])
+  
+  def _checkFieldNames(self, kwargs):
+    # CHECK: no extra attributes were passed
+    extraKeys = [x for x in kwargs if x not in self._FIELD_SET]
+    if len(extraKeys) > 0:
+      raise AttributeError("unknown attribute(s): {}".format(extraKeys))
+  
+  def __hash__(self):
+    return hash(self.id)
 
 
 class Channel(Item):
   
+  FIELDS = ("title", "id", "publishedAt", "ignore", "excludeFilter", "includeFilter", "minVideoDate",
+            "maxVideoDate", "minVideoLength", "maxVideoLength", "priority", "pollInterval",
+            "pollIntervalOverride", "lastPolledAt", "descriptionFilter", "tagFilter", "minViewCount")
+  __slots__  = FIELDS
+  _FIELD_SET = frozenset(FIELDS)
+  
+  # fields each run updates, rather than the user (see StateStore)
+  STATE_FIELDS = ["minVideoDate", "lastPolledAt", "pollInterval"]
+  
   def setTitle(self, title):
     self.title = title
   
@@ -38,6 +72,55 @@ class Channel(Item):
     from managedYoutubeDL import convertTime
     self.maxVideoDate = convertTime(maxVideoDate)
   
+  def setPriority(self, priority):
+    if priority is None:
+      self.priority = 0
+    elif isinstance(priority, int) and not isinstance(priority, bool):
+      self.priority = priority
+    else:
+      raise TypeError("priority must be an int or None")
+    
+  def setPollInterval(self, pollInterval):
+    self.pollInterval = Channel._toInterval("pollInterval", pollInterval)
+  
+  def setPollIntervalOverride(self, pollIntervalOverride):
+    self.pollIntervalOverride = Channel._toInterval("pollIntervalOverride", pollIntervalOverride)
+  
+  def setLastPolledAt(self, lastPolledAt):
+    from managedYoutubeDL import convertTime
+    self.lastPolledAt = convertTime(lastPolledAt)
+  
+  def setDescriptionFilter(self, descriptionFilter):
+    self.descriptionFilter = descriptionFilter
+  
+  def setTagFilter(self, tagFilter):
+    self.tagFilter = tagFilter
+  
+  def setMinViewCount(self, minViewCount):
+    self.minViewCount = Channel._toViewCount("minViewCount", minViewCount)
+  
+  @staticmethod
+  def _toViewCount(name, value):
+    if value is None:
+      return None
+    if not isinstance(value, int) or isinstance(value, bool):
+      raise TypeError("{} must be an int or None".format(name))
+    if value < 0:
+      raise ValueError("{} must be >= 0".format(name))
+    return value
+  
+  @staticmethod
+  def _toInterval(name, value):
+    if value is None:
+      return None
+    if isinstance(value, int) and not isinstance(value, bool):
+      value = timedelta(seconds=value)
+    if not isinstance(value, timedelta):
+      raise TypeError("{} must be an int, None, or timedelta".format(name))
+    if value.total_seconds() <= 0:
+      raise ValueError("{} must be positive".format(name))
+    return value
+    
   def setMinVideoLength(self, minVideoLength):
     if isinstance(minVideoLength, int):
       self.minVideoLength = timedelta(seconds=minVideoLength)
@@ -69,6 +152,13 @@ class Channel(Item):
     self.maxVideoDate   = None
     self.minVideoLength = None
     self.maxVideoLength = None
+    self.priority       = None
+    self.pollInterval   = None
+    self.pollIntervalOverride = None
+    self.lastPolledAt   = None
+    self.descriptionFilter = None
+    self.tagFilter         = None
+    self.minViewCount      = None
     
     # channel details
     self.setTitle(kwargs.get("title", None))
@@ -92,16 +182,50 @@ class Channel(Item):
     self.setMinVideoDate(kwargs.get("minVideoDate", datetime.datetime.fromtimestamp(0, datetime.timezone.utc)))
     self.setMaxVideoDate(kwargs.get("maxVideoDate", None))
     
+    # download priority: higher priority channels are downloaded first
+    self.setPriority(kwargs.get("priority", 0))
+    
+    # polling: the interval learned from the channel's upload history, a
+    # manual interval that replaces it, and when we last polled
+    self.setPollInterval(kwargs.get("pollInterval", None))
+    self.setPollIntervalOverride(kwargs.get("pollIntervalOverride", None))
+    self.setLastPolledAt(kwargs.get("lastPolledAt", None))
+    
+    # metadata filters: include videos whose description/a tag matches, and
+    # that have at least <minViewCount> views
+    self.setDescriptionFilter(kwargs.get("descriptionFilter", None))
+    self.setTagFilter(kwargs.get("tagFilter", None))
+    self.setMinViewCount(kwargs.get("minViewCount", None))
+    
     
     # CHECK: no extra attributes were passed
-    extraKeys = [x for x in kwargs if x not in self.__dict__.keys()]
-    if len(extraKeys) > 0:
-      raise AttributeError("unknown attribute(s): {}".format(extraKeys))
+    self._checkFieldNames(kwargs)
   
     
   def __str__(self):
-    return "\n".join(["{}: {}".format(k,v) for k,v in self.__dict__.items()])
+    return "\n".join(["{}: {}".format(k,v) for k,v in self.toDict().items()])
+
 
+  def getPollInterval(self):
+    """
+    # Return how often this channel should be polled: the manual override
+    # if there is one, otherwise the learned interval (None if unknown)
+    #
+    :return:
+    """
+    return self.pollIntervalOverride if self.pollIntervalOverride is not None else self.pollInterval
+
+  def isDueForPoll(self, now: datetime.datetime) -> bool:
+    """
+    # Is it time to poll this channel again
+    #
+    :param now:
+    :return:
+    """
+    interval = self.getPollInterval()
+    if interval is None or self.lastPolledAt is None:
+      return True
+    return now - self.lastPolledAt >= interval
 
   def __eq__(self, other):
     if not isinstance(other, Channel):
@@ -109,11 +233,16 @@ class Channel(Item):
     else:
       return self.title == other.title and self.id == other.id
   
+  __hash__ = Item.__hash__
   
 
   
 class Video(Item):
   
+  FIELDS     = ("title", "id", "thumbnailURL", "publishedAt")
+  __slots__  = FIELDS
+  _FIELD_SET = frozenset(FIELDS)
+  
   def __init__(self, **kwargs):
     from managedYoutubeDL import convertTime
     
@@ -125,9 +254,7 @@ class Video(Item):
     self.publishedAt = convertTime(publishedAt)
     
     # CHECK: no extra attributes were passed
-    extraKeys = [x for x in kwargs if x not in self.__dict__.keys()]
-    if len(extraKeys) > 0:
-      raise AttributeError("unknown attribute(s): {}".format(extraKeys))
+    self._checkFieldNames(kwargs)
     
     
   def __str__(self):
@@ -142,4 +269,5 @@ class Video(Item):
       return False
     else:
       return self.title == other.title and self.id == other.id
-    
\ No newline at end of file
+  
+  __hash__ = Item.__hash__
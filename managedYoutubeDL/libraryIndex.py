@@ -0,0 +1,204 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import json
+import os
+import re
+
+
+class LibraryIndex:
+  """
+  # A persistent index of the videos already in the download directory,
+  # mapping video ID -> file name, size and mtime
+  #
+  # Downloaded files are named "...-<videoID>.<ext>" (see the output
+  # templates in Manager._buildDownloadOptions and manual-download), so the
+  # index can be rebuilt from a single scan of the directory. The scan is
+  # skipped while the directory's mtime matches the one recorded with the
+  # index, i.e., while no files have been added, removed or renamed.
+  """
+
+  INDEX_VERSION = 1
+
+  # "<anything>-<11 character video ID>.<extension>"
+  VIDEO_FILE_PATTERN = re.compile(r"-([A-Za-z0-9_-]{11})\.([A-Za-z0-9]+)$")
+
+  # final video/audio files; partial downloads, separate streams
+  # (".f137.mp4"), thumbnails and subtitles are not indexed
+  VIDEO_EXTENSIONS = {"mkv", "mp4", "webm", "m4a", "mp3", "opus", "ogg", "flv", "avi", "mov"}
+
+
+  @staticmethod
+  def parseVideoID(fileName: str):
+    """
+    # Return the video ID in a downloaded <fileName>, or None if it isn't
+    # a downloaded video
+    #
+    :param fileName:
+    :return:
+    """
+    match = LibraryIndex.VIDEO_FILE_PATTERN.search(fileName)
+    if match is None or match.group(2).lower() not in LibraryIndex.VIDEO_EXTENSIONS:
+      return None
+    return match.group(1)
+
+
+  def __init__(self, indexFile: str, directory: str):
+
+    # CHECK: directory exists
+    if not os.path.isdir(directory):
+      raise NotADirectoryError("library directory does not exist: {}".format(directory))
+
+    self.indexFile = indexFile
+    self.directory = directory
+
+    # video ID -> {"path", "size", "mtime"}
+    self.entries        = {}
+    self.directoryMtime = None
+
+    # load any saved index, then make sure it's up to date
+    self.load()
+    self.refresh()
+
+
+  def __len__(self):
+    return len(self.entries)
+
+
+  def _getDirectoryMtime(self):
+    return os.stat(self.directory).st_mtime_ns
+
+
+  def load(self):
+    """
+    # Load the saved index, if there is one for this directory
+    #
+    :return:
+    """
+    if self.indexFile is None or not os.path.exists(self.indexFile):
+      return
+
+    try:
+      with open(self.indexFile, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    except (OSError, ValueError) as err:
+      logger.warning("LibraryIndex: Ignoring unreadable index {}: {}".format(self.indexFile, err))
+      return
+
+    # CHECK: index is for this directory and in a format we understand
+    if data.get("version") != LibraryIndex.INDEX_VERSION or \
+       os.path.realpath(data.get("directory", "")) != os.path.realpath(self.directory):
+      logger.info("LibraryIndex: Saved index doesn't match {}; rebuilding".format(self.directory))
+      return
+
+    self.entries        = data.get("entries", {})
+    self.directoryMtime = data.get("directoryMtime", None)
+
+
+  def save(self):
+    """
+    # Save the index, replacing the previous version in a single step
+    #
+    :return:
+    """
+    if self.indexFile is None:
+      return
+
+    data = {
+      "version":        LibraryIndex.INDEX_VERSION,
+      "directory":      os.path.realpath(self.directory),
+      "directoryMtime": self.directoryMtime,
+      "entries":        self.entries,
+    }
+    tmpFileLoc = "{}.tmp".format(self.indexFile)
+    with open(tmpFileLoc, "w", encoding="utf-8") as f:
+      json.dump(data, f)
+    os.replace(tmpFileLoc, self.indexFile)
+
+
+  def refresh(self):
+    """
+    # Rescan the directory if it has changed since the index was built
+    #
+    :return:
+    """
+    if self.directoryMtime != self._getDirectoryMtime():
+      self.scan()
+
+
+  def scan(self):
+    """
+    # Rebuild the index from a single scan of the directory
+    #
+    :return:
+    """
+    directoryMtime = self._getDirectoryMtime()
+
+    entries = {}
+    with os.scandir(self.directory) as it:
+      for entry in it:
+        videoID = LibraryIndex.parseVideoID(entry.name)
+        if videoID is None or not entry.is_file():
+          continue
+        stats = entry.stat()
+        entries[videoID] = {"path": entry.name, "size": stats.st_size, "mtime": stats.st_mtime}
+
+    logger.debug("LibraryIndex: Found {} videos in {}".format(len(entries), self.directory))
+    self.entries        = entries
+    self.directoryMtime = directoryMtime
+
+
+  def hasVideo(self, videoID: str) -> bool:
+    """
+    # Is the video with <videoID> in the library
+    #  -entries whose file has since been deleted are dropped
+    #
+    :param videoID:
+    :return:
+    """
+    entry = self.entries.get(videoID, None)
+    if entry is None:
+      return False
+
+    if not os.path.exists(os.path.join(self.directory, entry["path"])):
+      del self.entries[videoID]
+      return False
+    return True
+
+
+  def getVideoPath(self, videoID: str):
+    entry = self.entries.get(videoID, None)
+    return None if entry is None else os.path.join(self.directory, entry["path"])
+
+
+  def addVideo(self, videoID: str, fileLoc: str) -> bool:
+    """
+    # Add the newly downloaded video with <videoID>, saved to <fileLoc>, to
+    # the index, without rescanning the directory. Returns whether it was
+    # added.
+    #  -the recorded directory mtime is left alone, so files added or
+    #   removed by anyone else are still picked up by the next refresh(),
+    #   as is this video if its file isn't known
+    #
+    :param videoID:
+    :param fileLoc:
+    :return:
+    """
+    if fileLoc is None:
+      logger.debug("LibraryIndex: No file for video {}; it will be indexed on the next rescan".format(videoID))
+      return False
+
+    fileName = os.path.basename(fileLoc)
+    if LibraryIndex.parseVideoID(fileName) != videoID or \
+       os.path.realpath(os.path.dirname(os.path.abspath(fileLoc))) != os.path.realpath(self.directory):
+      logger.warning("LibraryIndex: {} isn't a downloaded file for video {}".format(fileLoc, videoID))
+      return False
+
+    try:
+      stats = os.stat(fileLoc)
+    except OSError as err:
+      logger.warning("LibraryIndex: Couldn't find the downloaded file for video {}: {}".format(videoID, err))
+      return False
+
+    self.entries[videoID] = {"path": fileName, "size": stats.st_size, "mtime": stats.st_mtime}
+    return True
@@ -0,0 +1,191 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import copy
+import datetime
+import json
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+# extra record attributes (see logFields) that get their own JSON field
+LOG_FIELDS = ("channelID", "videoID")
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# log file rotation
+MAX_BYTES    = 5000000
+BACKUP_COUNT = 5
+
+
+def logFields(channel=None, video=None) -> dict:
+  """
+  # The extra fields of a log record about <channel> and/or <video>, e.g.
+  #   logger.info("...", extra=logFields(channel, video))
+  #
+  :param channel:
+  :param video:
+  :return:
+  """
+  fields = {}
+  if channel is not None:
+    fields["channelID"] = channel.id
+  if video is not None:
+    fields["videoID"] = video.id
+  return fields
+
+
+class LazyJoin:
+  """
+  # A log argument that joins <items> (each passed through <key>) when the
+  # message is formatted, e.g.
+  #   logger.debug("Ignoring: %s", LazyJoin(channelList, key=lambda x: x.title))
+  #  -so the join is only done if the record is written, and then on the
+  #   log pipeline's thread rather than the caller's
+  """
+
+  def __init__(self, items, key=str, separator: str = ", "):
+    self.items     = items
+    self.key       = key
+    self.separator = separator
+
+  def __str__(self):
+    return self.separator.join(self.key(item) for item in self.items)
+
+
+class JSONFormatter(logging.Formatter):
+  """
+  # Format each record as one line of JSON, with the record's LOG_FIELDS
+  # (if set) as fields of their own
+  """
+
+  def format(self, record: logging.LogRecord) -> str:
+    entry = {
+      "time":    datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+      "level":   record.levelname,
+      "logger":  record.name,
+      "message": record.getMessage(),
+    }
+    for field in LOG_FIELDS:
+      value = getattr(record, field, None)
+      if value is not None:
+        entry[field] = value
+    if record.exc_info and not record.exc_text:
+      record.exc_text = self.formatException(record.exc_info)
+    if record.exc_text:
+      entry["exception"] = record.exc_text
+    return json.dumps(entry, ensure_ascii=False)
+
+
+class _QueueHandler(QueueHandler):
+  """
+  # A QueueHandler that leaves a record's message to be formatted by the
+  # listener thread, and keeps its traceback out of the message, so the
+  # JSON formatter can give it its own field
+  #  -the queue is in-process, so the message's args aren't pickled, and
+  #   are formatted after the log call returns: don't log args that are
+  #   changed afterwards
+  #  -the traceback is formatted here, while its frames are still current
+  """
+
+  def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+    record = copy.copy(record)
+    if record.exc_info:
+      record.exc_text = logging.Formatter().formatException(record.exc_info)
+      record.exc_info = None
+    return record
+
+
+class LogPipeline:
+  """
+  # Root-logger output through a queue: a log call only puts the record on
+  # the queue, and a background thread formats and writes it out
+  #  -a forked child (e.g. a download process) has the queue but not the
+  #   thread, so it writes to the handlers directly instead
+  """
+
+  # pipelines running in this process
+  _running = []
+
+  def __init__(self, handlers: list, level: int = logging.DEBUG):
+    self.handlers     = handlers
+    self.level        = level
+    self.queueHandler = _QueueHandler(queue.SimpleQueue())
+    self.listener     = QueueListener(self.queueHandler.queue, *handlers, respect_handler_level=True)
+
+
+  def start(self):
+    """
+    # Send the root logger's records through the queue
+    #  -the root logger's level is lowered to our level if need be, so
+    #   records below it are dropped before they're built
+    #
+    :return:
+    """
+    root = logging.getLogger("")
+    if root.getEffectiveLevel() > self.level:
+      root.setLevel(self.level)
+    self.listener.start()
+    root.addHandler(self.queueHandler)
+    LogPipeline._running.append(self)
+
+
+  def stop(self):
+    """
+    # Write out any queued records, stop the thread and close the handlers
+    #  -safe to call more than once
+    #
+    :return:
+    """
+    if self not in LogPipeline._running:
+      return
+    LogPipeline._running.remove(self)
+    logging.getLogger("").removeHandler(self.queueHandler)
+    self.listener.stop()
+    for handler in self.handlers:
+      handler.close()
+
+
+  def _writeDirectly(self):
+    root = logging.getLogger("")
+    root.removeHandler(self.queueHandler)
+    for handler in self.handlers:
+      root.addHandler(handler)
+
+
+  @staticmethod
+  def _afterForkInChild():
+    for pipeline in LogPipeline._running:
+      pipeline._writeDirectly()
+    LogPipeline._running.clear()
+
+
+if hasattr(os, "register_at_fork"):
+  os.register_at_fork(after_in_child=LogPipeline._afterForkInChild)
+
+
+def startFileLogging(logDirectory: str, fileName: str, jsonLines: bool = False,
+                     level: int = logging.DEBUG) -> LogPipeline:
+  """
+  # Log to a rotating file in <logDirectory>, written by a background thread
+  #
+  :param logDirectory:
+  :param fileName: log file name, without extension
+  :param jsonLines: write JSON lines (<fileName>.jsonl) instead of text (<fileName>.log)
+  :param level:
+  :return: the running pipeline; stop() it to flush the log before exiting
+  """
+
+  # CHECK: log file can be created
+  if not os.path.isdir(logDirectory):
+    raise FileNotFoundError("log directory does not exist: {}".format(logDirectory))
+
+  fileLoc     = os.path.join(logDirectory, "{}.{}".format(fileName, "jsonl" if jsonLines else "log"))
+  fileHandler = RotatingFileHandler(filename=fileLoc, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding="utf-8")
+  fileHandler.setLevel(level)
+  fileHandler.setFormatter(JSONFormatter() if jsonLines else logging.Formatter(TEXT_FORMAT))
+
+  pipeline = LogPipeline([fileHandler], level)
+  pipeline.start()
+  return pipeline
@@ -1,11 +1,16 @@
 import logging
 logger = logging.getLogger(__name__)
 
+import contextlib
 import datetime
+import hashlib
+import json
 import os
+import queue
 import re
 import shutil
 import sys
+import tempfile
 import time
 from enum import Enum
 import multiprocessing
@@ -13,9 +18,19 @@ from datetime import timedelta
 
 from managedYoutubeDL import Fetcher, YAMLBuilder
 from managedYoutubeDL.items import Channel, Video
+from managedYoutubeDL.filterPlan import FilterPlan
+from managedYoutubeDL.downloadPlan import DownloadPlan, historicalThroughput
+from managedYoutubeDL.downloadQueue import DownloadJob, DownloadQueue, DownloadResult, DiskSpaceGuard, formatBytes
+from managedYoutubeDL.libraryIndex import LibraryIndex
+from managedYoutubeDL.logSetup import LazyJoin, logFields
+from managedYoutubeDL.postProcessor import MergePool
+from managedYoutubeDL.runLock import ClaimDirectory
+from managedYoutubeDL.seenStore import SeenStore
+from managedYoutubeDL.stateStore import StateStore
+from managedYoutubeDL.telemetry import TelemetryLog, buildJobRecord
 
+# yt_dlp is slow to import, so it's only imported where it's used
 #import youtube_dl
-import yt_dlp
 
 _BOLD  = "\033[1m" if sys.stderr.isatty() else ""
 _RESET = "\033[0m" if sys.stderr.isatty() else ""
@@ -50,6 +65,55 @@ class Manager:
     VideoQuality.QUALITY_2160P: "bestvideo[height<=2160]+bestaudio",
   }
   
+  # number of DASH/HLS fragments to fetch in parallel for each quality
+  #  -higher qualities have more (and larger) fragments, so benefit most
+  CONCURRENT_FRAGMENT_DOWNLOADS = {
+    VideoQuality.QUALITY_MAX:   8,
+    VideoQuality.QUALITY_480P:  2,
+    VideoQuality.QUALITY_720P:  4,
+    VideoQuality.QUALITY_1080P: 4,
+    VideoQuality.QUALITY_1440P: 8,
+    VideoQuality.QUALITY_2160P: 8,
+  }
+  
+  # size (bytes) of each ranged request when downloading progressive files
+  #  -per-connection throttling kicks in after the first few MB, so
+  #   fetching in chunks keeps each request in its fast initial burst
+  HTTP_CHUNK_SIZE = 10 * 1024 * 1024
+  
+  # while merging, the separate video and audio streams and the merged file
+  # are all on disk at once, so reserve this multiple of the stream sizes
+  MERGE_SPACE_FACTOR = 2
+  
+  # with "smallest-first" ordering, a waiting video's effective size halves
+  # every DOWNLOAD_AGING_HALF_LIFE seconds since it was published
+  DOWNLOAD_AGING_HALF_LIFE = 60*60*24
+  
+  # number of ffmpeg merges to run alongside the downloads (0: merge inside
+  # the download process, under the download timeout)
+  MERGE_WORKERS = 2
+  
+  # max time (seconds) to allow for a merge
+  MERGE_TIMEOUT = 60*30
+  
+  # with adaptive polling, the bounds (seconds) on a channel's learned poll
+  # interval, and how many times we poll in a typical gap between uploads
+  MIN_POLL_INTERVAL = 60*60
+  MAX_POLL_INTERVAL = 60*60*24*7
+  POLLS_PER_UPLOAD  = 4
+  
+  # local port for the WebSub callback server
+  WEBSUB_PORT = 8080
+  
+  # sub-directory of the download directory holding per-video claims
+  CLAIM_DIRECTORY = ".claims"
+  
+  # seen videos kept per channel in seenChannelVideos, without a seen store
+  SEEN_VIDEOS_PER_CHANNEL = 25
+  
+  # previous configs kept next to the config file when it's saved
+  CONFIG_GENERATIONS = 3
+  
   def setClientSecretsFile(self, value):
     self.clientSecretsFile = value
     
@@ -81,7 +145,8 @@ class Manager:
     # alphabetically sort the channel list
     if value is not None and len(value) > 0:
       value = sorted(value, key=lambda x: x.title.lower())
-    self.channelList = value
+    self.channelList   = value
+    self._channelsByID = None
     
   def setDownloadTimeout(self, value):
     if value is not None:
@@ -109,6 +174,168 @@ class Manager:
       self.postTimeoutWait = value
     
     
+  def setConcurrentFragmentDownloads(self, value):
+    
+    # CHECK: either a single value for all qualities, or a {quality: value} dict
+    if value is not None:
+      if isinstance(value, dict):
+        for qual, num in value.items():
+          try:
+            Manager.VideoQuality(qual)
+          except ValueError:
+            raise ValueError("concurrentFragmentDownloads has unknown quality: {}".format(qual))
+          if not isinstance(num, int) or num < 1:
+            raise ValueError("concurrentFragmentDownloads must be ints >= 1: {}: {}".format(qual, num))
+      elif not isinstance(value, int) or value < 1:
+        raise TypeError("concurrentFragmentDownloads must be an int >= 1, or a {quality: int} dict")
+    self.concurrentFragmentDownloads = value
+  
+  def setHttpChunkSize(self, value):
+    if value is not None:
+      if not isinstance(value, int) or value < 1:
+        raise TypeError("httpChunkSize must be an int >= 1 (bytes), or None")
+    self.httpChunkSize = value
+    
+  def setMinFreeDiskSpace(self, value):
+    
+    # None turns off disk-space admission control
+    if value is not None:
+      if not isinstance(value, int) or value < 0:
+        raise TypeError("minFreeDiskSpace must be an int >= 0 (bytes), or None")
+    self.minFreeDiskSpace = value
+    
+  def setDownloadOrder(self, value):
+    
+    # CHECK: ordering policy is known
+    if value is not None:
+      try:
+        DownloadQueue.Order(value)
+      except ValueError:
+        raise ValueError("Unknown downloadOrder {}. Supported orders: {}"
+                         .format(value, [x.value for x in DownloadQueue.Order]))
+    self.downloadOrder = value
+  
+  def setDownloadAgingHalfLife(self, value):
+    if value is not None:
+      if isinstance(value, timedelta):
+        self.downloadAgingHalfLife = value
+      elif isinstance(value, int):
+        self.downloadAgingHalfLife = timedelta(seconds=value)
+      else:
+        raise TypeError("downloadAgingHalfLife must be either a timedelta or an int")
+      if self.downloadAgingHalfLife.total_seconds() <= 0:
+        raise ValueError("downloadAgingHalfLife must be positive")
+    
+    else:
+      self.downloadAgingHalfLife = value
+    
+  def setMergeWorkers(self, value):
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+      raise TypeError("mergeWorkers must be an int >= 0")
+    self.mergeWorkers = value
+  
+  def setMergeTimeout(self, value):
+    if value is not None:
+      if isinstance(value, timedelta):
+        self.mergeTimeout = value
+      elif isinstance(value, int):
+        self.mergeTimeout = timedelta(seconds=value)
+      else:
+        raise TypeError("mergeTimeout must be either a timedelta or an int")
+    
+    else:
+      self.mergeTimeout = value
+    
+  def setLibraryIndexFile(self, value):
+    self.libraryIndexFile = value
+    self._libraryIndex    = None
+    
+  def setAdaptivePolling(self, value):
+    if not isinstance(value, bool):
+      raise TypeError("adaptivePolling must be a bool")
+    self.adaptivePolling = value
+  
+  def setMinPollInterval(self, value):
+    self.minPollInterval = Manager._toPollInterval("minPollInterval", value)
+    self._checkPollIntervals()
+  
+  def setMaxPollInterval(self, value):
+    self.maxPollInterval = Manager._toPollInterval("maxPollInterval", value)
+    self._checkPollIntervals()
+  
+  @staticmethod
+  def _toPollInterval(name, value):
+    if isinstance(value, int) and not isinstance(value, bool):
+      value = timedelta(seconds=value)
+    if not isinstance(value, timedelta):
+      raise TypeError("{} must be either a timedelta or an int".format(name))
+    if value.total_seconds() <= 0:
+      raise ValueError("{} must be positive".format(name))
+    return value
+  
+  def _checkPollIntervals(self):
+    if self.minPollInterval is not None and self.maxPollInterval is not None:
+      if self.minPollInterval > self.maxPollInterval:
+        raise ValueError("minPollInterval must be <= maxPollInterval")
+  
+  def setTelemetryFile(self, value):
+    self.telemetryFile = value
+    self._telemetryLog = None
+  
+  def setWebSubCallbackURL(self, value):
+    if value is not None and not isinstance(value, str):
+      raise TypeError("webSubCallbackURL must be a string or None")
+    self.webSubCallbackURL = value
+  
+  def setWebSubPort(self, value):
+    if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= 65535:
+      raise TypeError("webSubPort must be an int port number")
+    self.webSubPort = value
+  
+  def setWebSubHubURL(self, value):
+    if value is not None and not isinstance(value, str):
+      raise TypeError("webSubHubURL must be a string or None")
+    self.webSubHubURL = value
+  
+  def setGlobalDescriptionFilter(self, value):
+    self.globalDescriptionFilter = value
+  
+  def setGlobalTagFilter(self, value):
+    self.globalTagFilter = value
+  
+  def setGlobalMinViewCount(self, value):
+    self.globalMinViewCount = Channel._toViewCount("globalMinViewCount", value)
+    
+  def setSeenStoreFile(self, value):
+    if value is not None and not isinstance(value, str):
+      raise TypeError("seenStoreFile must be a string or None")
+    self.seenStoreFile = value
+    self._seenStore    = None
+  
+  def setStateFile(self, value):
+    if value is not None and not isinstance(value, str):
+      raise TypeError("stateFile must be a string or None")
+    self.stateFile   = value
+    self._stateStore = None
+  
+  def setConfigGenerations(self, value):
+    if value is None:
+      value = Manager.CONFIG_GENERATIONS
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+      raise TypeError("configGenerations must be a non-negative int or None")
+    self.configGenerations = value
+  
+  def setCompressConfigGenerations(self, value):
+    self.compressConfigGenerations = bool(value)
+  
+  def setSeenRetentionCount(self, value):
+    if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value <= 0):
+      raise TypeError("seenRetentionCount must be a positive int or None")
+    self.seenRetentionCount = value
+  
+  def setSeenRetentionAge(self, value):
+    self.seenRetentionAge = None if value is None else Manager._toPollInterval("seenRetentionAge", value)
+    
   def setGlobalMinVideoDate(self, value):
     from managedYoutubeDL import convertTime
     self.globalMinVideoDate = convertTime(value)
@@ -222,7 +449,30 @@ class Manager:
     
     self.downloadTimeout = None
     self.postTimeoutWait = None
-    
+    self.concurrentFragmentDownloads = None
+    self.httpChunkSize               = None
+    self.minFreeDiskSpace            = None
+    self.downloadOrder               = None
+    self.downloadAgingHalfLife       = None
+    self.libraryIndexFile            = None
+    self.mergeWorkers                = None
+    self.mergeTimeout                = None
+    self.telemetryFile               = None
+    self.adaptivePolling             = None
+    self.minPollInterval             = None
+    self.maxPollInterval             = None
+    self.webSubCallbackURL           = None
+    self.webSubPort                  = None
+    self.webSubHubURL                = None
+    self.globalDescriptionFilter     = None
+    self.globalTagFilter             = None
+    self.globalMinViewCount          = None
+    self.seenStoreFile               = None
+    self.seenRetentionCount          = None
+    self.seenRetentionAge            = None
+    self.stateFile                   = None
+    self.configGenerations           = None
+    self.compressConfigGenerations   = None
 
     
     # youtube setup
@@ -256,25 +506,298 @@ class Manager:
     # download options
     self.setDownloadTimeout(kwargs.get("downloadTimeout", Manager.DOWNLOAD_TIMEOUT))
     self.setPostTimeoutWait(kwargs.get("postTimeoutWait", Manager.POST_TIMEOUT_WAIT))
+    self.setConcurrentFragmentDownloads(kwargs.get("concurrentFragmentDownloads", None))
+    self.setHttpChunkSize(kwargs.get("httpChunkSize", Manager.HTTP_CHUNK_SIZE))
+    
+    # space to keep free on the download volume (None: don't check)
+    self.setMinFreeDiskSpace(kwargs.get("minFreeDiskSpace", None))
+    
+    # order to download videos in
+    self.setDownloadOrder(kwargs.get("downloadOrder", DownloadQueue.Order.CHANNEL.value))
+    self.setDownloadAgingHalfLife(kwargs.get("downloadAgingHalfLife", Manager.DOWNLOAD_AGING_HALF_LIFE))
+    
+    # index of the videos already in the download directory (None: no index)
+    self.setLibraryIndexFile(kwargs.get("libraryIndexFile", None))
+    
+    # merging of separate video and audio streams
+    self.setMergeWorkers(kwargs.get("mergeWorkers", Manager.MERGE_WORKERS))
+    self.setMergeTimeout(kwargs.get("mergeTimeout", Manager.MERGE_TIMEOUT))
+    
+    # JSON-lines file to record each download's telemetry in (None: don't record)
+    self.setTelemetryFile(kwargs.get("telemetryFile", None))
+    
+    # only poll channels when they're due, based on their upload history
+    self.setAdaptivePolling(kwargs.get("adaptivePolling", False))
+    self.setMinPollInterval(kwargs.get("minPollInterval", Manager.MIN_POLL_INTERVAL))
+    self.setMaxPollInterval(kwargs.get("maxPollInterval", Manager.MAX_POLL_INTERVAL))
+    
+    # push notifications of new uploads from a WebSub hub (None: poll only)
+    self.setWebSubCallbackURL(kwargs.get("webSubCallbackURL", None))
+    self.setWebSubPort(kwargs.get("webSubPort", Manager.WEBSUB_PORT))
+    self.setWebSubHubURL(kwargs.get("webSubHubURL", None))
+    
+    # metadata filters: description and tag patterns, and min view count
+    #  -these need a yt-dlp extraction per video, so run after the others
+    self.setGlobalDescriptionFilter(kwargs.get("globalDescriptionFilter", None))
+    self.setGlobalTagFilter(kwargs.get("globalTagFilter", None))
+    self.setGlobalMinViewCount(kwargs.get("globalMinViewCount", None))
+    
+    # SQLite file of the videos we've seen (None: keep the last
+    # SEEN_VIDEOS_PER_CHANNEL in seenChannelVideos), and how long to keep them
+    self.setSeenStoreFile(kwargs.get("seenStoreFile", None))
+    self.setSeenRetentionCount(kwargs.get("seenRetentionCount", None))
+    self.setSeenRetentionAge(kwargs.get("seenRetentionAge", None))
+    
+    # SQLite file of the channels' run state, and the seen videos if there's
+    # no seenStoreFile (None: keep them in the config)
+    self.setStateFile(kwargs.get("stateFile", None))
+    
+    # previous configs to keep when saving (None: CONFIG_GENERATIONS), and
+    # whether to gzip them
+    self.setConfigGenerations(kwargs.get("configGenerations", None))
+    self.setCompressConfigGenerations(kwargs.get("compressConfigGenerations", False))
     
     
     # CHECK: no extra attributes were passed
-    extraKeys = [x for x in kwargs if x not in self.__dict__.keys()]
+    extraKeys = [x for x in kwargs if x not in self.__dict__.keys() or x.startswith("_")]
     if len(extraKeys) > 0:
       raise AttributeError("unknown attribute(s): {}".format(extraKeys))
 
-    # load the YouTube fetcher
-    if self.clientSecretsFile is not None:
-      self.ytFetcher = Fetcher(
+    # compiled filters, per channel ID
+    self._filterPlans = {}
+    
+    # videos whose filters couldn't be checked (see FilterPlan.deferred), per
+    # channel ID; their channel's min video date is held back for them
+    self._undecidedVideos = {}
+    
+    # the config's settings when it was last loaded or saved (see loadState)
+    self._configFingerprint = None
+
+    # the YouTube fetcher, built on first use (see ytFetcher)
+    self._ytFetcher = None
+    
+    # the config file's previous generation has been kept this run (see
+    # YAMLBuilder.safeDumpManager; reset by each downloadNewVideos())
+    self._configRotated = False
+    
+    # while set (see planNewVideos), nothing is written to the seen store,
+    # and no video is marked seen
+    self._readOnly = False
+    
+    
+  @property
+  def ytFetcher(self):
+    """
+    # The YouTube fetcher, or None if we have no client secrets file
+    #  -built on first use, so commands that never call the API (e.g.
+    #   manual-download) don't pay for building the API client
+    #
+    :return:
+    """
+    if self._ytFetcher is None and self.clientSecretsFile is not None:
+      self._ytFetcher = Fetcher(
         clientSecretsFile  = self.clientSecretsFile,
         pickledCredentials = self.pickledCredentials
       )
-    else:
-      self.ytFetcher = None
-    
-    
+    return self._ytFetcher
+  
+  @ytFetcher.setter
+  def ytFetcher(self, value):
+    self._ytFetcher = value
+  
+  def hasFetcher(self) -> bool:
+    """
+    # Do we have (or can we build) a YouTube fetcher, without building it
+    #
+    :return:
+    """
+    return self._ytFetcher is not None or self.clientSecretsFile is not None
+  
   def getAPICreditsUsed(self):
-    return 0 if self.ytFetcher is None else self.ytFetcher.creditsUsed
+    return 0 if self._ytFetcher is None else self._ytFetcher.creditsUsed
+  
+  def getChannelsByID(self) -> dict:
+    """
+    # Return our channels keyed by their ID, built on first use
+    #  -rebuilt when the channel list is replaced (see setChannelList), so
+    #   change the channel list through setChannelList
+    #
+    :return:
+    """
+    if self._channelsByID is None:
+      self._channelsByID = dict([(channel.id, channel) for channel in (self.channelList or [])])
+    return self._channelsByID
+  
+  def getLibraryIndex(self):
+    """
+    # Return the index of videos already in the download directory, loading
+    # or building it on first use, or None if we aren't keeping an index
+    #
+    :return:
+    """
+    if self.libraryIndexFile is None:
+      return None
+    if self._libraryIndex is None:
+      self._libraryIndex = LibraryIndex(self.libraryIndexFile, self.downloadDirectory or ".")
+    return self._libraryIndex
+  
+  def getSeenStore(self):
+    """
+    # Return the store of the videos we've seen, opening it on first use,
+    # or None if we keep them in seenChannelVideos
+    #  -on opening, any IDs in seenChannelVideos are moved into the store,
+    #   and IDs outside the retention limits are dropped
+    #  -while read-only, a store that doesn't exist yet isn't created, and
+    #   an existing one is only read (see haveSeenVideo)
+    #
+    :return:
+    """
+    seenStoreFile = self.seenStoreFile or self.stateFile
+    if seenStoreFile is None:
+      return None
+    if self._seenStore is None:
+      if self._readOnly and not os.path.exists(seenStoreFile):
+        return None
+      maxAge    = None if self.seenRetentionAge is None else self.seenRetentionAge.total_seconds()
+      seenStore = SeenStore(seenStoreFile, maxPerChannel=self.seenRetentionCount, maxAge=maxAge)
+      if not self._readOnly:
+        if self.seenChannelVideos:
+          numAdded = seenStore.migrate(self.seenChannelVideos)
+          logger.info("Moved {} seen video(s) from the config to {}".format(numAdded, seenStoreFile))
+          self.seenChannelVideos = {}
+        seenStore.prune()
+      self._seenStore = seenStore
+    return self._seenStore
+  
+  def getStateStore(self):
+    """
+    # Return the store of the channels' run state, opening it on first use,
+    # or None if we keep it in the config
+    #
+    :return:
+    """
+    if self.stateFile is None:
+      return None
+    if self._stateStore is None:
+      self._stateStore = StateStore(self.stateFile)
+    return self._stateStore
+  
+  def configFingerprint(self) -> str:
+    """
+    # Return a hash of the config's settings: everything stored in the config
+    # except the channels' run state (Channel.STATE_FIELDS)
+    #
+    :return:
+    """
+    settings = [(key, repr(value)) for key, value in sorted(self.__dict__.items())
+                if key != "channelList" and not key.startswith("_")]
+    channels = [[(key, repr(value)) for key, value in sorted(channel.toDict().items())
+                 if key not in Channel.STATE_FIELDS] for channel in self.channelList]
+    return hashlib.sha1(repr((settings, channels)).encode("utf-8")).hexdigest()
+  
+  def configChanged(self) -> bool:
+    """
+    # Have the config's settings changed since it was last loaded or saved
+    # (always True if we don't know)
+    #
+    :return:
+    """
+    return self._configFingerprint is None or self.configFingerprint() != self._configFingerprint
+  
+  def loadState(self, stateInConfig: bool = False):
+    """
+    # Note the config's settings, as just loaded, then apply the run state
+    # saved in the state file to the channels
+    #  -the config doesn't hold the run state when there's a state file; if
+    #   it still does (e.g., the state file was just set), channels without
+    #   saved state keep the config's values, and the config counts as
+    #   changed, so the next save moves the state out of it
+    #
+    :param stateInConfig: the config held the channels' run state
+    :return:
+    """
+    self._configFingerprint = self.configFingerprint()
+    stateStore = self.getStateStore()
+    if stateStore is not None:
+      numLoaded = stateStore.load(self.channelList)
+      logger.debug("loadState: Loaded the state of {} channel(s) from {}".format(numLoaded, self.stateFile))
+      if stateInConfig:
+        logger.info("loadState: Moving the channels' run state out of the config, into {}".format(self.stateFile))
+        self._configFingerprint = None
+  
+  def saveState(self, configSaved: bool = False):
+    """
+    # Save the channels' changed run state to the state file
+    #
+    :param configSaved: the config has just been saved, so its settings are
+                        no longer changed
+    :return:
+    """
+    stateStore = self.getStateStore()
+    if stateStore is not None:
+      stateStore.save(self.channelList)
+    if configSaved:
+      self._configFingerprint = self.configFingerprint()
+  
+  def copyRunState(self, manager):
+    """
+    # Take the run state of <manager>, loaded from an earlier version of our
+    # config: the run state (Channel.STATE_FIELDS) of the channels we both
+    # have, and the seen videos kept in the config
+    #
+    :param manager:
+    :return:
+    """
+    channelsByID = dict([(channel.id, channel) for channel in manager.channelList])
+    for channel in self.channelList:
+      if channel.id in channelsByID:
+        for key in Channel.STATE_FIELDS:
+          setattr(channel, key, getattr(channelsByID[channel.id], key))
+    self.seenChannelVideos = dict([(channelID, list(videoIDs))
+                                   for channelID, videoIDs in manager.seenChannelVideos.items()])
+  
+  def getTelemetryLog(self):
+    """
+    # Return the log to record download telemetry in, or None if we aren't
+    # recording telemetry
+    #
+    :return:
+    """
+    if self.telemetryFile is None:
+      return None
+    if self._telemetryLog is None:
+      self._telemetryLog = TelemetryLog(self.telemetryFile)
+    return self._telemetryLog
+  
+  def getConcurrentFragmentDownloads(self, quality):
+    """
+    # Return how many fragments to download in parallel at <quality>
+    #  -the config can give one value for all qualities, or a value per
+    #   quality; anything not given falls back to the class defaults
+    #
+    :param quality:
+    :return:
+    """
+    value = self.concurrentFragmentDownloads
+    if isinstance(value, int):
+      return value
+    if isinstance(value, dict) and quality.value in value:
+      return value[quality.value]
+    return Manager.CONCURRENT_FRAGMENT_DOWNLOADS.get(quality, 1)
+  
+  def addTransferOptions(self, options: dict, quality):
+    """
+    # Add the network transfer options (parallel fragments and chunked
+    # range requests) for <quality> to the yt-dlp <options>
+    #
+    :param options:
+    :param quality:
+    :return:
+    """
+    options["concurrent_fragment_downloads"] = self.getConcurrentFragmentDownloads(quality)
+    if self.httpChunkSize is not None:
+      options["http_chunk_size"] = self.httpChunkSize
+    return options
 
   def _isolateIgnoreChannels(self):
     """
@@ -294,37 +817,65 @@ class Manager:
   
     
   
-  def _downloadVideo(self, channel: Channel, video: Video, quality=None, timeout: timedelta=None) -> bool:
+  def _isolateDueChannels(self, channelList: list, now: datetime.datetime):
     """
-    # Download the <channel>'s <video> and report on whether it was a success
+    # Return separate lists of the channels in <channelList> that are due
+    # to be polled at <now>, and those that aren't
     #
-    :param channel:
-    :param video:
+    :param channelList:
+    :param now:
     :return:
     """
-    
+    dueChannelList    = []
+    notDueChannelList = []
+    for channel in channelList:
+      if channel.isDueForPoll(now):
+        dueChannelList.append(channel)
+      else:
+        notDueChannelList.append(channel)
+    return dueChannelList, notDueChannelList
+  
+  
+  def _estimatePollInterval(self, videoList: list, now: datetime.datetime) -> timedelta:
     """
-    from subprocess import Popen, PIPE
-    from threading import Timer
+    # Estimate how often to poll a channel from the publish dates of its
+    # recent <videoList>
+    #  -the typical gap between uploads is the median of the gaps between
+    #   the videos, plus the gap since the newest one (so channels that
+    #   have gone quiet are polled less), and we poll POLLS_PER_UPLOAD
+    #   times per typical gap, within [minPollInterval, maxPollInterval]
+    #
+    :param videoList:
+    :param now:
+    :return:
+    """
+    publishedDates = sorted([video.publishedAt for video in videoList if video.publishedAt is not None])
     
-    def run(cmd, timeout_sec):
-        proc = Popen(cmd.split(), stdout=PIPE, stderr=PIPE)
-        timer = Timer(timeout_sec, proc.kill)
-        try:
-            timer.start()
-            stdout, stderr = proc.communicate()
-        finally:
-            timer.cancel()
+    # not enough history: rarely uploads
+    if len(publishedDates) < 2:
+      return self.maxPollInterval
     
-    run("sleep 1", 5)
-    run("sleep 5", 1)
-    """
+    gaps  = [later - earlier for earlier, later in zip(publishedDates[:-1], publishedDates[1:])]
+    gaps += [max(now - publishedDates[-1], timedelta(0))]
+    gaps  = sorted(gaps)
     
-    # throw timeout error
-    #  -have timeout argument=None
+    # median gap
+    mid = len(gaps) // 2
+    typicalGap = gaps[mid] if len(gaps) % 2 == 1 else (gaps[mid - 1] + gaps[mid]) / 2
     
-    if quality is None:
-      quality = Manager.VideoQuality.QUALITY_MAX
+    interval = typicalGap / Manager.POLLS_PER_UPLOAD
+    return max(self.minPollInterval, min(self.maxPollInterval, interval))
+  
+  
+  def _buildDownloadOptions(self, channel: Channel, quality) -> dict:
+    """
+    # Return the yt-dlp options used to download one of <channel>'s videos
+    # at <quality>
+    #
+    :param channel:
+    :param quality:
+    :return:
+    """
     
     # OS-friendly channel name
     channelName = "".join([s for s in channel.title if s.isalpha() or s.isdigit()])
@@ -369,12 +920,88 @@ class Manager:
     else:
       logger.warning("_download: FFmpeg not in path. Download may not be the highest possible quality")
       options["format"] = "bestaudio/best"
-      
+    
+    # parallel fragments and chunked range requests
+    self.addTransferOptions(options, quality)
+    
+    return options
+  
+  
+  def _usesMergePool(self) -> bool:
+    """
+    # Are video and audio streams merged by a MergePool, rather than inside
+    # the download process
+    #
+    :return:
+    """
+    return self.ffmpegLocation is not None and self.mergeWorkers > 0
+  
+  
+  @staticmethod
+  def _separateStreams(options: dict) -> dict:
+    """
+    # Change the yt-dlp <options> to download the video and audio streams
+    # as separate files ("<name>.f<format id>.<ext>") and leave the merge
+    # to a MergePool
+    #
+    :param options:
+    :return:
+    """
+    if "merge_output_format" not in options:
+      return options
+    
+    options["format"]  = options["format"].replace("+", ",")
+    options["outtmpl"] = re.sub(r"\.%\(ext\)s$", ".f%(format_id)s.%(ext)s", options["outtmpl"])
+    del options["merge_output_format"]
+    return options
+  
+  
+  def _downloadVideo(self, channel: Channel, video: Video, quality=None, timeout: timedelta=None,
+                     info: dict = None) -> bool:
+    """
+    # Download the <channel>'s <video> and report on whether it was a success
+    #
+    :param channel:
+    :param video:
+    :param info: the video's yt-dlp info, if already extracted (see
+                 _extractVideoInfo), so it isn't extracted again
+    :return:
+    """
+    
+    """
+    from subprocess import Popen, PIPE
+    from threading import Timer
+    
+    def run(cmd, timeout_sec):
+        proc = Popen(cmd.split(), stdout=PIPE, stderr=PIPE)
+        timer = Timer(timeout_sec, proc.kill)
+        try:
+            timer.start()
+            stdout, stderr = proc.communicate()
+        finally:
+            timer.cancel()
+    
+    run("sleep 1", 5)
+    run("sleep 5", 1)
+    """
+    
+    # throw timeout error
+    #  -have timeout argument=None
+    
+    if quality is None:
+      quality = Manager.VideoQuality.QUALITY_MAX
+    
+    # yt-dlp options for this video
+    options = self._buildDownloadOptions(channel, quality)
+    
+    # leave merging to the merge pool
+    if self._usesMergePool():
+      Manager._separateStreams(options)
     
     returnQueue = multiprocessing.Queue()
     proc = multiprocessing.Process(
       target = Manager._callYoutubeDL,
-      args   = (returnQueue, options, [self.ytFetcher.assembleVideoURL(video.id)])
+      args   = (returnQueue, options, [Fetcher.assembleVideoURL(video.id)], info)
     )
     proc.start()
     proc.join(timeout=timeout.total_seconds())
@@ -384,37 +1011,178 @@ class Manager:
       proc.kill()
       raise TimeoutError()
     try:
-      return returnQueue.get(timeout=5)
+      result = returnQueue.get(timeout=5)
     except Exception:
-      return False
+      return DownloadResult(False)
+    return DownloadResult(**result)
     
     # download the video and return whether we were successful
-    #return Manager._callYoutubeDL(options, [self.ytFetcher.assembleVideoURL(video.id)])
+    #return Manager._callYoutubeDL(options, [Fetcher.assembleVideoURL(video.id)])
     
     #with youtube_dl.YoutubeDL(options) as ydl:
-    #  returnCode = ydl.download([self.ytFetcher.assembleVideoURL(video.id)])
+    #  returnCode = ydl.download([Fetcher.assembleVideoURL(video.id)])
     #return returnCode == 0
   
   
   @staticmethod
-  def _getVideoInfo(options: dict, urlList: list) -> list:
+  def _getFormatSize(formatInfo: dict) -> int:
     """
-    # For each video in <urlList> return a dictionary of video info
+    # Return the size in bytes of a yt-dlp format, or -1 if it isn't known
     #
-    :param options:
-    :param urlList:
+    :param formatInfo:
     :return:
     """
-    
-    # list of dictionaries to return
-    infoList = []
-    
-    # get a yt-dlp object
-    with yt_dlp.YoutubeDL(options) as ydl:
-    
-      # for each video url
-      for url in urlList:
-        
+    size = formatInfo.get("filesize") or formatInfo.get("filesize_approx")
+    return -1 if size is None else int(size)
+  
+  
+  def _estimateDownloadSize(self, channel: Channel, video: Video, quality, info: dict = None) -> int:
+    """
+    # Estimate the disk space needed to download <channel>'s <video> at
+    # <quality>, or None if it can't be estimated
+    #
+    :param channel:
+    :param video:
+    :param quality:
+    :param info: the video's yt-dlp info, if already extracted
+    :return:
+    """
+    size = self._estimateTransferSize(channel, video, quality, info=info)
+    if size is None:
+      return None
+    
+    # merging needs room for the streams and the merged file
+    if "merge_output_format" in self._buildDownloadOptions(channel, quality):
+      size *= Manager.MERGE_SPACE_FACTOR
+    return size
+  
+  
+  def _estimateTransferSize(self, channel: Channel, video: Video, quality, info: dict = None) -> int:
+    """
+    # Estimate the bytes transferred downloading <channel>'s <video> at
+    # <quality>, from its format info, or None if it can't be estimated
+    #
+    :param channel:
+    :param video:
+    :param quality:
+    :param info: the video's yt-dlp info, if already extracted
+    :return:
+    """
+    if info is None:
+      info = self._extractVideoInfo(channel, video, quality)
+      if info is None:
+        return None
+    
+    # CHECK: we know the size of every stream
+    videoSize, audioSize = Manager._getStreamSizes(info)
+    if videoSize < 0 or audioSize < 0:
+      return None
+    return videoSize + audioSize
+  
+  
+  def _extractVideoInfo(self, channel: Channel, video: Video, quality) -> dict:
+    """
+    # Return <channel>'s <video>'s yt-dlp info at <quality>, or None if it
+    # couldn't be extracted
+    #  -like a download, the extraction runs in a child process that is
+    #   killed after downloadTimeout
+    #
+    :param channel:
+    :param video:
+    :param quality:
+    :return:
+    """
+    options = self._buildDownloadOptions(channel, quality)
+    timeout = None if self.downloadTimeout is None else self.downloadTimeout.total_seconds()
+    
+    returnQueue = multiprocessing.Queue()
+    proc = multiprocessing.Process(
+      target = Manager._callExtractInfo,
+      args   = (returnQueue, options, Fetcher.assembleVideoURL(video.id))
+    )
+    proc.start()
+    
+    # (read the info before joining: the child can't exit until it's read)
+    try:
+      info = returnQueue.get(timeout=timeout)
+    except queue.Empty:
+      logger.warning("_extractVideoInfo: Extraction timed out after {}s; size unknown".format(timeout),
+                     extra=logFields(channel, video))
+      info = None
+    
+    proc.join(timeout=5)
+    if proc.is_alive():
+      proc.terminate()
+      proc.kill()
+    return info
+  
+  
+  @staticmethod
+  def _callExtractInfo(returnQueue: multiprocessing.Queue, options: dict, url: str):
+    import yt_dlp
+    with yt_dlp.YoutubeDL(options) as ydl:
+      try:
+        info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+      except Exception as err:
+        logger.warning("_extractVideoInfo: Couldn't get info for {}: {}".format(url, err))
+        info = None
+    returnQueue.put(info)
+  
+  
+  @staticmethod
+  def _getStreamSizes(urlInfo: dict) -> tuple:
+    """
+    # Return the (video, audio) sizes in bytes of the formats yt-dlp chose in
+    # <urlInfo>, with -1 for a size that isn't known
+    #
+    :param urlInfo:
+    :return:
+    """
+    
+    # separate video+audio streams, or a single mixed file
+    requestedFormats = urlInfo.get("requested_formats") or [urlInfo]
+    videoFormat      = requestedFormats[0]
+    audioFormat      = requestedFormats[1] if len(requestedFormats) > 1 else None
+    
+    #  -DASH formats often only have an approximate size
+    return Manager._getFormatSize(videoFormat), 0 if audioFormat is None else Manager._getFormatSize(audioFormat)
+  
+  
+  def getVideoMetadata(self, channel: Channel, video: Video) -> dict:
+    """
+    # Return <channel>'s <video>'s yt-dlp info (description, tags, view
+    # count, etc.), as used by the metadata filters
+    #
+    :param channel:
+    :param video:
+    :return:
+    """
+    options = self._buildDownloadOptions(channel, Manager.VideoQuality.QUALITY_MAX)
+    return Manager._getVideoInfo(options, [Fetcher.assembleVideoURL(video.id)])[0]
+  
+  
+  @staticmethod
+  def _getVideoInfo(options: dict, urlList: list) -> list:
+    """
+    # For each video in <urlList> return a dictionary of video info
+    #  -if the info couldn't be extracted, <error> says why, and the other
+    #   fields keep their blank values
+    #
+    :param options:
+    :param urlList:
+    :return:
+    """
+    
+    # list of dictionaries to return
+    infoList = []
+    
+    # get a yt-dlp object
+    import yt_dlp
+    with yt_dlp.YoutubeDL(options) as ydl:
+    
+      # for each video url
+      for url in urlList:
+        
         # create a blank info to return
         info = {
           "videoSize":   -1,
@@ -424,18 +1192,21 @@ class Manager:
           "duration":    -1,
           "viewCount":   -1,
           "description": None,
-          "tags":        []
+          "tags":        [],
+          "error":       None
         }
         
         # get the info and extract the details we want
         try:
           urlInfo = ydl.extract_info(url, download=False)
           
+          # separate video+audio streams, or a single mixed file
+          videoFormat = (urlInfo.get("requested_formats") or [urlInfo])[0]
+          
           # extract the info we are interested in
-          info["videoSize"]   = urlInfo["requested_formats"][0]["filesize"]
-          info["audioSize"]   = urlInfo["requested_formats"][1]["filesize"]
-          info["height"]      = urlInfo["requested_formats"][0]["height"]
-          info["width"]       = urlInfo["requested_formats"][0]["width"]
+          info["videoSize"], info["audioSize"] = Manager._getStreamSizes(urlInfo)
+          info["height"]      = videoFormat["height"]
+          info["width"]       = videoFormat["width"]
           info["duration"]    = urlInfo["duration"]
           info["viewCount"]   = urlInfo["view_count"]
           info["description"] = urlInfo["description"]
@@ -443,6 +1214,7 @@ class Manager:
 
         except Exception as err:
           logger.error("_getVideoInfo: Couldn't get info for {}: {}\n{}".format(url, err, info))
+          info["error"] = str(err) or type(err).__name__
 
         infoList.append(info)
     
@@ -450,22 +1222,45 @@ class Manager:
     return infoList
   
   @staticmethod
-  def _callYoutubeDL(returnQueue: multiprocessing.Queue, options: dict, urlList: list):
+  def _callYoutubeDL(returnQueue: multiprocessing.Queue, options: dict, urlList: list, videoInfo: dict = None):
+    
+    # files yt-dlp has finished downloading (or already had), their format
+    # IDs and sizes, and when the transfer started and finished
+    downloadedFiles = []
+    formatIDs       = []
+    fileSizes       = {}
+    transferTimes   = []
+    def progressHook(status):
+      transferTimes.append(time.monotonic())
+      if status.get("status") == "finished" and status.get("filename") not in downloadedFiles:
+        downloadedFiles.append(status.get("filename"))
+        formatIDs.append(status.get("info_dict", {}).get("format_id"))
+        fileSizes[status.get("filename")] = status.get("total_bytes") or status.get("downloaded_bytes") or 0
+    
+    # the final file(s), once yt-dlp's own post-processing is done
+    finishedFiles = []
+    options = dict(options, progress_hooks=[progressHook], post_hooks=[finishedFiles.append])
+    
+    info        = {}
+    extractTime = None
     
     # download the video and return whether we were successful
     #with youtube_dl.YoutubeDL(options) as ydl:
+    import yt_dlp
     with yt_dlp.YoutubeDL(options) as ydl:
       
       try:
         #logger.info(urlList)
-        info = ydl.extract_info(urlList[0], download=False)
+        #  -if the info was extracted already (when estimating the video's
+        #   size), it isn't extracted again
+        startTime   = time.monotonic()
+        info        = videoInfo if videoInfo is not None else ydl.extract_info(urlList[0], download=False)
+        extractTime = None if videoInfo is not None else time.monotonic() - startTime
         #logger.info("File size test result: {}".format(list(info["requested_formats"][0].keys())))
         
         # requested_formats
         #   -filesize, height, width
         # duration, view_count, description, tags,
-        videoInfo = info["requested_formats"][0]
-        audioInfo = info["requested_formats"][1]
         
         # SD: file info printed here
         
@@ -495,25 +1290,56 @@ class Manager:
       except Exception as err:
         logger.warning("File size test failed: {}".format(err), exc_info=True)
 
-      returnCode = ydl.download(urlList)
+      # download from the extracted info, if we have it
+      #  -yt-dlp re-extracts it if its format URLs have expired
+      if videoInfo is not None:
+        with tempfile.NamedTemporaryFile("w", suffix=".info.json", delete=False, encoding="utf-8") as f:
+          json.dump(videoInfo, f)
+        try:
+          returnCode = ydl.download_with_info_file(f.name)
+        finally:
+          os.remove(f.name)
+      else:
+        returnCode = ydl.download(urlList)
+    
     
+    # separately downloaded streams still need merging
+    streamFiles = downloadedFiles if "," in options.get("format", "") else []
     
-    returnQueue.put(returnCode == 0)
+    # what was actually downloaded
+    formatID = "+".join([x for x in formatIDs if x]) or (info or {}).get("format_id")
+    numBytes = sum(fileSizes.values()) if len(fileSizes) > 0 else None
+    transferTime = transferTimes[-1] - transferTimes[0] if len(transferTimes) > 0 else None
+    
+    returnQueue.put({
+      "success":      returnCode == 0,
+      "streamFiles":  streamFiles,
+      "formatID":     formatID,
+      "numBytes":     numBytes,
+      "extractTime":  extractTime,
+      "transferTime": transferTime,
+      "fileLoc":      finishedFiles[-1] if len(finishedFiles) > 0 and len(streamFiles) == 0 else None,
+    })
     
 
   def addSeenVideo(self, channel: Channel, video: Video):
     """
     # Add the <video>'s ID to the list of seen videos for <channel>
+    #  -without a seen store, only the last SEEN_VIDEOS_PER_CHANNEL are kept
     #
     :param channel:
     :param video:
     :return:
     """
+    seenStore = self.getSeenStore()
+    if seenStore is not None:
+      seenStore.add(channel.id, video.id)
+      return
     
     currentSeenVideos = self.seenChannelVideos.get(channel.id, [])
     if video.id not in currentSeenVideos:
       currentSeenVideos.append(video.id)
-      self.seenChannelVideos[channel.id] = currentSeenVideos[-25:]
+      self.seenChannelVideos[channel.id] = currentSeenVideos[-Manager.SEEN_VIDEOS_PER_CHANNEL:]
       
       
   def haveSeenVideo(self, channel: Channel, video: Video) -> bool:
@@ -524,55 +1350,73 @@ class Manager:
     :param video:
     :return:
     """
+    # (seenChannelVideos is empty once moved into the seen store, unless it
+    # was opened read-only)
+    seenStore = self.getSeenStore()
+    if seenStore is not None and seenStore.has(channel.id, video.id):
+      return True
     return video.id in self.seenChannelVideos.get(channel.id, [])
   
   
-  def downloadNewVideos(self, quality:VideoQuality):
+  def getSeenVideoIDs(self, channel: Channel) -> set:
+    """
+    # The IDs of the videos we've seen from <channel>
+    #  -the result may be shared with the seen store: don't change it
+    #
+    :param channel:
+    :return:
+    """
+    seenStore = self.getSeenStore()
+    if seenStore is not None and not self.seenChannelVideos.get(channel.id):
+      return seenStore.videoIDs(channel.id)
+    seenVideoIDs = set(self.seenChannelVideos.get(channel.id, []))
+    if seenStore is not None:
+      seenVideoIDs |= seenStore.videoIDs(channel.id)
+    return seenVideoIDs
+  
+  
+  def downloadNewVideos(self, quality:VideoQuality, stopEvent=None, checkpoint=None, mergePool: MergePool = None,
+                        pushedVideos: dict = None, pushChannelIDs=None, downloadSlot=None, claims=None):
     """
     # Iterate over our list of subscribed channels, fetching new
     # videos, filtering them by channel-specific and global filters, then
     # downloading them
     #
+    :param quality:
+    :param stopEvent: threading.Event; once set, no new downloads are
+                      started, and the rest are left for the next run
+    :param checkpoint: called after each video, to save our state
+    :param mergePool: a long-lived pool to merge in (otherwise one is
+                      created for this run)
+    :param pushedVideos: channel ID -> videos we were notified of, which
+                         are used instead of fetching the channel's videos
+    :param pushChannelIDs: channels whose uploads are pushed to us, so
+                           aren't polled
+    :param downloadSlot: function() -> context manager each download runs
+                         inside, to share a limit on concurrent downloads with others
+    :param claims: ClaimDirectory; videos claimed by another run are left
+                   for the next run
     :return:
     """
     
     downloadResults = {
-      "Downloaded": 0,
-      "Failed":     0
+      "Downloaded":   0,
+      "Failed":       0,
+      "Bytes":        0,
+      "TransferTime": 0.0,
     }
     
     # CHECK: quality is supported
     if quality not in Manager.SUPPORTED_QUALITIES:
       raise ValueError(f"Unknown video quality {quality}. Supported qualitities: {list(Manager.SUPPORTED_QUALITIES.keys())}")
     
+    # this run's first save keeps the config from before it as a generation,
+    # even if this manager (e.g. the daemon's) has saved in earlier runs
+    self._configRotated = False
     
-    # separate to-ignore and to-download channels
-    ignoreChannelList, channelList = self._isolateIgnoreChannels()
-    logger.debug("downloadNewVideos: Ignoring {} channel(s)".format(len(ignoreChannelList)))
-    logger.debug("downloadNewVideos: Ignoring: " + ", ".join([x.title for x in ignoreChannelList]))
-    
-    
-    # for each subscribed channel, get the recent channel videos
-    channelVideos  = []
-    lenChannelList = len(channelList)
-    if lenChannelList == 1: logger.info("Checking 1 channel")
-    else:                   logger.info("Checking {} channels".format(len(channelList)))
-    
-    for channel in channelList:
-      logger.debug("downloadNewVideos: Checking channel {}".format(channel.title))
-      
-      # get the recent channel videos
-      videoList = self.ytFetcher.fetchRecentVideos(channel.id)
-      logger.debug("downloadNewVideos: Found {} recent videos".format(len(videoList)))
-      
-      # apply global and per-channel filters
-      videoList = self.filterChannelVideos(channel, videoList)
-      logger.debug("downloadNewVideos: {} videos remain after channel filtering".format(len(videoList)))
-    
-      # add the videos to the master list
-      if len(videoList) > 0:
-        channelVideos.append((channel, videoList))
-    
+    # find the new videos to download
+    channelVideos = self._discoverNewVideos(stopEvent, pushedVideos, pushChannelIDs)
+    libraryIndex  = self.getLibraryIndex()
     
     # log total number of videos found
     if len(channelVideos) == 0:
@@ -598,241 +1442,713 @@ class Manager:
     # titles line up vertically (channel.title is the *visible* text, the
     # _BOLD/_RESET codes around it take no visual space)
     channelWidth = max((len(channel.title) for channel, _ in channelVideos), default=0)
+    
+    # only start downloads that fit on the download volume
+    diskGuard = None
+    if self.minFreeDiskSpace is not None:
+      diskGuard = DiskSpaceGuard(self.downloadDirectory or ".", self.minFreeDiskSpace)
+    deferredJobs = []
+    
+    # videos another run is downloading
+    claimedJobs = []
+    
+    # each channel's min video date before we start downloading
+    startMinVideoDates = {channel.id: channel.minVideoDate for channel, _ in channelVideos}
+    
+    # queue the videos in the configured order
+    downloadQueue = self._createDownloadQueue()
+    for channel, videoList in channelVideos:
+      for video in videoList:
+        job = DownloadJob(channel, video, quality=quality)
+        
+        # size-based ordering needs every size up front
+        #  -the info isn't kept for the download: it's large, and its
+        #   format URLs may expire before the video's turn comes
+        if downloadQueue.needsSizeEstimates():
+          job.estimatedSize = self._estimateDownloadSize(channel, video, quality)
+        downloadQueue.push(job)
+    
+    # merge video and audio streams while the next video downloads
+    ownMergePool = mergePool is None
+    if ownMergePool:
+      mergePool = self.createMergePool()
+    
+    # save our state, without letting any channel's min video date move
+    # past its videos that are still to be downloaded or merged
+    def saveCheckpoint():
+      currentMinVideoDates = {channel.id: channel.minVideoDate for channel, _ in channelVideos}
+      pendingJobs = deferredJobs + claimedJobs + downloadQueue.jobs() + ([] if mergePool is None else mergePool.pendingJobs())
+      self._holdPendingVideos(channelVideos, startMinVideoDates, pendingJobs)
+      try:
+        checkpoint()
+      finally:
+        for channel, _ in channelVideos:
+          channel.setMinVideoDate(currentMinVideoDates[channel.id])
+    
     n = 0
     logger.info("")
     logger.info("Downloading:")
-    for channel, videoList in channelVideos:
-
-      for video in videoList:
+    try:
+      while len(downloadQueue) > 0:
+        
+        # CHECK: we haven't been asked to stop
+        if stopEvent is not None and stopEvent.is_set():
+          logger.warning("Stopping: leaving {} video(s) for the next run".format(len(downloadQueue)))
+          break
+        
+        job = downloadQueue.pop()
+        channel, video = job.channel, job.video
+        
         n += 1
         logger.info("  [{}/{}] {}{}{}: {}".format(
-          str(n).rjust(width), numVideos, _BOLD, channel.title.ljust(channelWidth), _RESET, video.title))
-
-        while True:
-          try:
-            
-            # if it downloaded successfully
-            if self._downloadVideo(channel, video, quality=quality, timeout=self.downloadTimeout):
-              downloadResults["Downloaded"] += 1
-              logger.debug("downloadNewVideos: Downloaded successfully")
-            
-              # add to "seen" list
-              self.addSeenVideo(channel=channel, video=video)
-              
-              # update this channel's min video date to our latest video
-              if channel.minVideoDate is None or video.publishedAt > channel.minVideoDate:
-                channel.setMinVideoDate(video.publishedAt)
-                logger.debug("downloadNewVideos: Min video date for channel {} is now {}"
-                             .format(channel.title, video.publishedAt))
-            
-            # else, download unsuccessful
-            else:
-              downloadResults["Failed"] += 1
-              logger.error("downloadNewVideos: Could not download video: title: {}, id: {}"
-                              .format(video.title, video.id))
-
-            # wait between consecutive downloads
-            time.sleep(Manager.WAIT_BETWEEN_DOWNLOADS)
-            
-            # no timeout
-            break
-          
-          except TimeoutError:
-            waitingTime = 0 if self.postTimeoutWait is None else self.postTimeoutWait.total_seconds()
-            wakeTime = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=waitingTime)
-            logger.error("Download timed out. Waiting {}s (until {})"
-                         .format(waitingTime, wakeTime))
-            time.sleep(waitingTime)
-          
-    
+          str(n).rjust(width), numVideos, _BOLD, channel.title.ljust(channelWidth), _RESET, video.title),
+          extra=logFields(channel, video))
+        
+        # CHECK: no other run is downloading this video
+        if claims is not None and not claims.claim(video.id):
+          logger.warning("Skipping {}: it's being downloaded by another run".format(video.id),
+                         extra=logFields(channel, video))
+          claimedJobs.append(job)
+          continue
+        
+        # CHECK: there is space for this video
+        #  -the info extracted for the estimate is kept for the download
+        if diskGuard is not None:
+          if job.estimatedSize is None:
+            startTime         = time.monotonic()
+            job.videoInfo     = self._extractVideoInfo(channel, video, quality)
+            job.extractTime   = time.monotonic() - startTime
+            if job.videoInfo is not None:
+              job.estimatedSize = self._estimateDownloadSize(channel, video, quality, info=job.videoInfo)
+          if not diskGuard.admit(job):
+            deferredJobs.append(job)
+            self._recordTelemetry(job, "deferred")
+            if claims is not None:
+              claims.release(video.id)
+            continue
+        
+        # a queued merge keeps its disk reservation until it's finished
+        mergeQueued = False
+        try:
+          mergeQueued = self._downloadWithRetry(job, downloadResults, mergePool, downloadSlot)
+        finally:
+          if diskGuard is not None and not mergeQueued:
+            diskGuard.release(job)
+          if claims is not None and not mergeQueued:
+            claims.release(video.id)
+        
+        # record any merges that have finished
+        self._collectMerges(mergePool, downloadResults, diskGuard)
+        
+        if checkpoint is not None:
+          saveCheckpoint()
+      
+      # wait for the remaining merges
+      self._collectMerges(mergePool, downloadResults, diskGuard, wait=True)
     
+    finally:
+      if mergePool is not None and ownMergePool:
+        mergePool.shutdown()
+      
+      # claims on merged (or abandoned) videos
+      if claims is not None:
+        claims.releaseAll()
+    
+    # how fast did we download
+    if downloadResults["Bytes"] > 0 and downloadResults["TransferTime"] > 0:
+      logger.info("")
+      logger.info("Transferred {} in {:.0f}s ({}/s)".format(
+        formatBytes(downloadResults["Bytes"]), downloadResults["TransferTime"],
+        formatBytes(downloadResults["Bytes"] / downloadResults["TransferTime"])))
+    
+    # store the updated library index
+    if libraryIndex is not None:
+      libraryIndex.save()
+    
+    
+    # deferred (and, if we were stopped, unstarted) videos stay unseen, so
+    # are tried again next run
+    #  -don't let their channel's min video date move past them
+    if len(deferredJobs) > 0:
+      logger.warning("Deferred {} video(s) due to lack of disk space".format(len(deferredJobs)))
+    if len(claimedJobs) > 0:
+      logger.warning("Skipped {} video(s) being downloaded by another run".format(len(claimedJobs)))
+    self._holdPendingVideos(channelVideos, startMinVideoDates, deferredJobs + claimedJobs + downloadQueue.jobs())
     
     # return how we did overall
     return downloadResults["Downloaded"], downloadResults["Failed"]
   
   
-  def filterChannelVideos(self, channel: Channel, videoList: list):
+  def _discoverNewVideos(self, stopEvent=None, pushedVideos: dict = None, pushChannelIDs=None,
+                         channelCredits: dict = None) -> list:
     """
-    # Apply global and channel-specific filters to all of thet videos in
-    # <channel>'s <videoList>
+    # Return (channel, videos) for each of our channels with new videos
+    # that pass its filters, and aren't already in the download directory
+    #  -see downloadNewVideos for the arguments
+    #
+    :param stopEvent:
+    :param pushedVideos:
+    :param pushChannelIDs:
+    :param channelCredits: if given, filled with the API credits used
+                           checking each channel, by channel ID
+    :return:
+    """
+    
+    # record the credits used checking <channel> since <creditsUsed>
+    def countCredits(channel, creditsUsed):
+      if channelCredits is not None:
+        channelCredits[channel.id] = channelCredits.get(channel.id, 0) + self.getAPICreditsUsed() - creditsUsed
+    
+    # separate to-ignore and to-download channels
+    ignoreChannelList, channelList = self._isolateIgnoreChannels()
+    logger.debug("downloadNewVideos: Ignoring {} channel(s)".format(len(ignoreChannelList)))
+    logger.debug("downloadNewVideos: Ignoring: %s", LazyJoin(ignoreChannelList, key=lambda x: x.title))
+    
+    
+    # channels whose videos were pushed to us don't need fetching, and
+    # channels we get pushes for don't need polling
+    pushedVideos   = {} if pushedVideos is None else pushedVideos
+    pushChannelIDs = set() if pushChannelIDs is None else set(pushChannelIDs)
+    pushedChannelList = [channel for channel in channelList if channel.id in pushedVideos]
+    channelList       = [channel for channel in channelList
+                         if channel.id not in pushedVideos and channel.id not in pushChannelIDs]
+    
+    # only poll the channels that are due
+    pollTime = datetime.datetime.now(datetime.timezone.utc)
+    if self.adaptivePolling:
+      channelList, notDueChannelList = self._isolateDueChannels(channelList, pollTime)
+      logger.debug("downloadNewVideos: %d channel(s) not due: %s",
+                   len(notDueChannelList), LazyJoin(notDueChannelList, key=lambda x: x.title))
+    
+    # for each subscribed channel, get the recent channel videos
+    channelVideos  = []
+    lenChannelList = len(channelList)
+    if lenChannelList == 1: logger.info("Checking 1 channel")
+    else:                   logger.info("Checking {} channels".format(len(channelList)))
+    
+    # pushed videos go straight to filtering
+    #  -the channel's other undecided videos are still waiting to be checked
+    for channel in pushedChannelList:
+      creditsUsed = None if channelCredits is None else self.getAPICreditsUsed()
+      videoList = self.filterChannelVideos(channel, pushedVideos[channel.id])
+      countCredits(channel, creditsUsed)
+      pushedIDs = set([video.id for video in pushedVideos[channel.id]])
+      self._undecidedVideos[channel.id] = [video for video in self._undecidedVideos.get(channel.id, [])
+                                           if video.id not in pushedIDs] + self.getFilterPlan(channel).deferred
+      logger.debug("downloadNewVideos: {} of {} pushed videos remain for {}".format(
+        len(videoList), len(pushedVideos[channel.id]), channel.title))
+      if len(videoList) > 0:
+        channelVideos.append((channel, videoList))
+    
+    for channel in channelList:
+      if stopEvent is not None and stopEvent.is_set():
+        logger.warning("Stopping: not checking the remaining channels")
+        break
+      logger.debug("downloadNewVideos: Checking channel {}".format(channel.title), extra=logFields(channel))
+      
+      # get the recent channel videos
+      creditsUsed = None if channelCredits is None else self.getAPICreditsUsed()
+      videoList = self.ytFetcher.fetchRecentVideos(channel.id)
+      logger.debug("downloadNewVideos: Found {} recent videos".format(len(videoList)), extra=logFields(channel))
+      
+      # learn how often to poll this channel from its upload history
+      #  -only with adaptive polling, so the config isn't rewritten for
+      #   every channel on every run otherwise
+      if self.adaptivePolling and not self._readOnly:
+        channel.setLastPolledAt(pollTime)
+        channel.setPollInterval(self._estimatePollInterval(videoList, pollTime))
+        logger.debug("downloadNewVideos: Poll interval for {} is now {}".format(channel.title, channel.pollInterval))
+      
+      # apply global and per-channel filters
+      videoList = self.filterChannelVideos(channel, videoList)
+      logger.debug("downloadNewVideos: {} videos remain after channel filtering".format(len(videoList)))
+      countCredits(channel, creditsUsed)
+      
+      # (videos that have left the recent videos won't be checked again)
+      self._undecidedVideos[channel.id] = list(self.getFilterPlan(channel).deferred)
+    
+      # add the videos to the master list
+      if len(videoList) > 0:
+        channelVideos.append((channel, videoList))
+    
+    
+    # skip videos that are already in the download directory
+    libraryIndex = self.getLibraryIndex()
+    if libraryIndex is not None:
+      channelVideos = self._skipLibraryVideos(libraryIndex, channelVideos)
+    
+    return channelVideos
+  
+  
+  def _skipLibraryVideos(self, libraryIndex: LibraryIndex, channelVideos: list) -> list:
+    """
+    # Remove the videos that are already in <libraryIndex> from
+    # <channelVideos>, marking them as seen (unless read-only)
+    #
+    :param libraryIndex:
+    :param channelVideos:
+    :return:
+    """
+    remainingChannelVideos = []
+    for channel, videoList in channelVideos:
+      remainingVideos = []
+      for video in videoList:
+        if libraryIndex.hasVideo(video.id):
+          logger.info("Already downloaded: [{}] {} ({})"
+                      .format(channel.title, video.title, libraryIndex.getVideoPath(video.id)))
+          if not self._readOnly:
+            self._markDownloaded(channel, video)
+        else:
+          remainingVideos.append(video)
+      if len(remainingVideos) > 0:
+        remainingChannelVideos.append((channel, remainingVideos))
+    return remainingChannelVideos
+  
+  
+  def _markDownloaded(self, channel: Channel, video: Video):
+    """
+    # Record that <channel>'s <video> is downloaded: add it to the seen list
+    # and move the channel's min video date up to it
+    #  -but not past the channel's undecided videos, so they're checked
+    #   again next run
     #
     :param channel:
-    :param videoList:
+    :param video:
     :return:
     """
     
-    # compare two values of the same type, where one or more may be None
-    def _compare(comparison, value1, value2):
-      if   value1 is None: return value2
-      elif value2 is None: return value1
-      else:
-        return {
-          "max": max,
-          "min": min,
-        }.get(comparison)(value1, value2)
+    # add to "seen" list
+    self.addSeenVideo(channel=channel, video=video)
+    
+    # update this channel's min video date to our latest video
+    minVideoDate   = video.publishedAt
+    undecidedDates = [undecided.publishedAt for undecided in self._undecidedVideos.get(channel.id, [])
+                      if undecided.publishedAt is not None]
+    if len(undecidedDates) > 0 and min(undecidedDates) < minVideoDate:
+      minVideoDate = min(undecidedDates)
+      logger.debug("downloadNewVideos: Min video date for channel {} held at an undecided video"
+                   .format(channel.title))
+    if channel.minVideoDate is None or minVideoDate > channel.minVideoDate:
+      channel.setMinVideoDate(minVideoDate)
+      logger.debug("downloadNewVideos: Min video date for channel {} is now {}"
+                   .format(channel.title, minVideoDate))
+  
+  
+  def _createDownloadQueue(self) -> DownloadQueue:
+    """
+    # Return an empty download queue using our ordering policy
+    #
+    :return:
+    """
+    halfLife = None if self.downloadAgingHalfLife is None else self.downloadAgingHalfLife.total_seconds()
+    return DownloadQueue(order=self.downloadOrder, agingHalfLife=halfLife)
+  
+  
+  def _holdPendingVideos(self, channelVideos: list, startMinVideoDates: dict, pendingJobs: list):
+    """
+    # Hold each channel's min video date at its oldest video in <pendingJobs>
+    #
+    :param channelVideos:
+    :param startMinVideoDates:
+    :param pendingJobs:
+    :return:
+    """
+    if len(pendingJobs) == 0:
+      return
+    for channel, _ in channelVideos:
+      pendingVideos = [job.video for job in pendingJobs if job.channel is channel]
+      if len(pendingVideos) > 0:
+        self._holdMinVideoDate(channel, startMinVideoDates[channel.id], pendingVideos)
+  
+  
+  def _holdMinVideoDate(self, channel: Channel, startDate, pendingVideos: list):
+    """
+    # Make sure <channel>'s min video date hasn't moved past any of its
+    # <pendingVideos>, without going back before its <startDate>
+    #
+    :param channel:
+    :param startDate:
+    :param pendingVideos:
+    :return:
+    """
+    pendingDates = [video.publishedAt for video in pendingVideos if video.publishedAt is not None]
+    if len(pendingDates) == 0 or channel.minVideoDate is None:
+      return
+    
+    oldestPending = min(pendingDates)
+    if oldestPending < channel.minVideoDate:
+      heldDate = oldestPending if startDate is None else max(startDate, oldestPending)
+      channel.setMinVideoDate(heldDate)
+      logger.debug("_holdMinVideoDate: Min video date for channel {} held at {}"
+                   .format(channel.title, heldDate))
+  
+  
+  def createMergePool(self):
+    """
+    # Return a pool to merge downloaded streams in, or None if they are
+    # merged inside the download process
+    #
+    :return:
+    """
+    if not self._usesMergePool():
+      return None
+    timeout = None if self.mergeTimeout is None else self.mergeTimeout.total_seconds()
+    return MergePool(self.ffmpegLocation, maxWorkers=self.mergeWorkers, timeout=timeout)
+  
+  
+  def createWebSubReceiver(self):
+    """
+    # Return a (not yet started) receiver for pushed upload notifications,
+    # or None if push mode isn't configured
+    #
+    :return:
+    """
+    if self.webSubCallbackURL is None:
+      return None
     
-    logger.debug("filterChannelVideos: Filtering channel: {}".format(channel.title))
-
-    # compile regex filters once before the video loop
-    _flags = re.MULTILINE | re.IGNORECASE
-    channelIncludePattern = re.compile(channel.includeFilter,      _flags) if channel.includeFilter      else None
-    globalIncludePattern  = re.compile(self.globalIncludeFilter,   _flags) if self.globalIncludeFilter   else None
-    channelExcludePattern = re.compile(channel.excludeFilter,      _flags) if channel.excludeFilter      else None
-    globalExcludePattern  = re.compile(self.globalExcludeFilter,   _flags) if self.globalExcludeFilter   else None
-
-    # filter each channel video
-    approvedVideos = []
-    for video in videoList:
-      logger.debug("filterChannelVideos: Filtering video: {}".format(video.title))
-
-      #########################################################################
-      # CHECK: item is a video
-      #########################################################################
-      if not isinstance(video, Video):
-        raise TypeError("{} is not a Video".format(video))
-
-
-      #########################################################################
-      # FILTER: not seen this video before
-      #########################################################################
-      if self.haveSeenVideo(channel, video):
-        logger.debug("filterChannelVideos: FILTERED OUT: seen before")
-        continue
-
-
-      #########################################################################
-      # FILTER: video min/max date
-      #########################################################################
-
-      minVideoDate = _compare("max", channel.minVideoDate, self.globalMinVideoDate)
-      if not (minVideoDate is None or video.publishedAt >= minVideoDate):
-        logger.debug("filterChannelVideos: FILTERED OUT: published before min date")
-        continue
-      maxVideoDate = _compare("min", channel.maxVideoDate, self.globalMaxVideoDate)
-      if not (maxVideoDate is None or video.publishedAt <= maxVideoDate):
-        logger.debug("filterChannelVideos: FILTERED OUT: published after max date")
+    # (the callback server's HTTP and XML modules are only needed in push mode)
+    from managedYoutubeDL.websub import WebSubReceiver
+    return WebSubReceiver(self.webSubCallbackURL, port=self.webSubPort, hubURL=self.webSubHubURL)
+  
+  
+  def createClaimDirectory(self):
+    """
+    # Return the per-video claims shared by every run downloading to our
+    # download directory
+    #
+    :return:
+    """
+    return ClaimDirectory(os.path.join(self.downloadDirectory or ".", Manager.CLAIM_DIRECTORY))
+  
+  
+  def planNewVideos(self, quality: VideoQuality) -> DownloadPlan:
+    """
+    # Work out what downloadNewVideos would do, without downloading
+    #  -discovery and filtering run as normal (and use API credits), but
+    #   read-only: the seen store isn't migrated, pruned or added to, and
+    #   videos already in the library aren't marked seen. The caller
+    #   shouldn't save the manager afterwards.
+    #  -each video's size comes from its format info, and its time from the
+    #   throughput recorded in the telemetry file (if there is one)
+    #
+    :param quality:
+    :return:
+    """
+    
+    # CHECK: quality is supported
+    if quality not in Manager.SUPPORTED_QUALITIES:
+      raise ValueError(f"Unknown video quality {quality}. Supported qualitities: {list(Manager.SUPPORTED_QUALITIES.keys())}")
+    
+    creditsUsed    = self.getAPICreditsUsed()
+    channelCredits = {}
+    self._readOnly = True
+    try:
+      channelVideos = dict([(channel.id, videoList) for channel, videoList in
+                            self._discoverNewVideos(channelCredits=channelCredits)])
+    finally:
+      self._readOnly = False
+    
+    # how fast have we downloaded before
+    throughput = None
+    if self.telemetryFile is not None and os.path.exists(self.telemetryFile):
+      throughput = historicalThroughput(TelemetryLog.read(self.telemetryFile), quality)
+    
+    plan = DownloadPlan(quality, throughput, waitBetweenDownloads=Manager.WAIT_BETWEEN_DOWNLOADS)
+    for channel in self.channelList:
+      if channel.id not in channelCredits:
         continue
-
-
-      #########################################################################
-      # FILTER: regex video title inclusion
-      #########################################################################
-
-      # channel filter
-      if channelIncludePattern:
-        if len(channelIncludePattern.findall(video.title)) == 0:
-          logger.debug("filterChannelVideos: FILTERED OUT: didn't match include filter")
-          continue
-
-      # global filter
-      if globalIncludePattern:
-        if len(globalIncludePattern.findall(video.title)) == 0:
-          logger.debug("filterChannelVideos: FILTERED OUT: didn't match include filter")
-          continue
-
-
-      #########################################################################
-      # FILTER: regex video title exclusion
-      #########################################################################
-
-      # channel filter
-      if channelExcludePattern:
-        if len(channelExcludePattern.findall(video.title)) > 0:
-          logger.debug("filterChannelVideos: FILTERED OUT: matched exclude filter")
-          continue
-
-      # global filter
-      if globalExcludePattern:
-        if len(globalExcludePattern.findall(video.title)) > 0:
-          logger.debug("filterChannelVideos: FILTERED OUT: matched exclude filter")
-          continue
-          
-          
-      #########################################################################
-      # FILTER: video duration
-      #  -involves an API call, so is done last
-      #########################################################################
-      minVideoLength = _compare("max", channel.minVideoLength, self.globalMinVideoLength)
-      maxVideoLength = _compare("min", channel.maxVideoLength, self.globalMaxVideoLength)
-      
-      if minVideoLength or maxVideoLength:
+      videoList = channelVideos.get(channel.id, [])
+      estimatedSizes = [self._estimateTransferSize(channel, video, quality) for video in videoList]
+      plan.addChannel(channel, channelCredits[channel.id], videoList, estimatedSizes)
+    plan.credits = self.getAPICreditsUsed() - creditsUsed
+    
+    return plan
+  
+  
+  def enqueueNewVideos(self, workQueue, quality: VideoQuality, stopEvent=None) -> int:
+    """
+    # Find our channels' new videos, as downloadNewVideos does, but add them
+    # to <workQueue> for workers to download instead of downloading them
+    #
+    :param workQueue: WorkQueue
+    :param quality:
+    :param stopEvent:
+    :return: number of jobs added
+    """
+    
+    # CHECK: quality is supported
+    if quality not in Manager.SUPPORTED_QUALITIES:
+      raise ValueError(f"Unknown video quality {quality}. Supported qualitities: {list(Manager.SUPPORTED_QUALITIES.keys())}")
+    
+    numQueued = 0
+    for channel, videoList in self._discoverNewVideos(stopEvent):
+      for video in videoList:
+        if workQueue.enqueue(channel, video, quality):
+          numQueued += 1
+          logger.debug("enqueueNewVideos: Queued [{}] {}".format(channel.title, video.title),
+                       extra=logFields(channel, video))
+    
+    logger.info("Queued {} new video(s) ({} waiting or in progress)".format(numQueued, len(workQueue.pendingJobs())))
+    return numQueued
+  
+  
+  def collectQueueResults(self, workQueue) -> tuple:
+    """
+    # Fold the results of the jobs the workers have finished in <workQueue>
+    # back into our state, as if we had downloaded them
+    #
+    :param workQueue: WorkQueue
+    :return: (number downloaded, number failed)
+    """
+    channelsByID = self.getChannelsByID()
+    
+    numDownloaded, numFailed = 0, 0
+    for channelID, video, success in workQueue.collectResults():
+      channel = channelsByID.get(channelID, None)
       
-        # get this video's duration
-        videoDetails = self.ytFetcher.fetchVideoDetails(video)
-        if videoDetails is None or videoDetails["duration"] is None:
-          logger.error("Skipped (duration unknown): [{}] {}".format(channel.title, video.title))
-          continue
+      # CHECK: we still have this channel
+      if channel is None:
+        logger.warning("collectQueueResults: Unknown channel {} for video {}".format(channelID, video.id))
+        continue
       
-        # reject this video if it's too short or too long
-        if minVideoLength and videoDetails["duration"] < minVideoLength:
-          logger.debug("filterChannelVideos: FILTERED OUT: video length too short ({} < {})"
-                       .format(videoDetails["duration"], minVideoLength))
-          continue
-        if maxVideoLength and videoDetails["duration"] > maxVideoLength:
-          logger.debug("filterChannelVideos: FILTERED OUT: video length too long ({} > {})"
-                       .format(videoDetails["duration"], maxVideoLength))
-          continue
+      if success:
+        numDownloaded += 1
+        self._markDownloaded(channel, video)
+      else:
+        numFailed += 1
+        logger.error("collectQueueResults: Could not download video: title: {}, id: {}".format(video.title, video.id),
+                     extra=logFields(channel, video))
     
+    # (workers may be on other hosts, so their files are picked up when the
+    # library index next rescans the download directory)
+    return numDownloaded, numFailed
+  
+  
+  def _collectMerges(self, mergePool: MergePool, downloadResults: dict, diskGuard: DiskSpaceGuard = None,
+                     wait: bool = False):
+    """
+    # Record the result of each finished merge in <downloadResults>,
+    # waiting for all outstanding merges if <wait>
+    #
+    :param mergePool:
+    :param downloadResults:
+    :param diskGuard:
+    :param wait:
+    :return:
+    """
+    if mergePool is None:
+      return
+    for job, success, mergeTime in mergePool.collect(wait=wait):
+      job.mergeTime = mergeTime
+      if success:
+        job.result.fileLoc = mergePool.getOutputFile(job.result.streamFiles)
+      self._finishDownload(job, success, downloadResults, outcome=None if success else "merge-failed")
+      if diskGuard is not None:
+        diskGuard.release(job)
+  
+  
+  def _finishDownload(self, job: DownloadJob, success: bool, downloadResults: dict, outcome: str = None):
+    """
+    # Record whether <job>'s video was successfully downloaded (and merged)
+    #
+    :param job:
+    :param success:
+    :param downloadResults:
+    :param outcome: telemetry outcome, if not simply "downloaded"/"failed"
+    :return:
+    """
+    channel = job.channel
+    video   = job.video
+    
+    # bytes transferred, even if the merge then failed
+    if job.result is not None and job.result.numBytes is not None and job.result.transferTime is not None:
+      downloadResults["Bytes"]        += job.result.numBytes
+      downloadResults["TransferTime"] += job.result.transferTime
+    
+    # if it downloaded successfully
+    #  -a job from a WorkQueue is only reported back through the queue: the
+    #   coordinator records it (see collectQueueResults), not the worker
+    if success:
+      downloadResults["Downloaded"] += 1
+      logger.debug("downloadNewVideos: Downloaded successfully", extra=logFields(channel, video))
+      if job.queueID is None:
+        self._markDownloaded(channel, video)
+        
+        # add it to the library index
+        libraryIndex = self.getLibraryIndex()
+        if libraryIndex is not None:
+          libraryIndex.addVideo(video.id, None if job.result is None else job.result.fileLoc)
     
-      # this video is approved
-      approvedVideos.append(video)
+    # else, download unsuccessful
+    else:
+      downloadResults["Failed"] += 1
+      logger.error("downloadNewVideos: Could not download video: title: {}, id: {}"
+                      .format(video.title, video.id), extra=logFields(channel, video))
     
+    self._recordTelemetry(job, outcome or ("downloaded" if success else "failed"))
+  
+  
+  def _recordTelemetry(self, job: DownloadJob, outcome: str):
+    """
+    # Write <job>'s telemetry record, if we are recording telemetry
+    #
+    :param job:
+    :param outcome:
+    :return:
+    """
+    telemetryLog = self.getTelemetryLog()
+    if telemetryLog is not None:
+      telemetryLog.write(buildJobRecord(job, outcome))
+  
+  
+  def _downloadWithRetry(self, job: DownloadJob, downloadResults: dict, mergePool: MergePool = None,
+                         downloadSlot=None) -> bool:
+    """
+    # Download <job>'s video, retrying after timeouts, and record the result
+    # in <downloadResults>, or hand its streams to <mergePool>. Returns
+    # whether a merge was queued.
+    #
+    :param job:
+    :param downloadResults:
+    :param mergePool:
+    :param downloadSlot: function() -> context manager to download inside
+    :return:
+    """
+    channel = job.channel
+    video   = job.video
+    quality = job.quality
     
-    # return this channel's approved videos
-    return approvedVideos
+    while True:
+      job.attempts += 1
+      try:
+        # (the first attempt reuses the info extracted for the size estimate,
+        # if there is one; retries extract it afresh)
+        downloadArgs = {"quality": quality, "timeout": self.downloadTimeout}
+        if job.videoInfo is not None and job.attempts == 1:
+          downloadArgs["info"] = job.videoInfo
+        with contextlib.nullcontext() if downloadSlot is None else downloadSlot():
+          result = self._downloadVideo(channel, video, **downloadArgs)
+        if not isinstance(result, DownloadResult):
+          result = DownloadResult(bool(result))
+        if result.extractTime is None:
+          result.extractTime = job.extractTime
+        job.result = result
+        
+        # streams downloaded: merge them while we carry on downloading
+        mergeQueued = mergePool is not None and result.needsMerge()
+        if mergeQueued:
+          logger.debug("downloadNewVideos: Queued merge of {} stream(s)".format(len(result.streamFiles)))
+          mergePool.submit(job, result.streamFiles)
+        else:
+          self._finishDownload(job, bool(result), downloadResults)
+
+        # wait between consecutive downloads
+        time.sleep(Manager.WAIT_BETWEEN_DOWNLOADS)
+        
+        # no timeout
+        return mergeQueued
+      
+      except TimeoutError:
+        waitingTime = 0 if self.postTimeoutWait is None else self.postTimeoutWait.total_seconds()
+        wakeTime = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=waitingTime)
+        logger.error("Download timed out. Waiting {}s (until {})"
+                     .format(waitingTime, wakeTime))
+        time.sleep(waitingTime)
+  
+  
+  def filterChannelVideos(self, channel: Channel, videoList: list):
+    """
+    # Apply global and channel-specific filters to all of thet videos in
+    # <channel>'s <videoList>
+    #
+    :param channel:
+    :param videoList:
+    :return:
+    """
+    logger.debug("filterChannelVideos: Filtering channel: {}".format(channel.title))
+    return self.getFilterPlan(channel).evaluate(videoList)
+  
+  
+  def getFilterPlan(self, channel: Channel) -> FilterPlan:
+    """
+    # Return <channel>'s compiled filter plan, rebuilding it if its (or the
+    # global) filter settings have changed since it was built
+    #
+    :param channel:
+    :return:
+    """
+    plan = self._filterPlans.get(channel.id, None)
+    if plan is None or plan.channel is not channel or plan.key != FilterPlan.settingsKey(self, channel):
+      plan = FilterPlan(self, channel, stats=None if plan is None else plan.stats)
+      self._filterPlans[channel.id] = plan
+    return plan
+  
+  
+  def getFilterRejections(self) -> dict:
+    """
+    # Number of videos rejected by each filter, per channel ID
+    #
+    :return:
+    """
+    return {channelID: dict(plan.rejections) for channelID, plan in self._filterPlans.items()}
   
   
   def updateChannels(self):
     """
     # Fetch the currently subscribed channels for the user, adding new
-    # channels to our list of known channels, and removing old ones
+    # channels to our list of known channels, removing old ones, and
+    # updating the titles of renamed ones (see diffChannels)
     #
-    :return:
+    :return: (number added, number removed, number renamed)
     """
   
-    # load the existing (stale) list of channels
-    channelList = [] + self.channelList
-    
     # how many channels do we know about
-    numKnownChannels = len(channelList)
-    logger.debug("updateChannels: Found {} channels in the current channel list".format(numKnownChannels))
+    channelList = self.channelList or []
+    logger.debug("updateChannels: Found {} channels in the current channel list".format(len(channelList)))
   
     # fetch the currently subscribed channels
     currentChannels = self.ytFetcher.fetchMySubscribedChannels()
     
-    # separate out the new channels added and old channels removed
-    newChannels = [ch for ch in currentChannels if ch not in channelList]
-    remChannels = [ch for ch in channelList if ch not in currentChannels]
+    # separate out the new, removed and renamed channels
+    newChannels, remChannels, renamedChannels = Manager.diffChannels(channelList, currentChannels)
     
-    # add the new channels
+    # log the changes
     for channel in newChannels:
       logger.info("Adding channel: {}".format(channel.title))
-      channelList.append(channel)
-    
-    # remove and log the removed channels
     for channel in remChannels:
       logger.info("Removing channel: {}".format(channel.title))
-    channelList = [ch for ch in channelList if ch not in remChannels]
-
-    ## for each of the CURRENTLY SUBSCRIBED channels
-    ##  -add it to the channel list if it's not already there
-    #numAdded = 0
-    #for channel in currentChannels:
-    #  if channel not in channelList:
-    #    logger.debug("updateChannels: Adding channel: {}".format(channel.title))
-    #    numAdded += 1
-    #    channelList.append(channel)
-    #logger.debug("updateChannels: Found {} new channels".format(numAdded))
-    
-    ## for each EXISTING channel
-    ##  -remove it from the list if it's not a current channel
-    #numKnownChannels = len(channelList)
-    #channelList      = list(filter(lambda _ch: _ch in currentChannels, channelList))
-    #numRemoved       = numKnownChannels - len(channelList)
-    #logger.debug("updateChannels: Removed {} old channels".format(numRemoved))
-
+    
+    # renamed channels keep their settings; only the title changes
+    for channel, title in renamedChannels:
+      logger.info("Renaming channel: {} -> {}".format(channel.title, title))
+      channel.setTitle(title)
+    
     # store the channel list
-    self.setChannelList(channelList)
+    if len(newChannels) > 0 or len(remChannels) > 0 or len(renamedChannels) > 0:
+      remIDs = set([channel.id for channel in remChannels])
+      self.setChannelList([ch for ch in channelList if ch.id not in remIDs] + newChannels)
     
-    return len(newChannels), len(remChannels)
+    return len(newChannels), len(remChannels), len(renamedChannels)
+  
+  
+  @staticmethod
+  def diffChannels(knownChannels: list, currentChannels: list) -> tuple:
+    """
+    # Compare our <knownChannels> with the <currentChannels> subscribed to,
+    # by channel ID
+    #  -a channel whose ID we know but whose title has changed is renamed,
+    #   rather than removed and added, so it keeps its settings
+    #
+    :param knownChannels:
+    :param currentChannels:
+    :return: (new channels, removed channels, [(renamed channel, new title)])
+    """
+    knownByID   = dict([(channel.id, channel) for channel in knownChannels])
+    currentByID = dict([(channel.id, channel) for channel in currentChannels])
+    
+    newChannels     = [channel for channelID, channel in currentByID.items() if channelID not in knownByID]
+    remChannels     = [channel for channelID, channel in knownByID.items() if channelID not in currentByID]
+    renamedChannels = [(channel, currentByID[channelID].title) for channelID, channel in knownByID.items()
+                       if channelID in currentByID and channel.title != currentByID[channelID].title]
+    return newChannels, remChannels, renamedChannels
   
\ No newline at end of file
@@ -0,0 +1,204 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class MergePool:
+  """
+  # Merges separately downloaded video and audio streams with ffmpeg, away
+  # from the download path, so the network isn't idle while we merge and a
+  # slow merge can't time out (and re-download) a finished transfer
+  #  -each merge runs in its own ffmpeg process; at most <maxWorkers> run at
+  #   once, and each is killed after <timeout> seconds
+  """
+
+  # yt-dlp names the separate streams "<name>.f<format id>.<ext>"
+  STREAM_FILE_PATTERN = re.compile(r"\.f[0-9A-Za-z_-]+\.[A-Za-z0-9]+$")
+
+
+  @staticmethod
+  def getMergedFileName(streamFile: str, outputFormat: str = "mkv") -> str:
+    """
+    # Return the name of the merged file for one of a video's <streamFile>s,
+    # i.e., "<name>.f137.mp4" -> "<name>.mkv"
+    #
+    :param streamFile:
+    :param outputFormat:
+    :return:
+    """
+    baseName = MergePool.STREAM_FILE_PATTERN.sub("", streamFile)
+    if baseName == streamFile:
+      baseName = os.path.splitext(streamFile)[0]
+    return "{}.{}".format(baseName, outputFormat)
+
+
+  @staticmethod
+  def _getFFmpegBinary(ffmpegLocation: str) -> str:
+
+    # like yt-dlp, accept either the binary or the directory it's in
+    if ffmpegLocation is not None and os.path.isdir(ffmpegLocation):
+      return os.path.join(ffmpegLocation, "ffmpeg")
+    return ffmpegLocation or "ffmpeg"
+
+
+  def __init__(self, ffmpegLocation: str, maxWorkers: int = 1, timeout: float = None, outputFormat: str = "mkv"):
+
+    # CHECK: number of workers is valid
+    if not isinstance(maxWorkers, int) or maxWorkers < 1:
+      raise ValueError("maxWorkers must be an int >= 1")
+
+    self.ffmpegBinary = MergePool._getFFmpegBinary(ffmpegLocation)
+    self.maxWorkers   = maxWorkers
+    self.timeout      = timeout
+    self.outputFormat = outputFormat
+
+    # each worker thread just waits on its ffmpeg process, so the CPU
+    # work happens outside this process
+    self._executor = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix="merge")
+
+    # (job, future) for every merge that hasn't been collected yet
+    self._pending = []
+    self._lock    = threading.Lock()
+
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, excType, excValue, traceback):
+    self.shutdown()
+
+  def __len__(self):
+    with self._lock:
+      return len(self._pending)
+
+
+  def pendingJobs(self) -> list:
+    """
+    # Return the jobs whose merges haven't been collected yet
+    #
+    :return:
+    """
+    with self._lock:
+      return [job for job, _ in self._pending]
+
+
+  def submit(self, job, streamFiles: list):
+    """
+    # Queue the merge of <job>'s downloaded <streamFiles>
+    #
+    :param job:
+    :param streamFiles:
+    :return:
+    """
+    future = self._executor.submit(self._merge, job, list(streamFiles))
+    with self._lock:
+      self._pending.append((job, future))
+    return future
+
+
+  def collect(self, wait: bool = False) -> list:
+    """
+    # Return (job, success, mergeTime) for each finished merge, waiting for
+    # all outstanding merges to finish if <wait>
+    #
+    :param wait:
+    :return:
+    """
+    with self._lock:
+      pending = list(self._pending)
+
+    finished = []
+    for job, future in pending:
+      if not wait and not future.done():
+        continue
+      try:
+        success, mergeTime = future.result()
+      except Exception as err:
+        logger.error("MergePool: Merge of {} failed: {}".format(job, err), exc_info=True)
+        success, mergeTime = False, None
+      finished.append((job, success, mergeTime))
+      with self._lock:
+        self._pending.remove((job, future))
+    return finished
+
+
+  def shutdown(self, wait: bool = True):
+    self._executor.shutdown(wait=wait)
+
+
+  def getOutputFile(self, streamFiles: list) -> str:
+    """
+    # Return the file a video's <streamFiles> are merged into
+    #
+    :param streamFiles:
+    :return:
+    """
+    # a single (already mixed) stream keeps its own format
+    if len(streamFiles) == 1:
+      return MergePool.getMergedFileName(streamFiles[0], streamFiles[0].rsplit(".", 1)[-1])
+    return MergePool.getMergedFileName(streamFiles[0], self.outputFormat)
+
+
+  def _merge(self, job, streamFiles: list) -> tuple:
+    """
+    # Merge <streamFiles> into a single file, removing the streams if
+    # successful, and return (success, time taken)
+    #  -on failure the streams are kept, so the next attempt only has to
+    #   redo the merge
+    #
+    :param job:
+    :param streamFiles:
+    :return:
+    """
+    startTime  = time.monotonic()
+    outputFile = self.getOutputFile(streamFiles)
+
+    # a single (already mixed) stream only needs renaming
+    if len(streamFiles) == 1:
+      os.replace(streamFiles[0], outputFile)
+      return True, time.monotonic() - startTime
+
+    # write to a temporary file, so a partial merge is never mistaken for a
+    # finished video
+    tmpFile = "{}.temp.{}".format(outputFile[:-len(self.outputFormat) - 1], self.outputFormat)
+    cmd = [self.ffmpegBinary, "-y", "-loglevel", "error", "-nostdin"]
+    for streamFile in streamFiles:
+      cmd += ["-i", streamFile]
+    for i in range(len(streamFiles)):
+      cmd += ["-map", str(i)]
+    cmd += ["-c", "copy", tmpFile]
+
+    try:
+      proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=self.timeout)
+    except subprocess.TimeoutExpired:
+      logger.error("MergePool: Merge of {} timed out after {}s".format(job, self.timeout))
+      MergePool._removeFile(tmpFile)
+      return False, time.monotonic() - startTime
+
+    if proc.returncode != 0 or not os.path.exists(tmpFile):
+      logger.error("MergePool: Merge of {} failed ({}): {}"
+                   .format(job, proc.returncode, proc.stderr.decode("utf-8", "replace").strip()))
+      MergePool._removeFile(tmpFile)
+      return False, time.monotonic() - startTime
+
+    os.replace(tmpFile, outputFile)
+    for streamFile in streamFiles:
+      MergePool._removeFile(streamFile)
+
+    mergeTime = time.monotonic() - startTime
+    logger.debug("MergePool: Merged {} in {:.1f}s".format(job, mergeTime))
+    return True, mergeTime
+
+
+  @staticmethod
+  def _removeFile(fileLoc: str):
+    try:
+      os.remove(fileLoc)
+    except FileNotFoundError:
+      pass
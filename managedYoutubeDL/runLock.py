@@ -0,0 +1,248 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import json
+import os
+import socket
+import time
+
+# fcntl is POSIX-only: without it, RunLock doesn't lock (see acquire)
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+
+class RunLockedError(RuntimeError):
+  """ Another run holds the lock on the config file """
+  pass
+
+
+def _processAlive(pid) -> bool:
+  if not isinstance(pid, int) or pid <= 0:
+    return False
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    return True
+  return True
+
+
+def _ownerInfo() -> dict:
+  return {"host": socket.gethostname(), "pid": os.getpid(), "time": time.time()}
+
+
+class RunLock:
+  """
+  # An advisory lock that stops two runs using the same config file at once
+  #  -the lock is an flock() on "<config>.lock", not on the config itself,
+  #   as saving replaces the config file (and so would drop the lock)
+  #  -the kernel releases the lock if its run crashes; the holder's details
+  #   are kept in the lock file, so the next run can report that it
+  #   recovered a stale lock
+  """
+
+  def __init__(self, configFileLocation: str):
+    self.lockFileLocation = "{}.lock".format(configFileLocation)
+    self._fd = None
+
+
+  def __enter__(self):
+    self.acquire()
+    return self
+
+  def __exit__(self, excType, excValue, traceback):
+    self.release()
+
+
+  def isHeld(self) -> bool:
+    return self._fd is not None
+
+
+  def acquire(self, blocking: bool = False):
+    """
+    # Take the lock, raising RunLockedError if another run holds it (unless
+    # <blocking>, in which case we wait for it)
+    #
+    :param blocking:
+    :return:
+    """
+    if self._fd is not None:
+      return
+
+    # CHECK: this platform can lock files
+    if fcntl is None:
+      logger.warning("RunLock: File locking isn't supported on this platform; not locking {}".format(
+        self.lockFileLocation))
+      return
+
+    fd = os.open(self.lockFileLocation, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+      fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except BlockingIOError:
+      holder = RunLock._readOwner(fd)
+      os.close(fd)
+      raise RunLockedError("{} is locked by another run (pid {} on {})".format(
+        self.lockFileLocation, holder.get("pid", "?"), holder.get("host", "?")))
+    except BaseException:
+      os.close(fd)
+      raise
+
+    # a previous holder that didn't release the lock cleanly crashed
+    previous = RunLock._readOwner(fd)
+    if len(previous) > 0:
+      logger.warning("RunLock: Recovered stale lock {} from pid {} on {}".format(
+        self.lockFileLocation, previous.get("pid", "?"), previous.get("host", "?")))
+
+    # record who holds the lock
+    os.ftruncate(fd, 0)
+    os.pwrite(fd, json.dumps(_ownerInfo()).encode("utf-8"), 0)
+    self._fd = fd
+
+
+  def release(self):
+    if self._fd is None:
+      return
+
+    # an empty lock file marks a clean release
+    os.ftruncate(self._fd, 0)
+    fcntl.flock(self._fd, fcntl.LOCK_UN)
+    os.close(self._fd)
+    self._fd = None
+
+
+  @staticmethod
+  def _readOwner(fd) -> dict:
+    try:
+      data = os.pread(fd, 4096, 0)
+      return json.loads(data.decode("utf-8")) if len(data) > 0 else {}
+    except (OSError, ValueError):
+      return {"pid": "unknown"}
+
+
+class ClaimDirectory:
+  """
+  # Per-video claim files, so runs that share a download directory never
+  # download the same video at once
+  #  -a claim is "<videoID>.claim", created exclusively, holding its
+  #   owner's host, pid and claim time
+  #  -claims of dead processes on this host, or older than <staleAfter>
+  #   seconds (on any host), are stale and can be taken over
+  #  -a stale claim is only removed under an flock() on the directory's
+  #   ".claims.lock", after checking it's still stale, so two runs
+  #   recovering it at once can't remove each other's new claim
+  """
+
+  # default age (seconds) at which a claim is stale, whoever holds it
+  STALE_AFTER = 60*60*24
+
+
+  def __init__(self, directory: str, staleAfter: float = None):
+    os.makedirs(directory, exist_ok=True)
+    self.directory  = directory
+    self.staleAfter = ClaimDirectory.STALE_AFTER if staleAfter is None else staleAfter
+
+    # video IDs we hold claims for
+    self.claimed = set()
+
+
+  def _claimFile(self, videoID: str) -> str:
+    return os.path.join(self.directory, "{}.claim".format(videoID))
+
+
+  def claim(self, videoID: str) -> bool:
+    """
+    # Claim <videoID>, and report whether we now hold it
+    #
+    :param videoID:
+    :return:
+    """
+    if videoID in self.claimed:
+      return True
+
+    claimFile = self._claimFile(videoID)
+    for _ in range(2):
+      try:
+        fd = os.open(claimFile, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+      except FileExistsError:
+
+        # someone else holds it: take it over only if it's stale
+        if not self._isStale(claimFile) or not self._removeStaleClaim(claimFile):
+          return False
+        logger.warning("ClaimDirectory: Recovering stale claim on {}".format(videoID))
+        continue
+
+      with os.fdopen(fd, "w") as f:
+        json.dump(_ownerInfo(), f)
+      self.claimed.add(videoID)
+      return True
+
+    return False
+
+
+  def release(self, videoID: str):
+    if videoID in self.claimed:
+      self.claimed.discard(videoID)
+      self._removeFile(self._claimFile(videoID))
+
+
+  def releaseAll(self):
+    for videoID in list(self.claimed):
+      self.release(videoID)
+
+
+  def _removeStaleClaim(self, claimFile: str) -> bool:
+    """
+    # Remove <claimFile> if it's (still) stale, and report whether it was
+    #  -whoever gets the directory's lock first removes it; the others then
+    #   find it gone, or replaced by a live claim, and it's up to the
+    #   exclusive create in claim() which of them gets the video
+    #
+    :param claimFile:
+    :return:
+    """
+    # without file locking, just remove it (see RunLock.acquire)
+    if fcntl is None:
+      ClaimDirectory._removeFile(claimFile)
+      return True
+
+    fd = os.open(os.path.join(self.directory, ".claims.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+      fcntl.flock(fd, fcntl.LOCK_EX)
+      if not self._isStale(claimFile):
+        return False
+      ClaimDirectory._removeFile(claimFile)
+      return True
+    finally:
+      os.close(fd)
+
+
+  def _isStale(self, claimFile: str) -> bool:
+    try:
+      with open(claimFile, "r") as f:
+        owner = json.load(f)
+    except FileNotFoundError:
+      return True
+    except (OSError, ValueError):
+
+      # half-written: stale only once it's old
+      try:
+        return time.time() - os.stat(claimFile).st_mtime > self.staleAfter
+      except FileNotFoundError:
+        return True
+
+    if time.time() - owner.get("time", 0) > self.staleAfter:
+      return True
+    if owner.get("host") == socket.gethostname() and owner.get("pid") != os.getpid():
+      return not _processAlive(owner.get("pid", None))
+    return False
+
+
+  @staticmethod
+  def _removeFile(fileLoc: str):
+    try:
+      os.remove(fileLoc)
+    except FileNotFoundError:
+      pass
@@ -0,0 +1,140 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import time
+
+from managedYoutubeDL.sqliteStore import SQLiteStore
+
+
+class SeenStore(SQLiteStore):
+  """
+  # The IDs of the videos we've seen, per channel, in a SQLite file
+  #  -replaces the config's "seenChannelVideos" lists (which only kept the
+  #   last 25 IDs per channel), and can migrate them in (see migrate())
+  #  -a channel's IDs are read with one query the first time it's checked,
+  #   then looked up in memory
+  #  -old IDs are dropped by prune(), keeping at most <maxPerChannel> IDs
+  #   per channel and none seen more than <maxAge> seconds ago (None: no
+  #   limit)
+  """
+
+  _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS seen (
+      channelID TEXT NOT NULL,
+      videoID   TEXT NOT NULL,
+      seenAt    REAL NOT NULL,
+      PRIMARY KEY (channelID, videoID)
+    )
+  """
+
+
+  def __init__(self, dbFile: str, maxPerChannel: int = None, maxAge: float = None, clock=None):
+    super().__init__(dbFile, "seen store")
+    self.maxPerChannel = maxPerChannel
+    self.maxAge        = maxAge
+    self.clock         = time.time if clock is None else clock
+
+    # channel ID -> set of seen video IDs, for the channels checked so far
+    self._cache = {}
+
+
+  def __len__(self):
+    return self._connect().execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+
+  def _channelVideoIDs(self, channelID: str) -> set:
+    if channelID not in self._cache:
+      rows = self._connect().execute("SELECT videoID FROM seen WHERE channelID = ?", (channelID,))
+      self._cache[channelID] = set([row[0] for row in rows])
+    return self._cache[channelID]
+
+
+  def has(self, channelID: str, videoID: str) -> bool:
+    """
+    # Have we seen <channelID>'s <videoID>
+    #
+    :param channelID:
+    :param videoID:
+    :return:
+    """
+    return videoID in self._channelVideoIDs(channelID)
+
+
+  def videoIDs(self, channelID: str) -> set:
+    """
+    # Return the set of <channelID>'s seen video IDs
+    #  -this is the store's cached set: don't change it
+    #
+    :param channelID:
+    :return:
+    """
+    return self._channelVideoIDs(channelID)
+
+
+  def add(self, channelID: str, videoID: str):
+    """
+    # Record that we've seen <channelID>'s <videoID>
+    #
+    :param channelID:
+    :param videoID:
+    :return:
+    """
+    with self._transaction() as db:
+      db.execute("INSERT OR REPLACE INTO seen (channelID, videoID, seenAt) VALUES (?, ?, ?)",
+                 (channelID, videoID, self.clock()))
+    self._channelVideoIDs(channelID).add(videoID)
+
+
+  def channelVideoIDs(self, channelID: str) -> list:
+    """
+    # Return <channelID>'s seen video IDs, oldest first
+    #
+    :param channelID:
+    :return:
+    """
+    rows = self._connect().execute("SELECT videoID FROM seen WHERE channelID = ? ORDER BY seenAt, rowid",
+                                   (channelID,))
+    return [row[0] for row in rows]
+
+
+  def migrate(self, seenChannelVideos: dict) -> int:
+    """
+    # Add the IDs in a config's <seenChannelVideos> ({channelID: [videoID]},
+    # oldest first) to the store, keeping any we already have
+    #
+    :param seenChannelVideos:
+    :return: number of IDs added
+    """
+    now  = self.clock()
+    rows = [(channelID, videoID, now) for channelID, videoIDs in seenChannelVideos.items() for videoID in videoIDs]
+    with self._transaction() as db:
+      before = db.total_changes
+      db.executemany("INSERT OR IGNORE INTO seen (channelID, videoID, seenAt) VALUES (?, ?, ?)", rows)
+      numAdded = db.total_changes - before
+    self._cache = {}
+    return numAdded
+
+
+  def prune(self) -> int:
+    """
+    # Drop the IDs outside the retention limits
+    #
+    :return: number of IDs dropped
+    """
+    with self._transaction() as db:
+      before = db.total_changes
+      if self.maxAge is not None:
+        db.execute("DELETE FROM seen WHERE seenAt < ?", (self.clock() - self.maxAge,))
+      if self.maxPerChannel is not None:
+        db.execute("""
+          DELETE FROM seen WHERE rowid IN (
+            SELECT rowid FROM (
+              SELECT rowid, ROW_NUMBER() OVER (PARTITION BY channelID ORDER BY seenAt DESC, rowid DESC) AS n
+              FROM seen)
+            WHERE n > ?)
+        """, (self.maxPerChannel,))
+      numDropped = db.total_changes - before
+    self._cache = {}
+    if numDropped > 0:
+      logger.debug("SeenStore: Pruned {} seen video(s)".format(numDropped))
+    return numDropped
@@ -0,0 +1,77 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import sqlite3
+import threading
+
+
+class SQLiteStore:
+  """
+  # A SQLite file shared by threads, processes (and, for the work queue,
+  # hosts), with one connection per thread
+  #  -subclasses give the tables to create in _SCHEMA, and can set
+  #   _ROW_FACTORY for their connections
+  #  -writes go in a _transaction(), which takes the write lock straight
+  #   away, so two writers can't both act on what they read
+  """
+
+  # max time (seconds) to wait for another connection's lock on the file
+  BUSY_TIMEOUT = 60
+
+  _SCHEMA      = None
+  _ROW_FACTORY = None
+
+
+  def __init__(self, dbFile: str, name: str):
+    """
+    #
+    :param dbFile:
+    :param name: what the store is, for errors
+    """
+
+    # CHECK: directory for the store exists
+    dbDir = os.path.dirname(os.path.abspath(dbFile))
+    if not os.path.isdir(dbDir):
+      raise NotADirectoryError("{} directory does not exist: {}".format(name, dbDir))
+
+    self.dbFile = dbFile
+
+    # one connection per thread
+    self._local = threading.local()
+
+    with self._transaction() as db:
+      db.execute(self._SCHEMA)
+
+
+  def _connect(self) -> sqlite3.Connection:
+    db = getattr(self._local, "db", None)
+    if db is None:
+      db = sqlite3.connect(self.dbFile, timeout=self.BUSY_TIMEOUT, isolation_level=None)
+      if self._ROW_FACTORY is not None:
+        db.row_factory = self._ROW_FACTORY
+      self._local.db = db
+    return db
+
+
+  class _Transaction:
+    def __init__(self, db):
+      self.db = db
+
+    def __enter__(self):
+      self.db.execute("BEGIN IMMEDIATE")
+      return self.db
+
+    def __exit__(self, excType, excValue, traceback):
+      self.db.execute("COMMIT" if excType is None else "ROLLBACK")
+
+
+  def _transaction(self):
+    return SQLiteStore._Transaction(self._connect())
+
+
+  def close(self):
+    db = getattr(self._local, "db", None)
+    if db is not None:
+      db.close()
+      self._local.db = None
@@ -0,0 +1,89 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import datetime
+from datetime import timedelta
+
+from managedYoutubeDL.items import Channel
+from managedYoutubeDL.sqliteStore import SQLiteStore
+
+
+class StateStore(SQLiteStore):
+  """
+  # The channels' run state (see Channel.STATE_FIELDS) in a SQLite file,
+  # kept out of the hand-edited config
+  #  -a channel's saved state overrides the values in the config
+  #  -save() only writes the channels whose state changed since they were
+  #   last loaded or saved, in one transaction
+  """
+
+  _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS channelState (
+      channelID    TEXT PRIMARY KEY,
+      minVideoDate TEXT,
+      lastPolledAt TEXT,
+      pollInterval REAL
+    )
+  """
+
+
+  @staticmethod
+  def _toRow(channel: Channel) -> tuple:
+    return (
+      None if channel.minVideoDate is None else channel.minVideoDate.isoformat(),
+      None if channel.lastPolledAt is None else channel.lastPolledAt.isoformat(),
+      None if channel.pollInterval is None else channel.pollInterval.total_seconds(),
+    )
+
+
+  def __init__(self, dbFile: str):
+    super().__init__(dbFile, "state store")
+
+    # channel ID -> state row, as last loaded or saved
+    self._saved = {}
+
+
+  def load(self, channelList: list) -> int:
+    """
+    # Set the state of each channel in <channelList> that has saved state
+    #
+    :param channelList:
+    :return: number of channels with saved state
+    """
+    rows = self._connect().execute(
+      "SELECT channelID, minVideoDate, lastPolledAt, pollInterval FROM channelState").fetchall()
+    rows = dict([(row[0], tuple(row[1:])) for row in rows])
+
+    numLoaded = 0
+    for channel in channelList:
+      row = rows.get(channel.id, None)
+      if row is None:
+        continue
+      minVideoDate, lastPolledAt, pollInterval = row
+      channel.setMinVideoDate(None if minVideoDate is None else datetime.datetime.fromisoformat(minVideoDate))
+      channel.setLastPolledAt(None if lastPolledAt is None else datetime.datetime.fromisoformat(lastPolledAt))
+      channel.setPollInterval(None if pollInterval is None else timedelta(seconds=pollInterval))
+      self._saved[channel.id] = StateStore._toRow(channel)
+      numLoaded += 1
+    return numLoaded
+
+
+  def save(self, channelList: list) -> int:
+    """
+    # Save the state of the channels in <channelList> that has changed
+    #
+    :param channelList:
+    :return: number of channels saved
+    """
+    changed = [(channel.id,) + StateStore._toRow(channel) for channel in channelList
+               if self._saved.get(channel.id, None) != StateStore._toRow(channel)]
+    if len(changed) == 0:
+      return 0
+
+    with self._transaction() as db:
+      db.executemany("INSERT OR REPLACE INTO channelState (channelID, minVideoDate, lastPolledAt, pollInterval) "
+                     "VALUES (?, ?, ?, ?)", changed)
+    for row in changed:
+      self._saved[row[0]] = row[1:]
+    logger.debug("StateStore: Saved the state of {} channel(s)".format(len(changed)))
+    return len(changed)
@@ -0,0 +1,102 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import datetime
+import json
+import os
+import threading
+
+
+def _roundSeconds(value):
+  return None if value is None else round(value, 3)
+
+
+def buildJobRecord(job, outcome: str) -> dict:
+  """
+  # Return the telemetry record for a finished DownloadJob
+  #  -<outcome> is one of "downloaded", "failed", "merge-failed" or
+  #   "deferred"
+  #
+  :param job:
+  :param outcome:
+  :return:
+  """
+  result  = job.result
+  quality = getattr(job.quality, "value", job.quality)
+
+  numBytes     = None if result is None else result.numBytes
+  transferTime = None if result is None else result.transferTime
+
+  # average throughput (bytes/s) over the network transfer
+  throughput = None
+  if numBytes is not None and transferTime is not None and transferTime > 0:
+    throughput = int(numBytes / transferTime)
+
+  return {
+    "time":          datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+    "channel":       job.channel.title,
+    "channelID":     job.channel.id,
+    "videoID":       job.video.id,
+    "quality":       quality,
+    "format":        None if result is None else result.formatID,
+    "estimatedSize": job.estimatedSize,
+    "bytes":         numBytes,
+    "extractTime":   None if result is None else _roundSeconds(result.extractTime),
+    "transferTime":  _roundSeconds(transferTime),
+    "mergeTime":     _roundSeconds(job.mergeTime),
+    "throughput":    throughput,
+    "attempts":      job.attempts,
+    "outcome":       outcome,
+  }
+
+
+class TelemetryLog:
+  """
+  # Appends one JSON record per line to <fileLoc>, so records from every
+  # run can be analysed together
+  """
+
+  @staticmethod
+  def read(fileLoc: str) -> list:
+    """
+    # Return the records in the telemetry file at <fileLoc>, skipping any
+    # line that can't be parsed (e.g., cut short by a crash)
+    #
+    :param fileLoc:
+    :return:
+    """
+    records = []
+    with open(fileLoc, "r", encoding="utf-8") as f:
+      for line in f:
+        try:
+          records.append(json.loads(line))
+        except ValueError:
+          continue
+    return records
+
+
+  def __init__(self, fileLoc: str):
+
+    # CHECK: directory for the telemetry file exists
+    fileDir = os.path.dirname(os.path.abspath(fileLoc))
+    if not os.path.isdir(fileDir):
+      raise NotADirectoryError("telemetry directory does not exist: {}".format(fileDir))
+
+    self.fileLoc = fileLoc
+    self._lock   = threading.Lock()
+
+
+  def write(self, record: dict):
+    """
+    # Append <record> to the telemetry file
+    #  -telemetry is informational, so a failed write is logged, not raised
+    #
+    :param record:
+    :return:
+    """
+    line = json.dumps(record, separators=(",", ":")) + "\n"
+    try:
+      with self._lock, open(self.fileLoc, "a", encoding="utf-8") as f:
+        f.write(line)
+    except OSError as err:
+      logger.warning("TelemetryLog: Couldn't write to {}: {}".format(self.fileLoc, err))
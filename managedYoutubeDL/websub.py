@@ -0,0 +1,368 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import datetime
+import hashlib
+import hmac
+import queue
+import secrets
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ElementTree
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from managedYoutubeDL.items import Video
+
+
+# YouTube's public hub, and the feed (topic) for each channel's uploads
+DEFAULT_HUB_URL = "https://pubsubhubbub.appspot.com/subscribe"
+TOPIC_URL       = "https://www.youtube.com/xml/feeds/videos.xml?channel_id={}"
+
+_ATOM_NS = "{http://www.w3.org/2005/Atom}"
+_YT_NS   = "{http://www.youtube.com/xml/schemas/2015}"
+
+
+def getTopicURL(channelID: str) -> str:
+  return TOPIC_URL.format(channelID)
+
+
+def getChannelID(topicURL: str) -> str:
+  """
+  # Return the channel ID of a channel's feed <topicURL>, or None if it
+  # isn't a channel feed
+  #
+  :param topicURL:
+  :return:
+  """
+  query = urllib.parse.parse_qs(urllib.parse.urlparse(topicURL).query)
+  return query.get("channel_id", [None])[0]
+
+
+def _parseTime(text: str):
+  """
+  # Parse an Atom date, ISO 8601 with a UTC offset (e.g.,
+  # 2020-01-01T00:00:00+00:00), into an aware datetime
+  #
+  :param text:
+  :return: the datetime, or None if <text> is missing or unparseable
+  """
+  if text is None:
+    return None
+  try:
+    value = datetime.datetime.fromisoformat(text.strip().replace("Z", "+00:00"))
+  except ValueError:
+    return None
+  return value if value.tzinfo is not None else value.replace(tzinfo=datetime.timezone.utc)
+
+
+def parseNotification(body) -> list:
+  """
+  # Return the (channel ID, Video) of each entry in an Atom notification
+  #  -the hub sends a notification for new uploads and for edits to old
+  #   ones, so the videos still need filtering
+  #  -deleted videos (<at:deleted-entry>) have no <entry>, so are ignored
+  #  -an entry's publish date is its <published>, else its <updated>; an
+  #   entry with neither is dropped, as the date filters need one
+  #
+  :param body: bytes or str of the Atom feed
+  :return:
+  """
+  try:
+    root = ElementTree.fromstring(body)
+  except ElementTree.ParseError as err:
+    logger.warning("WebSub: Couldn't parse notification: {}".format(err))
+    return []
+
+  videos = []
+  for entry in root.findall(_ATOM_NS + "entry"):
+    videoID   = entry.findtext(_YT_NS + "videoId")
+    channelID = entry.findtext(_YT_NS + "channelId")
+    if videoID is None or channelID is None:
+      continue
+
+    publishedAt = _parseTime(entry.findtext(_ATOM_NS + "published"))
+    if publishedAt is None:
+      publishedAt = _parseTime(entry.findtext(_ATOM_NS + "updated"))
+    if publishedAt is None:
+      logger.warning("WebSub: Ignoring notification of {} from {}: no publish date".format(videoID, channelID))
+      continue
+
+    videos.append((channelID, Video(title=entry.findtext(_ATOM_NS + "title"), id=videoID, publishedAt=publishedAt)))
+  return videos
+
+
+class WebSubReceiver:
+  """
+  # Subscribes channels' upload feeds to a WebSub hub, and runs the local
+  # HTTP server the hub calls back with new uploads
+  #  -<callbackURL> is the public address of the server (which listens on
+  #   <port>), e.g., behind a reverse proxy
+  #  -a subscription only counts once the hub has verified it with us, and
+  #   lapses after its lease, so channels without one have to be polled
+  """
+
+  # lease we ask the hub for (the hub may grant a different one)
+  LEASE_SECONDS = 60*60*24*5
+
+  # renew leases this long before they run out
+  RENEW_MARGIN = timedelta(days=1)
+
+  # max time (seconds) to wait for the hub to accept a subscription
+  HUB_TIMEOUT = 30
+
+
+  def __init__(self, callbackURL: str, port: int = 8080, host: str = "", hubURL: str = None, urlopen=None):
+    """
+    #
+    :param callbackURL:
+    :param port: local port to listen on (0 for any free port)
+    :param host: local address to listen on (default: all)
+    :param hubURL:
+    :param urlopen: function(request, timeout), to talk to the hub
+    """
+    self.callbackURL = callbackURL
+    self.hubURL      = DEFAULT_HUB_URL if hubURL is None else hubURL
+    self.urlopen     = urllib.request.urlopen if urlopen is None else urlopen
+
+    # notifications are signed with a secret only we and the hub know
+    self.secret = secrets.token_hex(16)
+
+    # channel ID -> when its verified subscription runs out
+    self.leases = {}
+
+    # channel IDs we've asked to subscribe, waiting for the hub to verify
+    self._requested = set()
+    self._lock      = threading.Lock()
+
+    # (channel ID, Video) from notifications, waiting to be downloaded
+    self._notifications = queue.Queue()
+
+    self._server = ThreadingHTTPServer((host, port), self._createHandler())
+    self._server.daemon_threads = True
+    self._thread = None
+
+
+  @property
+  def port(self) -> int:
+    return self._server.server_address[1]
+
+
+  def __enter__(self):
+    self.start()
+    return self
+
+  def __exit__(self, excType, excValue, traceback):
+    self.stop()
+
+
+  def start(self):
+    """
+    # Start the callback server in the background
+    #
+    :return:
+    """
+    if self._thread is not None:
+      return
+    self._thread = threading.Thread(target=self._server.serve_forever, name="websub", daemon=True)
+    self._thread.start()
+    logger.info("WebSub: Listening on port {} for {}".format(self.port, self.callbackURL))
+
+
+  def stop(self):
+    if self._thread is not None:
+      self._server.shutdown()
+      self._thread.join()
+      self._thread = None
+    self._server.server_close()
+
+
+  ###########################################################################
+  # subscriptions
+  ###########################################################################
+
+  def hasLease(self, channelID: str, now: datetime.datetime = None) -> bool:
+    """
+    # Whether the hub is currently pushing <channelID>'s uploads to us
+    #
+    :param channelID:
+    :param now:
+    :return:
+    """
+    now = datetime.datetime.now(datetime.timezone.utc) if now is None else now
+    with self._lock:
+      expiresAt = self.leases.get(channelID, None)
+    return expiresAt is not None and now < expiresAt
+
+
+  def subscribe(self, channelID: str, mode: str = "subscribe") -> bool:
+    """
+    # Ask the hub to (un)subscribe us to <channelID>'s uploads, and report
+    # whether it accepted the request
+    #  -the subscription is only active once the hub verifies it
+    #
+    :param channelID:
+    :param mode: "subscribe" or "unsubscribe"
+    :return:
+    """
+    with self._lock:
+      self._requested.add(channelID)
+
+    data = urllib.parse.urlencode({
+      "hub.callback":      self.callbackURL,
+      "hub.mode":          mode,
+      "hub.topic":         getTopicURL(channelID),
+      "hub.verify":        "async",
+      "hub.lease_seconds": WebSubReceiver.LEASE_SECONDS,
+      "hub.secret":        self.secret,
+    }).encode("utf-8")
+    request = urllib.request.Request(self.hubURL, data=data, method="POST")
+
+    try:
+      with self.urlopen(request, timeout=WebSubReceiver.HUB_TIMEOUT) as response:
+        accepted = 200 <= response.status < 300
+    except (urllib.error.URLError, OSError) as err:
+      logger.warning("WebSub: Hub refused to {} to {}: {}".format(mode, channelID, err))
+      return False
+
+    logger.debug("WebSub: Requested {} to {}".format(mode, channelID))
+    return accepted
+
+
+  def renewLeases(self, channelIDs: list, now: datetime.datetime = None) -> int:
+    """
+    # (Re)subscribe each of <channelIDs> without a lease, or whose lease
+    # runs out within RENEW_MARGIN, and return how many were requested
+    #
+    :param channelIDs:
+    :param now:
+    :return:
+    """
+    now = datetime.datetime.now(datetime.timezone.utc) if now is None else now
+
+    numRequested = 0
+    for channelID in channelIDs:
+      if self.hasLease(channelID, now + WebSubReceiver.RENEW_MARGIN):
+        continue
+      if self.subscribe(channelID):
+        numRequested += 1
+    return numRequested
+
+
+  def _verify(self, mode: str, topicURL: str, leaseSeconds) -> bool:
+    """
+    # Handle the hub's verification of a (un)subscription we requested,
+    # recording the lease it granted
+    #
+    :param mode:
+    :param topicURL:
+    :param leaseSeconds:
+    :return: whether we asked for it
+    """
+    channelID = getChannelID(topicURL)
+    with self._lock:
+      if channelID is None or channelID not in self._requested:
+        return False
+
+      if mode == "subscribe":
+        try:
+          leaseSeconds = int(leaseSeconds)
+        except (TypeError, ValueError):
+          leaseSeconds = WebSubReceiver.LEASE_SECONDS
+        self.leases[channelID] = datetime.datetime.now(datetime.timezone.utc) + timedelta(seconds=leaseSeconds)
+      else:
+        self.leases.pop(channelID, None)
+        self._requested.discard(channelID)
+
+    logger.debug("WebSub: Hub verified {} to {}".format(mode, channelID))
+    return True
+
+
+  ###########################################################################
+  # notifications
+  ###########################################################################
+
+  def _isSigned(self, body: bytes, signature: str) -> bool:
+
+    # "<algorithm>=<hex digest>" of the body, keyed with our secret
+    if signature is None or "=" not in signature:
+      return False
+    algorithm, digest = signature.split("=", 1)
+    if algorithm not in ("sha1", "sha256", "sha384", "sha512"):
+      return False
+    expected = hmac.new(self.secret.encode("utf-8"), body, getattr(hashlib, algorithm)).hexdigest()
+    return hmac.compare_digest(expected, digest)
+
+
+  def _notify(self, body: bytes, signature: str):
+
+    # notifications not signed with our secret aren't from the hub
+    if not self._isSigned(body, signature):
+      logger.warning("WebSub: Ignoring notification with a bad signature")
+      return
+
+    for channelID, video in parseNotification(body):
+      logger.debug("WebSub: Notified of [{}] {}".format(channelID, video.title))
+      self._notifications.put((channelID, video))
+
+
+  def getNotifications(self, timeout: float = None) -> dict:
+    """
+    # Return the videos we've been notified of since the last call, by
+    # channel ID, waiting up to <timeout> seconds for the first one
+    #
+    :param timeout:
+    :return:
+    """
+    pushedVideos = {}
+    try:
+      item = self._notifications.get(timeout=timeout)
+      while True:
+        channelID, video = item
+        videoList = pushedVideos.setdefault(channelID, [])
+        if video not in videoList:
+          videoList.append(video)
+        item = self._notifications.get_nowait()
+    except queue.Empty:
+      pass
+    return pushedVideos
+
+
+  def _createHandler(self):
+    receiver = self
+
+    class _Handler(BaseHTTPRequestHandler):
+
+      # verification of a subscription: echo the challenge if we asked for it
+      def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        param = lambda name: query.get(name, [None])[0]
+
+        if param("hub.challenge") is None or not receiver._verify(
+            param("hub.mode"), param("hub.topic") or "", param("hub.lease_seconds")):
+          self.send_response(404)
+          self.end_headers()
+          return
+
+        challenge = param("hub.challenge").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(challenge)))
+        self.end_headers()
+        self.wfile.write(challenge)
+
+      # notification of a new (or changed) upload
+      def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        receiver._notify(body, self.headers.get("X-Hub-Signature"))
+
+        # always acknowledge, so the hub doesn't retry
+        self.send_response(204)
+        self.end_headers()
+
+      def log_message(self, format, *args):
+        logger.debug("WebSub: " + format % args)
+
+    return _Handler
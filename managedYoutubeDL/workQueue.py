@@ -0,0 +1,303 @@
+import logging
+logger = logging.getLogger(__name__)
+
+import datetime
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from managedYoutubeDL.downloadQueue import DownloadJob
+from managedYoutubeDL.items import Channel, Video
+from managedYoutubeDL.sqliteStore import SQLiteStore
+
+
+class WorkQueue(SQLiteStore):
+  """
+  # A queue of download jobs in a SQLite file on a shared directory, so a
+  # coordinator can hand out downloads to workers on several hosts
+  #  -a worker claims a job for <leaseSeconds>, renewing the lease while it
+  #   downloads; a job whose lease runs out (e.g., its worker died) can be
+  #   claimed by another worker, up to <maxAttempts> claims in all; after
+  #   that it fails, so a job that kills its worker isn't retried forever
+  #  -jobs are claimed in a transaction, which takes the write lock straight
+  #   away, so two workers can't both read a job as unclaimed
+  #  -finished jobs wait in the queue until the coordinator collects them
+  """
+
+  # default time (seconds) a claimed job stays claimed without a renewal
+  LEASE_SECONDS = 60*10
+
+  # default number of times a job can be claimed before it fails
+  MAX_ATTEMPTS = 3
+
+  # rows as sqlite3.Row, so columns can be read by name
+  _ROW_FACTORY = sqlite3.Row
+
+  QUEUED  = "queued"
+  CLAIMED = "claimed"
+  DONE    = "done"
+  FAILED  = "failed"
+
+  _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+      id             INTEGER PRIMARY KEY AUTOINCREMENT,
+      videoID        TEXT    NOT NULL UNIQUE,
+      videoTitle     TEXT,
+      publishedAt    TEXT,
+      channelID      TEXT    NOT NULL,
+      channelTitle   TEXT,
+      quality        TEXT,
+      state          TEXT    NOT NULL,
+      worker         TEXT,
+      leaseExpiresAt REAL,
+      attempts       INTEGER NOT NULL DEFAULT 0,
+      enqueuedAt     REAL    NOT NULL,
+      finishedAt     REAL
+    )
+  """
+
+
+  def __init__(self, dbFile: str, leaseSeconds: float = None, clock=None, maxAttempts: int = None):
+    super().__init__(dbFile, "work queue")
+    self.leaseSeconds = WorkQueue.LEASE_SECONDS if leaseSeconds is None else leaseSeconds
+    self.maxAttempts  = WorkQueue.MAX_ATTEMPTS if maxAttempts is None else maxAttempts
+    self.clock        = time.time if clock is None else clock
+
+
+  ###########################################################################
+  # coordinator
+  ###########################################################################
+
+  def enqueue(self, channel: Channel, video: Video, quality=None) -> bool:
+    """
+    # Add a job to download <channel>'s <video>, unless it's already queued
+    #
+    :param channel:
+    :param video:
+    :param quality: Manager.VideoQuality, or its value
+    :return: whether it was added
+    """
+    quality     = getattr(quality, "value", quality)
+    publishedAt = None if video.publishedAt is None else video.publishedAt.isoformat()
+    with self._transaction() as db:
+      cursor = db.execute(
+        "INSERT OR IGNORE INTO jobs (videoID, videoTitle, publishedAt, channelID, channelTitle, quality, state, "
+        "enqueuedAt) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (video.id, video.title, publishedAt, channel.id, channel.title, quality, WorkQueue.QUEUED, self.clock()))
+      return cursor.rowcount == 1
+
+
+  def collectResults(self) -> list:
+    """
+    # Remove and return the finished jobs, as (channelID, Video, success)
+    #
+    :return:
+    """
+    with self._transaction() as db:
+      rows = db.execute("SELECT * FROM jobs WHERE state IN (?, ?) ORDER BY id",
+                        (WorkQueue.DONE, WorkQueue.FAILED)).fetchall()
+      db.executemany("DELETE FROM jobs WHERE id = ?", [(row["id"],) for row in rows])
+    return [(row["channelID"], WorkQueue._rowVideo(row), row["state"] == WorkQueue.DONE) for row in rows]
+
+
+  def pendingJobs(self) -> list:
+    """
+    # Return (channelID, Video) for each job that hasn't finished yet
+    #
+    :return:
+    """
+    rows = self._connect().execute("SELECT * FROM jobs WHERE state IN (?, ?) ORDER BY id",
+                                   (WorkQueue.QUEUED, WorkQueue.CLAIMED)).fetchall()
+    return [(row["channelID"], WorkQueue._rowVideo(row)) for row in rows]
+
+
+  def counts(self) -> dict:
+    """
+    # Number of jobs in each state
+    #
+    :return:
+    """
+    rows = self._connect().execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+    return {state: count for state, count in rows}
+
+
+  ###########################################################################
+  # workers
+  ###########################################################################
+
+  def claim(self, worker: str) -> DownloadJob:
+    """
+    # Claim the oldest job that's waiting, or whose lease has run out
+    #  -a job whose lease ran out on its last allowed attempt fails instead
+    #
+    :param worker: name of the claiming worker
+    :return: the job (with its queue ID in <queueID>), or None if there's
+             nothing to do
+    """
+    now = self.clock()
+    with self._transaction() as db:
+      while True:
+        row = db.execute("SELECT * FROM jobs WHERE state = ? OR (state = ? AND leaseExpiresAt < ?) ORDER BY id LIMIT 1",
+                         (WorkQueue.QUEUED, WorkQueue.CLAIMED, now)).fetchone()
+        if row is None:
+          return None
+        if row["state"] == WorkQueue.QUEUED:
+          break
+
+        # CHECK: the job has attempts left
+        if row["attempts"] >= self.maxAttempts:
+          logger.error("WorkQueue: {}'s lease on {} ran out after {} attempt(s); failing it".format(
+            row["worker"], row["videoID"], row["attempts"]))
+          db.execute("UPDATE jobs SET state = ?, finishedAt = ? WHERE id = ?", (WorkQueue.FAILED, now, row["id"]))
+          continue
+
+        logger.warning("WorkQueue: {}'s lease on {} ran out; reclaiming it".format(row["worker"], row["videoID"]))
+        break
+
+      db.execute("UPDATE jobs SET state = ?, worker = ?, leaseExpiresAt = ?, attempts = attempts + 1 WHERE id = ?",
+                 (WorkQueue.CLAIMED, worker, now + self.leaseSeconds, row["id"]))
+
+    channel = Channel(title=row["channelTitle"], id=row["channelID"])
+    job = DownloadJob(channel, WorkQueue._rowVideo(row), quality=row["quality"])
+    job.attempts = row["attempts"]
+    job.queueID  = row["id"]
+    return job
+
+
+  def renew(self, job: DownloadJob, worker: str) -> bool:
+    """
+    # Extend <worker>'s lease on <job>, and report whether it still holds it
+    #
+    :param job:
+    :param worker:
+    :return:
+    """
+    with self._transaction() as db:
+      cursor = db.execute("UPDATE jobs SET leaseExpiresAt = ? WHERE id = ? AND state = ? AND worker = ?",
+                          (self.clock() + self.leaseSeconds, job.queueID, WorkQueue.CLAIMED, worker))
+      return cursor.rowcount == 1
+
+
+  def complete(self, job: DownloadJob, worker: str, success: bool) -> bool:
+    """
+    # Record the result of <worker>'s download of <job>
+    #  -ignored if the job has since been reclaimed by another worker
+    #
+    :param job:
+    :param worker:
+    :param success:
+    :return: whether the result was recorded
+    """
+    state = WorkQueue.DONE if success else WorkQueue.FAILED
+    with self._transaction() as db:
+      cursor = db.execute("UPDATE jobs SET state = ?, finishedAt = ? WHERE id = ? AND state = ? AND worker = ?",
+                          (state, self.clock(), job.queueID, WorkQueue.CLAIMED, worker))
+      recorded = cursor.rowcount == 1
+    if not recorded:
+      logger.warning("WorkQueue: {} no longer holds {}; dropping its result".format(worker, job.video.id))
+    return recorded
+
+
+  @staticmethod
+  def _rowVideo(row) -> Video:
+    publishedAt = row["publishedAt"]
+    if publishedAt is not None:
+      publishedAt = datetime.datetime.fromisoformat(publishedAt)
+    return Video(title=row["videoTitle"], id=row["videoID"], publishedAt=publishedAt)
+
+
+class QueueWorker:
+  """
+  # Claims jobs from a WorkQueue and downloads them with a Manager's
+  # download settings, renewing each job's lease while it downloads
+  #  -the worker doesn't keep any state: results go back through the queue
+  #   for the coordinator to collect
+  """
+
+  # time (seconds) to wait before checking an empty queue again
+  IDLE_WAIT = 30
+
+
+  @staticmethod
+  def defaultName() -> str:
+    return "{}-{}".format(socket.gethostname(), os.getpid())
+
+
+  def __init__(self, manager, workQueue: WorkQueue, name: str = None, stopEvent: threading.Event = None):
+    self.manager   = manager
+    self.workQueue = workQueue
+    self.name      = QueueWorker.defaultName() if name is None else name
+    self.stopEvent = threading.Event() if stopEvent is None else stopEvent
+
+
+  def stop(self, *args):
+    self.stopEvent.set()
+
+
+  def processJob(self, job: DownloadJob) -> bool:
+    """
+    # Download <job>'s video (merging it if needed) and report the result
+    #
+    :param job:
+    :return: whether it downloaded successfully
+    """
+    from managedYoutubeDL.manager import Manager
+
+    job.quality = Manager.VideoQuality(job.quality or Manager.VideoQuality.QUALITY_MAX.value)
+
+    # keep our lease while we download
+    finished = threading.Event()
+    def renewLease():
+      while not finished.wait(self.workQueue.leaseSeconds / 3):
+        if not self.workQueue.renew(job, self.name):
+          logger.warning("QueueWorker: Lost the lease on {}".format(job))
+          return
+    renewThread = threading.Thread(target=renewLease, name="lease-renewal", daemon=True)
+    renewThread.start()
+
+    downloadResults = {"Downloaded": 0, "Failed": 0, "Bytes": 0, "TransferTime": 0.0}
+    mergePool = self.manager.createMergePool()
+    try:
+      mergeQueued = self.manager._downloadWithRetry(job, downloadResults, mergePool)
+      if mergeQueued:
+        self.manager._collectMerges(mergePool, downloadResults, wait=True)
+    finally:
+      finished.set()
+      renewThread.join()
+      if mergePool is not None:
+        mergePool.shutdown()
+
+    success = downloadResults["Downloaded"] > 0
+    self.workQueue.complete(job, self.name, success)
+    return success
+
+
+  def run(self, maxJobs: int = None, exitWhenEmpty: bool = False) -> int:
+    """
+    # Process jobs until stopped (or until <maxJobs> are done, or the queue
+    # is empty if <exitWhenEmpty>)
+    #
+    :param maxJobs:
+    :param exitWhenEmpty:
+    :return: number of jobs processed
+    """
+    logger.info("QueueWorker: {} taking jobs from {}".format(self.name, self.workQueue.dbFile))
+    numJobs = 0
+    while not self.stopEvent.is_set() and (maxJobs is None or numJobs < maxJobs):
+      job = self.workQueue.claim(self.name)
+
+      # nothing to do
+      if job is None:
+        if exitWhenEmpty:
+          break
+        self.stopEvent.wait(QueueWorker.IDLE_WAIT)
+        continue
+
+      logger.info("QueueWorker: Downloading {}".format(job))
+      self.processJob(job)
+      numJobs += 1
+
+    logger.info("QueueWorker: {} processed {} job(s)".format(self.name, numJobs))
+    return numJobs
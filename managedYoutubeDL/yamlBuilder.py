@@ -2,38 +2,160 @@ import logging
 logger = logging.getLogger(__name__)
 
 import os
-import datetime
+import gzip
+import hashlib
+import pickle
 import shutil
-import tempfile
 import yaml
 from yaml import MappingNode
 
+# libyaml's C parser and emitter, if PyYAML was built with them
+_SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_SafeDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
 class YAMLBuilder:
   
+  # load configs from their snapshots, when they're up to date (see
+  # loadManager); set by the --snapshot command line option
+  useSnapshots = False
+  
+  # version of the snapshot format
+  SNAPSHOT_VERSION = 1
+  
   @staticmethod
-  def loadManager(fileLoc: str):
+  def loadManager(fileLoc: str, snapshot: bool = None):
     """
     # Load the data from the <fileLoc> YAML file and use it to create
     # a Manager object
+    #  -with <snapshot> (default: useSnapshots), the parsed config is
+    #   pickled to "<fileLoc>.snapshot", and later loads use that instead of
+    #   parsing the YAML, for as long as the YAML's contents are unchanged
     #
     :param fileLoc:
+    :param snapshot:
     :return:
     """
+    snapshot = YAMLBuilder.useSnapshots if snapshot is None else snapshot
     
     # CHECK: file exists
     if not os.path.exists(fileLoc):
       raise FileNotFoundError("file not found at {}".format(fileLoc))
     
     # load the data
-    with open(fileLoc, 'r') as f:
-
-      # build a local loader so we don't mutate the global yaml.SafeLoader singleton
-      class _Loader(yaml.SafeLoader):
-        pass
+    with open(fileLoc, 'rb') as f:
+      data = f.read()
+    manager = YAMLBuilder.loadSnapshot(fileLoc, data) if snapshot else None
+    if manager is None:
+      
+      # build a local loader so we don't mutate the global yaml loader singletons
+      class _Loader(_SafeLoader):
+        stateInConfig = False
       for builderClass in [YAMLBuilder.Channel, YAMLBuilder.Manager, YAMLBuilder.Timedelta]:
         _Loader.add_constructor(builderClass.YAML_TAG, builderClass.constructor)
 
-      return yaml.load(f, Loader=_Loader)
+      manager = yaml.load(data, Loader=_Loader)
+      
+      # run state left in a config that now has a state file is moved
+      # there on the next save, so don't snapshot it
+      stateInConfig = _Loader.stateInConfig and manager.stateFile is not None
+      if snapshot and not stateInConfig:
+        YAMLBuilder.saveSnapshot(manager, fileLoc, data)
+    else:
+      stateInConfig = False
+    
+    # apply any run state kept outside the config
+    manager.loadState(stateInConfig=stateInConfig)
+    return manager
+  
+  
+  @staticmethod
+  def _snapshotFields(manager) -> dict:
+    """
+    # The fields of <manager> stored in its config, with its channels as
+    # dictionaries of their fields
+    #  -with a state file, the channels' run state isn't stored in the config
+    #
+    :param manager:
+    :return:
+    """
+    from managedYoutubeDL.items import Channel
+    
+    fields = dict([(key, value) for key, value in manager.__dict__.items()
+                   if not key.startswith("_")])
+    fields["channelList"] = [channel.toDict() for channel in manager.channelList]
+    if manager.stateFile is not None:
+      for channelFields in fields["channelList"]:
+        for key in Channel.STATE_FIELDS:
+          del channelFields[key]
+    return fields
+  
+  
+  @staticmethod
+  def saveSnapshot(manager, fileLoc: str, data: bytes):
+    """
+    # Pickle <manager>, as loaded from or dumped to the config <data> at
+    # <fileLoc>, to "<fileLoc>.snapshot"
+    #  -a snapshot that can't be written is logged, not raised, as the
+    #   config can always be parsed instead
+    #
+    :param manager:
+    :param fileLoc:
+    :param data:
+    :return:
+    """
+    snapshot = {
+      "version": YAMLBuilder.SNAPSHOT_VERSION,
+      "hash":    hashlib.sha256(data).hexdigest(),
+      "fields":  YAMLBuilder._snapshotFields(manager),
+    }
+    snapshotFileLoc = "{}.snapshot".format(fileLoc)
+    try:
+      with open("{}.tmp".format(snapshotFileLoc), "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+      os.replace("{}.tmp".format(snapshotFileLoc), snapshotFileLoc)
+    except OSError as err:
+      logger.warning("saveSnapshot: Could not save {}: {}".format(snapshotFileLoc, err))
+  
+  
+  @staticmethod
+  def loadSnapshot(fileLoc: str, data: bytes):
+    """
+    # Return the Manager in "<fileLoc>.snapshot", or None if there's no
+    # usable snapshot of the config <data>
+    #
+    :param fileLoc:
+    :param data:
+    :return:
+    """
+    from managedYoutubeDL.items   import Channel
+    from managedYoutubeDL.manager import Manager
+    
+    snapshotFileLoc = "{}.snapshot".format(fileLoc)
+    if not os.path.exists(snapshotFileLoc):
+      return None
+    try:
+      with open(snapshotFileLoc, "rb") as f:
+        snapshot = pickle.load(f)
+      if snapshot["version"] != YAMLBuilder.SNAPSHOT_VERSION or snapshot["hash"] != hashlib.sha256(data).hexdigest():
+        logger.debug("loadSnapshot: {} is out of date".format(snapshotFileLoc))
+        return None
+      
+      # CHECK: not run state to move out of the config (see loadManager)
+      fields = snapshot["fields"]
+      if fields.get("stateFile", None) is not None and \
+         any(key in channelFields for channelFields in fields["channelList"] for key in Channel.STATE_FIELDS):
+        logger.debug("loadSnapshot: {} holds the channels' run state".format(snapshotFileLoc))
+        return None
+      
+      # build the objects as the YAML constructors would, so the fields are
+      # validated, and fields added since the snapshot get their defaults
+      fields["channelList"] = [Channel(**channelFields) for channelFields in fields["channelList"]]
+      return Manager(**fields)
+    
+    # an unreadable or incompatible snapshot just means parsing the YAML
+    except Exception as err:
+      logger.warning("loadSnapshot: Ignoring {}: {}".format(snapshotFileLoc, repr(err)))
+      return None
     
   
   @staticmethod
@@ -57,10 +179,11 @@ class YAMLBuilder:
     # dump the data
     with open(fileLoc, 'w') as f:
 
-      # build a local dumper so we don't mutate the global yaml.SafeDumper singleton
-      class _Dumper(yaml.SafeDumper):
+      # build a local dumper so we don't mutate the global yaml dumper singletons
+      class _Dumper(_SafeDumper):
         pass
       _Dumper.add_representer(Channel, YAMLBuilder.Channel.representer)
+      _Dumper.omitChannelFields = Channel.STATE_FIELDS if manager.stateFile is not None else []
       _Dumper.add_representer(Manager, YAMLBuilder.Manager.representer)
       _Dumper.add_representer(timedelta, YAMLBuilder.Timedelta.representer)
 
@@ -68,19 +191,42 @@ class YAMLBuilder:
   
   
   @staticmethod
-  def safeDumpManager(manager, fileLoc: str,
-                      overwrite: bool = False, maxChangeFraction=0.1):
+  def saveManager(manager, fileLoc: str) -> bool:
+    """
+    # Save <manager> after a run: its run state goes to its state file (if
+    # it has one), and the config at <fileLoc> is only safe-dumped if its
+    # settings have changed (or there's no state file to hold the state)
+    #
+    :param manager:
+    :param fileLoc:
+    :return: whether the config file was rewritten
+    """
+    manager.saveState()
+    if manager.stateFile is not None and not manager.configChanged():
+      logger.debug("saveManager: Config unchanged; not rewriting {}".format(fileLoc))
+      return False
+    
+    YAMLBuilder.safeDumpManager(manager, fileLoc, overwrite=True)
+    manager.saveState(configSaved=True)
+    return True
+  
+  
+  @staticmethod
+  def safeDumpManager(manager, fileLoc: str, overwrite: bool = False):
     """
     # A safe version of dumpManager that, in addition to dumping <manager>
     # to <fileLoc>, will:
-    #  -make sure the resultant config file exists and has data
-    #  -make sure any changes to the config file's size are reasonable, i.e.,
-    #   within (<maxChangeFraction> * 100) % of the original
+    #  -write the new config to a sibling temp file and fsync it, then swap
+    #   it in with a single rename, so a config is never seen half-written
+    #  -make sure the new config reloads to the same manager first
+    #  -keep the last manager.configGenerations configs (see
+    #   rotateGenerations), rotating at most once per loaded manager, so
+    #   repeated saves in one run don't push out the older generations
+    #  -leave the config alone if it's unchanged, byte for byte
     #
     :param manager:
     :param fileLoc:
     :param overwrite:
-    :param maxChangeFraction:
     :return:
     """
     
@@ -88,16 +234,11 @@ class YAMLBuilder:
     if os.path.exists(fileLoc) and not overwrite:
       raise FileExistsError("output file {} already exists".format(fileLoc))
     
-    
-    # use a temporary directory for the file
-    with tempfile.TemporaryDirectory() as tmpDir:
-    
-      # create a temp file in the temp directory
-      tmpFileLoc = os.path.join(tmpDir, "tmp.config")
-      if os.path.exists(tmpFileLoc):
-        raise FileExistsError("temp file already exists at {}".format(tmpFileLoc))
-    
-      # dump the manager to a temporary config file
+    # dump the manager to a temp file next to the config, so the rename
+    # below stays on one filesystem
+    tmpFileLoc = "{}.tmp".format(fileLoc)
+    YAMLBuilder._removeFile(tmpFileLoc)
+    try:
       YAMLBuilder.dumpManager(manager, tmpFileLoc)
     
       # CHECK: new config file exists
@@ -106,48 +247,148 @@ class YAMLBuilder:
         logger.error("safeDumpManager: " + msg)
         raise FileNotFoundError(msg)
       
-      # if there is an old config file to overwrite
-      #  -check everything is okay before overwriting it
-      if os.path.exists(fileLoc):
-        
-        oldConfigFileStats = os.stat(fileLoc)
-        newConfigFileStats = os.stat(tmpFileLoc)
+      # CHECK: new config file reloads to the manager we dumped
+      with open(tmpFileLoc, "rb") as f:
+        data = f.read()
+      problem = YAMLBuilder.validateConfig(manager, data)
+      if problem is not None:
+        msg = "New config file is invalid ({}); Original config file is unchanged".format(problem)
+        logger.error("safeDumpManager: " + msg)
+        raise SystemError(msg)
       
-        # CHECK: new config file has data
-        if newConfigFileStats.st_size == 0:
-          msg = "New config file size is 0; Original config file is unchanged"
-          logger.error("safeDumpManager: " + msg)
-          raise SystemError(msg)
+      # CHECK: the config has changed
+      if os.path.exists(fileLoc):
+        with open(fileLoc, "rb") as f:
+          if f.read() == data:
+            logger.debug("safeDumpManager: Config unchanged; not rewriting {}".format(fileLoc))
+            return
+      with open(tmpFileLoc, "rb") as f:
+        os.fsync(f.fileno())
       
-        # CHECK: new config file hasn't drastically changed
-        sizeChange = newConfigFileStats.st_size / max(oldConfigFileStats.st_size, 1)
-        logger.debug("safeDumpManager: Config file size change: {} => {} = {}"
-                     .format(oldConfigFileStats.st_size, newConfigFileStats.st_size, sizeChange))
-        if abs(sizeChange - 1) > maxChangeFraction:
-          msg  = "safeDumpManager: New config file changed by more than {}%; "\
-                    .format(maxChangeFraction*100)
-          msg +=  "Original config file will be backed up"
-          logger.warning(msg)
-        
-          # backup the original config file file
-          now = str(datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)).replace(":", "-").replace(" ", "--")
-          backupFileLoc = "{}.{}.old".format(fileLoc, now)
-          shutil.move(fileLoc, backupFileLoc)
-        
-          # CHECK: old config file doesn't exist anymore and backup does
-          if os.path.exists(fileLoc) or not os.path.exists(backupFileLoc):
-            msg = "safeDumpManager: Cannot store new config file at {} as old file was not correctly backed up to {}" \
-              .format(fileLoc, backupFileLoc)
-            logger.error(msg)
-            raise FileExistsError(msg)
+      # keep the current config as the newest generation, then swap in the
+      # new one
+      if os.path.exists(fileLoc) and not manager._configRotated:
+        YAMLBuilder.rotateGenerations(fileLoc, manager.configGenerations, manager.compressConfigGenerations)
+        manager._configRotated = True
+      os.replace(tmpFileLoc, fileLoc)
+      YAMLBuilder._fsyncDirectory(fileLoc)
+    finally:
+      YAMLBuilder._removeFile(tmpFileLoc)
+    
+    # the next load can use the manager we just saved, without parsing it
+    if YAMLBuilder.useSnapshots:
+      YAMLBuilder.saveSnapshot(manager, fileLoc, data)
+  
+  
+  @staticmethod
+  def validateConfig(manager, data: bytes):
+    """
+    # Check the config <data> dumped from <manager> has the same structure:
+    # a manager with the same fields, and the same channels in order
+    #  -the config is parsed into plain dictionaries, so no Manager (or
+    #   Fetcher) is built
+    #
+    :param manager:
+    :param data:
+    :return: what's wrong with it, or None if it's valid
+    """
+    
+    class _Loader(_SafeLoader):
+      pass
+    constructMapping = lambda loader, node: loader.construct_mapping(node, deep=True)
+    _Loader.add_constructor(YAMLBuilder.Manager.YAML_TAG, constructMapping)
+    _Loader.add_constructor(YAMLBuilder.Channel.YAML_TAG, constructMapping)
+    _Loader.add_constructor(YAMLBuilder.Timedelta.YAML_TAG, YAMLBuilder.Timedelta.constructor)
+    
+    try:
+      fields = yaml.load(data, Loader=_Loader)
+    except yaml.YAMLError as err:
+      return "unparseable: {}".format(err)
+    if not isinstance(fields, dict):
+      return "not a manager"
+    
+    expectedFields = YAMLBuilder._snapshotFields(manager)
+    if set(fields.keys()) != set(expectedFields.keys()):
+      return "fields differ"
+    channelList = fields["channelList"]
+    if not isinstance(channelList, list) or not all(isinstance(channel, dict) for channel in channelList):
+      return "channelList is not a list of channels"
+    if [channel.get("id", None) for channel in channelList] != [channel["id"] for channel in expectedFields["channelList"]]:
+      return "channels differ"
+    return None
+  
+  
+  @staticmethod
+  def rotateGenerations(fileLoc: str, generations: int, compress: bool = False):
+    """
+    # Keep the config at <fileLoc> as its newest generation, "<fileLoc>.1",
+    # moving the older ones along and dropping any past <generations>
+    #  -with <compress>, generations are gzipped ("<fileLoc>.<n>.gz")
+    #  -the config itself stays in place; the caller replaces it
+    #
+    :param fileLoc:
+    :param generations:
+    :param compress:
+    :return:
+    """
+    def generationFile(n, compressed):
+      return "{}.{}{}".format(fileLoc, n, ".gz" if compressed else "")
+    
+    # drop the generations we no longer keep
+    n = max(generations, 0) + 1
+    while os.path.exists(generationFile(n, False)) or os.path.exists(generationFile(n, True)):
+      YAMLBuilder._removeFile(generationFile(n, False))
+      YAMLBuilder._removeFile(generationFile(n, True))
+      n += 1
+    if generations <= 0:
+      return
+    YAMLBuilder._removeFile(generationFile(generations, False))
+    YAMLBuilder._removeFile(generationFile(generations, True))
     
+    # move the rest along
+    for n in range(generations - 1, 0, -1):
+      for compressed in [False, True]:
+        if os.path.exists(generationFile(n, compressed)):
+          os.replace(generationFile(n, compressed), generationFile(n + 1, compressed))
     
-      # store the new config file
-      shutil.copy2(tmpFileLoc, fileLoc)
-      if not os.path.exists(fileLoc):
-        msg = "safeDumpManager: Failed to write config file data to {}".format(fileLoc)
-        logger.error(msg)
-        raise FileExistsError(msg)
+    # the current config: hard-linked if we can, so it's not copied
+    if compress:
+      with open(fileLoc, "rb") as src, gzip.open(generationFile(1, True) + ".tmp", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+      os.replace(generationFile(1, True) + ".tmp", generationFile(1, True))
+    else:
+      try:
+        os.link(fileLoc, generationFile(1, False))
+      except OSError:
+        shutil.copy2(fileLoc, generationFile(1, False))
+  
+  
+  @staticmethod
+  def _fsyncDirectory(fileLoc: str):
+    """
+    # Make the rename of <fileLoc> durable
+    #
+    :param fileLoc:
+    :return:
+    """
+    try:
+      fd = os.open(os.path.dirname(os.path.abspath(fileLoc)), os.O_RDONLY)
+    except OSError:
+      return
+    try:
+      os.fsync(fd)
+    except OSError:
+      pass
+    finally:
+      os.close(fd)
+  
+  
+  @staticmethod
+  def _removeFile(fileLoc: str):
+    try:
+      os.remove(fileLoc)
+    except FileNotFoundError:
+      pass
   
   
   class Channel:
@@ -163,18 +404,23 @@ class YAMLBuilder:
       :return:
       """
     
-      # organise the object so title, id, then ignore are first
+      # organise the object so title, id, ignore, then priority are first
       #  -remaining keys are ordered backwards-alphabetically since it
       #   groups similar items together
-      orderedKeys    = ["title", "id", "ignore"]
-      remainingKeys  = list(filter(lambda x: x not in orderedKeys, channel.__dict__.keys()))
+      fields         = channel.toDict()
+      orderedKeys    = ["title", "id", "ignore", "priority"]
+      remainingKeys  = list(filter(lambda x: x not in orderedKeys, fields.keys()))
       orderedKeys   += sorted(remainingKeys, key=lambda x: "".join(reversed(x)))
     
+      # with a state file, the run state isn't stored in the config
+      for key in getattr(dumper, "omitChannelFields", []):
+        orderedKeys.remove(key)
+    
       # yaml-ise the key:value pairs
       valueList = []
       for key in orderedKeys:
         yamlKey   = dumper.represent_data(key)
-        yamlValue = dumper.represent_data(channel.__dict__[key])
+        yamlValue = dumper.represent_data(fields[key])
         valueList.append((yamlKey, yamlValue))
     
       return MappingNode(YAMLBuilder.Channel.YAML_TAG, valueList)
@@ -190,6 +436,10 @@ class YAMLBuilder:
       """
       from managedYoutubeDL.items import Channel
       kwargs = loader.construct_mapping(node, deep=True)
+      
+      # note any run state in the config (see loadManager)
+      if any(key in kwargs for key in Channel.STATE_FIELDS):
+        type(loader).stateInConfig = True
       return Channel(**kwargs)
   
   
@@ -210,8 +460,8 @@ class YAMLBuilder:
       orderedKeys = []
       
       # all keys in Manager to yaml-ise
-      excludeKeys = ["ytFetcher"]
-      allKeys = [key for key in manager.__dict__.keys() if key not in excludeKeys]
+      #  -"_" keys are run-time state, so aren't stored
+      allKeys = [key for key in manager.__dict__.keys() if not key.startswith("_")]
       
       # order all keys by type
       byTypeDict = {}
@@ -0,0 +1,292 @@
+import base64
+import datetime
+import os
+import pickle
+import tempfile
+import threading
+import time
+from io import StringIO
+import logging
+
+import unittest
+import unittest.mock
+
+# create a streamed log so we can check its output at runtime
+logStream = StringIO()
+logging.basicConfig(stream=logStream, level=logging.DEBUG)
+
+# console
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+console.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+logging.getLogger("").addHandler(console)
+logger = logging.getLogger(__name__)
+
+from managedYoutubeDL.batch import BatchRunner, FairScheduler, SharedFetcher
+from managedYoutubeDL.items import Channel, Video
+from managedYoutubeDL.manager import Manager
+from managedYoutubeDL.runLock import RunLock
+
+"""
+sudo python3 -m unittest tests.test_batch.test_Batch.
+.
+"""
+
+
+class FakeFetcher:
+  """ Counts the API calls made for each channel/video """
+
+  def __init__(self, channelVideos: dict):
+    self.channelVideos = channelVideos
+    self.creditsUsed   = 0
+    self.calls         = []
+
+  def fetchRecentVideos(self, channelID, maxResults=10):
+    self.calls.append(channelID)
+    self.creditsUsed += 1
+    return list(self.channelVideos.get(channelID, []))
+
+  def fetchVideoDetails(self, video):
+    self.calls.append(video.id)
+    return {"duration": None}
+
+  def fetchMySubscribedChannels(self):
+    self.calls.append("subscriptions")
+    return []
+
+
+class test_Batch(unittest.TestCase):
+  TEST_ALL = True
+
+
+  @classmethod
+  def setUpClass(cls):
+    pass
+
+  @classmethod
+  def tearDownClass(cls):
+    pass
+
+  def setUp(self):
+
+    # reset log stream
+    logStream.truncate(0)
+
+    self.tmpDir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.tmpDir.cleanup()
+
+
+  @staticmethod
+  def waitFor(condition, timeout: float = 5):
+    endTime = time.monotonic() + timeout
+    while not condition() and time.monotonic() < endTime:
+      time.sleep(0.01)
+    return condition()
+
+
+  def test_FairScheduler(self):
+    """  """
+    logger.info("test_FairScheduler")
+
+    ###########################################################################
+    # TEST: a freed slot goes to the config that has had the fewest
+    ###########################################################################
+    scheduler = FairScheduler(1)
+    granted   = []
+
+    def download(key):
+      with scheduler.slot(key):
+        granted.append(key)
+
+    with scheduler.slot("a"):
+      threadA = threading.Thread(target=download, args=("a",))
+      threadA.start()
+      self.assertTrue(test_Batch.waitFor(lambda: len(scheduler._waiting) == 1))
+      threadB = threading.Thread(target=download, args=("b",))
+      threadB.start()
+      self.assertTrue(test_Batch.waitFor(lambda: len(scheduler._waiting) == 2))
+
+    threadA.join(5)
+    threadB.join(5)
+    self.assertListEqual(granted, ["b", "a"])
+    self.assertDictEqual(scheduler.granted, {"a": 2, "b": 1})
+
+    ###########################################################################
+    # TEST: no more than <workers> downloads run at once
+    ###########################################################################
+    scheduler = FairScheduler(2)
+    active    = [0, 0]
+    lock      = threading.Lock()
+
+    def busyDownload(key):
+      with scheduler.slot(key):
+        with lock:
+          active[0] += 1
+          active[1]  = max(active)
+        time.sleep(0.02)
+        with lock:
+          active[0] -= 1
+
+    threads = [threading.Thread(target=busyDownload, args=("config-{}".format(i % 3),)) for i in range(9)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join(5)
+    self.assertEqual(active[1], 2)
+    self.assertEqual(sum(scheduler.granted.values()), 9)
+
+    # TEST: invalid numbers of workers raise errors
+    for bad in [0, -1, 1.5, True]:
+      self.assertRaises(ValueError, FairScheduler, bad)
+
+
+  def test_SharedFetcher(self):
+    """  """
+    logger.info("test_SharedFetcher")
+
+    video   = Video(title="video-0", id="vid-id-0")
+    fetcher = FakeFetcher({"ch-id-0": [video]})
+    shared  = SharedFetcher(fetcher)
+
+    # TEST: a channel's videos are only fetched once, and each caller gets its own list
+    videoList = shared.fetchRecentVideos("ch-id-0")
+    videoList.append("extra")
+    self.assertListEqual(shared.fetchRecentVideos("ch-id-0"), [video])
+    self.assertListEqual(fetcher.calls, ["ch-id-0"])
+    self.assertEqual(shared.creditsUsed, 1)
+
+    # TEST: video details are only fetched once
+    shared.fetchVideoDetails(video)
+    shared.fetchVideoDetails(video)
+    self.assertListEqual(fetcher.calls, ["ch-id-0", "vid-id-0"])
+
+    # TEST: everything else goes straight to the fetcher
+    shared.fetchMySubscribedChannels()
+    shared.fetchMySubscribedChannels()
+    self.assertListEqual(fetcher.calls, ["ch-id-0", "vid-id-0", "subscriptions", "subscriptions"])
+
+
+  def test_run(self):
+    """  """
+    logger.info("test_run")
+
+    UTC    = datetime.timezone.utc
+    videos = {
+      "ch-shared": [Video(title="shared", id="vid-shared", publishedAt=datetime.datetime(2020, 1, 1, tzinfo=UTC))],
+      "ch-own":    [Video(title="own",    id="vid-own",    publishedAt=datetime.datetime(2020, 1, 2, tzinfo=UTC))],
+    }
+    channelIDs = {"a.yaml": ["ch-shared", "ch-own"], "b.yaml": ["ch-shared"], "broken.yaml": []}
+
+    configFiles = []
+    for name in channelIDs:
+      configFiles.append(os.path.join(self.tmpDir.name, name))
+      with open(configFiles[-1], "w") as f:
+        f.write("config")
+
+    fetcher       = FakeFetcher(videos)
+    downloadCalls = []
+    dumpCalls     = []
+    lock          = threading.Lock()
+
+    def loadManager(fileLoc):
+      name = os.path.basename(fileLoc)
+      if name == "broken.yaml":
+        raise ValueError("bad config")
+      # (each config downloads to its own directory, else they'd claim each other's videos)
+      downloadDirectory = os.path.join(self.tmpDir.name, os.path.splitext(name)[0])
+      os.makedirs(downloadDirectory, exist_ok=True)
+      manager = Manager(
+        clientSecretsFile  = None,
+        pickledCredentials = base64.b64encode(pickle.dumps("pickleStr")).decode("utf-8"),
+        downloadDirectory  = downloadDirectory,
+        ffmpegLocation     = None,
+        channelList        = [Channel(title=cid, id=cid, ignore=False) for cid in channelIDs[name]],
+        seenChannelVideos  = {},
+      )
+      manager.ytFetcher = fetcher
+      def download(channel, video, quality, timeout):
+        with lock:
+          downloadCalls.append((name, video.id))
+        return True
+      manager._downloadVideo = download
+      return manager
+
+    def dumpManager(manager, fileLoc):
+      with lock:
+        dumpCalls.append(os.path.basename(fileLoc))
+
+    ###########################################################################
+    # TEST: a broken config is reported as failed and unlocked; the others
+    # still run
+    ###########################################################################
+    runner = BatchRunner(configFiles, Manager.VideoQuality.QUALITY_MAX, workers=2,
+                         loadManager=loadManager, dumpManager=dumpManager)
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"), \
+         self.assertLogs("managedYoutubeDL.batch", level="ERROR") as logs:
+      results = runner.run()
+    self.assertDictEqual(results, {configFiles[0]: (2, 0), configFiles[1]: (1, 0), configFiles[2]: None})
+    self.assertNotIn(configFiles[2], runner.managers)
+    self.assertTrue(any("Couldn't load {}".format(configFiles[2]) in line for line in logs.output))
+    self.assertNotIn("broken.yaml", dumpCalls)
+    
+    # TEST: its lock was released
+    with RunLock(configFiles[2]):
+      pass
+    
+    downloadCalls.clear()
+    dumpCalls.clear()
+    fetcher.calls.clear()
+
+    ###########################################################################
+    # TEST: every config is downloaded and saved, sharing one fetcher
+    ###########################################################################
+    runner = BatchRunner(configFiles[:2], Manager.VideoQuality.QUALITY_MAX, workers=2,
+                         loadManager=loadManager, dumpManager=dumpManager)
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      results = runner.run()
+
+    self.assertDictEqual(results, {configFiles[0]: (2, 0), configFiles[1]: (1, 0)})
+    self.assertListEqual(sorted(downloadCalls),
+                         [("a.yaml", "vid-own"), ("a.yaml", "vid-shared"), ("b.yaml", "vid-shared")])
+
+    # TEST: the shared channel was only fetched once
+    self.assertListEqual(sorted(fetcher.calls), ["ch-own", "ch-shared"])
+    self.assertIs(runner.managers[configFiles[0]].ytFetcher, runner.managers[configFiles[1]].ytFetcher)
+
+    # TEST: each config is saved after each video, and at the end
+    self.assertEqual(dumpCalls.count("a.yaml"), 2 + 1)
+    self.assertEqual(dumpCalls.count("b.yaml"), 1 + 1)
+
+    ###########################################################################
+    # TEST: a config failing mid-run doesn't stop the others
+    ###########################################################################
+    def loadFailingManager(fileLoc):
+      manager = loadManager(fileLoc)
+      if fileLoc == configFiles[0]:
+        manager.downloadNewVideos = unittest.mock.Mock(side_effect=ConnectionError("no network"))
+      return manager
+
+    runner = BatchRunner(configFiles[:2], Manager.VideoQuality.QUALITY_MAX, workers=2,
+                         loadManager=loadFailingManager, dumpManager=dumpManager)
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      results = runner.run()
+    self.assertIsNone(results[configFiles[0]])
+    self.assertEqual(results[configFiles[1]], (1, 0))
+
+    ###########################################################################
+    # TEST: a config locked by another run is skipped
+    ###########################################################################
+    runner = BatchRunner(configFiles[:2], Manager.VideoQuality.QUALITY_MAX, workers=2,
+                         loadManager=loadManager, dumpManager=dumpManager)
+    with RunLock(configFiles[1]), unittest.mock.patch("managedYoutubeDL.manager.time.sleep"), \
+         self.assertLogs("managedYoutubeDL.batch", level="WARNING") as logs:
+      results = runner.run()
+    self.assertListEqual(list(results), [configFiles[0]])
+    self.assertDictEqual(runner.runLocks, {})
+    
+    # TEST: with one config left, only one of the two download slots is used
+    self.assertTrue(any("Only 1 of the 2 download slots" in line for line in logs.output))
+
+    # TEST: the same config can't be given twice
+    self.assertRaises(ValueError, BatchRunner, [configFiles[0], configFiles[0]], Manager.VideoQuality.QUALITY_MAX)
+    self.assertRaises(ValueError, BatchRunner, [], Manager.VideoQuality.QUALITY_MAX)
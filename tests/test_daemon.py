@@ -0,0 +1,374 @@
+import base64
+import datetime
+import os
+import pickle
+import signal
+import tempfile
+import threading
+import time
+from io import StringIO
+import logging
+
+import unittest
+import unittest.mock
+
+# create a streamed log so we can check its output at runtime
+logStream = StringIO()
+logging.basicConfig(stream=logStream, level=logging.DEBUG)
+
+# console
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+console.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+logging.getLogger("").addHandler(console)
+logger = logging.getLogger(__name__)
+
+from managedYoutubeDL.daemon import Daemon
+from managedYoutubeDL.items import Channel, Video
+from managedYoutubeDL.manager import Manager
+
+"""
+sudo python3 -m unittest tests.test_daemon.test_Daemon.
+.
+"""
+
+
+class test_Daemon(unittest.TestCase):
+  TEST_ALL = True
+  
+  
+  @classmethod
+  def setUpClass(cls):
+    pass
+  
+  @classmethod
+  def tearDownClass(cls):
+    pass
+  
+  def setUp(self):
+    
+    # reset log stream
+    logStream.truncate(0)
+    
+    self.tmpDir     = tempfile.TemporaryDirectory()
+    self.configFile = os.path.join(self.tmpDir.name, "config.yaml")
+    with open(self.configFile, "w") as f:
+      f.write("config")
+    
+    # the channel's videos, and the ones "downloaded"
+    UTC = datetime.timezone.utc
+    self.channel = Channel(title="ch-0", id="ch-id-0", ignore=False)
+    self.videos  = [Video(title="video-{}".format(n), id="vid-id-{}".format(n),
+                          publishedAt=datetime.datetime(2020, 1, n + 1, tzinfo=UTC)) for n in range(3)]
+    self.downloadCalls = []
+    self.loadCalls     = 0
+    self.dumpCalls     = 0
+    
+    # for each dump, whether it would keep the previous config as a generation
+    self.rotations     = []
+  
+  def tearDown(self):
+    self.tmpDir.cleanup()
+  
+  
+  def createManager(self, fileLoc):
+    self.loadCalls += 1
+    manager = Manager(
+      clientSecretsFile  = None,
+      pickledCredentials = base64.b64encode(pickle.dumps("pickleStr")).decode("utf-8"),
+      downloadDirectory  = self.tmpDir.name,
+      ffmpegLocation     = None,
+      channelList        = [self.channel],
+      seenChannelVideos  = {},
+    )
+    manager.ytFetcher = type("F", (), {
+      "fetchRecentVideos": lambda _, cid: list(self.videos),
+      "creditsUsed":       0,
+    })()
+    manager._downloadVideo = lambda channel, video, quality, timeout: self.downloadCalls.append(video.id) or True
+    return manager
+  
+  def dumpManager(self, manager, fileLoc):
+    self.dumpCalls += 1
+    self.rotations.append(not manager._configRotated)
+    manager._configRotated = True
+  
+  def createDaemon(self, **kwargs):
+    args = {
+      "configFileLocation": self.configFile,
+      "quality":            Manager.VideoQuality.QUALITY_MAX,
+      "interval":           60,
+      "loadManager":        self.createManager,
+      "dumpManager":        self.dumpManager,
+    }
+    args.update(kwargs)
+    return Daemon(**args)
+  
+  
+  def test_runCycle(self):
+    """  """
+    logger.info("test_runCycle")
+    
+    daemon = self.createDaemon()
+    
+    ###########################################################################
+    # TEST: one cycle downloads everything, saving after each video
+    ###########################################################################
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      self.assertEqual(daemon.runCycle(), (3, 0))
+    self.assertEqual(self.downloadCalls, ["vid-id-0", "vid-id-1", "vid-id-2"])
+    self.assertEqual(self.dumpCalls, 3 + 1)
+    
+    ###########################################################################
+    # TEST: the next cycle reuses the loaded manager, and finds nothing new
+    ###########################################################################
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      self.assertEqual(daemon.runCycle(), (0, 0))
+    self.assertEqual(self.loadCalls, 1)
+    self.assertEqual(daemon.cycles, 2)
+    
+    # TEST: each cycle's first save keeps a generation, not just the first cycle's
+    self.assertEqual(self.rotations, [True, False, False, False, True])
+    
+    ###########################################################################
+    # TEST: the manager is reloaded if the config file is edited
+    ###########################################################################
+    stats = os.stat(self.configFile)
+    os.utime(self.configFile, ns=(stats.st_atime_ns, stats.st_mtime_ns + 1000000000))
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      daemon.runCycle()
+    self.assertEqual(self.loadCalls, 2)
+    
+    # TEST: invalid interval raises an error
+    self.assertRaises(ValueError, self.createDaemon, interval=0)
+  
+  
+  def test_stop(self):
+    """  """
+    logger.info("test_stop")
+    
+    daemon = self.createDaemon()
+    
+    ###########################################################################
+    # TEST: once stopped, the current download finishes but no more start
+    ###########################################################################
+    manager = self.createManager(self.configFile)
+    def downloadThenStop(channel, video, quality, timeout):
+      self.downloadCalls.append(video.id)
+      daemon.stop()
+      return True
+    manager._downloadVideo = downloadThenStop
+    daemon.loadManager = lambda fileLoc: manager
+    
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      daemon.run()
+    
+    self.assertEqual(daemon.cycles, 1)
+    self.assertEqual(self.downloadCalls, ["vid-id-0"])
+    self.assertTrue(manager.haveSeenVideo(self.channel, self.videos[0]))
+    self.assertFalse(manager.haveSeenVideo(self.channel, self.videos[1]))
+    
+    # TEST: the min video date hasn't moved past the unstarted videos
+    self.assertEqual(self.channel.minVideoDate, self.videos[0].publishedAt)
+    self.assertGreaterEqual(self.dumpCalls, 1)
+    
+    ###########################################################################
+    # TEST: SIGTERM stops the daemon
+    ###########################################################################
+    daemon = self.createDaemon()
+    originalHandlers = signal.getsignal(signal.SIGTERM), signal.getsignal(signal.SIGINT)
+    try:
+      daemon.installSignalHandlers()
+      os.kill(os.getpid(), signal.SIGTERM)
+      self.assertTrue(daemon.stopEvent.wait(5))
+    finally:
+      signal.signal(signal.SIGTERM, originalHandlers[0])
+      signal.signal(signal.SIGINT,  originalHandlers[1])
+  
+  
+  def test_run(self):
+    """  """
+    logger.info("test_run")
+    
+    ###########################################################################
+    # TEST: a failed cycle doesn't stop the daemon
+    ###########################################################################
+    failures = [0]
+    def flakyLoad(fileLoc):
+      if failures[0] == 0:
+        failures[0] += 1
+        raise ConnectionError("no network")
+      return self.createManager(fileLoc)
+    
+    daemon = self.createDaemon(interval=0.01, loadManager=flakyLoad)
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      daemon.run(maxCycles=2)
+    self.assertEqual(daemon.cycles, 2)
+    self.assertEqual(self.downloadCalls, ["vid-id-0", "vid-id-1", "vid-id-2"])
+    
+    ###########################################################################
+    # TEST: waiting for the next cycle ends as soon as we're stopped
+    ###########################################################################
+    daemon = self.createDaemon(interval=60)
+    threading.Timer(0.2, daemon.stop).start()
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      daemon.run()
+    self.assertEqual(daemon.cycles, 1)
+  
+  
+  def test_pushedCycles(self):
+    """  """
+    logger.info("test_pushedCycles")
+    
+    # a stand-in for the WebSub receiver, with a lease on our channel
+    pushed = [{self.channel.id: [self.videos[2]]}]
+    class FakeWebSub:
+      renewed = []
+      def renewLeases(self, channelIDs):
+        FakeWebSub.renewed.append(list(channelIDs))
+      def hasLease(self, channelID):
+        return True
+      def getNotifications(self, timeout=None):
+        return pushed.pop(0) if len(pushed) > 0 else {}
+      def stop(self):
+        pass
+    
+    fetchCalls = []
+    def loadManager(fileLoc):
+      manager = self.createManager(fileLoc)
+      manager.ytFetcher.fetchRecentVideos = lambda cid: fetchCalls.append(cid) or list(self.videos)
+      manager.createWebSubReceiver = lambda: None
+      return manager
+    
+    daemon = self.createDaemon(interval=0.2, loadManager=loadManager)
+    daemon.load()
+    daemon.webSub = FakeWebSub()
+    
+    ###########################################################################
+    # TEST: leases are renewed, and leased channels aren't polled
+    ###########################################################################
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      self.assertEqual(daemon.runCycle(), (0, 0))
+    self.assertListEqual(FakeWebSub.renewed, [[self.channel.id]])
+    self.assertListEqual(fetchCalls, [])
+    
+    ###########################################################################
+    # TEST: pushed videos are downloaded while waiting for the next cycle
+    ###########################################################################
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      daemon._waitForNextCycle(time.monotonic() + 0.2)
+    self.assertEqual(daemon.cycles, 2)
+    self.assertListEqual(self.downloadCalls, ["vid-id-2"])
+    self.assertListEqual(fetchCalls, [])
+  
+  
+  def test_webSubReload(self):
+    """  """
+    logger.info("test_webSubReload")
+    
+    # stand-in receivers, recording what happened to them
+    events = []
+    class FakeWebSub:
+      def __init__(self, settings):
+        self.settings = settings
+      def start(self):
+        events.append(("start", self.settings))
+      def stop(self):
+        events.append(("stop", self.settings))
+    
+    settings = {"webSubCallbackURL": "http://example.com/websub", "webSubPort": 8080}
+    def loadManager(fileLoc):
+      manager = self.createManager(fileLoc)
+      manager.setWebSubCallbackURL(settings["webSubCallbackURL"])
+      manager.setWebSubPort(settings["webSubPort"])
+      manager.createWebSubReceiver = lambda: FakeWebSub(manager.webSubPort) if manager.webSubCallbackURL else None
+      return manager
+    
+    def editConfig():
+      stats = os.stat(self.configFile)
+      os.utime(self.configFile, ns=(stats.st_atime_ns, stats.st_mtime_ns + 1000000000))
+    
+    daemon = self.createDaemon(loadManager=loadManager)
+    daemon.load()
+    receiver = daemon.webSub
+    self.assertListEqual(events, [("start", 8080)])
+    
+    ###########################################################################
+    # TEST: a reload keeps the receiver if the push settings are the same
+    ###########################################################################
+    editConfig()
+    daemon.load()
+    self.assertEqual(self.loadCalls, 2)
+    self.assertIs(daemon.webSub, receiver)
+    self.assertListEqual(events, [("start", 8080)])
+    
+    ###########################################################################
+    # TEST: changed push settings replace it
+    ###########################################################################
+    settings["webSubPort"] = 8081
+    editConfig()
+    daemon.load()
+    self.assertIsNot(daemon.webSub, receiver)
+    self.assertListEqual(events, [("start", 8080), ("stop", 8080), ("start", 8081)])
+    
+    # TEST: and turning push mode off stops it
+    settings["webSubCallbackURL"] = None
+    editConfig()
+    daemon.load()
+    self.assertIsNone(daemon.webSub)
+    self.assertListEqual(events[-1:], [("stop", 8081)])
+  
+  
+  def test_saveKeepsConfigEdits(self):
+    """  """
+    logger.info("test_saveKeepsConfigEdits")
+    from managedYoutubeDL import YAMLBuilder
+    
+    UTC = datetime.timezone.utc
+    YAMLBuilder.safeDumpManager(self.createManager(self.configFile), self.configFile, overwrite=True)
+    daemon = self.createDaemon(loadManager=YAMLBuilder.loadManager, dumpManager=YAMLBuilder.saveManager)
+    daemon.load()
+    
+    # a video is downloaded, and the config is edited while the daemon runs
+    daemon.manager.channelList[0].setMinVideoDate(self.videos[1].publishedAt)
+    daemon.manager.seenChannelVideos = {"ch-id-0": ["vid-id-1"]}
+    edited = YAMLBuilder.loadManager(self.configFile)
+    edited.channelList[0].ignore = True
+    edited.channelList.append(Channel(title="ch-1", id="ch-id-1", minVideoDate=datetime.datetime(2021, 1, 1, tzinfo=UTC)))
+    YAMLBuilder.safeDumpManager(edited, self.configFile, overwrite=True)
+    stats = os.stat(self.configFile)
+    os.utime(self.configFile, ns=(stats.st_atime_ns, stats.st_mtime_ns + 1000000000))
+    
+    ###########################################################################
+    # TEST: saving keeps the edits, with our run state
+    ###########################################################################
+    daemon.save()
+    saved = YAMLBuilder.loadManager(self.configFile)
+    self.assertListEqual([channel.id for channel in saved.channelList], ["ch-id-0", "ch-id-1"])
+    self.assertTrue(saved.channelList[0].ignore)
+    self.assertEqual(saved.channelList[0].minVideoDate, self.videos[1].publishedAt)
+    self.assertEqual(saved.channelList[1].minVideoDate, datetime.datetime(2021, 1, 1, tzinfo=UTC))
+    self.assertDictEqual(saved.seenChannelVideos, {"ch-id-0": ["vid-id-1"]})
+    
+    # TEST: and the next cycle loads the edited config
+    daemon.load()
+    self.assertTrue(daemon.manager.channelList[0].ignore)
+    self.assertEqual(daemon.manager.channelList[0].minVideoDate, self.videos[1].publishedAt)
+    
+    # TEST: once loaded, saves write the config directly again
+    daemon.manager.channelList[0].setMinVideoDate(self.videos[2].publishedAt)
+    daemon.save()
+    self.assertEqual(YAMLBuilder.loadManager(self.configFile).channelList[0].minVideoDate, self.videos[2].publishedAt)
+    
+    ###########################################################################
+    # TEST: a changed config that can't be loaded isn't saved over
+    ###########################################################################
+    with open(self.configFile, "w") as f:
+      f.write("!!not a config")
+    with self.assertLogs("managedYoutubeDL.daemon", level="ERROR"):
+      daemon.save()
+    with open(self.configFile, "r") as f:
+      self.assertEqual(f.read(), "!!not a config")
+    
+    if daemon.mergePool is not None:
+      daemon.mergePool.shutdown()
@@ -0,0 +1,263 @@
+import base64
+import datetime
+import json
+import os
+import pickle
+import tempfile
+from io import StringIO
+import logging
+
+import unittest
+
+# create a streamed log so we can check its output at runtime
+logStream = StringIO()
+logging.basicConfig(stream=logStream, level=logging.DEBUG)
+
+# console
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+console.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+logging.getLogger("").addHandler(console)
+logger = logging.getLogger(__name__)
+
+from managedYoutubeDL.downloadPlan import DownloadPlan, historicalThroughput
+from managedYoutubeDL.items import Channel, Video
+from managedYoutubeDL.manager import Manager
+
+"""
+sudo python3 -m unittest tests.test_downloadPlan.test_DownloadPlan.
+.
+"""
+
+
+class test_DownloadPlan(unittest.TestCase):
+  TEST_ALL = True
+
+
+  @classmethod
+  def setUpClass(cls):
+    pass
+
+  @classmethod
+  def tearDownClass(cls):
+    pass
+
+  def setUp(self):
+
+    # reset log stream
+    logStream.truncate(0)
+
+    self.tmpDir = tempfile.TemporaryDirectory()
+
+    UTC = datetime.timezone.utc
+    self.channels = [Channel(title="ch-{}".format(n), id="ch-id-{}".format(n)) for n in range(2)]
+    self.videos   = [Video(title="video-{}".format(n), id="vid-id-{}".format(n),
+                           publishedAt=datetime.datetime(2020, 1, n + 1, tzinfo=UTC)) for n in range(3)]
+
+  def tearDown(self):
+    self.tmpDir.cleanup()
+
+
+  def test_historicalThroughput(self):
+    """  """
+    logger.info("test_historicalThroughput")
+
+    records = [
+      {"outcome": "downloaded", "quality": "1080p", "bytes": 3000, "transferTime": 1.0, "extractTime": 2.0, "mergeTime": 1.0},
+      {"outcome": "downloaded", "quality": "1080p", "bytes": 1000, "transferTime": 1.0, "extractTime": 4.0, "mergeTime": None},
+      {"outcome": "downloaded", "quality": "max",   "bytes": 9000, "transferTime": 1.0, "extractTime": 0.0, "mergeTime": 0.0},
+      {"outcome": "failed",     "quality": "1080p", "bytes": None, "transferTime": None},
+      {"outcome": "deferred",   "quality": "1080p", "bytes": 50,   "transferTime": 100.0},
+    ]
+
+    ###########################################################################
+    # TEST: only successful downloads at the quality are used
+    ###########################################################################
+    self.assertDictEqual(historicalThroughput(records, Manager.VideoQuality.QUALITY_1080P),
+                         {"samples": 2, "bytesPerSecond": 2000.0, "extractTime": 3.0, "mergeTime": 1.0})
+
+    # TEST: without downloads at the quality, every quality is used
+    self.assertEqual(historicalThroughput(records, "480p")["samples"], 3)
+    self.assertEqual(historicalThroughput(records)["bytesPerSecond"], 13000 / 3)
+
+    # TEST: no usable records
+    self.assertIsNone(historicalThroughput([]))
+    self.assertIsNone(historicalThroughput(records[3:]))
+
+
+  def test_DownloadPlan(self):
+    """  """
+    logger.info("test_DownloadPlan")
+
+    throughput = {"samples": 4, "bytesPerSecond": 1000.0, "extractTime": 2.0, "mergeTime": 1.0}
+
+    ###########################################################################
+    # TEST: each video's time is its extraction, transfer, merge and wait
+    ###########################################################################
+    plan = DownloadPlan(Manager.VideoQuality.QUALITY_MAX, throughput, waitBetweenDownloads=10)
+    self.assertEqual(plan.estimateTime(5000), 18.0)
+    self.assertEqual(plan.estimateTime(None), 13.0)
+
+    plan.addChannel(self.channels[0], 2, self.videos[:2], [5000, None])
+    plan.addChannel(self.channels[1], 1, [], [])
+    plan.credits = 4
+
+    self.assertDictEqual(plan.totals(), {"credits": 4, "videos": 2, "estimatedBytes": 5000,
+                                         "unknownSizes": 1, "estimatedTime": 31.0})
+
+    # TEST: the plan can be written out as JSON
+    planDict = json.loads(json.dumps(plan.toDict()))
+    self.assertEqual(planDict["quality"], "max")
+    self.assertListEqual([row["channelID"] for row in planDict["channels"]], ["ch-id-0", "ch-id-1"])
+    self.assertDictEqual(planDict["channels"][0]["videos"][0],
+                         {"id": "vid-id-0", "title": "video-0", "publishedAt": "2020-01-01T00:00:00+00:00",
+                          "estimatedSize": 5000, "estimatedTime": 18.0})
+
+    # TEST: the table has a row per channel, and a total
+    lines = plan.formatTable()
+    self.assertTrue(lines[0].startswith("Channel"))
+    self.assertTrue(lines[2].startswith("ch-0"))
+    self.assertTrue(lines[3].startswith("ch-1"))
+    self.assertTrue(lines[5].startswith("Total"))
+    self.assertIn("(+1 unknown)", lines[5])
+    self.assertTrue(lines[5].endswith("0m31s"))
+
+    ###########################################################################
+    # TEST: without throughput history, times are unknown
+    ###########################################################################
+    plan = DownloadPlan(Manager.VideoQuality.QUALITY_MAX)
+    plan.addChannel(self.channels[0], 1, self.videos[:1], [5000])
+    self.assertIsNone(plan.totals()["estimatedTime"])
+    self.assertTrue(plan.formatTable()[-2].endswith("unknown"))
+    self.assertIn("no download history", plan.formatTable()[-1])
+
+
+  def test_planNewVideos(self):
+    """  """
+    logger.info("test_planNewVideos")
+
+    manager = Manager(
+      clientSecretsFile  = None,
+      pickledCredentials = base64.b64encode(pickle.dumps("pickleStr")).decode("utf-8"),
+      downloadDirectory  = self.tmpDir.name,
+      ffmpegLocation     = None,
+      channelList        = self.channels,
+      seenChannelVideos  = {},
+    )
+    manager.setGlobalMinVideoDate(None)
+    self.channels[1].setIgnore(True)
+
+    # each fetch costs 1 credit, each duration check 1 more
+    fetcher = type("F", (), {"creditsUsed": 0})()
+    def fetchRecentVideos(channelID):
+      fetcher.creditsUsed += 1
+      return list(self.videos)
+    def fetchVideoDetails(video):
+      fetcher.creditsUsed += 1
+      return {"duration": datetime.timedelta(minutes=int(video.id[-1]) + 1)}
+    fetcher.fetchRecentVideos = fetchRecentVideos
+    fetcher.fetchVideoDetails = fetchVideoDetails
+    manager.ytFetcher = fetcher
+    manager._estimateTransferSize = lambda channel, video, quality: {"vid-id-1": 2000, "vid-id-2": None}[video.id]
+
+    # past downloads ran at 1000 bytes/s
+    telemetryFile = os.path.join(self.tmpDir.name, "telemetry.jsonl")
+    with open(telemetryFile, "w") as f:
+      f.write(json.dumps({"outcome": "downloaded", "quality": "max", "bytes": 8000, "transferTime": 8.0,
+                          "extractTime": 1.0, "mergeTime": 0.0}) + "\n")
+    manager.setTelemetryFile(telemetryFile)
+
+    ###########################################################################
+    # TEST: the plan covers the channels checked, and the videos that passed
+    ###########################################################################
+    self.channels[0].setMinVideoLength(90)
+    plan = manager.planNewVideos(Manager.VideoQuality.QUALITY_MAX)
+    self.assertEqual(len(plan.channels), 1)
+    self.assertEqual(plan.channels[0]["channelID"], "ch-id-0")
+    self.assertListEqual([video["id"] for video in plan.channels[0]["videos"]], ["vid-id-1", "vid-id-2"])
+
+    # TEST: credits cover the fetch and the duration checks
+    self.assertEqual(plan.channels[0]["credits"], 4)
+    self.assertEqual(plan.credits, 4)
+
+    # TEST: bytes and time come from the format info and telemetry
+    self.assertDictEqual(plan.totals(), {"credits": 4, "videos": 2, "estimatedBytes": 2000, "unknownSizes": 1,
+                                         "estimatedTime": 2*(1.0 + Manager.WAIT_BETWEEN_DOWNLOADS) + 2.0})
+
+    # TEST: nothing was downloaded
+    self.assertListEqual(os.listdir(self.tmpDir.name), ["telemetry.jsonl"])
+
+    # TEST: unsupported quality
+    self.assertRaises(ValueError, manager.planNewVideos, "not-a-quality")
+
+
+  def test_planNewVideos_readOnly(self):
+    """
+    # Planning leaves the seen and state stores byte-for-byte as they were,
+    # and marks nothing seen
+    """
+    logger.info("test_planNewVideos_readOnly")
+
+    UTC         = datetime.timezone.utc
+    channel     = self.channels[0]
+    videos      = [Video(title="video-{}".format(n), id=videoID, publishedAt=datetime.datetime(2020, 1, n + 1, tzinfo=UTC))
+                   for n, videoID in enumerate(["aaaaaaaaaaa", "bbbbbbbbbbb", "ccccccccccc"])]
+    downloadDir = os.path.join(self.tmpDir.name, "videos")
+    storeFiles  = [os.path.join(self.tmpDir.name, name) for name in ["seen.sqlite", "state.sqlite"]]
+    os.mkdir(downloadDir)
+
+    def createManager(seenChannelVideos):
+      manager = Manager(
+        clientSecretsFile  = None,
+        pickledCredentials = base64.b64encode(pickle.dumps("pickleStr")).decode("utf-8"),
+        downloadDirectory  = downloadDir,
+        ffmpegLocation     = None,
+        channelList        = [channel],
+        seenChannelVideos  = seenChannelVideos,
+        seenStoreFile      = storeFiles[0],
+        stateFile          = storeFiles[1],
+        seenRetentionCount = 1,
+        libraryIndexFile   = os.path.join(self.tmpDir.name, "library.json"),
+      )
+      manager.setGlobalMinVideoDate(None)
+      manager.loadState()
+      return manager
+
+    # a previous run saw a video, and saved the channel's state
+    manager = createManager({})
+    manager.addSeenVideo(channel, Video(title="old", id="00000000000", publishedAt=datetime.datetime(2019, 1, 1, tzinfo=UTC)))
+    manager.saveState()
+    manager.getSeenStore().close()
+    manager.getStateStore().close()
+
+    # the config still has a seen video to move into the store (which would
+    # also prune the old one), and the second video is already downloaded
+    manager = createManager({channel.id: [videos[0].id]})
+    manager.ytFetcher = type("F", (), {"creditsUsed": 0, "fetchRecentVideos": lambda _, cid: list(videos)})()
+    manager._estimateTransferSize = lambda channel, video, quality: None
+    open(os.path.join(downloadDir, "ch-0 - video-1-{}.mkv".format(videos[1].id)), "w").close()
+
+    def readStores():
+      contents = []
+      for fileLoc in storeFiles:
+        with open(fileLoc, "rb") as f:
+          contents.append(f.read())
+      return contents
+    storesBefore  = readStores()
+    minDateBefore = channel.minVideoDate
+
+    ###########################################################################
+    # TEST: the stores are unchanged, and nothing was marked seen
+    ###########################################################################
+    plan = manager.planNewVideos(Manager.VideoQuality.QUALITY_MAX)
+    self.assertListEqual(readStores(), storesBefore)
+    self.assertDictEqual(manager.seenChannelVideos, {channel.id: [videos[0].id]})
+    self.assertFalse(manager.haveSeenVideo(channel, videos[1]))
+    self.assertEqual(channel.minVideoDate, minDateBefore)
+
+    # TEST: the seen and already downloaded videos are still left out
+    self.assertListEqual([video["id"] for video in plan.channels[0]["videos"]], [videos[2].id])
+    
+    # TEST: a real run afterwards still sees the config's seen video
+    self.assertTrue(manager.haveSeenVideo(channel, videos[0]))
+    self.assertIn(videos[0].id, manager.getSeenVideoIDs(channel))
@@ -0,0 +1,194 @@
+import collections
+import datetime
+from io import StringIO
+import logging
+
+import unittest
+
+# create a streamed log so we can check its output at runtime
+logStream = StringIO()
+logging.basicConfig(stream=logStream, level=logging.DEBUG)
+
+# console
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+console.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+logging.getLogger("").addHandler(console)
+logger = logging.getLogger(__name__)
+
+from managedYoutubeDL.downloadQueue import DownloadJob, DownloadQueue, DiskSpaceGuard, formatBytes
+from managedYoutubeDL.items import Channel, Video
+
+"""
+sudo python3 -m unittest tests.test_downloadQueue.test_DownloadQueue.
+.
+"""
+
+
+DiskUsage = collections.namedtuple("DiskUsage", ["total", "used", "free"])
+
+
+class test_DownloadQueue(unittest.TestCase):
+  TEST_ALL = True
+  
+  
+  @classmethod
+  def setUpClass(cls):
+    pass
+  
+  @classmethod
+  def tearDownClass(cls):
+    pass
+  
+  def setUp(self):
+    
+    # reset log stream
+    logStream.truncate(0)
+  
+  def tearDown(self):
+    pass
+  
+  
+  @staticmethod
+  def createJob(n, estimatedSize=None):
+    channel = Channel(title="ch-{}".format(n), id="ch-id-{}".format(n))
+    video   = Video(title="video-{}".format(n), id="vid-id-{}".format(n))
+    return DownloadJob(channel, video, estimatedSize=estimatedSize)
+  
+  
+  def test_formatBytes(self):
+    """  """
+    logger.info("test_formatBytes")
+    
+    self.assertEqual(formatBytes(None), "unknown")
+    self.assertEqual(formatBytes(512), "512 B")
+    self.assertEqual(formatBytes(1536), "1.5 KiB")
+    self.assertEqual(formatBytes(3 * 1024 ** 3), "3.0 GiB")
+  
+  
+  def test_DownloadQueue(self):
+    """  """
+    logger.info("test_DownloadQueue")
+    
+    now   = [1000000.0]
+    clock = lambda: now[0]
+    sizes = [300, 100, None, 200]
+    
+    def fill(queue):
+      jobs = [test_DownloadQueue.createJob(i, estimatedSize=size) for i, size in enumerate(sizes)]
+      for job in jobs:
+        queue.push(job)
+      return jobs
+    
+    def drain(queue):
+      order = []
+      while len(queue) > 0:
+        order.append(queue.pop().video.id)
+      return order
+    
+    ###########################################################################
+    # TEST: channel order hands jobs out in the order they were added
+    ###########################################################################
+    queue = DownloadQueue(clock=clock)
+    fill(queue)
+    self.assertFalse(queue.needsSizeEstimates())
+    self.assertEqual(drain(queue), ["vid-id-0", "vid-id-1", "vid-id-2", "vid-id-3"])
+    self.assertRaises(IndexError, queue.pop)
+    
+    ###########################################################################
+    # TEST: smallest first; unknown sizes count as the largest known size
+    ###########################################################################
+    queue = DownloadQueue(order="smallest-first", clock=clock)
+    fill(queue)
+    self.assertTrue(queue.needsSizeEstimates())
+    self.assertEqual(drain(queue), ["vid-id-1", "vid-id-3", "vid-id-0", "vid-id-2"])
+    
+    ###########################################################################
+    # TEST: aging lets a large job that has waited overtake newer small ones
+    ###########################################################################
+    queue = DownloadQueue(order="smallest-first", agingHalfLife=60, clock=clock)
+    bigJob = test_DownloadQueue.createJob(0, estimatedSize=1000)
+    queue.push(bigJob)
+    
+    # 4 half lives later, the big job is effectively 1000/16 = 62.5
+    now[0] += 4 * 60
+    for i, size in enumerate([100, 50]):
+      queue.push(test_DownloadQueue.createJob(i + 1, estimatedSize=size))
+    self.assertEqual(drain(queue), ["vid-id-2", "vid-id-0", "vid-id-1"])
+    
+    # TEST: waiting time counts from when the video was published
+    queue    = DownloadQueue(order="smallest-first", agingHalfLife=60, clock=clock)
+    oldJob   = test_DownloadQueue.createJob(0, estimatedSize=1000)
+    oldJob.video.publishedAt = datetime.datetime.fromtimestamp(now[0] - 10 * 60, datetime.timezone.utc)
+    queue.push(oldJob)
+    queue.push(test_DownloadQueue.createJob(1, estimatedSize=100))
+    self.assertEqual(drain(queue), ["vid-id-0", "vid-id-1"])
+    
+    ###########################################################################
+    # TEST: newest first, with higher priority channels ahead of the rest
+    ###########################################################################
+    for order in DownloadQueue.Order:
+      queue = DownloadQueue(order=order, clock=clock)
+      jobs  = [test_DownloadQueue.createJob(i, estimatedSize=100) for i in range(4)]
+      for i, job in enumerate(jobs):
+        job.video.publishedAt = datetime.datetime(2020, 1, i + 1, tzinfo=datetime.timezone.utc)
+        queue.push(job)
+      jobs[1].channel.setPriority(10)
+      jobs[3].video.publishedAt = None
+      
+      expected = {
+        DownloadQueue.Order.CHANNEL:        ["vid-id-1", "vid-id-0", "vid-id-2", "vid-id-3"],
+        DownloadQueue.Order.SMALLEST_FIRST: ["vid-id-1", "vid-id-0", "vid-id-2", "vid-id-3"],
+        DownloadQueue.Order.NEWEST_FIRST:   ["vid-id-1", "vid-id-2", "vid-id-0", "vid-id-3"],
+      }
+      self.assertEqual(drain(queue), expected[order])
+    
+    # TEST: invalid arguments raise errors
+    self.assertRaises(ValueError, DownloadQueue, order="largest-first")
+    self.assertRaises(ValueError, DownloadQueue, agingHalfLife=0)
+  
+  
+  def test_DiskSpaceGuard(self):
+    """  """
+    logger.info("test_DiskSpaceGuard")
+    
+    free  = [1000]
+    guard = DiskSpaceGuard("/", minFreeSpace=100, diskUsage=lambda _: DiskUsage(10000, 10000 - free[0], free[0]))
+    
+    ###########################################################################
+    # TEST: jobs are admitted while they fit, and their space is reserved
+    ###########################################################################
+    job1 = test_DownloadQueue.createJob(1, estimatedSize=500)
+    job2 = test_DownloadQueue.createJob(2, estimatedSize=400)
+    job3 = test_DownloadQueue.createJob(3, estimatedSize=200)
+    
+    self.assertTrue(guard.admit(job1))
+    self.assertTrue(guard.admit(job2))
+    self.assertEqual(guard.reservedBytes(), 900)
+    self.assertEqual(guard.availableBytes(), 0)
+    
+    # TEST: in-flight reservations (and the margin) count against new jobs
+    with self.assertLogs("managedYoutubeDL.downloadQueue", level="WARNING") as logs:
+      self.assertFalse(guard.admit(job3))
+    self.assertIn("Disk space: deferring", logs.output[0])
+    
+    ###########################################################################
+    # TEST: releasing a reservation makes room again
+    ###########################################################################
+    guard.release(job1)
+    self.assertEqual(guard.reservedBytes(), 400)
+    self.assertTrue(guard.admit(job3))
+    
+    # TEST: releasing an unknown or already released job is harmless
+    guard.release(job1)
+    self.assertEqual(guard.reservedBytes(), 600)
+    
+    ###########################################################################
+    # TEST: jobs of unknown size are admitted without a reservation
+    ###########################################################################
+    free[0] = 0
+    self.assertTrue(guard.admit(test_DownloadQueue.createJob(4)))
+    self.assertEqual(guard.reservedBytes(), 600)
+    
+    # TEST: invalid margin raises an error
+    self.assertRaises(ValueError, DiskSpaceGuard, "/", minFreeSpace=-1)
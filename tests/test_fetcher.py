@@ -497,6 +497,32 @@ class test_Fetcher(unittest.TestCase):
         correctChannelList  = createChannelList(0, numChannels)
         self.assertListEqual(returnedChannelList, correctChannelList)
         
+        
+    ###########################################################################
+    # TEST: paging stops as soon as it can
+    ###########################################################################
+    numChannels       = 30
+    maxResultsPerPage = 10
+    
+    # TEST: a channel repeated on a later page under a new title is kept once
+    #  -3 pages, no retries
+    pages = [createResponse(0, 10), createResponse(9, 20), createResponse(20, 30)]
+    pages[1]["items"][0]["snippet"]["title"] = "renamed"
+    def callbackFunctionFromPages():
+      FakeAPI.subscriptionsResponse = pages[min(FakeAPI.callCount, len(pages)) - 1]
+    FakeAPI.callbackFunction = callbackFunctionFromPages
+    FakeAPI.callCount        = 0
+    
+    self.assertListEqual(fetcher.fetchMySubscribedChannels(maxResultsPerPage=maxResultsPerPage),
+                         createChannelList(0, 30))
+    self.assertEqual(FakeAPI.callCount, 3)
+    
+    # TEST: the last page doesn't get requested again
+    pages = [createResponse(0, 10), createResponse(10, 20)]
+    del pages[-1]["nextPageToken"]
+    FakeAPI.callCount = 0
+    self.assertRaises(SystemError, fetcher.fetchMySubscribedChannels, maxResultsPerPage=maxResultsPerPage)
+    self.assertEqual(FakeAPI.callCount, 2)
 
     
     # undo our fakery
@@ -579,6 +605,27 @@ class test_Fetcher(unittest.TestCase):
     googleapiclient.discovery.build = originalBuild
 
 
+  def test_parseVideoID(self):
+    """  """
+    logger.info("test_parseVideoID")
+    
+    # TEST: supported link formats
+    for videoURL in ["https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+                     "https://youtube.com/watch?feature=share&v=dQw4w9WgXcQ&t=10",
+                     "https://m.youtube.com/watch?v=dQw4w9WgXcQ",
+                     "https://youtu.be/dQw4w9WgXcQ?t=5",
+                     "https://www.youtube.com/shorts/dQw4w9WgXcQ",
+                     "https://www.youtube.com/live/dQw4w9WgXcQ",
+                     "https://www.youtube.com/embed/dQw4w9WgXcQ"]:
+      self.assertEqual(Fetcher.parseVideoID(videoURL), "dQw4w9WgXcQ", msg=videoURL)
+    
+    # TEST: anything else returns None
+    for videoURL in ["", "dQw4w9WgXcQ", "https://www.youtube.com/watch?v=short",
+                     "https://www.youtube.com/channel/UC1234567890123456789012",
+                     "https://youtu.be/", "https://www.youtube.com/playlist?list=PL123"]:
+      self.assertIsNone(Fetcher.parseVideoID(videoURL), msg=videoURL)
+  
+  
   def test_convertVideoDuration(self):
     """  """
     logger.info("test_convertVideoDuration")
@@ -0,0 +1,214 @@
+import base64
+import datetime
+import pickle
+import re
+from io import StringIO
+import logging
+
+import unittest
+import unittest.mock
+
+# create a streamed log so we can check its output at runtime
+logStream = StringIO()
+logging.basicConfig(stream=logStream, level=logging.DEBUG)
+
+# console
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+console.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+logging.getLogger("").addHandler(console)
+logger = logging.getLogger(__name__)
+
+from managedYoutubeDL.filterPlan import FilterPlan
+from managedYoutubeDL.items import Channel, Video
+from managedYoutubeDL.manager import Manager
+
+"""
+sudo python3 -m unittest tests.test_filterPlan.test_FilterPlan.
+.
+"""
+
+
+class test_FilterPlan(unittest.TestCase):
+  TEST_ALL = True
+
+
+  @classmethod
+  def setUpClass(cls):
+    pass
+
+  @classmethod
+  def tearDownClass(cls):
+    pass
+
+  def setUp(self):
+
+    # reset log stream
+    logStream.truncate(0)
+
+    UTC = datetime.timezone.utc
+    self.manager = Manager(
+      clientSecretsFile  = None,
+      pickledCredentials = base64.b64encode(pickle.dumps("pickleStr")).decode("utf-8"),
+      downloadDirectory  = "",
+      ffmpegLocation     = None,
+      channelList        = [],
+      seenChannelVideos  = {},
+    )
+    self.channel = Channel(title="ch-0", id="ch-id-0")
+    self.videos  = [Video(title=title, id="vid-id-{}".format(n),
+                          publishedAt=datetime.datetime(2020, 1, n + 1, tzinfo=UTC))
+                    for n, title in enumerate(["Part 1", "Part 2 (trailer)", "Vlog", "Part 3"])]
+
+
+  def test_cache(self):
+    """  """
+    logger.info("test_cache")
+
+    ###########################################################################
+    # TEST: the plan is reused until a filter setting changes
+    ###########################################################################
+    plan = self.manager.getFilterPlan(self.channel)
+    self.assertIs(self.manager.getFilterPlan(self.channel), plan)
+
+    with unittest.mock.patch("managedYoutubeDL.filterPlan.re.compile", wraps=re.compile) as compile:
+      self.channel.setIncludeFilter("part")
+      self.manager.filterChannelVideos(self.channel, self.videos)
+      self.manager.filterChannelVideos(self.channel, self.videos)
+      self.assertEqual(compile.call_count, 1)
+
+      # TEST: channel and global settings both invalidate it
+      self.manager.setGlobalExcludeFilter("trailer")
+      self.manager.filterChannelVideos(self.channel, self.videos)
+      self.assertEqual(compile.call_count, 3)
+      self.channel.setMinVideoDate(self.videos[1].publishedAt)
+      self.manager.filterChannelVideos(self.channel, self.videos)
+      self.assertEqual(compile.call_count, 5)
+
+    self.assertIsNot(self.manager.getFilterPlan(self.channel), plan)
+
+    # TEST: a different channel object with the same ID gets its own plan
+    otherChannel = Channel(title="ch-0", id="ch-id-0")
+    self.assertIsNot(self.manager.getFilterPlan(otherChannel), self.manager.getFilterPlan(self.channel))
+
+
+  def test_evaluate(self):
+    """  """
+    logger.info("test_evaluate")
+
+    self.channel.setIncludeFilter("part")
+    self.manager.setGlobalExcludeFilter("trailer")
+    self.manager.addSeenVideo(self.channel, self.videos[0])
+
+    ###########################################################################
+    # TEST: each video is rejected by the first predicate it fails
+    ###########################################################################
+    self.assertListEqual(self.manager.filterChannelVideos(self.channel, self.videos), [self.videos[3]])
+    self.assertDictEqual(self.manager.getFilterRejections(),
+                         {self.channel.id: {"seen": 1, "channelIncludeFilter": 1, "globalExcludeFilter": 1}})
+
+    # TEST: the counts carry on across runs, and across rebuilt plans
+    self.channel.setMinVideoDate(self.videos[3].publishedAt)
+    self.manager.filterChannelVideos(self.channel, self.videos)
+    self.assertDictEqual(self.manager.getFilterRejections()[self.channel.id],
+                         {"seen": 2, "channelIncludeFilter": 1, "globalExcludeFilter": 1, "minVideoDate": 2})
+
+    ###########################################################################
+    # TEST: the duration is only fetched for videos the free filters pass
+    ###########################################################################
+    fetched = []
+    self.manager.ytFetcher = type("F", (), {
+      "fetchVideoDetails": lambda _, video: fetched.append(video.id) or {"duration": datetime.timedelta(minutes=5)}})()
+    self.channel.setMinVideoDate(None)
+    self.manager.setGlobalMinVideoDate(None)
+    self.channel.setMinVideoLength(60*10)
+    self.assertListEqual(self.manager.filterChannelVideos(self.channel, self.videos), [])
+    self.assertListEqual(fetched, [self.videos[3].id])
+    self.assertEqual(self.manager.getFilterRejections()[self.channel.id]["videoLength"], 1)
+
+    # TEST: predicates only exist for filters that are set
+    names = [predicate.name for predicate in FilterPlan(self.manager, Channel(title="ch-1", id="ch-id-1")).predicates]
+    self.assertListEqual(names, ["seen", "minVideoDate", "globalExcludeFilter"])
+
+
+  def test_costOrdering(self):
+    """  """
+    logger.info("test_costOrdering")
+
+    self.manager.setGlobalIncludeFilter("part")
+    self.manager.setGlobalMinVideoDate(None)
+    self.channel.setMinVideoDate(None)
+
+    ###########################################################################
+    # TEST: cheaper predicates run first, until one has proved more selective
+    ###########################################################################
+    plan = self.manager.getFilterPlan(self.channel)
+    self.assertListEqual([predicate.name for predicate in plan.orderPredicates()], ["seen", "globalIncludeFilter"])
+
+    # the regex rejects most videos, while nothing has been seen
+    plan.stats.update({"seen": [100, 0], "globalIncludeFilter": [100, 90]})
+    self.assertListEqual([predicate.name for predicate in plan.orderPredicates()], ["globalIncludeFilter", "seen"])
+
+    ###########################################################################
+    # TEST: metadata filters run last, sharing one extraction per video
+    ###########################################################################
+    extracted = []
+    def getVideoMetadata(channel, video):
+      extracted.append(video.id)
+      return {"description": "sponsored by..." if video.id == "vid-id-3" else "just a video",
+              "tags": ["music", "live"], "viewCount": 5000 if video.id == "vid-id-0" else None}
+    self.manager.getVideoMetadata = getVideoMetadata
+
+    self.manager.setGlobalExcludeFilter("trailer")
+    self.channel.setDescriptionFilter("video")
+    self.channel.setTagFilter("^music$")
+    self.manager.setGlobalMinViewCount(1000)
+    plan = self.manager.getFilterPlan(self.channel)
+
+    self.assertListEqual(self.manager.filterChannelVideos(self.channel, self.videos), [self.videos[0]])
+    self.assertListEqual([predicate.name for predicate in plan.predicates][-3:],
+                         ["channelDescriptionFilter", "channelTagFilter", "minViewCount"])
+
+    # TEST: videos the title filters rejected were never extracted
+    self.assertListEqual(extracted, ["vid-id-0", "vid-id-3"])
+    self.assertEqual(plan.rejections["channelDescriptionFilter"], 1)
+    self.assertEqual(plan._metadata, {})
+
+    # TEST: a tag filter needs one matching tag
+    self.channel.setTagFilter("^rock$")
+    self.assertListEqual(self.manager.filterChannelVideos(self.channel, self.videos), [])
+    self.assertEqual(self.manager.getFilterPlan(self.channel).rejections["channelTagFilter"], 1)
+
+    ###########################################################################
+    # TEST: a video whose info couldn't be extracted is deferred, neither
+    # passed nor rejected
+    ###########################################################################
+    def getVideoMetadata(channel, video):
+      return {"description": None, "tags": [], "viewCount": -1, "error": "extraction failed"}
+    self.manager.getVideoMetadata = getVideoMetadata
+
+    plan   = self.manager.getFilterPlan(self.channel)
+    before = dict(plan.rejections)
+    with self.assertLogs("managedYoutubeDL.filterPlan", level="ERROR") as logs:
+      self.assertListEqual(self.manager.filterChannelVideos(self.channel, self.videos), [])
+    self.assertEqual(len(logs.output), 2)
+    self.assertIn("Deferred (info unknown)", logs.output[0])
+    self.assertListEqual(plan.deferred, [self.videos[0], self.videos[3]])
+    for name in ["channelDescriptionFilter", "channelTagFilter", "minViewCount"]:
+      self.assertEqual(plan.rejections.get(name), before.get(name))
+
+    ###########################################################################
+    # TEST: so is a video whose duration couldn't be fetched
+    ###########################################################################
+    self.manager.setGlobalMinVideoLength(datetime.timedelta(minutes=1))
+    self.manager.ytFetcher = type("F", (), {"fetchVideoDetails": lambda _, video: None})()
+    plan = self.manager.getFilterPlan(self.channel)
+    with self.assertLogs("managedYoutubeDL.filterPlan", level="ERROR") as logs:
+      self.assertListEqual(self.manager.filterChannelVideos(self.channel, self.videos[:1]), [])
+    self.assertIn("Deferred (duration unknown)", logs.output[0])
+    self.assertListEqual(plan.deferred, [self.videos[0]])
+    self.assertNotIn("videoLength", plan.rejections)
+    
+    # TEST: the next evaluation starts with nothing deferred
+    self.assertListEqual(self.manager.filterChannelVideos(self.channel, self.videos[1:2]), [])
+    self.assertListEqual(plan.deferred, [])
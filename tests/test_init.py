@@ -60,6 +60,11 @@ class test_ConvertTime(unittest.TestCase):
     self.assertUTCAware(result)
     self.assertEqual(result, datetime.datetime(2020, 1, 1, 0, 0, 1, 2, tzinfo=UTC))
 
+  def test_iso_string_with_offset(self):
+    result = convertTime("2020-01-01T01:00:01+01:00")
+    self.assertUTCAware(result)
+    self.assertEqual(result, datetime.datetime(2020, 1, 1, 0, 0, 1, tzinfo=UTC))
+
   def test_invalid_type_raises(self):
     for bad in [42, 3.14, [], {}]:
       with self.subTest(bad=bad):
@@ -67,6 +67,13 @@ class test_Items(unittest.TestCase):
       "maxVideoDate":   datetime.datetime.fromtimestamp(1, datetime.timezone.utc),
       "minVideoLength": timedelta(0),
       "maxVideoLength": timedelta(0),
+      "priority":       0,
+      "pollInterval":   timedelta(hours=1),
+      "pollIntervalOverride": timedelta(hours=2),
+      "lastPolledAt":   datetime.datetime.fromtimestamp(2, datetime.timezone.utc),
+      "descriptionFilter": "string val",
+      "tagFilter":         "string val",
+      "minViewCount":      0,
     }
   
     # TEST: acceptable arguments are accepted and assigned correctly
@@ -76,7 +83,7 @@ class test_Items(unittest.TestCase):
     
     # TEST: our test has assigned all arguments
     channel = Channel(**arguments)
-    self.assertListEqual(list(arguments.keys()), list(channel.__dict__.keys()))
+    self.assertListEqual(list(arguments.keys()), list(channel.toDict().keys()))
     
     # TEST: unacceptable arguments raise errors
     for arg in arguments.keys():
@@ -102,6 +109,13 @@ class test_Items(unittest.TestCase):
         "maxVideoDate":   datetime.datetime.fromtimestamp((i+1)*100, datetime.timezone.utc),
         "minVideoLength": timedelta(seconds=(i+1)*10),
         "maxVideoLength": timedelta(seconds=(i+1)*100),
+        "priority":       (i+1)*7,
+        "pollInterval":   timedelta(seconds=(i+1)*1000),
+        "pollIntervalOverride": timedelta(seconds=(i+1)*2000),
+        "lastPolledAt":   datetime.datetime.fromtimestamp((i+1)*1000, datetime.timezone.utc),
+        "descriptionFilter": str((i + 1) * 100000),
+        "tagFilter":         str((i + 1) * 1000000),
+        "minViewCount":      (i+1)*11,
       }
       
       # TEST: none of the arguments have the same values
@@ -117,6 +131,56 @@ class test_Items(unittest.TestCase):
       self.assertEqual(str(channel), correctStr)
     
     
+    ###########################################################################
+    # TEST: priority
+    ###########################################################################
+    self.assertEqual(Channel().priority, 0)
+    self.assertEqual(Channel(priority=None).priority, 0)
+    self.assertEqual(Channel(priority=-3).priority, -3)
+    for bad in ["1", 1.5, True]:
+      self.assertRaises(TypeError, Channel, priority=bad)
+    
+    ###########################################################################
+    # TEST: min view count
+    ###########################################################################
+    self.assertIsNone(Channel().minViewCount)
+    self.assertEqual(Channel(minViewCount=0).minViewCount, 0)
+    for bad in ["1", 1.5, True]:
+      self.assertRaises(TypeError, Channel, minViewCount=bad)
+    self.assertRaises(ValueError, Channel, minViewCount=-1)
+    
+    
+    ###########################################################################
+    # TEST: poll interval
+    ###########################################################################
+    now = datetime.datetime.fromtimestamp(100000, datetime.timezone.utc)
+    
+    # TEST: ints are taken as seconds, and bad intervals are rejected
+    self.assertEqual(Channel(pollInterval=60).pollInterval, timedelta(seconds=60))
+    for bad in ["60", 1.5, True]:
+      self.assertRaises(TypeError, Channel, pollInterval=bad)
+      self.assertRaises(TypeError, Channel, pollIntervalOverride=bad)
+    for bad in [0, -60, timedelta(0)]:
+      self.assertRaises(ValueError, Channel, pollInterval=bad)
+      self.assertRaises(ValueError, Channel, pollIntervalOverride=bad)
+    
+    # TEST: a channel without a learned interval, or never polled, is always due
+    self.assertTrue(Channel().isDueForPoll(now))
+    self.assertTrue(Channel(pollInterval=3600).isDueForPoll(now))
+    self.assertTrue(Channel(lastPolledAt=now).isDueForPoll(now))
+    
+    # TEST: a channel is due once its interval has passed
+    channel = Channel(pollInterval=3600, lastPolledAt=now - timedelta(minutes=30))
+    self.assertEqual(channel.getPollInterval(), timedelta(hours=1))
+    self.assertFalse(channel.isDueForPoll(now))
+    self.assertTrue(channel.isDueForPoll(now + timedelta(minutes=30)))
+    
+    # TEST: the override takes precedence over the learned interval
+    channel.setPollIntervalOverride(60*10)
+    self.assertEqual(channel.getPollInterval(), timedelta(minutes=10))
+    self.assertTrue(channel.isDueForPoll(now))
+    
+    
     ###########################################################################
     # TEST: equality
     ###########################################################################
@@ -146,6 +210,23 @@ class test_Items(unittest.TestCase):
       for ind2 in range(ind1 + 1, numChannels):
         self.assertEqual(channelList[ind1], channelList[ind2])
         self.assertNotEqual(id(channelList[ind1]), id(channelList[ind2]))
+    
+    
+    ###########################################################################
+    # TEST: hashing
+    ###########################################################################
+    
+    # TEST: equal channels are one set entry; a renamed channel is another
+    channels = set([Channel(title="title", id="0"), Channel(title="title", id="0"), Channel(title="renamed", id="0")])
+    self.assertEqual(len(channels), 2)
+    self.assertIn(Channel(title="title", id="0"), channels)
+    self.assertNotIn(Channel(title="title", id="1"), channels)
+    
+    # TEST: fields are slots, so there's no per-channel __dict__
+    channel = Channel(title="title", id="0")
+    self.assertFalse(hasattr(channel, "__dict__"))
+    self.assertRaises(AttributeError, setattr, channel, "notAField", None)
+    self.assertDictEqual(Channel(**channel.toDict()).toDict(), channel.toDict())
 
 
     
@@ -173,11 +254,16 @@ class test_Items(unittest.TestCase):
     
     # TEST: our test has assigned all arguments
     video = Video(**arguments)
-    self.assertListEqual(list(arguments.keys()), list(video.__dict__.keys()))
+    self.assertListEqual(list(arguments.keys()), list(video.toDict().keys()))
     
     # TEST: unacceptable arguments raise errors
     for arg in arguments.keys():
       self.assertRaises(AttributeError, Video, **{"{}-diff".format(arg): None})
+    
+    # TEST: videos hash on their ID
+    videos = set([Video(title="title", id="0"), Video(title="title", id="0"), Video(title="title", id="1")])
+    self.assertEqual(len(videos), 2)
+    self.assertFalse(hasattr(video, "__dict__"))
       
       
     ###########################################################################
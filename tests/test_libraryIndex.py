@@ -0,0 +1,203 @@
+import json
+import os
+import tempfile
+from io import StringIO
+import logging
+
+import unittest
+
+# create a streamed log so we can check its output at runtime
+logStream = StringIO()
+logging.basicConfig(stream=logStream, level=logging.DEBUG)
+
+# console
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+console.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+logging.getLogger("").addHandler(console)
+logger = logging.getLogger(__name__)
+
+from managedYoutubeDL.libraryIndex import LibraryIndex
+
+"""
+sudo python3 -m unittest tests.test_libraryIndex.test_LibraryIndex.
+.
+"""
+
+
+class test_LibraryIndex(unittest.TestCase):
+  TEST_ALL = True
+  
+  
+  @classmethod
+  def setUpClass(cls):
+    pass
+  
+  @classmethod
+  def tearDownClass(cls):
+    pass
+  
+  def setUp(self):
+    
+    # reset log stream
+    logStream.truncate(0)
+    
+    # a download directory, and somewhere outside it to keep the index
+    self.downloadDir = tempfile.TemporaryDirectory()
+    self.indexDir    = tempfile.TemporaryDirectory()
+    self.indexFile   = os.path.join(self.indexDir.name, "library.json")
+  
+  def tearDown(self):
+    self.downloadDir.cleanup()
+    self.indexDir.cleanup()
+  
+  
+  def createFile(self, fileName):
+    fileLoc = os.path.join(self.downloadDir.name, fileName)
+    with open(fileLoc, "w") as f:
+      f.write("video")
+    return fileLoc
+  
+  
+  def test_parseVideoID(self):
+    """  """
+    logger.info("test_parseVideoID")
+    
+    # TEST: downloaded videos are recognised
+    self.assertEqual(LibraryIndex.parseVideoID("ch - title-dQw4w9WgXcQ.mkv"), "dQw4w9WgXcQ")
+    self.assertEqual(LibraryIndex.parseVideoID("title-_-Ab_12-xYz.webm"), "_-Ab_12-xYz")
+    
+    # TEST: partial downloads, separate streams and other files are not
+    for fileName in ["title-dQw4w9WgXcQ.mkv.part", "title-dQw4w9WgXcQ.f137.mp4", "title-dQw4w9WgXcQ.jpg",
+                     "title-dQw4w9WgXcQ.en.vtt", "title-short.mkv", "dQw4w9WgXcQ.mkv", "library.json"]:
+      self.assertIsNone(LibraryIndex.parseVideoID(fileName), msg=fileName)
+  
+  
+  def test_scanAndSave(self):
+    """  """
+    logger.info("test_scanAndSave")
+    
+    self.createFile("ch - one-aaaaaaaaaaa.mkv")
+    self.createFile("ch - two-bbbbbbbbbbb.mp4")
+    self.createFile("ch - two-bbbbbbbbbbb.jpg")
+    self.createFile("ch - three-ccccccccccc.mkv.part")
+    os.mkdir(os.path.join(self.downloadDir.name, "sub-ddddddddddd.mkv"))
+    
+    ###########################################################################
+    # TEST: scan only finds finished videos
+    ###########################################################################
+    index = LibraryIndex(self.indexFile, self.downloadDir.name)
+    self.assertEqual(len(index), 2)
+    self.assertTrue(index.hasVideo("aaaaaaaaaaa"))
+    self.assertTrue(index.hasVideo("bbbbbbbbbbb"))
+    self.assertFalse(index.hasVideo("ccccccccccc"))
+    self.assertFalse(index.hasVideo("ddddddddddd"))
+    self.assertEqual(index.getVideoPath("bbbbbbbbbbb"),
+                     os.path.join(self.downloadDir.name, "ch - two-bbbbbbbbbbb.mp4"))
+    self.assertIsNone(index.getVideoPath("ccccccccccc"))
+    
+    ###########################################################################
+    # TEST: save and reload round trip
+    ###########################################################################
+    index.save()
+    self.assertTrue(os.path.exists(self.indexFile))
+    self.assertFalse(os.path.exists(self.indexFile + ".tmp"))
+    
+    reloaded = LibraryIndex(self.indexFile, self.downloadDir.name)
+    self.assertDictEqual(reloaded.entries, index.entries)
+    self.assertEqual(reloaded.directoryMtime, index.directoryMtime)
+    
+    ###########################################################################
+    # TEST: an index for another directory is ignored
+    ###########################################################################
+    with tempfile.TemporaryDirectory() as otherDir:
+      otherIndex = LibraryIndex(self.indexFile, otherDir)
+      self.assertEqual(len(otherIndex), 0)
+    
+    ###########################################################################
+    # TEST: an unreadable index is ignored
+    ###########################################################################
+    with open(self.indexFile, "w") as f:
+      f.write("{not json")
+    index = LibraryIndex(self.indexFile, self.downloadDir.name)
+    self.assertEqual(len(index), 2)
+  
+  
+  def test_refresh(self):
+    """  """
+    logger.info("test_refresh")
+    
+    self.createFile("ch - one-aaaaaaaaaaa.mkv")
+    index = LibraryIndex(self.indexFile, self.downloadDir.name)
+    index.save()
+    
+    ###########################################################################
+    # TEST: no rescan while the directory is unchanged
+    ###########################################################################
+    
+    # mark the saved index so we can tell if it was rebuilt
+    with open(self.indexFile, "r") as f:
+      data = json.load(f)
+    data["entries"]["zzzzzzzzzzz"] = data["entries"]["aaaaaaaaaaa"]
+    with open(self.indexFile, "w") as f:
+      json.dump(data, f)
+    
+    index = LibraryIndex(self.indexFile, self.downloadDir.name)
+    self.assertIn("zzzzzzzzzzz", index.entries)
+    
+    ###########################################################################
+    # TEST: rescan once the directory changes
+    ###########################################################################
+    self.createFile("ch - two-bbbbbbbbbbb.mkv")
+    dirStats = os.stat(self.downloadDir.name)
+    os.utime(self.downloadDir.name, ns=(dirStats.st_atime_ns, dirStats.st_mtime_ns + 1000000000))
+    
+    index = LibraryIndex(self.indexFile, self.downloadDir.name)
+    self.assertSetEqual(set(index.entries.keys()), {"aaaaaaaaaaa", "bbbbbbbbbbb"})
+  
+  
+  def test_hasVideoAndAddVideo(self):
+    """  """
+    logger.info("test_hasVideoAndAddVideo")
+    
+    fileLoc = self.createFile("ch - one-aaaaaaaaaaa.mkv")
+    index   = LibraryIndex(self.indexFile, self.downloadDir.name)
+    
+    ###########################################################################
+    # TEST: deleted files are dropped from the index
+    ###########################################################################
+    os.remove(fileLoc)
+    self.assertFalse(index.hasVideo("aaaaaaaaaaa"))
+    self.assertNotIn("aaaaaaaaaaa", index.entries)
+    
+    ###########################################################################
+    # TEST: new downloads are added without a rescan
+    ###########################################################################
+    directoryMtime = index.directoryMtime
+    fileLoc = self.createFile("ch - [two]-bbbbbbbbbbb.mkv")
+    self.createFile("ch - [two]-bbbbbbbbbbb.jpg")
+    self.assertTrue(index.addVideo("bbbbbbbbbbb", fileLoc))
+    self.assertTrue(index.hasVideo("bbbbbbbbbbb"))
+    self.assertEqual(index.getVideoPath("bbbbbbbbbbb"), fileLoc)
+    self.assertEqual(index.entries["bbbbbbbbbbb"]["size"], len("video"))
+    
+    # TEST: the directory mtime isn't updated, so changes made by anyone
+    # else in the meantime are still picked up
+    self.assertEqual(index.directoryMtime, directoryMtime)
+    self.createFile("other - three-ddddddddddd.mp4")
+    index.refresh()
+    self.assertTrue(index.hasVideo("ddddddddddd"))
+    self.assertTrue(index.hasVideo("bbbbbbbbbbb"))
+    
+    # TEST: missing downloads, other videos' files and unknown files aren't added
+    self.assertFalse(index.addVideo("ccccccccccc", os.path.join(self.downloadDir.name, "ch - four-ccccccccccc.mkv")))
+    self.assertFalse(index.addVideo("ccccccccccc", fileLoc))
+    self.assertFalse(index.addVideo("ccccccccccc", None))
+    self.assertFalse(index.hasVideo("ccccccccccc"))
+    
+    # TEST: files outside the download directory aren't added
+    outsideLoc = os.path.join(self.indexDir.name, "ch - five-eeeeeeeeeee.mkv")
+    with open(outsideLoc, "w") as f:
+      f.write("video")
+    self.assertFalse(index.addVideo("eeeeeeeeeee", outsideLoc))
+    self.assertFalse(index.hasVideo("eeeeeeeeeee"))
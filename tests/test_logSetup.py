@@ -0,0 +1,215 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+from io import StringIO
+import logging
+
+import unittest
+import unittest.mock
+
+# create a streamed log so we can check its output at runtime
+logStream = StringIO()
+logging.basicConfig(stream=logStream, level=logging.DEBUG)
+
+# console
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+console.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+logging.getLogger("").addHandler(console)
+logger = logging.getLogger(__name__)
+
+from managedYoutubeDL.items import Channel, Video
+from managedYoutubeDL.logSetup import JSONFormatter, LazyJoin, LogPipeline, logFields, startFileLogging
+
+"""
+sudo python3 -m unittest tests.test_logSetup.test_LogSetup.
+.
+"""
+
+
+class test_LogSetup(unittest.TestCase):
+  TEST_ALL = True
+
+
+  @classmethod
+  def setUpClass(cls):
+    pass
+
+  @classmethod
+  def tearDownClass(cls):
+    pass
+
+  def setUp(self):
+
+    # reset log stream
+    logStream.truncate(0)
+
+    self.tmpDir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.tmpDir.cleanup()
+
+
+  def test_logFields(self):
+    """  """
+    logger.info("test_logFields")
+
+    channel = Channel(title="ch-title", id="ch-id")
+    video   = Video(title="vid-title", id="vid-id")
+
+    self.assertDictEqual(logFields(), {})
+    self.assertDictEqual(logFields(channel), {"channelID": "ch-id"})
+    self.assertDictEqual(logFields(video=video), {"videoID": "vid-id"})
+    self.assertDictEqual(logFields(channel, video), {"channelID": "ch-id", "videoID": "vid-id"})
+
+
+  def test_LazyJoin(self):
+    """  """
+    logger.info("test_LazyJoin")
+
+    channels = [Channel(title="ch-{}".format(n), id="ch-id-{}".format(n)) for n in range(3)]
+
+    self.assertEqual(str(LazyJoin(channels, key=lambda x: x.title)), "ch-0, ch-1, ch-2")
+    self.assertEqual(str(LazyJoin([1, 2], separator="+")), "1+2")
+    self.assertEqual(str(LazyJoin([])), "")
+
+    # TEST: nothing is joined until the message is formatted
+    joins = []
+    record = logging.LogRecord("name", logging.DEBUG, __file__, 1, "Ignoring: %s",
+                               (LazyJoin(channels, key=lambda x: joins.append(x) or x.id),), None)
+    self.assertListEqual(joins, [])
+    self.assertEqual(record.getMessage(), "Ignoring: ch-id-0, ch-id-1, ch-id-2")
+    self.assertEqual(len(joins), 3)
+
+
+  def test_JSONFormatter(self):
+    """  """
+    logger.info("test_JSONFormatter")
+
+    formatter = JSONFormatter()
+    channel   = Channel(title="ch-title", id="ch-id")
+    video     = Video(title="vid-title", id="vid-id")
+
+    ###########################################################################
+    # TEST: one line of JSON, with the IDs as fields
+    ###########################################################################
+    record = logging.LogRecord("name", logging.INFO, __file__, 1, "got {} \"videos\"\n", None, None)
+    record.__dict__.update(logFields(channel, video))
+    line   = formatter.format(record)
+    self.assertNotIn("\n", line)
+    entry = json.loads(line)
+    self.assertEqual(entry["message"], "got {} \"videos\"\n")
+    self.assertEqual(entry["level"], "INFO")
+    self.assertEqual(entry["logger"], "name")
+    self.assertEqual(entry["channelID"], "ch-id")
+    self.assertEqual(entry["videoID"], "vid-id")
+    self.assertNotIn("exception", entry)
+
+    # TEST: no IDs, no fields
+    entry = json.loads(formatter.format(logging.LogRecord("name", logging.INFO, __file__, 1, "%s", ("x",), None)))
+    self.assertEqual(entry["message"], "x")
+    self.assertNotIn("channelID", entry)
+    self.assertNotIn("videoID", entry)
+
+    # TEST: exceptions get their own field
+    try:
+      raise ValueError("bad value")
+    except ValueError:
+      record = logging.getLogger("name").makeRecord("name", logging.ERROR, __file__, 1, "failed", None,
+                                                    exc_info=sys.exc_info())
+    entry = json.loads(formatter.format(record))
+    self.assertEqual(entry["message"], "failed")
+    self.assertIn("ValueError: bad value", entry["exception"])
+
+
+  def test_startFileLogging(self):
+    """  """
+    logger.info("test_startFileLogging")
+
+    channel = Channel(title="ch-title", id="ch-id")
+    video   = Video(title="vid-title", id="vid-id")
+
+    ###########################################################################
+    # TEST: records are written by the pipeline's thread, not the caller
+    ###########################################################################
+    pipeline = startFileLogging(self.tmpDir.name, "test", jsonLines=True)
+    try:
+      writers = []
+      original = pipeline.handlers[0].emit
+      def emit(record):
+        writers.append(threading.current_thread())
+        original(record)
+      pipeline.handlers[0].emit = emit
+
+      logger.debug("downloading", extra=logFields(channel, video))
+      try:
+        raise ValueError("bad value")
+      except ValueError:
+        logger.exception("download failed", extra=logFields(channel, video))
+    finally:
+      pipeline.stop()
+
+    # TEST: stopping again does nothing, and the queue handler is gone
+    pipeline.stop()
+    self.assertNotIn(pipeline.queueHandler, logging.getLogger("").handlers)
+
+    self.assertEqual(len(writers), 2)
+    self.assertNotIn(threading.current_thread(), writers)
+
+    ###########################################################################
+    # TEST: messages are formatted by the pipeline's thread, not the caller
+    ###########################################################################
+    formatters = []
+    class Arg:
+      def __str__(self):
+        formatters.append(threading.current_thread())
+        return "arg"
+
+    pipeline = startFileLogging(self.tmpDir.name, "lazy")
+    try:
+      record = logging.LogRecord("name", logging.DEBUG, __file__, 1, "lazy %s", (Arg(),), None)
+      queued = pipeline.queueHandler.prepare(record)
+      self.assertEqual(queued.msg, "lazy %s")
+      self.assertListEqual(formatters, [])
+
+      # (the test's other handlers format it on this thread too)
+      logger.debug("lazy %s", Arg())
+    finally:
+      pipeline.stop()
+    self.assertTrue(any(thread is not threading.current_thread() for thread in formatters))
+    with open(os.path.join(self.tmpDir.name, "lazy.log"), encoding="utf-8") as f:
+      self.assertTrue(f.read().rstrip().endswith(" - DEBUG - lazy arg"))
+
+    with open(os.path.join(self.tmpDir.name, "test.jsonl"), encoding="utf-8") as f:
+      entries = [json.loads(line) for line in f]
+    self.assertListEqual([entry["message"] for entry in entries], ["downloading", "download failed"])
+    self.assertListEqual([entry["videoID"] for entry in entries], ["vid-id", "vid-id"])
+    self.assertIn("ValueError: bad value", entries[1]["exception"])
+
+    ###########################################################################
+    # TEST: text log
+    ###########################################################################
+    pipeline = startFileLogging(self.tmpDir.name, "test")
+    logger.info("plain line")
+    pipeline.stop()
+    with open(os.path.join(self.tmpDir.name, "test.log"), encoding="utf-8") as f:
+      self.assertTrue(f.read().rstrip().endswith(" - tests.test_logSetup - INFO - plain line"))
+
+    ###########################################################################
+    # TEST: after a fork, the child writes to the handlers directly
+    ###########################################################################
+    pipeline = startFileLogging(self.tmpDir.name, "fork")
+    try:
+      LogPipeline._afterForkInChild()
+      root = logging.getLogger("")
+      self.assertNotIn(pipeline.queueHandler, root.handlers)
+      self.assertIn(pipeline.handlers[0], root.handlers)
+      root.removeHandler(pipeline.handlers[0])
+    finally:
+      pipeline.listener.stop()
+      pipeline.handlers[0].close()
+
+    # TEST: log directory must exist
+    self.assertRaises(FileNotFoundError, startFileLogging, os.path.join(self.tmpDir.name, "missing"), "test")
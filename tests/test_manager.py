@@ -1,14 +1,19 @@
 import base64
+import json
 import datetime
 import os
 import pickle
 import random
 import shutil
+import subprocess
+import sys
 import tempfile
+import time
 from io import StringIO
 import logging
 
 import unittest
+import unittest.mock
 
 from datetime import timedelta
 
@@ -77,6 +82,30 @@ class test_Manager(unittest.TestCase):
       "globalMaxVideoLength":  timedelta(1),
       "downloadTimeout":       timedelta(seconds=10),
       "postTimeoutWait":       timedelta(seconds=5),
+      "concurrentFragmentDownloads": {"1080p": 4},
+      "httpChunkSize":         1024,
+      "minFreeDiskSpace":      0,
+      "downloadOrder":         "smallest-first",
+      "downloadAgingHalfLife": timedelta(hours=2),
+      "libraryIndexFile":      None,
+      "mergeWorkers":          1,
+      "mergeTimeout":          timedelta(minutes=5),
+      "telemetryFile":         None,
+      "adaptivePolling":       False,
+      "minPollInterval":       timedelta(hours=1),
+      "maxPollInterval":       timedelta(days=7),
+      "webSubCallbackURL":     None,
+      "webSubPort":            8080,
+      "webSubHubURL":          None,
+      "globalDescriptionFilter": None,
+      "globalTagFilter":       None,
+      "globalMinViewCount":    None,
+      "seenStoreFile":         None,
+      "seenRetentionCount":    1000,
+      "seenRetentionAge":      timedelta(days=365),
+      "stateFile":             None,
+      "configGenerations":     3,
+      "compressConfigGenerations": False,
     }
 
     # TEST: acceptable arguments are accepted and assigned correctly
@@ -85,7 +114,9 @@ class test_Manager(unittest.TestCase):
       self.assertEqual(str(getattr(manager, argName)), str(argVal))
 
     # TEST: our test has assigned all arguments
-    initAssignedFields = ["ytFetcher"]
+    initAssignedFields = ["_channelsByID", "_libraryIndex", "_telemetryLog", "_seenStore", "_stateStore",
+                          "_filterPlans", "_undecidedVideos", "_configFingerprint", "_ytFetcher", "_configRotated",
+                          "_readOnly"]
     self.assertListEqual(list(arguments.keys())+initAssignedFields, list(manager.__dict__.keys()))
     
     # TEST: unacceptable arguments raise errors
@@ -107,6 +138,117 @@ class test_Manager(unittest.TestCase):
     return Manager(**args)
 
 
+  def test_downloadOptions(self):
+    """  """
+    logger.info("test_downloadOptions")
+
+    channel = Channel(title="ch: 1", id="ch-id-1")
+
+    ###########################################################################
+    # TEST: per-quality fragment concurrency, falling back to class defaults
+    ###########################################################################
+    manager = test_Manager.createManager(concurrentFragmentDownloads={"1080p": 3}, httpChunkSize=2048)
+    options = manager._buildDownloadOptions(channel, Manager.VideoQuality.QUALITY_1080P)
+    self.assertEqual(options["concurrent_fragment_downloads"], 3)
+    self.assertEqual(options["http_chunk_size"], 2048)
+    self.assertEqual(options["format"], Manager.SUPPORTED_QUALITIES[Manager.VideoQuality.QUALITY_1080P])
+    self.assertTrue(options["outtmpl"].endswith("ch1--%(title)s-%(id)s.%(ext)s"))
+
+    options = manager._buildDownloadOptions(channel, Manager.VideoQuality.QUALITY_MAX)
+    self.assertEqual(options["concurrent_fragment_downloads"],
+                     Manager.CONCURRENT_FRAGMENT_DOWNLOADS[Manager.VideoQuality.QUALITY_MAX])
+
+    ###########################################################################
+    # TEST: a single value applies to every quality
+    ###########################################################################
+    manager = test_Manager.createManager(concurrentFragmentDownloads=5)
+    for quality in Manager.VideoQuality:
+      self.assertEqual(manager._buildDownloadOptions(channel, quality)["concurrent_fragment_downloads"], 5)
+    self.assertEqual(manager.httpChunkSize, Manager.HTTP_CHUNK_SIZE)
+
+    ###########################################################################
+    # TEST: chunked range requests can be turned off
+    ###########################################################################
+    manager = test_Manager.createManager(httpChunkSize=None)
+    self.assertNotIn("http_chunk_size", manager._buildDownloadOptions(channel, Manager.VideoQuality.QUALITY_MAX))
+
+    ###########################################################################
+    # TEST: invalid values raise errors
+    ###########################################################################
+    self.assertRaises(ValueError, test_Manager.createManager, concurrentFragmentDownloads={"999p": 2})
+    self.assertRaises(ValueError, test_Manager.createManager, concurrentFragmentDownloads={"max": 0})
+    self.assertRaises(TypeError,  test_Manager.createManager, concurrentFragmentDownloads="4")
+    self.assertRaises(TypeError,  test_Manager.createManager, httpChunkSize=0)
+
+    ###########################################################################
+    # TEST: with a merge pool, streams are downloaded as separate files
+    ###########################################################################
+    manager = test_Manager.createManager()
+    self.assertTrue(manager._usesMergePool())
+    options = Manager._separateStreams(manager._buildDownloadOptions(channel, Manager.VideoQuality.QUALITY_1080P))
+    self.assertEqual(options["format"], "bestvideo[height<=1080],bestaudio")
+    self.assertTrue(options["outtmpl"].endswith("ch1--%(title)s-%(id)s.f%(format_id)s.%(ext)s"))
+    self.assertNotIn("merge_output_format", options)
+
+    # TEST: no merge pool when merging in the download process, or without ffmpeg
+    self.assertFalse(test_Manager.createManager(mergeWorkers=0)._usesMergePool())
+    self.assertFalse(test_Manager.createManager(ffmpegLocation=None)._usesMergePool())
+    self.assertRaises(TypeError, test_Manager.createManager, mergeWorkers=-1)
+    self.assertRaises(TypeError, test_Manager.createManager, mergeTimeout="10")
+
+
+  def test_lazyFetcher(self):
+    """  """
+    logger.info("test_lazyFetcher")
+
+    ###########################################################################
+    # TEST: the fetcher is only built on first use
+    ###########################################################################
+    with unittest.mock.patch("managedYoutubeDL.manager.Fetcher") as fetcherClass:
+      manager = test_Manager.createManager(clientSecretsFile=os.path.realpath(__file__))
+      fetcherClass.assert_not_called()
+      self.assertTrue(manager.hasFetcher())
+      self.assertEqual(manager.getAPICreditsUsed(), 0)
+      fetcherClass.assert_not_called()
+
+      # TEST: built once, then reused
+      self.assertIs(manager.ytFetcher, fetcherClass.return_value)
+      self.assertIs(manager.ytFetcher, fetcherClass.return_value)
+      fetcherClass.assert_called_once_with(clientSecretsFile=os.path.realpath(__file__),
+                                           pickledCredentials=manager.pickledCredentials)
+
+    # TEST: downloads and metadata only need the video URL, not an API client
+    with unittest.mock.patch("managedYoutubeDL.fetcher.Fetcher.__init__", side_effect=AssertionError("built")), \
+         unittest.mock.patch.object(Manager, "_getVideoInfo", return_value=[{}]) as getVideoInfo:
+      manager = test_Manager.createManager(clientSecretsFile=os.path.realpath(__file__))
+      manager.getVideoMetadata(Channel(title="ch-title", id="ch-id"), Video(title="vid-title", id="vid-id"))
+      self.assertListEqual(getVideoInfo.call_args[0][1], ["https://www.youtube.com/watch?v=vid-id"])
+
+    # TEST: no client secrets, no fetcher
+    manager = test_Manager.createManager()
+    self.assertFalse(manager.hasFetcher())
+    self.assertIsNone(manager.ytFetcher)
+
+    # TEST: an assigned fetcher is used as is
+    fetcher = type("F", (), {"creditsUsed": 7})()
+    manager.ytFetcher = fetcher
+    self.assertTrue(manager.hasFetcher())
+    self.assertIs(manager.ytFetcher, fetcher)
+    self.assertEqual(manager.getAPICreditsUsed(), 7)
+
+    ###########################################################################
+    # TEST: importing the manager doesn't import yt-dlp, the Google API client
+    #       or the WebSub callback server
+    ###########################################################################
+    code = "import sys, managedYoutubeDL.manager; print(sorted(set(name.split('.')[0] for name in sys.modules) " \
+           "& {'yt_dlp', 'googleapiclient', 'google_auth_oauthlib', 'http'} | " \
+           "{name for name in sys.modules if name == 'managedYoutubeDL.websub'}))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    self.assertEqual(result.returncode, 0, result.stderr)
+    self.assertEqual(result.stdout.strip(), "[]")
+
+
   def test_seenVideos(self):
     """  """
     logger.info("test_seenVideos")
@@ -148,6 +290,33 @@ class test_Manager(unittest.TestCase):
     manager.addSeenVideo(channel2, video2)
     self.assertEqual(len(manager.seenChannelVideos[channel2.id]), 1)
 
+    ###########################################################################
+    # TEST: with a seen store, the config's lists are moved into it
+    ###########################################################################
+    with tempfile.TemporaryDirectory() as tmpDir:
+      manager.setSeenStoreFile(os.path.join(tmpDir, "seen.sqlite"))
+      self.assertTrue(manager.haveSeenVideo(capChannel, Video(title="", id=videoIds[-1])))
+      self.assertDictEqual(manager.seenChannelVideos, {})
+
+      # TEST: no cap on the seen videos per channel
+      for vid_id in videoIds:
+        manager.addSeenVideo(capChannel, Video(title=vid_id, id=vid_id))
+      self.assertTrue(all(manager.haveSeenVideo(capChannel, Video(title="", id=vid_id)) for vid_id in videoIds))
+      self.assertEqual(len(manager.getSeenStore()), CAP + 5 + 2)
+
+      # TEST: the retention limits are applied when the store is opened
+      manager.setSeenRetentionCount(10)
+      manager.setSeenStoreFile(manager.seenStoreFile)
+      self.assertFalse(manager.haveSeenVideo(capChannel, Video(title="", id=videoIds[0])))
+      self.assertTrue(manager.haveSeenVideo(capChannel, Video(title="", id=videoIds[-1])))
+      self.assertTrue(manager.haveSeenVideo(channel1, video1))
+      manager.getSeenStore().close()
+
+    # TEST: bad retention limits
+    self.assertRaises(TypeError, test_Manager.createManager, seenRetentionCount=0)
+    self.assertRaises(TypeError, test_Manager.createManager, seenRetentionAge="1d")
+    self.assertRaises(TypeError, test_Manager.createManager, seenStoreFile=1)
+
 
     
   def test_downloadNewVideos(self):
@@ -311,6 +480,51 @@ class test_Manager(unittest.TestCase):
     self.assertEqual(downloadCalls, [vid2.id])
 
 
+  def test_discoverNewVideos_perChannel(self):
+    """  """
+    logger.info("test_discoverNewVideos_perChannel")
+
+    UTC      = datetime.timezone.utc
+    videos   = [Video(title="video-{}".format(n), id="vid-id-{}".format(n),
+                      publishedAt=datetime.datetime(2020, 1, n + 1, tzinfo=UTC)) for n in range(6)]
+    channels = [Channel(title="ch-{}".format(n), id="ch-id-{}".format(n), ignore=False,
+                        minVideoDate=datetime.datetime(2020, 1, n + 1, tzinfo=UTC)) for n in range(4)]
+    channels[3].setMaxVideoDate(datetime.datetime(2020, 1, 5, tzinfo=UTC))
+    manager = test_Manager.createManager(channelList=channels)
+    manager.setGlobalExcludeFilter("video-5")
+    manager.addSeenVideo(channels[2], videos[3])
+
+    # record the order channels are fetched and filtered in
+    events = []
+    def fetchRecentVideos(self, cid):
+      events.append(("fetch", cid))
+      return list(videos)
+    manager.ytFetcher = type("F", (), {"fetchRecentVideos": fetchRecentVideos})()
+    filterChannelVideos = manager.filterChannelVideos
+    def recordFilter(channel, videoList):
+      events.append(("filter", channel.id))
+      return filterChannelVideos(channel, videoList)
+    manager.filterChannelVideos = recordFilter
+
+    ###########################################################################
+    # TEST: each channel is filtered as soon as it's fetched
+    ###########################################################################
+    channelVideos = manager._discoverNewVideos()
+    self.assertListEqual(events, [(action, channel.id) for channel in channels for action in ["fetch", "filter"]])
+
+    # TEST: the seen, date and global filters all apply
+    self.assertListEqual([(channel.id, [video.id for video in videoList]) for channel, videoList in channelVideos],
+                         [("ch-id-0", ["vid-id-0", "vid-id-1", "vid-id-2", "vid-id-3", "vid-id-4"]),
+                          ("ch-id-1", ["vid-id-1", "vid-id-2", "vid-id-3", "vid-id-4"]),
+                          ("ch-id-2", ["vid-id-2", "vid-id-4"]),
+                          ("ch-id-3", ["vid-id-3", "vid-id-4"])])
+    self.assertDictEqual(manager.getFilterRejections()["ch-id-2"],
+                         {"minVideoDate": 2, "seen": 1, "globalExcludeFilter": 1})
+
+    # TEST: without adaptive polling, the channels' poll times aren't touched
+    self.assertListEqual([channel.lastPolledAt for channel in channels], [None] * len(channels))
+
+
   def test_downloadNewVideos_retriesAfterTimeout(self):
     """
     # A download that times out once is retried (after postTimeoutWait) and
@@ -349,6 +563,574 @@ class test_Manager(unittest.TestCase):
     self.assertTrue(manager.haveSeenVideo(ch, vid))
 
 
+  def test_downloadNewVideos_defersWhenDiskFull(self):
+    """
+    # With disk-space admission control on, videos that wouldn't fit are
+    # deferred: not downloaded, not marked seen, and their channel's min
+    # video date doesn't move past them.
+    """
+    logger.info("test_downloadNewVideos_defersWhenDiskFull")
+    import collections
+    import unittest.mock
+
+    UTC     = datetime.timezone.utc
+    QUALITY = Manager.VideoQuality.QUALITY_MAX
+
+    def makeVideo(n):
+      return Video(
+        title="video-{}".format(n),
+        id="vid-id-{}".format(n),
+        publishedAt=datetime.datetime(2020, 1, n + 1, tzinfo=UTC),
+      )
+
+    ch     = Channel(title="ch-0", id="ch-id-0", ignore=False)
+    videos = [makeVideo(0), makeVideo(1), makeVideo(2)]
+    sizes  = {"vid-id-0": 300, "vid-id-1": 5000, "vid-id-2": 200}
+
+    # each size comes from the video's extracted info, which the download reuses
+    downloadCalls = []
+    manager = test_Manager.createManager(channelList=[ch], minFreeDiskSpace=100)
+    manager.ytFetcher = type("F", (), {"fetchRecentVideos": lambda self, cid: list(videos)})()
+    manager._extractVideoInfo = lambda channel, video, quality: {"id": video.id}
+    manager._estimateDownloadSize = lambda channel, video, quality, info=None: sizes[info["id"]]
+    manager._downloadVideo = lambda channel, video, quality, timeout, info=None: (
+      downloadCalls.append(info["id"]) or True)
+
+    DiskUsage = collections.namedtuple("DiskUsage", ["total", "used", "free"])
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"), \
+         unittest.mock.patch("managedYoutubeDL.downloadQueue.shutil.disk_usage",
+                             return_value=DiskUsage(10000, 9000, 1000)):
+      downloaded, failed = manager.downloadNewVideos(quality=QUALITY)
+
+    # TEST: the video too big for the free space (minus the margin) is skipped
+    self.assertEqual((downloaded, failed), (2, 0))
+    self.assertEqual(downloadCalls, ["vid-id-0", "vid-id-2"])
+    self.assertFalse(manager.haveSeenVideo(ch, videos[1]))
+
+    # TEST: the min video date is held at the deferred video, so it's
+    # fetched again next run
+    self.assertEqual(ch.minVideoDate, videos[1].publishedAt)
+
+
+  def test_extractVideoInfo(self):
+    """
+    # Size estimates extract the video's info in a child process, which is
+    # killed after the download timeout
+    """
+    logger.info("test_extractVideoInfo")
+
+    channel = Channel(title="ch-0", id="ch-id-0")
+    video   = Video(title="video-0", id="vid-id-0")
+    QUALITY = Manager.VideoQuality.QUALITY_MAX
+    manager = test_Manager.createManager(downloadTimeout=1)
+
+    def extractInfo(returnQueue, options, url):
+      returnQueue.put({"webpage_url": url, "requested_formats": [{"filesize": 1000}, {"filesize_approx": 200}]})
+    def extractSlowly(returnQueue, options, url):
+      time.sleep(30)
+
+    ###########################################################################
+    # TEST: the size comes from the chosen formats
+    ###########################################################################
+    with unittest.mock.patch.object(Manager, "_callExtractInfo", extractInfo):
+      info = manager._extractVideoInfo(channel, video, QUALITY)
+      self.assertEqual(info["webpage_url"], "https://www.youtube.com/watch?v=vid-id-0")
+      self.assertEqual(manager._estimateTransferSize(channel, video, QUALITY), 1200)
+    self.assertEqual(manager._estimateTransferSize(channel, video, QUALITY, info={"filesize": None}), None)
+
+    ###########################################################################
+    # TEST: an extraction that takes too long gives an unknown size
+    ###########################################################################
+    startTime = time.monotonic()
+    with unittest.mock.patch.object(Manager, "_callExtractInfo", extractSlowly), \
+         self.assertLogs("managedYoutubeDL.manager", level="WARNING") as logs:
+      self.assertIsNone(manager._estimateDownloadSize(channel, video, QUALITY))
+    self.assertLess(time.monotonic() - startTime, 15)
+    self.assertIn("timed out", logs.output[0])
+
+
+  def test_callYoutubeDL_reusesInfo(self):
+    """
+    # A download given the video's extracted info downloads from it, rather
+    # than extracting it again
+    """
+    logger.info("test_callYoutubeDL_reusesInfo")
+    import queue
+    import unittest.mock
+
+    calls = []
+    class FakeYoutubeDL:
+      def __init__(self, options):
+        self.options = options
+      def __enter__(self):
+        return self
+      def __exit__(self, *args):
+        pass
+      def extract_info(self, url, download=False):
+        calls.append(("extract_info", url))
+        return {"format_id": "18"}
+      def download(self, urlList):
+        calls.append(("download", urlList))
+        return 0
+      def download_with_info_file(self, infoFile):
+        with open(infoFile, "r") as f:
+          calls.append(("download_with_info_file", json.load(f)))
+        return 0
+
+    returnQueue = queue.Queue()
+    with unittest.mock.patch("yt_dlp.YoutubeDL", FakeYoutubeDL):
+      Manager._callYoutubeDL(returnQueue, {}, ["url-0"], {"id": "vid-id-0", "format_id": "22"})
+      self.assertListEqual(calls, [("download_with_info_file", {"id": "vid-id-0", "format_id": "22"})])
+      result = returnQueue.get_nowait()
+      self.assertTrue(result["success"])
+      self.assertEqual(result["formatID"], "22")
+      self.assertIsNone(result["extractTime"])
+
+      # TEST: without it, the info is extracted as before
+      del calls[:]
+      Manager._callYoutubeDL(returnQueue, {}, ["url-0"])
+      self.assertListEqual(calls, [("extract_info", "url-0"), ("download", ["url-0"])])
+      self.assertIsNotNone(returnQueue.get_nowait()["extractTime"])
+
+
+  def test_downloadNewVideos_smallestFirst(self):
+    """
+    # With "smallest-first" ordering, videos from all channels are
+    # downloaded in order of their estimated size
+    """
+    logger.info("test_downloadNewVideos_smallestFirst")
+    import unittest.mock
+
+    UTC     = datetime.timezone.utc
+    QUALITY = Manager.VideoQuality.QUALITY_MAX
+    NOW     = datetime.datetime.now(UTC)
+
+    ch0 = Channel(title="ch-0", id="ch-id-0", ignore=False)
+    ch1 = Channel(title="ch-1", id="ch-id-1", ignore=False)
+    channelVideos = {
+      ch0.id: [Video(title="big",   id="big",   publishedAt=NOW)],
+      ch1.id: [Video(title="small", id="small", publishedAt=NOW),
+               Video(title="mid",   id="mid",   publishedAt=NOW)],
+    }
+    sizes = {"big": 8 * 1024**3, "small": 10 * 1024**2, "mid": 500 * 1024**2}
+
+    downloadCalls = []
+    manager = test_Manager.createManager(channelList=[ch0, ch1], downloadOrder="smallest-first")
+    manager.ytFetcher = type("F", (), {"fetchRecentVideos": lambda self, cid: list(channelVideos[cid])})()
+    manager._estimateDownloadSize = lambda channel, video, quality: sizes[video.id]
+    manager._downloadVideo = lambda channel, video, quality, timeout: (
+      downloadCalls.append(video.id) or True)
+
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      downloaded, failed = manager.downloadNewVideos(quality=QUALITY)
+
+    # TEST: all downloaded, smallest first
+    self.assertEqual((downloaded, failed), (3, 0))
+    self.assertEqual(downloadCalls, ["small", "mid", "big"])
+
+    # TEST: unknown orders are rejected
+    self.assertRaises(ValueError, test_Manager.createManager, downloadOrder="largest-first")
+
+
+  def test_downloadNewVideos_priority(self):
+    """
+    # With "newest-first" ordering, high-priority channels are downloaded
+    # first, then the rest, newest videos first
+    """
+    logger.info("test_downloadNewVideos_priority")
+    import unittest.mock
+
+    UTC     = datetime.timezone.utc
+    QUALITY = Manager.VideoQuality.QUALITY_MAX
+
+    def makeVideo(name, day):
+      return Video(title=name, id=name, publishedAt=datetime.datetime(2020, 1, day, tzinfo=UTC))
+
+    chA = Channel(title="a-backlog", id="ch-a", ignore=False)
+    chZ = Channel(title="z-favourite", id="ch-z", ignore=False, priority=5)
+    channelVideos = {
+      chA.id: [makeVideo("a-old", 1), makeVideo("a-new", 9)],
+      chZ.id: [makeVideo("z-old", 2), makeVideo("z-new", 3)],
+    }
+
+    downloadCalls = []
+    manager = test_Manager.createManager(channelList=[chA, chZ], downloadOrder="newest-first")
+    manager.ytFetcher = type("F", (), {"fetchRecentVideos": lambda self, cid: list(channelVideos[cid])})()
+    manager._downloadVideo = lambda channel, video, quality, timeout: (
+      downloadCalls.append(video.id) or True)
+
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      manager.downloadNewVideos(quality=QUALITY)
+
+    # TEST: the favourite channel goes first despite its name, newest first
+    self.assertEqual(downloadCalls, ["z-new", "z-old", "a-new", "a-old"])
+
+
+  def test_downloadNewVideos_checkpoint(self):
+    """
+    # Checkpoints save the state after each video, with each channel's min
+    # video date held at its oldest video that's still to be downloaded
+    """
+    logger.info("test_downloadNewVideos_checkpoint")
+    import unittest.mock
+
+    UTC     = datetime.timezone.utc
+    QUALITY = Manager.VideoQuality.QUALITY_MAX
+
+    ch     = Channel(title="ch-0", id="ch-id-0", ignore=False)
+    videos = [Video(title="video-{}".format(n), id="vid-id-{}".format(n),
+                    publishedAt=datetime.datetime(2020, 1, n + 1, tzinfo=UTC)) for n in range(3)]
+
+    manager = test_Manager.createManager(channelList=[ch], downloadOrder="newest-first", mergeWorkers=0)
+    manager.ytFetcher = type("F", (), {"fetchRecentVideos": lambda self, cid: list(videos)})()
+    manager._downloadVideo = lambda channel, video, quality, timeout: True
+
+    savedDates = []
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      manager.downloadNewVideos(quality=QUALITY, checkpoint=lambda: savedDates.append(ch.minVideoDate))
+
+    # TEST: newest first, so the oldest video holds the saved date until it's done
+    self.assertListEqual(savedDates, [videos[0].publishedAt, videos[0].publishedAt, videos[2].publishedAt])
+
+    # TEST: the held date isn't kept once everything is downloaded
+    self.assertEqual(ch.minVideoDate, videos[2].publishedAt)
+
+
+  def test_downloadNewVideos_adaptivePolling(self):
+    """
+    # With adaptive polling, each channel learns a poll interval from its
+    # upload history, and is only polled again once that interval is up
+    """
+    logger.info("test_downloadNewVideos_adaptivePolling")
+    import unittest.mock
+
+    UTC     = datetime.timezone.utc
+    QUALITY = Manager.VideoQuality.QUALITY_MAX
+    now     = datetime.datetime.now(UTC)
+
+    # uploads every 2 days, the last one a day ago
+    ch     = Channel(title="ch-0", id="ch-id-0", ignore=False)
+    videos = [Video(title="video-{}".format(n), id="vid-id-{}".format(n),
+                    publishedAt=now - timedelta(days=1 + 2*n)) for n in range(3)]
+
+    fetchCalls = []
+    def fetchRecentVideos(cid):
+      fetchCalls.append(cid)
+      return list(videos)
+
+    manager = test_Manager.createManager(channelList=[ch], adaptivePolling=True, mergeWorkers=0)
+    manager.ytFetcher = type("F", (), {"fetchRecentVideos": lambda self, cid: fetchRecentVideos(cid)})()
+    manager._downloadVideo = lambda channel, video, quality, timeout: True
+
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      manager.downloadNewVideos(quality=QUALITY)
+
+      # TEST: the channel was polled and learned a quarter of its median upload gap
+      self.assertEqual(len(fetchCalls), 1)
+      self.assertGreaterEqual(ch.lastPolledAt, now)
+      self.assertEqual(ch.pollInterval, timedelta(days=2) / Manager.POLLS_PER_UPLOAD)
+
+      # TEST: the channel isn't polled again until it's due
+      manager.downloadNewVideos(quality=QUALITY)
+      self.assertEqual(len(fetchCalls), 1)
+      ch.setLastPolledAt(ch.lastPolledAt - ch.pollInterval)
+      manager.downloadNewVideos(quality=QUALITY)
+      self.assertEqual(len(fetchCalls), 2)
+
+      # TEST: a manual override takes precedence over the learned interval
+      ch.setPollIntervalOverride(1)
+      ch.setLastPolledAt(ch.lastPolledAt - timedelta(seconds=1))
+      manager.downloadNewVideos(quality=QUALITY)
+      self.assertEqual(len(fetchCalls), 3)
+
+    # TEST: learned intervals are kept within the bounds
+    manager.setMinPollInterval(timedelta(days=1))
+    self.assertEqual(manager._estimatePollInterval(videos, now), timedelta(days=1))
+    manager.setMinPollInterval(60)
+    manager.setMaxPollInterval(60*60)
+    self.assertEqual(manager._estimatePollInterval(videos, now), timedelta(hours=1))
+
+    # TEST: too little history polls at the max interval
+    self.assertEqual(manager._estimatePollInterval(videos[:1], now), timedelta(hours=1))
+
+    # TEST: bad settings are rejected
+    self.assertRaises(ValueError, manager.setMinPollInterval, 60*60*2)
+    self.assertRaises(TypeError,  manager.setAdaptivePolling, "yes")
+    self.assertRaises(ValueError, manager.setMaxPollInterval, 0)
+
+
+  def test_downloadNewVideos_pushedVideos(self):
+    """
+    # Pushed videos are filtered and downloaded without fetching their
+    # channel, and channels whose uploads are pushed aren't polled
+    """
+    logger.info("test_downloadNewVideos_pushedVideos")
+    import unittest.mock
+
+    UTC     = datetime.timezone.utc
+    QUALITY = Manager.VideoQuality.QUALITY_MAX
+
+    chPushed = Channel(title="pushed", id="ch-pushed", ignore=False)
+    chLeased = Channel(title="leased", id="ch-leased", ignore=False)
+    chPolled = Channel(title="polled", id="ch-polled", ignore=False)
+    polledVideo = Video(title="polled", id="vid-polled", publishedAt=datetime.datetime(2020, 1, 1, tzinfo=UTC))
+    pushedVideo = Video(title="pushed", id="vid-pushed", publishedAt=datetime.datetime(2020, 1, 2, tzinfo=UTC))
+    oldVideo    = Video(title="old",    id="vid-old",    publishedAt=datetime.datetime(2019, 1, 1, tzinfo=UTC))
+    chPushed.setMinVideoDate(datetime.datetime(2019, 6, 1, tzinfo=UTC))
+
+    fetchCalls    = []
+    downloadCalls = []
+    manager = test_Manager.createManager(channelList=[chPushed, chLeased, chPolled], mergeWorkers=0)
+    manager.ytFetcher = type("F", (), {
+      "fetchRecentVideos": lambda self, cid: fetchCalls.append(cid) or [polledVideo]})()
+    manager._downloadVideo = lambda channel, video, quality, timeout: downloadCalls.append(video.id) or True
+
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      downloaded, failed = manager.downloadNewVideos(
+        quality        = QUALITY,
+        pushedVideos   = {chPushed.id: [pushedVideo, oldVideo]},
+        pushChannelIDs = [chPushed.id, chLeased.id])
+
+    # TEST: only the channel without a push subscription was polled
+    self.assertListEqual(fetchCalls, [chPolled.id])
+
+    # TEST: pushed videos still go through the filters
+    self.assertEqual((downloaded, failed), (2, 0))
+    self.assertListEqual(sorted(downloadCalls), ["vid-polled", "vid-pushed"])
+    self.assertTrue(manager.haveSeenVideo(chPushed, pushedVideo))
+
+
+  def test_downloadNewVideos_claims(self):
+    """
+    # Videos claimed by another run are skipped, and stay unseen for the
+    # next run; our own claims are released once downloaded
+    """
+    logger.info("test_downloadNewVideos_claims")
+    import unittest.mock
+    from managedYoutubeDL.runLock import ClaimDirectory
+
+    UTC     = datetime.timezone.utc
+    QUALITY = Manager.VideoQuality.QUALITY_MAX
+
+    ch     = Channel(title="ch-0", id="ch-id-0", ignore=False)
+    videos = [Video(title="video-{}".format(n), id="vid-id-{}".format(n),
+                    publishedAt=datetime.datetime(2020, 1, n + 1, tzinfo=UTC)) for n in range(3)]
+
+    with tempfile.TemporaryDirectory() as downloadDir:
+      downloadCalls = []
+      manager = test_Manager.createManager(channelList=[ch], downloadDirectory=downloadDir, mergeWorkers=0)
+      manager.ytFetcher = type("F", (), {"fetchRecentVideos": lambda self, cid: list(videos)})()
+      manager._downloadVideo = lambda channel, video, quality, timeout: downloadCalls.append(video.id) or True
+
+      # another run is downloading the middle video
+      otherRun = ClaimDirectory(os.path.join(downloadDir, Manager.CLAIM_DIRECTORY))
+      self.assertTrue(otherRun.claim(videos[1].id))
+
+      claims = manager.createClaimDirectory()
+      with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+        self.assertEqual(manager.downloadNewVideos(quality=QUALITY, claims=claims), (2, 0))
+
+      # TEST: the claimed video was skipped, and held for the next run
+      self.assertListEqual(downloadCalls, [videos[0].id, videos[2].id])
+      self.assertFalse(manager.haveSeenVideo(ch, videos[1]))
+      self.assertLessEqual(ch.minVideoDate, videos[1].publishedAt)
+
+      # TEST: only the other run's claim is left
+      self.assertSetEqual(claims.claimed, set())
+      self.assertListEqual(os.listdir(otherRun.directory), ["{}.claim".format(videos[1].id)])
+
+      # TEST: once released, the next run downloads it
+      otherRun.release(videos[1].id)
+      with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+        self.assertEqual(manager.downloadNewVideos(quality=QUALITY, claims=claims), (1, 0))
+      self.assertListEqual(downloadCalls, [videos[0].id, videos[2].id, videos[1].id])
+
+
+  def test_downloadNewVideos_mergePool(self):
+    """
+    # With a merge pool, downloads hand their streams over to be merged, and
+    # videos are only counted, marked seen and recorded in the telemetry
+    # once merged
+    """
+    logger.info("test_downloadNewVideos_mergePool")
+    import sys
+    import unittest.mock
+    from managedYoutubeDL.downloadQueue import DownloadResult
+
+    UTC     = datetime.timezone.utc
+    QUALITY = Manager.VideoQuality.QUALITY_MAX
+
+    def makeVideo(videoID, day):
+      return Video(title="video-{}".format(day), id=videoID,
+                   publishedAt=datetime.datetime(2020, 1, day, tzinfo=UTC))
+
+    ch     = Channel(title="ch-0", id="ch-id-0", ignore=False)
+    good   = makeVideo("aaaaaaaaaaa", 1)
+    bad    = makeVideo("bbbbbbbbbbb", 2)
+
+    with tempfile.TemporaryDirectory() as downloadDir:
+
+      # a fake ffmpeg: fails for "bad" videos, otherwise writes the output file
+      ffmpegLoc = os.path.join(downloadDir, "ffmpeg")
+      with open(ffmpegLoc, "w") as f:
+        f.write("#!{}\n".format(sys.executable))
+        f.write("import sys\n")
+        f.write("if '{}' in sys.argv[-1]: sys.exit(1)\n".format(bad.id))
+        f.write("open(sys.argv[-1], 'w').close()\n")
+      os.chmod(ffmpegLoc, 0o755)
+
+      # "download" writes separate video and audio streams
+      def fakeDownload(channel, video, quality, timeout):
+        streamFiles = []
+        for formatID, ext in [("137", "mp4"), ("251", "webm")]:
+          streamFile = os.path.join(downloadDir, "ch0--{}-{}.f{}.{}".format(video.title, video.id, formatID, ext))
+          open(streamFile, "w").close()
+          streamFiles.append(streamFile)
+        return DownloadResult(True, streamFiles=streamFiles, formatID="137+251", numBytes=4000,
+                              extractTime=0.5, transferTime=2.0)
+
+      telemetryFile = os.path.join(downloadDir, "telemetry.jsonl")
+      manager = test_Manager.createManager(channelList=[ch], downloadDirectory=downloadDir,
+                                           ffmpegLocation=ffmpegLoc, mergeWorkers=2, telemetryFile=telemetryFile)
+      manager.ytFetcher = type("F", (), {"fetchRecentVideos": lambda self, cid: [good, bad]})()
+      manager._downloadVideo = fakeDownload
+
+      with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+        downloaded, failed = manager.downloadNewVideos(quality=QUALITY)
+
+      # TEST: the good video is merged and recorded; the failed merge isn't
+      self.assertEqual((downloaded, failed), (1, 1))
+      self.assertTrue(manager.haveSeenVideo(ch, good))
+      self.assertFalse(manager.haveSeenVideo(ch, bad))
+
+      # TEST: the merged file replaces the good video's streams; the failed
+      # merge keeps its streams for next time
+      self.assertListEqual(sorted(os.listdir(downloadDir)), [
+        "ch0--video-1-aaaaaaaaaaa.mkv",
+        "ch0--video-2-bbbbbbbbbbb.f137.mp4",
+        "ch0--video-2-bbbbbbbbbbb.f251.webm",
+        "ffmpeg",
+        "telemetry.jsonl",
+      ])
+
+      # TEST: one telemetry record per video, including the merge
+      from managedYoutubeDL.telemetry import TelemetryLog
+      records = {record["videoID"]: record for record in TelemetryLog.read(telemetryFile)}
+      self.assertSetEqual(set(records.keys()), {good.id, bad.id})
+      self.assertEqual(records[good.id]["outcome"], "downloaded")
+      self.assertEqual(records[bad.id]["outcome"], "merge-failed")
+      for record in records.values():
+        self.assertEqual(record["channelID"], ch.id)
+        self.assertEqual(record["quality"], "max")
+        self.assertEqual(record["format"], "137+251")
+        self.assertEqual(record["bytes"], 4000)
+        self.assertEqual(record["throughput"], 2000)
+        self.assertEqual(record["attempts"], 1)
+        self.assertIsNotNone(record["mergeTime"])
+
+
+  def test_downloadNewVideos_skipsLibraryVideos(self):
+    """
+    # With a library index, videos already in the download directory are
+    # not downloaded again (even if they were never marked seen), and new
+    # downloads are added to the saved index
+    """
+    logger.info("test_downloadNewVideos_skipsLibraryVideos")
+    import json
+    import unittest.mock
+    from managedYoutubeDL.downloadQueue import DownloadResult
+
+    UTC     = datetime.timezone.utc
+    QUALITY = Manager.VideoQuality.QUALITY_MAX
+
+    def makeVideo(videoID, day):
+      return Video(title="video-{}".format(day), id=videoID,
+                   publishedAt=datetime.datetime(2020, 1, day, tzinfo=UTC))
+
+    ch     = Channel(title="ch-0", id="ch-id-0", ignore=False)
+    have   = makeVideo("aaaaaaaaaaa", 1)
+    need   = makeVideo("bbbbbbbbbbb", 2)
+
+    with tempfile.TemporaryDirectory() as downloadDir, tempfile.TemporaryDirectory() as indexDir:
+      indexFile = os.path.join(indexDir, "library.json")
+
+      # a copy of <have> is already on disk
+      open(os.path.join(downloadDir, "ch-0 - video-1-aaaaaaaaaaa.mkv"), "w").close()
+
+      # "download" writes the file to the download directory, and reports it
+      downloadCalls = []
+      def fakeDownload(channel, video, quality, timeout):
+        downloadCalls.append(video.id)
+        fileLoc = os.path.join(downloadDir, "ch-0 - {}-{}.mkv".format(video.title, video.id))
+        open(fileLoc, "w").close()
+        return DownloadResult(True, fileLoc=fileLoc)
+
+      manager = test_Manager.createManager(channelList=[ch], downloadDirectory=downloadDir,
+                                           libraryIndexFile=indexFile)
+      manager.ytFetcher = type("F", (), {"fetchRecentVideos": lambda self, cid: [have, need]})()
+      manager._downloadVideo = fakeDownload
+
+      with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+        downloaded, failed = manager.downloadNewVideos(quality=QUALITY)
+
+      # TEST: only the missing video is downloaded; the other is marked seen
+      self.assertEqual((downloaded, failed), (1, 0))
+      self.assertEqual(downloadCalls, [need.id])
+      self.assertTrue(manager.haveSeenVideo(ch, have))
+      self.assertEqual(ch.minVideoDate, need.publishedAt)
+
+      # TEST: the saved index contains both videos
+      with open(indexFile, "r") as f:
+        self.assertSetEqual(set(json.load(f)["entries"].keys()), {have.id, need.id})
+
+
+  def test_downloadNewVideos_defersUndecidedVideos(self):
+    """
+    # A video whose filters couldn't be checked stays unseen, and its
+    # channel's min video date is held at it, so it's checked next run
+    """
+    logger.info("test_downloadNewVideos_defersUndecidedVideos")
+    import unittest.mock
+
+    UTC     = datetime.timezone.utc
+    QUALITY = Manager.VideoQuality.QUALITY_MAX
+
+    def makeVideo(videoID, day):
+      return Video(title="video-{}".format(day), id=videoID,
+                   publishedAt=datetime.datetime(2020, 1, day, tzinfo=UTC))
+
+    ch        = Channel(title="ch-0", id="ch-id-0", ignore=False)
+    undecided = makeVideo("aaaaaaaaaaa", 1)
+    newer     = makeVideo("bbbbbbbbbbb", 2)
+
+    # the first run can't fetch <undecided>'s duration
+    durations = {undecided.id: None, newer.id: datetime.timedelta(minutes=10)}
+    manager = test_Manager.createManager(channelList=[ch], globalMinVideoLength=datetime.timedelta(minutes=1))
+    manager.ytFetcher = type("F", (), {
+      "fetchRecentVideos": lambda self, cid: [undecided, newer],
+      "fetchVideoDetails": lambda self, video: {"duration": durations[video.id]},
+    })()
+    downloadCalls = []
+    manager._downloadVideo = lambda channel, video, quality, timeout: downloadCalls.append(video.id) or True
+
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      self.assertEqual(manager.downloadNewVideos(quality=QUALITY), (1, 0))
+
+    # TEST: the undecided video isn't downloaded or seen, and the min date
+    # stays at it
+    self.assertEqual(downloadCalls, [newer.id])
+    self.assertFalse(manager.haveSeenVideo(ch, undecided))
+    self.assertEqual(ch.minVideoDate, undecided.publishedAt)
+
+    # TEST: once its duration is known, the next run downloads it
+    durations[undecided.id] = datetime.timedelta(minutes=10)
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      self.assertEqual(manager.downloadNewVideos(quality=QUALITY), (1, 0))
+    self.assertEqual(downloadCalls, [newer.id, undecided.id])
+    self.assertTrue(manager.haveSeenVideo(ch, undecided))
+    self.assertEqual(manager._undecidedVideos, {ch.id: []})
+
+
   def test_updateChannels(self):
     """  """
     logger.info("test_updateChannels")
@@ -364,7 +1146,7 @@ class test_Manager(unittest.TestCase):
     # TEST: starting from empty list, all subscribed channels are added
     manager = test_Manager.createManager(channelList=[])
     manager.ytFetcher = makeFetcher([ch(0), ch(1), ch(2)])
-    added, removed = manager.updateChannels()
+    added, removed, renamed = manager.updateChannels()
     self.assertEqual(added,   3)
     self.assertEqual(removed, 0)
     for i in range(3):
@@ -373,7 +1155,7 @@ class test_Manager(unittest.TestCase):
     # TEST: new channel added when not in current list
     manager = test_Manager.createManager(channelList=[ch(0), ch(1)])
     manager.ytFetcher = makeFetcher([ch(0), ch(1), ch(2)])
-    added, removed = manager.updateChannels()
+    added, removed, renamed = manager.updateChannels()
     self.assertEqual(added,   1)
     self.assertEqual(removed, 0)
     self.assertIn(ch(2), manager.channelList)
@@ -381,17 +1163,17 @@ class test_Manager(unittest.TestCase):
     # TEST: removed channel is no longer in list
     manager = test_Manager.createManager(channelList=[ch(0), ch(1), ch(2)])
     manager.ytFetcher = makeFetcher([ch(0), ch(2)])
-    added, removed = manager.updateChannels()
+    added, removed, renamed = manager.updateChannels()
     self.assertEqual(added,   0)
     self.assertEqual(removed, 1)
     self.assertNotIn(ch(1), manager.channelList)
     self.assertIn(ch(0), manager.channelList)
     self.assertIn(ch(2), manager.channelList)
 
-    # TEST: no changes returns (0, 0)
+    # TEST: no changes returns (0, 0, 0)
     manager = test_Manager.createManager(channelList=[ch(0), ch(1)])
     manager.ytFetcher = makeFetcher([ch(0), ch(1)])
-    added, removed = manager.updateChannels()
+    added, removed, renamed = manager.updateChannels()
     self.assertEqual(added,   0)
     self.assertEqual(removed, 0)
     self.assertEqual(len(manager.channelList), 2)
@@ -399,13 +1181,55 @@ class test_Manager(unittest.TestCase):
     # TEST: mix — some added, some removed, some unchanged
     manager = test_Manager.createManager(channelList=[ch(0), ch(1), ch(2)])
     manager.ytFetcher = makeFetcher([ch(1), ch(2), ch(3)])
-    added, removed = manager.updateChannels()
+    added, removed, renamed = manager.updateChannels()
     self.assertEqual(added,   1)
     self.assertEqual(removed, 1)
     self.assertNotIn(ch(0), manager.channelList)
     self.assertIn(ch(1), manager.channelList)
     self.assertIn(ch(2), manager.channelList)
     self.assertIn(ch(3), manager.channelList)
+    self.assertEqual(renamed, 0)
+    
+    
+    ###########################################################################
+    # TEST: a renamed channel keeps its settings
+    ###########################################################################
+    known = Channel(title="old title", id="id-0", ignore=True, includeFilter="part \\d+",
+                    minVideoDate=datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc))
+    manager = test_Manager.createManager(channelList=[known, ch(1)])
+    manager.ytFetcher = makeFetcher([Channel(title="new title", id="id-0"), ch(1)])
+    self.assertTupleEqual(manager.updateChannels(), (0, 0, 1))
+    self.assertIs(manager.getChannelsByID()["id-0"], known)
+    self.assertEqual(known.title, "new title")
+    self.assertTrue(known.ignore)
+    self.assertEqual(known.includeFilter, "part \\d+")
+    self.assertEqual(known.minVideoDate, datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc))
+    
+    # TEST: the list stays sorted by title
+    self.assertListEqual([channel.id for channel in manager.channelList], ["id-0", "id-1"])
+    manager.ytFetcher = makeFetcher([Channel(title="x title", id="id-0"), ch(1)])
+    manager.updateChannels()
+    self.assertListEqual([channel.id for channel in manager.channelList], ["id-1", "id-0"])
+    
+    # TEST: diffChannels reports each change once, by ID
+    newChannels, remChannels, renamedChannels = Manager.diffChannels(
+      [ch(0), ch(1), Channel(title="old", id="id-2")], [ch(1), Channel(title="new", id="id-2"), ch(3), ch(3)])
+    self.assertListEqual([channel.id for channel in newChannels], ["id-3"])
+    self.assertListEqual([channel.id for channel in remChannels], ["id-0"])
+    self.assertListEqual([(channel.id, title) for channel, title in renamedChannels], [("id-2", "new")])
+    
+    
+    ###########################################################################
+    # TEST: channels can be looked up by ID
+    ###########################################################################
+    manager = test_Manager.createManager(channelList=[ch(0), ch(1)])
+    self.assertIs(manager.getChannelsByID()["id-1"], manager.channelList[1])
+    self.assertNotIn("id-2", manager.getChannelsByID())
+    
+    # TEST: the index follows the channel list
+    manager.ytFetcher = makeFetcher([ch(1), ch(2)])
+    manager.updateChannels()
+    self.assertListEqual(sorted(manager.getChannelsByID().keys()), ["id-1", "id-2"])
 
 
     
@@ -631,10 +1455,11 @@ class test_Manager(unittest.TestCase):
     setFakeDuration(manager, TEN_MIN + timedelta(seconds=1))
     self.assertNotIn(video, manager.filterChannelVideos(channel, [video]))
 
-    # unknown duration (None) excluded when filter is set
+    # unknown duration (None) deferred when filter is set
     manager = makeManagerWithLength(minLen=ONE_MIN)
     setFakeDuration(manager, None)
     self.assertNotIn(video, manager.filterChannelVideos(channel, [video]))
+    self.assertIn(video, manager.getFilterPlan(channel).deferred)
 
     # duration fetch not called when no length filters set
     fetchCount = [0]
@@ -0,0 +1,161 @@
+import os
+import sys
+import tempfile
+import time
+from io import StringIO
+import logging
+
+import unittest
+
+# create a streamed log so we can check its output at runtime
+logStream = StringIO()
+logging.basicConfig(stream=logStream, level=logging.DEBUG)
+
+# console
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+console.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+logging.getLogger("").addHandler(console)
+logger = logging.getLogger(__name__)
+
+from managedYoutubeDL.postProcessor import MergePool
+
+"""
+sudo python3 -m unittest tests.test_postProcessor.test_MergePool.
+.
+"""
+
+
+class test_MergePool(unittest.TestCase):
+  TEST_ALL = True
+  
+  
+  @classmethod
+  def setUpClass(cls):
+    pass
+  
+  @classmethod
+  def tearDownClass(cls):
+    pass
+  
+  def setUp(self):
+    
+    # reset log stream
+    logStream.truncate(0)
+    
+    self.tmpDir = tempfile.TemporaryDirectory()
+    
+    # a fake ffmpeg: sleeps for the time in the output file's name (if
+    # any), fails if it contains "fail", otherwise writes the output file
+    self.ffmpegLoc = os.path.join(self.tmpDir.name, "ffmpeg")
+    with open(self.ffmpegLoc, "w") as f:
+      f.write("#!{}\n".format(sys.executable))
+      f.write("import re, sys, time\n")
+      f.write("output = sys.argv[-1]\n")
+      f.write("delay = re.search(r'sleep([0-9.]+)-', output)\n")
+      f.write("if delay: time.sleep(float(delay.group(1)))\n")
+      f.write("if 'fail' in output: sys.exit(1)\n")
+      f.write("open(output, 'w').close()\n")
+    os.chmod(self.ffmpegLoc, 0o755)
+  
+  def tearDown(self):
+    self.tmpDir.cleanup()
+  
+  
+  def createStreams(self, name):
+    streamFiles = []
+    for formatID, ext in [("137", "mp4"), ("251", "webm")]:
+      streamFile = os.path.join(self.tmpDir.name, "{}.f{}.{}".format(name, formatID, ext))
+      open(streamFile, "w").close()
+      streamFiles.append(streamFile)
+    return streamFiles
+  
+  
+  def test_getMergedFileName(self):
+    """  """
+    logger.info("test_getMergedFileName")
+    
+    self.assertEqual(MergePool.getMergedFileName("/a/ch--title-abc.f137.mp4"), "/a/ch--title-abc.mkv")
+    self.assertEqual(MergePool.getMergedFileName("/a/ch--title-abc.f251-drc.webm", "mp4"), "/a/ch--title-abc.mp4")
+    self.assertEqual(MergePool.getMergedFileName("/a/ch--title-abc.webm"), "/a/ch--title-abc.mkv")
+    
+    # TEST: a single stream keeps its format
+    pool = MergePool(None, outputFormat="mp4")
+    self.assertEqual(pool.getOutputFile(["/a/ch--title-abc.f137.mp4", "/a/ch--title-abc.f251.webm"]),
+                     "/a/ch--title-abc.mp4")
+    self.assertEqual(pool.getOutputFile(["/a/ch--title-abc.f18.webm"]), "/a/ch--title-abc.webm")
+    pool.shutdown()
+    
+    # TEST: a directory is given the ffmpeg binary in it
+    self.assertEqual(MergePool._getFFmpegBinary(self.tmpDir.name), self.ffmpegLoc)
+    self.assertEqual(MergePool._getFFmpegBinary(self.ffmpegLoc), self.ffmpegLoc)
+  
+  
+  def test_merge(self):
+    """  """
+    logger.info("test_merge")
+    
+    with MergePool(self.ffmpegLoc, maxWorkers=2, timeout=5) as mergePool:
+      
+      # TEST: merged file replaces the streams
+      mergePool.submit("good", self.createStreams("good"))
+      
+      # TEST: failed merge keeps the streams, and leaves no output
+      mergePool.submit("fail", self.createStreams("fail"))
+      
+      # TEST: a single stream is just renamed
+      singleFile = os.path.join(self.tmpDir.name, "single.f18.mp4")
+      open(singleFile, "w").close()
+      mergePool.submit("single", [singleFile])
+      
+      results = {job: success for job, success, _ in mergePool.collect(wait=True)}
+      self.assertDictEqual(results, {"good": True, "fail": False, "single": True})
+      self.assertEqual(len(mergePool), 0)
+    
+    self.assertListEqual(sorted(os.listdir(self.tmpDir.name)), [
+      "fail.f137.mp4", "fail.f251.webm", "ffmpeg", "good.mkv", "single.mp4"])
+    
+    # TEST: invalid worker count raises an error
+    self.assertRaises(ValueError, MergePool, self.ffmpegLoc, maxWorkers=0)
+  
+  
+  def test_concurrencyAndTimeout(self):
+    """  """
+    logger.info("test_concurrencyAndTimeout")
+    
+    ###########################################################################
+    # TEST: merges run in the background, at most maxWorkers at a time
+    ###########################################################################
+    with MergePool(self.ffmpegLoc, maxWorkers=2, timeout=10) as mergePool:
+      startTime = time.monotonic()
+      for i in range(4):
+        mergePool.submit(i, self.createStreams("sleep0.5-{}".format(i)))
+      
+      # submitting doesn't wait for the merges
+      self.assertLess(time.monotonic() - startTime, 0.5)
+      self.assertListEqual(mergePool.collect(), [])
+      
+      results = mergePool.collect(wait=True)
+      elapsed = time.monotonic() - startTime
+      self.assertListEqual(sorted((job, success) for job, success, _ in results), [(i, True) for i in range(4)])
+      
+      # each merge reports how long it took
+      for _, _, mergeTime in results:
+        self.assertGreaterEqual(mergeTime, 0.5)
+      
+      # two rounds of two merges
+      self.assertGreaterEqual(elapsed, 1.0)
+      self.assertLess(elapsed, 1.9)
+    
+    ###########################################################################
+    # TEST: merges that take too long are killed, keeping their streams
+    ###########################################################################
+    with MergePool(self.ffmpegLoc, maxWorkers=1, timeout=0.2) as mergePool:
+      streamFiles = self.createStreams("sleep5-slow")
+      mergePool.submit("slow", streamFiles)
+      self.assertListEqual([x[:2] for x in mergePool.collect(wait=True)], [("slow", False)])
+      for streamFile in streamFiles:
+        self.assertTrue(os.path.exists(streamFile))
+      self.assertFalse(os.path.exists(os.path.join(self.tmpDir.name, "sleep5-slow.mkv")))
+      self.assertFalse(os.path.exists(os.path.join(self.tmpDir.name, "sleep5-slow.temp.mkv")))
+
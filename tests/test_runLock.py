@@ -0,0 +1,205 @@
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from io import StringIO
+import logging
+
+import unittest
+import unittest.mock
+
+# create a streamed log so we can check its output at runtime
+logStream = StringIO()
+logging.basicConfig(stream=logStream, level=logging.DEBUG)
+
+# console
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+console.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+logging.getLogger("").addHandler(console)
+logger = logging.getLogger(__name__)
+
+from managedYoutubeDL.runLock import ClaimDirectory, RunLock, RunLockedError
+
+"""
+sudo python3 -m unittest tests.test_runLock.test_RunLock.
+.
+"""
+
+
+class test_RunLock(unittest.TestCase):
+  TEST_ALL = True
+
+
+  @classmethod
+  def setUpClass(cls):
+    pass
+
+  @classmethod
+  def tearDownClass(cls):
+    pass
+
+  def setUp(self):
+
+    # reset log stream
+    logStream.truncate(0)
+
+    self.tmpDir     = tempfile.TemporaryDirectory()
+    self.configFile = os.path.join(self.tmpDir.name, "config.yaml")
+
+  def tearDown(self):
+    self.tmpDir.cleanup()
+
+
+  def test_RunLock(self):
+    """  """
+    logger.info("test_RunLock")
+
+    ###########################################################################
+    # TEST: only one run holds the lock
+    ###########################################################################
+    firstRun = RunLock(self.configFile)
+    with firstRun:
+      self.assertTrue(firstRun.isHeld())
+      with open(firstRun.lockFileLocation, "r") as f:
+        self.assertEqual(json.load(f)["pid"], os.getpid())
+
+      self.assertRaises(RunLockedError, RunLock(self.configFile).acquire)
+
+      # TEST: taking it again is a no-op
+      firstRun.acquire()
+
+    # TEST: once released, the next run can take it
+    self.assertFalse(firstRun.isHeld())
+    with RunLock(self.configFile) as secondRun:
+      self.assertTrue(secondRun.isHeld())
+    self.assertEqual(os.path.getsize(firstRun.lockFileLocation), 0)
+
+    ###########################################################################
+    # TEST: a lock left behind by a crashed run is recovered
+    ###########################################################################
+    with open(firstRun.lockFileLocation, "w") as f:
+      json.dump({"host": socket.gethostname(), "pid": 999999999, "time": 0}, f)
+    with self.assertLogs("managedYoutubeDL.runLock", level="WARNING") as logs:
+      with RunLock(self.configFile) as recoveredRun:
+        self.assertTrue(recoveredRun.isHeld())
+    self.assertIn("Recovered stale lock", logs.output[0])
+
+    ###########################################################################
+    # TEST: a lock held by another process blocks us until it exits
+    ###########################################################################
+    context = multiprocessing.get_context("fork")
+    locked  = context.Event()
+    finish  = context.Event()
+
+    def holdLock():
+      with RunLock(self.configFile):
+        locked.set()
+        finish.wait(10)
+
+    process = context.Process(target=holdLock)
+    process.start()
+    try:
+      self.assertTrue(locked.wait(10))
+      with self.assertRaises(RunLockedError) as err:
+        RunLock(self.configFile).acquire()
+      self.assertIn(str(process.pid), str(err.exception))
+    finally:
+      finish.set()
+      process.join(10)
+
+    with RunLock(self.configFile) as thirdRun:
+      self.assertTrue(thirdRun.isHeld())
+
+    ###########################################################################
+    # TEST: without fcntl (non-POSIX), runs go ahead unlocked
+    ###########################################################################
+    with unittest.mock.patch("managedYoutubeDL.runLock.fcntl", None):
+      with self.assertLogs("managedYoutubeDL.runLock", level="WARNING") as logs:
+        with RunLock(self.configFile) as unlockedRun:
+          self.assertFalse(unlockedRun.isHeld())
+      self.assertIn("not locking", logs.output[0])
+
+    # TEST: the package still imports without fcntl
+    code = "import sys; sys.modules['fcntl'] = None; import managedYoutubeDL.manager, managedYoutubeDL.__main__"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    self.assertEqual(result.returncode, 0, result.stderr)
+
+
+  def test_ClaimDirectory(self):
+    """  """
+    logger.info("test_ClaimDirectory")
+
+    claimDir = os.path.join(self.tmpDir.name, ".claims")
+    ourRun   = ClaimDirectory(claimDir)
+    otherRun = ClaimDirectory(claimDir)
+
+    ###########################################################################
+    # TEST: a video can only be claimed by one run
+    ###########################################################################
+    self.assertTrue(ourRun.claim("vid-id-0"))
+    self.assertTrue(ourRun.claim("vid-id-0"))
+    self.assertTrue(ourRun.claim("vid-id-1"))
+    self.assertFalse(otherRun.claim("vid-id-0"))
+    self.assertSetEqual(ourRun.claimed, {"vid-id-0", "vid-id-1"})
+    self.assertSetEqual(otherRun.claimed, set())
+
+    # TEST: released claims can be taken by the other run
+    ourRun.release("vid-id-0")
+    self.assertTrue(otherRun.claim("vid-id-0"))
+    ourRun.releaseAll()
+    self.assertListEqual(os.listdir(claimDir), ["vid-id-0.claim"])
+
+    # TEST: releasing a claim we don't hold leaves it alone
+    ourRun.release("vid-id-0")
+    self.assertFalse(ourRun.claim("vid-id-0"))
+
+    ###########################################################################
+    # TEST: claims of dead processes, or that are too old, are taken over
+    ###########################################################################
+    def writeClaim(videoID, owner):
+      with open(os.path.join(claimDir, "{}.claim".format(videoID)), "w") as f:
+        json.dump(owner, f)
+
+    writeClaim("vid-dead", {"host": socket.gethostname(), "pid": 999999999, "time": time.time()})
+    writeClaim("vid-old",  {"host": "other-host", "pid": 1, "time": time.time() - 2*ClaimDirectory.STALE_AFTER})
+    writeClaim("vid-live", {"host": "other-host", "pid": 1, "time": time.time()})
+    self.assertTrue(ourRun.claim("vid-dead"))
+    self.assertTrue(ourRun.claim("vid-old"))
+    self.assertFalse(ourRun.claim("vid-live"))
+
+    # TEST: a half-written claim is only taken over once it's old
+    with open(os.path.join(claimDir, "vid-partial.claim"), "w") as f:
+      f.write("{")
+    self.assertFalse(ourRun.claim("vid-partial"))
+    self.assertTrue(ClaimDirectory(claimDir, staleAfter=-1).claim("vid-partial"))
+
+    ###########################################################################
+    # TEST: runs recovering the same stale claim at once don't both get it
+    ###########################################################################
+    for attempt in range(20):
+      videoID = "vid-race-{}".format(attempt)
+      writeClaim(videoID, {"host": "other-host", "pid": 1, "time": time.time() - 2*ClaimDirectory.STALE_AFTER})
+      
+      runs    = [ClaimDirectory(claimDir) for _ in range(4)]
+      barrier = threading.Barrier(len(runs))
+      won     = []
+      def claimStale(run):
+        barrier.wait()
+        if run.claim(videoID):
+          won.append(run)
+      threads = [threading.Thread(target=claimStale, args=(run,)) for run in runs]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+      
+      self.assertEqual(len(won), 1)
+      with open(os.path.join(claimDir, "{}.claim".format(videoID)), "r") as f:
+        self.assertEqual(json.load(f)["pid"], os.getpid())
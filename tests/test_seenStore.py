@@ -0,0 +1,162 @@
+import os
+import tempfile
+from io import StringIO
+import logging
+
+import unittest
+
+# create a streamed log so we can check its output at runtime
+logStream = StringIO()
+logging.basicConfig(stream=logStream, level=logging.DEBUG)
+
+# console
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+console.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+logging.getLogger("").addHandler(console)
+logger = logging.getLogger(__name__)
+
+from managedYoutubeDL.seenStore import SeenStore
+
+"""
+sudo python3 -m unittest tests.test_seenStore.test_SeenStore.
+.
+"""
+
+
+class test_SeenStore(unittest.TestCase):
+  TEST_ALL = True
+
+
+  @classmethod
+  def setUpClass(cls):
+    pass
+
+  @classmethod
+  def tearDownClass(cls):
+    pass
+
+  def setUp(self):
+
+    # reset log stream
+    logStream.truncate(0)
+
+    self.tmpDir = tempfile.TemporaryDirectory()
+    self.dbFile = os.path.join(self.tmpDir.name, "seen.sqlite")
+
+    # a clock we can move forward
+    self.now = 1000.0
+
+  def tearDown(self):
+    self.tmpDir.cleanup()
+
+
+  def createStore(self, **kwargs):
+    return SeenStore(self.dbFile, clock=lambda: self.now, **kwargs)
+
+
+  def test_addHas(self):
+    """  """
+    logger.info("test_addHas")
+
+    ###########################################################################
+    # TEST: seen videos are recorded per channel
+    ###########################################################################
+    store = self.createStore()
+    self.assertFalse(store.has("ch-id-0", "vid-id-0"))
+    store.add("ch-id-0", "vid-id-0")
+    self.assertTrue(store.has("ch-id-0", "vid-id-0"))
+    self.assertFalse(store.has("ch-id-1", "vid-id-0"))
+
+    # TEST: adding a video twice keeps one entry
+    store.add("ch-id-0", "vid-id-0")
+    self.assertEqual(len(store), 1)
+
+    # TEST: the store persists, with no limit on IDs per channel
+    videoIDs = ["vid-id-{}".format(n) for n in range(1, 100)]
+    for videoID in videoIDs:
+      self.now += 1
+      store.add("ch-id-0", videoID)
+    store.close()
+
+    store = self.createStore()
+    self.assertListEqual(store.channelVideoIDs("ch-id-0"), ["vid-id-0"] + videoIDs)
+    self.assertTrue(all(store.has("ch-id-0", videoID) for videoID in videoIDs))
+
+    # TEST: a missing directory is rejected
+    self.assertRaises(NotADirectoryError, SeenStore, os.path.join(self.tmpDir.name, "missing", "seen.sqlite"))
+
+
+  def test_migrate(self):
+    """  """
+    logger.info("test_migrate")
+
+    ###########################################################################
+    # TEST: a config's seen lists are moved in, oldest first
+    ###########################################################################
+    store = self.createStore()
+    store.add("ch-id-0", "vid-id-1")
+    self.assertFalse(store.has("ch-id-1", "vid-id-5"))
+
+    self.assertEqual(store.migrate({"ch-id-0": ["vid-id-0", "vid-id-1", "vid-id-2"], "ch-id-1": ["vid-id-5"]}), 3)
+    self.assertTrue(store.has("ch-id-1", "vid-id-5"))
+    self.assertListEqual(store.channelVideoIDs("ch-id-0"), ["vid-id-1", "vid-id-0", "vid-id-2"])
+
+    # TEST: migrating again adds nothing
+    self.assertEqual(store.migrate({"ch-id-1": ["vid-id-5"]}), 0)
+    self.assertEqual(len(store), 4)
+
+
+  def test_prune(self):
+    """  """
+    logger.info("test_prune")
+
+    store = self.createStore(maxPerChannel=3, maxAge=100)
+    for n in range(5):
+      self.now += 10
+      store.add("ch-id-0", "vid-id-{}".format(n))
+    store.add("ch-id-1", "vid-id-x")
+
+    ###########################################################################
+    # TEST: only the newest <maxPerChannel> IDs are kept per channel
+    ###########################################################################
+    self.assertTrue(store.has("ch-id-0", "vid-id-0"))
+    self.assertEqual(store.prune(), 2)
+    self.assertListEqual(store.channelVideoIDs("ch-id-0"), ["vid-id-2", "vid-id-3", "vid-id-4"])
+    self.assertFalse(store.has("ch-id-0", "vid-id-0"))
+    self.assertTrue(store.has("ch-id-1", "vid-id-x"))
+
+    # TEST: seeing a video again makes it the newest
+    self.now += 10
+    store.add("ch-id-0", "vid-id-2")
+    store.add("ch-id-0", "vid-id-5")
+    store.prune()
+    self.assertListEqual(store.channelVideoIDs("ch-id-0"), ["vid-id-4", "vid-id-2", "vid-id-5"])
+
+    ###########################################################################
+    # TEST: IDs older than <maxAge> are dropped
+    ###########################################################################
+    self.now += 95
+    self.assertEqual(store.prune(), 2)
+    self.assertListEqual(store.channelVideoIDs("ch-id-0"), ["vid-id-2", "vid-id-5"])
+    self.assertListEqual(store.channelVideoIDs("ch-id-1"), [])
+
+    # TEST: without limits, nothing is dropped
+    self.now += 1000
+    self.assertEqual(self.createStore().prune(), 0)
+
+
+  def test_scale(self):
+    """  """
+    logger.info("test_scale")
+
+    ###########################################################################
+    # TEST: lookups stay correct with many IDs across many channels
+    ###########################################################################
+    store = self.createStore()
+    store.migrate(dict([("ch-id-{}".format(c), ["vid-{}-{}".format(c, v) for v in range(200)])
+                        for c in range(1000)]))
+    self.assertEqual(len(store), 200000)
+    self.assertTrue(store.has("ch-id-999", "vid-999-199"))
+    self.assertFalse(store.has("ch-id-999", "vid-998-199"))
+    self.assertFalse(store.has("ch-id-1000", "vid-999-199"))
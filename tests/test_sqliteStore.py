@@ -0,0 +1,104 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from io import StringIO
+import logging
+
+import unittest
+
+# create a streamed log so we can check its output at runtime
+logStream = StringIO()
+logging.basicConfig(stream=logStream, level=logging.DEBUG)
+
+# console
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+console.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+logging.getLogger("").addHandler(console)
+logger = logging.getLogger(__name__)
+
+from managedYoutubeDL.sqliteStore import SQLiteStore
+
+"""
+sudo python3 -m unittest tests.test_sqliteStore.test_SQLiteStore.
+.
+"""
+
+
+class NumberStore(SQLiteStore):
+  _SCHEMA      = "CREATE TABLE IF NOT EXISTS numbers (n INTEGER PRIMARY KEY)"
+  _ROW_FACTORY = sqlite3.Row
+
+  def __init__(self, dbFile: str):
+    super().__init__(dbFile, "number store")
+
+  def numbers(self) -> list:
+    return [row["n"] for row in self._connect().execute("SELECT n FROM numbers ORDER BY n")]
+
+
+class test_SQLiteStore(unittest.TestCase):
+  TEST_ALL = True
+
+
+  @classmethod
+  def setUpClass(cls):
+    pass
+
+  @classmethod
+  def tearDownClass(cls):
+    pass
+
+  def setUp(self):
+
+    # reset log stream
+    logStream.truncate(0)
+
+    self.tmpDir = tempfile.TemporaryDirectory()
+    self.dbFile = os.path.join(self.tmpDir.name, "numbers.sqlite")
+
+  def tearDown(self):
+    self.tmpDir.cleanup()
+
+
+  def test_SQLiteStore(self):
+    """  """
+    logger.info("test_SQLiteStore")
+
+    store = NumberStore(self.dbFile)
+
+    ###########################################################################
+    # TEST: the schema is created, and rows use the subclass's row factory
+    ###########################################################################
+    with store._transaction() as db:
+      db.execute("INSERT INTO numbers (n) VALUES (1)")
+    self.assertListEqual(store.numbers(), [1])
+
+    # TEST: a failed transaction is rolled back
+    with self.assertRaises(ValueError):
+      with store._transaction() as db:
+        db.execute("INSERT INTO numbers (n) VALUES (2)")
+        raise ValueError("failed")
+    self.assertListEqual(store.numbers(), [1])
+
+    ###########################################################################
+    # TEST: each thread has its own connection
+    ###########################################################################
+    connections = []
+    thread = threading.Thread(target=lambda: connections.append(store._connect()))
+    thread.start()
+    thread.join()
+    self.assertIsNot(connections[0], store._connect())
+    self.assertIs(store._connect(), store._connect())
+
+    # TEST: closing drops this thread's connection, and the next use reopens it
+    db = store._connect()
+    store.close()
+    self.assertIsNot(store._connect(), db)
+    self.assertListEqual(store.numbers(), [1])
+    store.close()
+
+    # TEST: the store's directory must exist
+    with self.assertRaises(NotADirectoryError) as context:
+      NumberStore(os.path.join(self.tmpDir.name, "missing", "numbers.sqlite"))
+    self.assertIn("number store directory does not exist", str(context.exception))
@@ -0,0 +1,100 @@
+import datetime
+import os
+import tempfile
+from io import StringIO
+from datetime import timedelta
+import logging
+
+import unittest
+
+# create a streamed log so we can check its output at runtime
+logStream = StringIO()
+logging.basicConfig(stream=logStream, level=logging.DEBUG)
+
+# console
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+console.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+logging.getLogger("").addHandler(console)
+logger = logging.getLogger(__name__)
+
+from managedYoutubeDL.items import Channel
+from managedYoutubeDL.stateStore import StateStore
+
+"""
+sudo python3 -m unittest tests.test_stateStore.test_StateStore.
+.
+"""
+
+
+class test_StateStore(unittest.TestCase):
+  TEST_ALL = True
+
+
+  @classmethod
+  def setUpClass(cls):
+    pass
+
+  @classmethod
+  def tearDownClass(cls):
+    pass
+
+  def setUp(self):
+
+    # reset log stream
+    logStream.truncate(0)
+
+    self.tmpDir = tempfile.TemporaryDirectory()
+    self.dbFile = os.path.join(self.tmpDir.name, "state.sqlite")
+
+  def tearDown(self):
+    self.tmpDir.cleanup()
+
+
+  def test_StateStore(self):
+    """  """
+    logger.info("test_StateStore")
+
+    UTC      = datetime.timezone.utc
+    channels = [Channel(title="ch-{}".format(n), id="ch-id-{}".format(n),
+                        minVideoDate=datetime.datetime(2020, 1, n + 1, tzinfo=UTC)) for n in range(3)]
+
+    ###########################################################################
+    # TEST: only changed channels are saved
+    ###########################################################################
+    store = StateStore(self.dbFile)
+    self.assertEqual(store.load(channels), 0)
+    self.assertEqual(store.save(channels), 3)
+    self.assertEqual(store.save(channels), 0)
+
+    channels[1].setLastPolledAt(datetime.datetime(2020, 2, 1, 6, 0, 30, 500, tzinfo=UTC))
+    channels[1].setPollInterval(timedelta(hours=2))
+    self.assertEqual(store.save(channels), 1)
+    store.close()
+
+    ###########################################################################
+    # TEST: saved state overrides the config's values
+    ###########################################################################
+    loaded = [Channel(title="ch-{}".format(n), id="ch-id-{}".format(n)) for n in range(4)]
+    store  = StateStore(self.dbFile)
+    self.assertEqual(store.load(loaded), 3)
+    for channel, loadedChannel in zip(channels, loaded):
+      for field in Channel.STATE_FIELDS:
+        self.assertEqual(getattr(channel, field), getattr(loadedChannel, field))
+
+    # TEST: channels without saved state are unchanged
+    self.assertEqual(loaded[3].minVideoDate, Channel(title="ch-3", id="ch-id-3").minVideoDate)
+
+    # TEST: loaded state isn't saved again, but cleared state is
+    self.assertEqual(store.save(loaded[:3]), 0)
+    loaded[1].setLastPolledAt(None)
+    loaded[1].setPollInterval(None)
+    self.assertEqual(store.save(loaded), 2)
+    store.close()
+    reloaded = Channel(title="ch-1", id="ch-id-1", pollInterval=60)
+    StateStore(self.dbFile).load([reloaded])
+    self.assertIsNone(reloaded.pollInterval)
+    self.assertIsNone(reloaded.lastPolledAt)
+
+    # TEST: a missing directory is rejected
+    self.assertRaises(NotADirectoryError, StateStore, os.path.join(self.tmpDir.name, "missing", "state.sqlite"))
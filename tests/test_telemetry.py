@@ -0,0 +1,120 @@
+import datetime
+import os
+import tempfile
+from io import StringIO
+import logging
+
+import unittest
+
+# create a streamed log so we can check its output at runtime
+logStream = StringIO()
+logging.basicConfig(stream=logStream, level=logging.DEBUG)
+
+# console
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+console.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+logging.getLogger("").addHandler(console)
+logger = logging.getLogger(__name__)
+
+from managedYoutubeDL.downloadQueue import DownloadJob, DownloadResult
+from managedYoutubeDL.items import Channel, Video
+from managedYoutubeDL.manager import Manager
+from managedYoutubeDL.telemetry import TelemetryLog, buildJobRecord
+
+"""
+sudo python3 -m unittest tests.test_telemetry.test_Telemetry.
+.
+"""
+
+
+class test_Telemetry(unittest.TestCase):
+  TEST_ALL = True
+  
+  
+  @classmethod
+  def setUpClass(cls):
+    pass
+  
+  @classmethod
+  def tearDownClass(cls):
+    pass
+  
+  def setUp(self):
+    
+    # reset log stream
+    logStream.truncate(0)
+  
+  def tearDown(self):
+    pass
+  
+  
+  @staticmethod
+  def createJob():
+    channel = Channel(title="ch-0", id="ch-id-0")
+    video   = Video(title="video-0", id="vid-id-0",
+                    publishedAt=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc))
+    return DownloadJob(channel, video, quality=Manager.VideoQuality.QUALITY_1080P, estimatedSize=5000)
+  
+  
+  def test_buildJobRecord(self):
+    """  """
+    logger.info("test_buildJobRecord")
+    
+    ###########################################################################
+    # TEST: finished job
+    ###########################################################################
+    job = test_Telemetry.createJob()
+    job.attempts  = 2
+    job.mergeTime = 1.23456
+    job.result    = DownloadResult(True, formatID="137+251", numBytes=3000, extractTime=0.4, transferTime=1.5)
+    
+    record = buildJobRecord(job, "downloaded")
+    self.assertEqual(record.pop("time")[-6:], "+00:00")
+    self.assertDictEqual(record, {
+      "channel":       "ch-0",
+      "channelID":     "ch-id-0",
+      "videoID":       "vid-id-0",
+      "quality":       "1080p",
+      "format":        "137+251",
+      "estimatedSize": 5000,
+      "bytes":         3000,
+      "extractTime":   0.4,
+      "transferTime":  1.5,
+      "mergeTime":     1.235,
+      "throughput":    2000,
+      "attempts":      2,
+      "outcome":       "downloaded",
+    })
+    
+    ###########################################################################
+    # TEST: job that was never downloaded
+    ###########################################################################
+    record = buildJobRecord(test_Telemetry.createJob(), "deferred")
+    self.assertEqual(record["outcome"], "deferred")
+    self.assertEqual(record["attempts"], 0)
+    for key in ["format", "bytes", "extractTime", "transferTime", "mergeTime", "throughput"]:
+      self.assertIsNone(record[key], msg=key)
+  
+  
+  def test_TelemetryLog(self):
+    """  """
+    logger.info("test_TelemetryLog")
+    
+    with tempfile.TemporaryDirectory() as tmpDir:
+      fileLoc = os.path.join(tmpDir, "telemetry.jsonl")
+      
+      # TEST: records are appended, one per line, across instances
+      TelemetryLog(fileLoc).write({"videoID": "a", "bytes": 1})
+      TelemetryLog(fileLoc).write({"videoID": "b", "bytes": 2})
+      with open(fileLoc, "r") as f:
+        self.assertEqual(len(f.readlines()), 2)
+      
+      # TEST: a truncated line is skipped when reading
+      with open(fileLoc, "a") as f:
+        f.write('{"videoID": "c", "by')
+      self.assertListEqual(TelemetryLog.read(fileLoc), [{"videoID": "a", "bytes": 1}, {"videoID": "b", "bytes": 2}])
+      
+      # TEST: directory must exist
+      self.assertRaises(NotADirectoryError, TelemetryLog, os.path.join(tmpDir, "missing", "telemetry.jsonl"))
+
@@ -0,0 +1,253 @@
+import datetime
+import hashlib
+import hmac
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+import logging
+
+import unittest
+
+# create a streamed log so we can check its output at runtime
+logStream = StringIO()
+logging.basicConfig(stream=logStream, level=logging.DEBUG)
+
+# console
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+console.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+logging.getLogger("").addHandler(console)
+logger = logging.getLogger(__name__)
+
+from managedYoutubeDL.websub import WebSubReceiver, getChannelID, getTopicURL, parseNotification
+
+"""
+sudo python3 -m unittest tests.test_websub.test_WebSub.
+.
+"""
+
+
+def createFeed(entries: list, deletedVideoID: str = None) -> bytes:
+  """
+  # An Atom notification like YouTube's, with an entry per
+  # (channel ID, video ID, title, published)
+  """
+  feed  = '<?xml version="1.0" encoding="UTF-8"?>'
+  feed += '<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom"' \
+          ' xmlns:at="http://purl.org/atompub/tombstones/1.0">'
+  if deletedVideoID is not None:
+    feed += '<at:deleted-entry ref="yt:video:{}" when="2020-01-02T00:00:00+00:00"/>'.format(deletedVideoID)
+  for channelID, videoID, title, published in entries:
+    feed += '<entry><id>yt:video:{1}</id><yt:videoId>{1}</yt:videoId><yt:channelId>{0}</yt:channelId>' \
+            '<title>{2}</title><published>{3}</published><updated>{3}</updated></entry>' \
+            .format(channelID, videoID, title, published)
+  feed += '</feed>'
+  return feed.encode("utf-8")
+
+
+class FakeHub:
+  """
+  # A local stand-in for a WebSub hub: accepts subscriptions, verifies them
+  # with the subscriber, and publishes signed notifications to them
+  """
+
+  def __init__(self, leaseSeconds: int = None):
+    self.leaseSeconds  = leaseSeconds
+    self.subscriptions = {}
+    self.requests      = []
+    self.verifications = []
+    hub = self
+
+    class _Handler(BaseHTTPRequestHandler):
+      def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        form = {k: v[0] for k, v in urllib.parse.parse_qs(body).items()}
+        hub.requests.append(form)
+        self.send_response(202)
+        self.end_headers()
+        hub.verify(form)
+
+      def log_message(self, format, *args):
+        pass
+
+    self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    self._thread.start()
+
+  @property
+  def url(self):
+    return "http://127.0.0.1:{}/subscribe".format(self._server.server_address[1])
+
+  def stop(self):
+    self._server.shutdown()
+    self._server.server_close()
+
+  def verify(self, form: dict):
+    leaseSeconds = form["hub.lease_seconds"] if self.leaseSeconds is None else self.leaseSeconds
+    query = urllib.parse.urlencode({
+      "hub.mode":          form["hub.mode"],
+      "hub.topic":         form["hub.topic"],
+      "hub.challenge":     "challenge-1234",
+      "hub.lease_seconds": leaseSeconds,
+    })
+    try:
+      with urllib.request.urlopen(form["hub.callback"] + "?" + query, timeout=5) as response:
+        verified = response.read().decode("utf-8") == "challenge-1234"
+    except urllib.error.HTTPError:
+      verified = False
+    self.verifications.append((form["hub.topic"], verified))
+    if verified and form["hub.mode"] == "subscribe":
+      self.subscriptions[form["hub.topic"]] = (form["hub.callback"], form["hub.secret"])
+
+  def publish(self, channelID: str, body: bytes, secret: str = None):
+    callback, subscriptionSecret = self.subscriptions[getTopicURL(channelID)]
+    secret    = subscriptionSecret if secret is None else secret
+    signature = "sha1=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha1).hexdigest()
+    request   = urllib.request.Request(callback, data=body, method="POST",
+                                       headers={"Content-Type": "application/atom+xml", "X-Hub-Signature": signature})
+    with urllib.request.urlopen(request, timeout=5) as response:
+      return response.status
+
+
+class test_WebSub(unittest.TestCase):
+  TEST_ALL = True
+
+
+  @classmethod
+  def setUpClass(cls):
+    pass
+
+  @classmethod
+  def tearDownClass(cls):
+    pass
+
+  def setUp(self):
+
+    # reset log stream
+    logStream.truncate(0)
+
+  def tearDown(self):
+    pass
+
+
+  @staticmethod
+  def createReceiver(hubURL: str) -> WebSubReceiver:
+    receiver = WebSubReceiver("http://127.0.0.1:{}/websub", port=0, host="127.0.0.1", hubURL=hubURL)
+    receiver.callbackURL = receiver.callbackURL.format(receiver.port)
+    return receiver
+
+  @staticmethod
+  def waitFor(condition, timeout: float = 5):
+    endTime = time.monotonic() + timeout
+    while not condition() and time.monotonic() < endTime:
+      time.sleep(0.01)
+    return condition()
+
+
+  def test_parseNotification(self):
+    """  """
+    logger.info("test_parseNotification")
+
+    # TEST: entries become videos, by channel; deleted entries are ignored
+    body = createFeed([("ch-1", "vid-1", "A &amp; B", "2020-01-01T10:00:00+00:00"),
+                       ("ch-2", "vid-2", "Second",    "2020-01-02T00:00:00Z")], deletedVideoID="vid-0")
+    videos = parseNotification(body)
+    self.assertEqual([(channelID, video.id) for channelID, video in videos], [("ch-1", "vid-1"), ("ch-2", "vid-2")])
+    self.assertEqual(videos[0][1].title, "A & B")
+    self.assertEqual(videos[0][1].publishedAt, datetime.datetime(2020, 1, 1, 10, tzinfo=datetime.timezone.utc))
+    self.assertEqual(videos[1][1].publishedAt, datetime.datetime(2020, 1, 2, tzinfo=datetime.timezone.utc))
+
+    # TEST: without a <published>, <updated> is used; without either, the entry is dropped
+    entry = '<entry><yt:videoId>{0}</yt:videoId><yt:channelId>ch-1</yt:channelId><title>t</title>{1}</entry>'
+    body  = createFeed([]).replace(b"</feed>", "".join([
+      entry.format("vid-updated", "<updated>2020-03-01T00:00:00+00:00</updated>"),
+      entry.format("vid-bad",     "<published>yesterday</published>"),
+      entry.format("vid-none",    ""),
+      entry.format("vid-naive",   "<published>2020-03-02T00:00:00</published>"),
+    ]).encode("utf-8") + b"</feed>")
+    with self.assertLogs("managedYoutubeDL.websub", level="WARNING") as logs:
+      videos = parseNotification(body)
+    self.assertListEqual([(video.id, video.publishedAt) for _, video in videos],
+                         [("vid-updated", datetime.datetime(2020, 3, 1, tzinfo=datetime.timezone.utc)),
+                          ("vid-naive",   datetime.datetime(2020, 3, 2, tzinfo=datetime.timezone.utc))])
+    self.assertEqual(len(logs.output), 2)
+
+    # TEST: a deletion-only or broken notification has no videos
+    self.assertListEqual(parseNotification(createFeed([], deletedVideoID="vid-0")), [])
+    self.assertListEqual(parseNotification(b"<feed"), [])
+
+    # TEST: topics map back to channels
+    self.assertEqual(getChannelID(getTopicURL("UC123")), "UC123")
+    self.assertIsNone(getChannelID("https://example.com/feed"))
+
+
+  def test_subscribeAndNotify(self):
+    """  """
+    logger.info("test_subscribeAndNotify")
+
+    hub = FakeHub()
+    try:
+      with test_WebSub.createReceiver(hub.url) as receiver:
+
+        #######################################################################
+        # TEST: subscribing is verified by the hub, and gives us a lease
+        #######################################################################
+        self.assertFalse(receiver.hasLease("ch-1"))
+        self.assertEqual(receiver.renewLeases(["ch-1"]), 1)
+        self.assertTrue(test_WebSub.waitFor(lambda: receiver.hasLease("ch-1")))
+        self.assertEqual(hub.requests[0]["hub.topic"], getTopicURL("ch-1"))
+        self.assertEqual(hub.requests[0]["hub.mode"], "subscribe")
+        self.assertTrue(test_WebSub.waitFor(lambda: len(hub.verifications) > 0))
+        self.assertListEqual(hub.verifications, [(getTopicURL("ch-1"), True)])
+
+        # TEST: leases that aren't running out aren't renewed
+        self.assertEqual(receiver.renewLeases(["ch-1"]), 0)
+        self.assertEqual(len(hub.requests), 1)
+
+        #######################################################################
+        # TEST: signed notifications are turned into videos, once each
+        #######################################################################
+        body = createFeed([("ch-1", "vid-1", "First", "2020-01-01T00:00:00+00:00")])
+        self.assertEqual(hub.publish("ch-1", body), 204)
+        self.assertEqual(hub.publish("ch-1", body), 204)
+        pushedVideos = receiver.getNotifications(timeout=5)
+        self.assertListEqual(list(pushedVideos.keys()), ["ch-1"])
+        self.assertEqual([video.id for video in pushedVideos["ch-1"]], ["vid-1"])
+
+        # TEST: notifications not signed with our secret are ignored
+        hub.publish("ch-1", createFeed([("ch-1", "vid-2", "Forged", "2020-01-02T00:00:00+00:00")]), secret="guess")
+        self.assertDictEqual(receiver.getNotifications(timeout=0.2), {})
+
+        #######################################################################
+        # TEST: verifications we didn't ask for are refused
+        #######################################################################
+        hub.verify({"hub.mode": "subscribe", "hub.topic": getTopicURL("ch-other"), "hub.lease_seconds": 60,
+                    "hub.callback": receiver.callbackURL, "hub.secret": "x"})
+        self.assertEqual(hub.verifications[-1], (getTopicURL("ch-other"), False))
+        self.assertFalse(receiver.hasLease("ch-other"))
+    finally:
+      hub.stop()
+
+    ###########################################################################
+    # TEST: short leases are renewed
+    ###########################################################################
+    hub = FakeHub(leaseSeconds=60)
+    try:
+      with test_WebSub.createReceiver(hub.url) as receiver:
+        receiver.renewLeases(["ch-1"])
+        self.assertTrue(test_WebSub.waitFor(lambda: receiver.hasLease("ch-1")))
+        self.assertEqual(receiver.renewLeases(["ch-1"]), 1)
+    finally:
+      hub.stop()
+
+    ###########################################################################
+    # TEST: an unreachable hub means no subscription
+    ###########################################################################
+    with test_WebSub.createReceiver(hub.url) as receiver:
+      self.assertFalse(receiver.subscribe("ch-1"))
+      self.assertEqual(receiver.renewLeases(["ch-1"]), 0)
+      self.assertFalse(receiver.hasLease("ch-1"))
@@ -0,0 +1,222 @@
+import base64
+import datetime
+import multiprocessing
+import os
+import pickle
+import tempfile
+from io import StringIO
+import logging
+
+import unittest
+import unittest.mock
+
+# create a streamed log so we can check its output at runtime
+logStream = StringIO()
+logging.basicConfig(stream=logStream, level=logging.DEBUG)
+
+# console
+console = logging.StreamHandler()
+console.setLevel(logging.INFO)
+console.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+logging.getLogger("").addHandler(console)
+logger = logging.getLogger(__name__)
+
+from managedYoutubeDL.items import Channel, Video
+from managedYoutubeDL.manager import Manager
+from managedYoutubeDL.workQueue import QueueWorker, WorkQueue
+
+"""
+sudo python3 -m unittest tests.test_workQueue.test_WorkQueue.
+.
+"""
+
+
+class test_WorkQueue(unittest.TestCase):
+  TEST_ALL = True
+
+
+  @classmethod
+  def setUpClass(cls):
+    pass
+
+  @classmethod
+  def tearDownClass(cls):
+    pass
+
+  def setUp(self):
+
+    # reset log stream
+    logStream.truncate(0)
+
+    self.tmpDir  = tempfile.TemporaryDirectory()
+    self.dbFile  = os.path.join(self.tmpDir.name, "queue.sqlite")
+    self.channel = Channel(title="ch-0", id="ch-id-0", ignore=False)
+    self.videos  = [Video(title="video-{}".format(n), id="vid-id-{}".format(n),
+                          publishedAt=datetime.datetime(2020, 1, n + 1, tzinfo=datetime.timezone.utc))
+                    for n in range(6)]
+
+  def tearDown(self):
+    self.tmpDir.cleanup()
+
+
+  def createManager(self, downloadDir: str) -> Manager:
+    manager = Manager(
+      clientSecretsFile  = None,
+      pickledCredentials = base64.b64encode(pickle.dumps("pickleStr")).decode("utf-8"),
+      downloadDirectory  = downloadDir,
+      ffmpegLocation     = None,
+      channelList        = [self.channel],
+      seenChannelVideos  = {},
+    )
+    manager.ytFetcher = type("F", (), {"fetchRecentVideos": lambda _, cid: list(self.videos), "creditsUsed": 0})()
+    return manager
+
+
+  def test_queue(self):
+    """  """
+    logger.info("test_queue")
+
+    now       = [1000.0]
+    workQueue = WorkQueue(self.dbFile, leaseSeconds=60, clock=lambda: now[0])
+
+    ###########################################################################
+    # TEST: jobs are only queued once
+    ###########################################################################
+    self.assertTrue(workQueue.enqueue(self.channel, self.videos[0], Manager.VideoQuality.QUALITY_720P))
+    self.assertTrue(workQueue.enqueue(self.channel, self.videos[1]))
+    self.assertFalse(workQueue.enqueue(self.channel, self.videos[0]))
+    self.assertDictEqual(workQueue.counts(), {WorkQueue.QUEUED: 2})
+
+    ###########################################################################
+    # TEST: jobs are claimed oldest first, by one worker at a time
+    ###########################################################################
+    job = workQueue.claim("w1")
+    self.assertEqual(job.video.id, self.videos[0].id)
+    self.assertEqual(job.video.publishedAt, self.videos[0].publishedAt)
+    self.assertEqual(job.channel.id, self.channel.id)
+    self.assertEqual(job.quality, "720p")
+    job2 = workQueue.claim("w2")
+    self.assertEqual(job2.video.id, self.videos[1].id)
+    self.assertIsNone(workQueue.claim("w3"))
+    self.assertTrue(workQueue.complete(job2, "w2", True))
+
+    ###########################################################################
+    # TEST: a job whose lease runs out is reclaimed, and the old worker's
+    # result is dropped
+    ###########################################################################
+    now[0] += 30
+    self.assertTrue(workQueue.renew(job, "w1"))
+    now[0] += 45
+    self.assertIsNone(workQueue.claim("w3"))
+    now[0] += 30
+    reclaimed = workQueue.claim("w3")
+    self.assertEqual(reclaimed.video.id, self.videos[0].id)
+    self.assertEqual(reclaimed.attempts, 1)
+    self.assertFalse(workQueue.renew(job, "w1"))
+    self.assertFalse(workQueue.complete(job, "w1", True))
+    self.assertTrue(workQueue.complete(reclaimed, "w3", False))
+
+    ###########################################################################
+    # TEST: finished jobs are collected once, and can then be queued again
+    ###########################################################################
+    results = workQueue.collectResults()
+    self.assertEqual([(channelID, video.id, success) for channelID, video, success in results],
+                     [(self.channel.id, self.videos[0].id, False), (self.channel.id, self.videos[1].id, True)])
+    self.assertListEqual(workQueue.collectResults(), [])
+    self.assertListEqual(workQueue.pendingJobs(), [])
+    self.assertTrue(workQueue.enqueue(self.channel, self.videos[0]))
+    self.assertEqual([video.id for _, video in workQueue.pendingJobs()], [self.videos[0].id])
+
+    ###########################################################################
+    # TEST: a job whose lease keeps running out fails after maxAttempts claims
+    ###########################################################################
+    workQueue = WorkQueue(self.dbFile, leaseSeconds=60, clock=lambda: now[0], maxAttempts=2)
+    self.assertEqual(workQueue.claim("w1").video.id, self.videos[0].id)
+    now[0] += 61
+    self.assertEqual(workQueue.claim("w2").attempts, 1)
+    now[0] += 61
+    self.assertIsNone(workQueue.claim("w3"))
+    self.assertDictEqual(workQueue.counts(), {WorkQueue.FAILED: 1})
+    results = workQueue.collectResults()
+    self.assertEqual([(video.id, success) for _, video, success in results], [(self.videos[0].id, False)])
+
+    # TEST: the queue's directory must exist
+    self.assertRaises(NotADirectoryError, WorkQueue, os.path.join(self.tmpDir.name, "missing", "queue.sqlite"))
+
+
+  def test_workers(self):
+    """  """
+    logger.info("test_workers")
+
+    downloadDir = os.path.join(self.tmpDir.name, "downloads")
+    os.mkdir(downloadDir)
+
+    ###########################################################################
+    # TEST: the coordinator queues the new videos
+    ###########################################################################
+    coordinator = self.createManager(downloadDir)
+    self.assertEqual(coordinator.enqueueNewVideos(WorkQueue(self.dbFile), Manager.VideoQuality.QUALITY_MAX), 6)
+    self.assertEqual(coordinator.enqueueNewVideos(WorkQueue(self.dbFile), Manager.VideoQuality.QUALITY_MAX), 0)
+
+    ###########################################################################
+    # TEST: several worker processes download each video exactly once
+    ###########################################################################
+    def download(channel, video, quality, timeout):
+
+      # a marker file per download; fail one video
+      with open(os.path.join(downloadDir, "{}.{}".format(video.id, os.getpid())), "w") as f:
+        f.write(str(quality))
+      return video.id != self.videos[3].id
+
+    def runWorker(name):
+      manager = self.createManager(downloadDir)
+      manager._downloadVideo = download
+      QueueWorker(manager, WorkQueue(self.dbFile), name=name).run(exitWhenEmpty=True)
+
+    context = multiprocessing.get_context("fork")
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      workers = [context.Process(target=runWorker, args=("w{}".format(i),)) for i in range(3)]
+      for worker in workers: worker.start()
+      for worker in workers: worker.join(30)
+    self.assertListEqual([worker.exitcode for worker in workers], [0, 0, 0])
+
+    downloads = sorted(os.listdir(downloadDir))
+    self.assertListEqual([fileName.split(".")[0] for fileName in downloads], [video.id for video in self.videos])
+
+    ###########################################################################
+    # TEST: the coordinator folds the results back into its state
+    ###########################################################################
+    workQueue = WorkQueue(self.dbFile)
+    self.assertEqual(coordinator.collectQueueResults(workQueue), (5, 1))
+    for video in self.videos:
+      self.assertEqual(coordinator.haveSeenVideo(self.channel, video), video.id != self.videos[3].id)
+    self.assertEqual(self.channel.minVideoDate, self.videos[-1].publishedAt)
+    self.assertDictEqual(workQueue.counts(), {})
+
+    ###########################################################################
+    # TEST: a worker leaves its own seen videos and library index alone
+    ###########################################################################
+    newVideo = Video(title="video-new", id="vid-id-new", publishedAt=datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc))
+    self.assertTrue(workQueue.enqueue(self.channel, newVideo, Manager.VideoQuality.QUALITY_MAX))
+    
+    worker = Manager(
+      clientSecretsFile  = None,
+      pickledCredentials = base64.b64encode(pickle.dumps("pickleStr")).decode("utf-8"),
+      downloadDirectory  = downloadDir,
+      ffmpegLocation     = None,
+      channelList        = [],
+      seenChannelVideos  = {},
+      libraryIndexFile   = os.path.join(self.tmpDir.name, "library.json"),
+    )
+    worker._downloadVideo = download
+    worker.addSeenVideo = unittest.mock.Mock()
+    worker.getLibraryIndex().addVideo = unittest.mock.Mock()
+    with unittest.mock.patch("managedYoutubeDL.manager.time.sleep"):
+      self.assertEqual(QueueWorker(worker, workQueue, name="w-local").run(exitWhenEmpty=True), 1)
+    worker.addSeenVideo.assert_not_called()
+    worker.getLibraryIndex().addVideo.assert_not_called()
+    self.assertDictEqual(worker.seenChannelVideos, {})
+    
+    # TEST: the result still reaches the coordinator
+    self.assertEqual(coordinator.collectQueueResults(workQueue), (1, 0))
+    self.assertTrue(coordinator.haveSeenVideo(self.channel, newVideo))
@@ -1,11 +1,13 @@
 import base64
 import datetime
+import gzip
 import os
 import pickle
 import tempfile
 import logging
 import yaml
 import unittest
+import unittest.mock
 
 from io import StringIO
 from datetime import timedelta
@@ -23,7 +25,7 @@ logger = logging.getLogger(__name__)
 
 
 from managedYoutubeDL import YAMLBuilder
-from managedYoutubeDL.items import Channel
+from managedYoutubeDL.items import Channel, Video
 from managedYoutubeDL.manager import Manager
 
 """
@@ -220,7 +222,18 @@ class test_YAMLBuilder(unittest.TestCase):
       
       
       #########################################################################
-      # TEST: backup file's size difference is greater than expected
+      # TEST: raise error when newly dumped file isn't the manager
+      #########################################################################
+      YAMLBuilder.dumpManager = lambda _manager, _fileLoc, overwrite=False: originalDumpFn(
+        test_YAMLBuilder.createmanager(channelList=[Channel(title="ch-0", id="ch-id-0")])[0], _fileLoc, overwrite)
+      self.assertRaises(SystemError, YAMLBuilder.safeDumpManager, manager, tempFileLoc)
+      
+      # TEST: a failed dump leaves no files behind
+      self.assertListEqual(list(os.scandir(tmpDir)), [])
+      
+      
+      #########################################################################
+      # TEST: the previous config is kept as a generation
       #########################################################################
       
       # create a small, config file
@@ -231,25 +244,15 @@ class test_YAMLBuilder(unittest.TestCase):
       YAMLBuilder.dumpManager = originalDumpFn
       
       # safe-dump the manager
-      YAMLBuilder.safeDumpManager(manager, tempFileLoc, overwrite=True, maxChangeFraction=0.0)
+      YAMLBuilder.safeDumpManager(manager, tempFileLoc, overwrite=True)
       
       # TEST: the newly created dump file matches the manager
       self.compareDumpedAndLoadedManager(manager, arguments)
       
-      # TEST: there should be a newly created backup file
-      #  -should be only other file in this temp directory
-      #  -should end in ".old"
-      self.assertEqual(len(list(os.scandir(tmpDir))), 2)
-      newFileLoc = None
-      for item in os.scandir(tmpDir):
-        if item.is_file() and item.name != os.path.basename(tempFileLoc):
-          newFileLoc = os.path.join(tmpDir, item.name)
-          #break
-      self.assertIsNotNone(newFileLoc)
-      self.assertEqual(os.path.splitext(newFileLoc)[-1], ".old")
-
-      # TEST: the backup file matches the original config file
-      with open(newFileLoc, "r") as backupFile:
+      # TEST: the only other file is the previous config, "<config>.1"
+      dirFiles = sorted(item.name for item in os.scandir(tmpDir))
+      self.assertListEqual(dirFiles, [os.path.basename(tempFileLoc), os.path.basename(tempFileLoc) + ".1"])
+      with open(tempFileLoc + ".1", "r") as backupFile:
         self.assertListEqual(backupFile.readlines(), [testStr])
 
     
@@ -257,13 +260,86 @@ class test_YAMLBuilder(unittest.TestCase):
     YAMLBuilder.dumpManager = originalDumpFn
 
 
-  def test_safeDump_happyPathNoBackup(self):
+  def test_safeDump_generations(self):
+    """  """
+    logger.info("test_safeDump_generations")
+
+    manager, _ = test_YAMLBuilder.createmanager(configGenerations=2)
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+      tempFileLoc = os.path.join(tmpDir, "temp_config.yaml")
+      
+      # each dump is a new run, unless <sameRun>
+      def dumpChannels(numChannels, sameRun=False):
+        if not sameRun:
+          manager._configRotated = False
+        manager.setChannelList([Channel(title="ch-{}".format(n), id="ch-id-{}".format(n)) for n in range(numChannels)])
+        YAMLBuilder.safeDumpManager(manager, tempFileLoc, overwrite=True)
+      
+      def generationChannels(fileLoc):
+        opener = gzip.open if fileLoc.endswith(".gz") else open
+        with opener(fileLoc, "rb") as f:
+          return f.read().count(b"!Channel")
+
+      #########################################################################
+      # TEST: only the last <configGenerations> configs are kept, newest first
+      #########################################################################
+      for numChannels in range(1, 5):
+        dumpChannels(numChannels)
+      dirFiles = sorted(item.name for item in os.scandir(tmpDir))
+      self.assertListEqual(dirFiles, ["temp_config.yaml", "temp_config.yaml.1", "temp_config.yaml.2"])
+      self.assertEqual(generationChannels(tempFileLoc), 4)
+      self.assertEqual(generationChannels(tempFileLoc + ".1"), 3)
+      self.assertEqual(generationChannels(tempFileLoc + ".2"), 2)
+      
+      # TEST: the config can change a lot (no size check)
+      dumpChannels(0)
+      self.assertEqual(len(YAMLBuilder.loadManager(tempFileLoc).channelList), 0)
+      
+      #########################################################################
+      # TEST: later saves in the same run replace the config, but keep the
+      #       generations as they were at the start of the run
+      #########################################################################
+      dumpChannels(2)
+      dumpChannels(3, sameRun=True)
+      self.assertEqual(generationChannels(tempFileLoc), 3)
+      self.assertEqual(generationChannels(tempFileLoc + ".1"), 0)
+      self.assertEqual(generationChannels(tempFileLoc + ".2"), 4)
+      
+      # TEST: an unchanged config isn't rewritten, or rotated, even in a new run
+      inode = os.stat(tempFileLoc).st_ino
+      dumpChannels(3)
+      self.assertEqual(os.stat(tempFileLoc).st_ino, inode)
+      self.assertEqual(generationChannels(tempFileLoc + ".1"), 0)
+      self.assertEqual(generationChannels(tempFileLoc + ".2"), 4)
+      
+      #########################################################################
+      # TEST: generations can be gzipped
+      #########################################################################
+      manager.setCompressConfigGenerations(True)
+      dumpChannels(5)
+      dirFiles = sorted(item.name for item in os.scandir(tmpDir))
+      self.assertListEqual(dirFiles, ["temp_config.yaml", "temp_config.yaml.1.gz", "temp_config.yaml.2"])
+      self.assertEqual(generationChannels(tempFileLoc + ".1.gz"), 3)
+      self.assertEqual(generationChannels(tempFileLoc + ".2"), 0)
+      
+      # TEST: with no generations, only the config is kept
+      manager.setConfigGenerations(0)
+      dumpChannels(1)
+      self.assertListEqual([item.name for item in os.scandir(tmpDir)], ["temp_config.yaml"])
+      
+      # TEST: generations must be a non-negative int
+      self.assertRaises(TypeError, manager.setConfigGenerations, -1)
+      self.assertRaises(TypeError, manager.setConfigGenerations, "3")
+
+
+  def test_safeDump_happyPath(self):
     """
     # The common case that runs on every download-new / update-channels:
-    # a small/no size change overwrites in place, creates NO ".old" backup,
-    # and the written file reloads to an equivalent Manager.
+    # the config is replaced, the previous one is kept as "<config>.1", and
+    # the written file reloads to an equivalent Manager.
     """
-    logger.info("test_safeDump_happyPathNoBackup")
+    logger.info("test_safeDump_happyPath")
 
     manager, arguments = test_YAMLBuilder.createmanager()
 
@@ -273,21 +349,179 @@ class test_YAMLBuilder(unittest.TestCase):
       # first dump establishes the baseline config file
       YAMLBuilder.safeDumpManager(manager, tempFileLoc)
       self.assertTrue(os.path.exists(tempFileLoc))
+      
+      # TEST: there's nothing to keep the first time
+      dirFiles = sorted(item.name for item in os.scandir(tmpDir) if item.is_file())
+      self.assertListEqual(dirFiles, [os.path.basename(tempFileLoc)])
 
-      # second dump of the same manager: size is unchanged, so it should
-      # overwrite in place WITHOUT creating a ".old" backup file
+      # TEST: dumping the same manager again leaves the config alone
       YAMLBuilder.safeDumpManager(manager, tempFileLoc, overwrite=True)
-
-      # TEST: the config is the only file present (no backup littering)
       dirFiles = sorted(item.name for item in os.scandir(tmpDir) if item.is_file())
       self.assertListEqual(dirFiles, [os.path.basename(tempFileLoc)])
 
+      # a changed manager, in a later run
+      manager.setGlobalMinViewCount(10)
+      manager._configRotated = False
+      YAMLBuilder.safeDumpManager(manager, tempFileLoc, overwrite=True)
+
+      # TEST: the config and its previous generation, and no temp file
+      dirFiles = sorted(item.name for item in os.scandir(tmpDir) if item.is_file())
+      self.assertListEqual(dirFiles, [os.path.basename(tempFileLoc), os.path.basename(tempFileLoc) + ".1"])
+
       # TEST: the written config reloads to an equivalent manager
       loadedManager = YAMLBuilder.loadManager(tempFileLoc)
       for argName in arguments.keys():
         self.assertEqual(getattr(manager, argName), getattr(loadedManager, argName))
 
 
+  def test_saveManager(self):
+    """  """
+    logger.info("test_saveManager")
+
+    UTC     = datetime.timezone.utc
+    channel = Channel(title="ch-0", id="ch-id-0", minVideoDate=datetime.datetime(2020, 1, 1, tzinfo=UTC))
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+      configFile = os.path.join(tmpDir, "config.yaml")
+      stateFile  = os.path.join(tmpDir, "state.sqlite")
+
+      #########################################################################
+      # TEST: without a state file, the config is always rewritten
+      #########################################################################
+      manager, _ = test_YAMLBuilder.createmanager(channelList=[channel], seenChannelVideos={})
+      YAMLBuilder.dumpManager(manager, configFile)
+      manager = YAMLBuilder.loadManager(configFile)
+      self.assertTrue(YAMLBuilder.saveManager(manager, configFile))
+
+      #########################################################################
+      # TEST: with a state file, a run's state changes don't rewrite it
+      #########################################################################
+      manager.setStateFile(stateFile)
+      manager.addSeenVideo(channel, Video(title="vid-0", id="vid-id-0"))
+      self.assertTrue(YAMLBuilder.saveManager(manager, configFile))
+      with open(configFile, "r") as f:
+        configText = f.read()
+      
+      # TEST: the run state is only in the state file
+      for key in Channel.STATE_FIELDS:
+        self.assertNotIn("\n  {}:".format(key), configText)
+
+      manager = YAMLBuilder.loadManager(configFile)
+      newDate = datetime.datetime(2021, 6, 1, 12, 30, tzinfo=UTC)
+      manager.channelList[0].setMinVideoDate(newDate)
+      manager.channelList[0].setLastPolledAt(newDate)
+      manager.channelList[0].setPollInterval(timedelta(hours=5))
+      manager.addSeenVideo(manager.channelList[0], Video(title="vid-1", id="vid-id-1"))
+      self.assertFalse(YAMLBuilder.saveManager(manager, configFile))
+      with open(configFile, "r") as f:
+        self.assertEqual(f.read(), configText)
+
+      # TEST: the state is loaded back over the config's values
+      manager = YAMLBuilder.loadManager(configFile)
+      self.assertEqual(manager.channelList[0].minVideoDate, newDate)
+      self.assertEqual(manager.channelList[0].lastPolledAt, newDate)
+      self.assertEqual(manager.channelList[0].pollInterval, timedelta(hours=5))
+      self.assertTrue(manager.haveSeenVideo(channel, Video(title="vid-0", id="vid-id-0")))
+      self.assertTrue(manager.haveSeenVideo(channel, Video(title="vid-1", id="vid-id-1")))
+      self.assertDictEqual(manager.seenChannelVideos, {})
+
+      # TEST: changing a setting rewrites it
+      manager.channelList[0].setIncludeFilter("part")
+      self.assertTrue(YAMLBuilder.saveManager(manager, configFile))
+      self.assertFalse(YAMLBuilder.saveManager(manager, configFile))
+      self.assertEqual(YAMLBuilder.loadManager(configFile).channelList[0].includeFilter, "part")
+
+      manager.getSeenStore().close()
+      manager.getStateStore().close()
+      
+      #########################################################################
+      # TEST: run state left in the config is moved to the state file
+      #########################################################################
+      os.remove(stateFile)
+      oldDate = datetime.datetime(2019, 1, 1, tzinfo=UTC)
+      manager.setStateFile(None)
+      manager.channelList[0].setMinVideoDate(oldDate)
+      YAMLBuilder.dumpManager(manager, configFile, overwrite=True)
+      with open(configFile, "r") as f:
+        configText = f.read()
+      self.assertIn("\n  minVideoDate:", configText)
+      with open(configFile, "w") as f:
+        f.write(configText.replace("stateFile: null", "stateFile: {}".format(stateFile)))
+      
+      manager = YAMLBuilder.loadManager(configFile, snapshot=True)
+      self.assertEqual(manager.channelList[0].minVideoDate, oldDate)
+      self.assertTrue(manager.configChanged())
+      self.assertFalse(os.path.exists(configFile + ".snapshot"))
+      self.assertTrue(YAMLBuilder.saveManager(manager, configFile))
+      with open(configFile, "r") as f:
+        self.assertNotIn("\n  minVideoDate:", f.read())
+      manager.getSeenStore().close()
+      manager.getStateStore().close()
+      
+      manager = YAMLBuilder.loadManager(configFile)
+      self.assertEqual(manager.channelList[0].minVideoDate, oldDate)
+      self.assertFalse(manager.configChanged())
+      manager.getSeenStore().close()
+      manager.getStateStore().close()
+
+
+  def test_snapshot(self):
+    """  """
+    logger.info("test_snapshot")
+
+    channels   = [Channel(title="ch-{}".format(n), id="ch-id-{}".format(n), priority=n) for n in range(3)]
+    manager, _ = test_YAMLBuilder.createmanager(channelList=channels, minPollInterval=timedelta(hours=2))
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+      configFile   = os.path.join(tmpDir, "config.yaml")
+      snapshotFile = configFile + ".snapshot"
+      YAMLBuilder.dumpManager(manager, configFile)
+
+      #########################################################################
+      # TEST: the first load parses the YAML and saves a snapshot
+      #########################################################################
+      with unittest.mock.patch("managedYoutubeDL.yamlBuilder.yaml.load", wraps=yaml.load) as load:
+        parsedManager = YAMLBuilder.loadManager(configFile, snapshot=True)
+        self.assertEqual(load.call_count, 1)
+        self.assertTrue(os.path.exists(snapshotFile))
+
+        # TEST: later loads use the snapshot, giving the same manager
+        snapshotManager = YAMLBuilder.loadManager(configFile, snapshot=True)
+        self.assertEqual(load.call_count, 1)
+        self.assertEqual(YAMLBuilder._snapshotFields(snapshotManager), YAMLBuilder._snapshotFields(parsedManager))
+        self.assertIsInstance(snapshotManager.channelList[0], Channel)
+        self.assertEqual(snapshotManager.channelList[2].priority, 2)
+
+        # TEST: snapshots are only used when asked for
+        YAMLBuilder.loadManager(configFile)
+        self.assertEqual(load.call_count, 2)
+
+        # TEST: an edited config is parsed again
+        with open(configFile, "a") as f:
+          f.write("\n")
+        YAMLBuilder.loadManager(configFile, snapshot=True)
+        self.assertEqual(load.call_count, 3)
+        YAMLBuilder.loadManager(configFile, snapshot=True)
+        self.assertEqual(load.call_count, 3)
+
+        # TEST: a corrupt snapshot is ignored
+        with open(snapshotFile, "wb") as f:
+          f.write(b"not a pickle")
+        self.assertEqual(YAMLBuilder.loadManager(configFile, snapshot=True).channelList[1].id, "ch-id-1")
+        self.assertEqual(load.call_count, 4)
+
+        #######################################################################
+        # TEST: saving with snapshots on keeps the snapshot up to date
+        #######################################################################
+        snapshotManager.setGlobalIncludeFilter("changed")
+        with unittest.mock.patch.object(YAMLBuilder, "useSnapshots", True):
+          YAMLBuilder.safeDumpManager(snapshotManager, configFile, overwrite=True)
+          self.assertEqual(YAMLBuilder.loadManager(configFile).globalIncludeFilter, "changed")
+        
+        # TEST: the only parse is safeDumpManager checking the new config
+        self.assertEqual(load.call_count, 5)
+
+
   def test_Channel(self):
     """  """
     logger.info("test_Channel")
@@ -303,6 +537,13 @@ class test_YAMLBuilder(unittest.TestCase):
       "maxVideoDate":   datetime.datetime.fromtimestamp(2, datetime.timezone.utc),
       "minVideoLength": timedelta(2),
       "maxVideoLength": timedelta(3),
+      "priority":       5,
+      "pollInterval":   timedelta(hours=6),
+      "pollIntervalOverride": None,
+      "lastPolledAt":   datetime.datetime.fromtimestamp(3, datetime.timezone.utc),
+      "descriptionFilter": "string description filter",
+      "tagFilter":         "string tag filter",
+      "minViewCount":      100,
     }
     
     channel = Channel(**arguments)
@@ -310,7 +551,7 @@ class test_YAMLBuilder(unittest.TestCase):
     # TEST: all channel values are set
     for argName, argValue in arguments.items():
       self.assertEqual(str(getattr(channel, argName)), str(argValue))
-    self.assertListEqual(list(arguments.keys()), list(channel.__dict__.keys()))
+    self.assertListEqual(list(arguments.keys()), list(channel.toDict().keys()))
     
     
     with tempfile.TemporaryDirectory() as tmpDir:
@@ -347,12 +588,38 @@ class test_YAMLBuilder(unittest.TestCase):
       "globalMaxVideoLength": timedelta(1),
       "downloadTimeout":      timedelta(0),
       "postTimeoutWait":      timedelta(0),
+      "concurrentFragmentDownloads": {"720p": 2, "max": 8},
+      "httpChunkSize":        1024,
+      "minFreeDiskSpace":     1024,
+      "downloadOrder":        "smallest-first",
+      "downloadAgingHalfLife": timedelta(hours=6),
+      "libraryIndexFile":     "/path/to/library.index",
+      "mergeWorkers":         3,
+      "mergeTimeout":         timedelta(minutes=20),
+      "telemetryFile":        "/path/to/telemetry.jsonl",
+      "adaptivePolling":      True,
+      "minPollInterval":      timedelta(minutes=30),
+      "maxPollInterval":      timedelta(days=2),
+      "webSubCallbackURL":    "https://example.com/websub",
+      "webSubPort":           8081,
+      "webSubHubURL":         "https://hub.example.com/subscribe",
+      "globalDescriptionFilter": "sponsored",
+      "globalTagFilter":      "music",
+      "globalMinViewCount":   1000,
+      "seenStoreFile":        "/path/to/seen.sqlite",
+      "seenRetentionCount":   500,
+      "seenRetentionAge":     timedelta(days=90),
+      "stateFile":            None,
+      "configGenerations":    3,
+      "compressConfigGenerations": False,
     }
   
     manager = Manager(**arguments)
     
     # TEST: our test has assigned all arguments
-    initAssignedFields = ["ytFetcher"]
+    initAssignedFields = ["_channelsByID", "_libraryIndex", "_telemetryLog", "_seenStore", "_stateStore",
+                          "_filterPlans", "_undecidedVideos", "_configFingerprint", "_ytFetcher", "_configRotated",
+                          "_readOnly"]
     self.assertListEqual(list(arguments.keys())+initAssignedFields, list(manager.__dict__.keys()))
     
     # TEST: all manager values are set